@@ -16,6 +16,8 @@ from utils.transaction_types import (
     needs_fee_asset,
     build_transaction_params
 )
+from services.holdings import get_account_asset_balance
+from services.shares import invalidate_nav_snapshot
 
 
 def render_transaction_form(engine):
@@ -589,39 +591,14 @@ def _save_transaction(engine, params):
     with engine.begin() as conn:
         result = conn.execute(text(sql_insert), params)
         tx_id = result.scalar_one()
-        return tx_id
+    invalidate_nav_snapshot()
+    return tx_id
 
 
 def _get_account_asset_balance(engine, account_id: int, asset_id: int) -> float:
     """Calcula o saldo atual de um asset numa conta específica (per-account).
-    Baseado nos deltas do modelo V2: inflows - outflows - fees.
+    Lê o saldo acumulado de t_daily_holdings (inflows - outflows - fees do modelo V2).
     """
     if not account_id or not asset_id:
         return 0.0
-    sql = text(
-        """
-        WITH inflows AS (
-            SELECT COALESCE(t.to_account_id, t.account_id, -1) AS account_id, t.to_asset_id AS asset_id, SUM(t.to_quantity) AS qty
-            FROM t_transactions t
-            WHERE t.to_asset_id = :asset_id AND COALESCE(t.to_account_id, t.account_id, -1) = :account_id
-            GROUP BY 1,2
-        ), outflows AS (
-            SELECT COALESCE(t.from_account_id, t.account_id, -1) AS account_id, t.from_asset_id AS asset_id, SUM(t.from_quantity) AS qty
-            FROM t_transactions t
-            WHERE t.from_asset_id = :asset_id AND COALESCE(t.from_account_id, t.account_id, -1) = :account_id
-            GROUP BY 1,2
-        ), fees AS (
-            SELECT COALESCE(t.from_account_id, t.account_id, -1) AS account_id, t.fee_asset_id AS asset_id, SUM(t.fee_quantity) AS qty
-            FROM t_transactions t
-            WHERE t.fee_asset_id = :asset_id AND t.fee_quantity > 0 AND COALESCE(t.from_account_id, t.account_id, -1) = :account_id
-            GROUP BY 1,2
-        )
-        SELECT 
-            COALESCE((SELECT SUM(qty) FROM inflows),0) 
-          - COALESCE((SELECT SUM(qty) FROM outflows),0)
-          - COALESCE((SELECT SUM(qty) FROM fees),0) AS balance
-        """
-    )
-    with engine.begin() as conn:
-        row = conn.execute(sql, {"account_id": int(account_id), "asset_id": int(asset_id)}).first()
-        return float(row[0]) if row and row[0] is not None else 0.0
+    return get_account_asset_balance(engine, int(account_id), int(asset_id))
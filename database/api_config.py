@@ -18,7 +18,7 @@ def get_all_apis() -> List[Dict]:
         cur.execute(
             """
             SELECT api_id, api_name, api_key, base_url, is_active, 
-                   default_address, rate_limit, timeout, notes,
+                   default_address, rate_limit, timeout, sync_workers, notes,
                    created_at, updated_at
             FROM t_api_cardano
             ORDER BY api_name
@@ -39,7 +39,7 @@ def get_active_apis() -> List[Dict]:
         cur.execute(
             """
             SELECT api_id, api_name, api_key, base_url, 
-                   default_address, rate_limit, timeout
+                   default_address, rate_limit, timeout, sync_workers
             FROM t_api_cardano
             WHERE is_active = TRUE
             ORDER BY api_name
@@ -83,7 +83,8 @@ def create_api(
     default_address: Optional[str] = None,
     rate_limit: Optional[int] = None,
     timeout: int = 10,
-    notes: Optional[str] = None
+    notes: Optional[str] = None,
+    sync_workers: int = 1
 ) -> Tuple[bool, str]:
     """
     Cria nova configuração de API.
@@ -97,11 +98,11 @@ def create_api(
         cur.execute(
             """
             INSERT INTO t_api_cardano 
-            (api_name, api_key, base_url, is_active, default_address, rate_limit, timeout, notes)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            (api_name, api_key, base_url, is_active, default_address, rate_limit, timeout, notes, sync_workers)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
             RETURNING api_id
             """,
-            (api_name, api_key, base_url, is_active, default_address, rate_limit, timeout, notes),
+            (api_name, api_key, base_url, is_active, default_address, rate_limit, timeout, notes, sync_workers),
         )
         api_id = cur.fetchone()[0]
         conn.commit()
@@ -125,7 +126,8 @@ def update_api(
     default_address: Optional[str] = None,
     rate_limit: Optional[int] = None,
     timeout: Optional[int] = None,
-    notes: Optional[str] = None
+    notes: Optional[str] = None,
+    sync_workers: Optional[int] = None
 ) -> Tuple[bool, str]:
     """
     Atualiza configuração de API.
@@ -165,6 +167,9 @@ def update_api(
     if notes is not None:
         updates.append("notes = %s")
         params.append(notes)
+    if sync_workers is not None:
+        updates.append("sync_workers = %s")
+        params.append(sync_workers)
     
     if not updates:
         return False, "Nenhum campo para atualizar"
@@ -1,4 +1,5 @@
 import os
+import threading
 import psycopg2
 from psycopg2 import pool
 from dotenv import load_dotenv
@@ -10,23 +11,28 @@ from sqlalchemy.engine import Engine
 load_dotenv()
 
 # Connection pool for better performance
+# (thread-safe: Streamlit e o sync paralelo de wallets usam o pool a partir de várias threads)
+POOL_MAX_CONNECTIONS = 10
 _connection_pool = None
 _engine: Engine | None = None
+_pool_lock = threading.Lock()
 
 
 def _get_pool():
     """Get or create the connection pool."""
     global _connection_pool
     if _connection_pool is None:
-        _connection_pool = psycopg2.pool.SimpleConnectionPool(
-            minconn=1,
-            maxconn=10,
-            dbname=os.getenv("DB_NAME"),
-            user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD"),
-            host=os.getenv("DB_HOST"),
-            port=os.getenv("DB_PORT")
-        )
+        with _pool_lock:
+            if _connection_pool is None:
+                _connection_pool = psycopg2.pool.ThreadedConnectionPool(
+                    minconn=1,
+                    maxconn=POOL_MAX_CONNECTIONS,
+                    dbname=os.getenv("DB_NAME"),
+                    user=os.getenv("DB_USER"),
+                    password=os.getenv("DB_PASSWORD"),
+                    host=os.getenv("DB_HOST"),
+                    port=os.getenv("DB_PORT")
+                )
     return _connection_pool
 
 
@@ -88,6 +88,7 @@ TABLES_ORDER = [
     't_assets',
     't_fee_settings',
     't_tags',
+    't_fx_rates',
     
     # Tabelas com dependências de nível 1
     't_address',
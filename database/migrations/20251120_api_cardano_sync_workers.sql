@@ -0,0 +1,15 @@
+-- ========================================
+-- MIGRATION: Parallel Cardano wallet sync
+-- Date: 2025-11-20
+-- Adds the per-API worker pool size used by sync_all_cardano_wallets_for_user
+-- to sync several wallets in parallel (1 = sequential, previous behaviour).
+-- ========================================
+
+ALTER TABLE t_api_cardano
+ADD COLUMN IF NOT EXISTS sync_workers INTEGER DEFAULT 1;
+
+UPDATE t_api_cardano
+SET sync_workers = 1
+WHERE sync_workers IS NULL;
+
+COMMENT ON COLUMN t_api_cardano.sync_workers IS 'Número de wallets sincronizadas em paralelo (1 = sequencial)';
@@ -0,0 +1,21 @@
+-- ========================================
+-- MIGRATION: Persistent Cardano token metadata cache
+-- Date: 2025-11-21
+-- t_cardano_assets doubles as the second-level cache of CardanoScan token metadata
+-- (services/cardano_metadata.py). Tokens without metadata are stored as 'missing'
+-- and retried only after NEGATIVE_TTL_DAYS.
+-- ========================================
+
+ALTER TABLE t_cardano_assets
+ADD COLUMN IF NOT EXISTS metadata_status TEXT,
+ADD COLUMN IF NOT EXISTS metadata_checked_at TIMESTAMP WITH TIME ZONE;
+
+-- Rows already resolved by previous syncs count as known metadata
+UPDATE t_cardano_assets
+SET metadata_status = 'ok',
+    metadata_checked_at = COALESCE(created_at, CURRENT_TIMESTAMP)
+WHERE metadata_status IS NULL
+  AND display_name IS NOT NULL;
+
+COMMENT ON COLUMN t_cardano_assets.metadata_status IS 'Resultado da última consulta de metadados: ok | missing';
+COMMENT ON COLUMN t_cardano_assets.metadata_checked_at IS 'Data da última consulta de metadados ao CardanoScan';
@@ -0,0 +1,115 @@
+-- ========================================
+-- MIGRATION: Materialised daily holdings (V2 ledger)
+-- Date: 2025-11-22
+-- t_daily_holdings(account_id, asset_id, date, delta, cumulative) is maintained by a
+-- trigger on t_transactions. To rebuild it from the full ledger later:
+--     python -m services.holdings
+-- ========================================
+
+CREATE TABLE IF NOT EXISTS t_daily_holdings (
+    account_id INT NOT NULL,                 -- -1 = sem conta (Banco/Tesouraria)
+    asset_id INT NOT NULL REFERENCES t_assets(asset_id),
+    date DATE NOT NULL,
+    delta NUMERIC(36,8) NOT NULL DEFAULT 0,  -- inflows - outflows - fees do dia
+    cumulative NUMERIC(36,8) NOT NULL DEFAULT 0,  -- saldo no fim do dia
+    CONSTRAINT pk_daily_holdings PRIMARY KEY (account_id, asset_id, date)
+);
+
+CREATE INDEX IF NOT EXISTS idx_daily_holdings_date ON t_daily_holdings(date);
+
+-- Aplica uma variação de quantidade a t_daily_holdings (delta do dia + cumulative dos dias seguintes)
+CREATE OR REPLACE FUNCTION apply_daily_holdings_delta(p_account_id INT, p_asset_id INT, p_date DATE, p_qty NUMERIC)
+RETURNS VOID AS $$
+BEGIN
+    IF p_asset_id IS NULL OR p_qty IS NULL OR p_qty = 0 THEN
+        RETURN;
+    END IF;
+
+    INSERT INTO t_daily_holdings (account_id, asset_id, date, delta, cumulative)
+    VALUES (
+        p_account_id, p_asset_id, p_date, p_qty,
+        p_qty + COALESCE((
+            SELECT h.cumulative FROM t_daily_holdings h
+            WHERE h.account_id = p_account_id AND h.asset_id = p_asset_id AND h.date < p_date
+            ORDER BY h.date DESC
+            LIMIT 1
+        ), 0)
+    )
+    ON CONFLICT (account_id, asset_id, date)
+    DO UPDATE SET delta = t_daily_holdings.delta + EXCLUDED.delta,
+                  cumulative = t_daily_holdings.cumulative + EXCLUDED.delta;
+
+    UPDATE t_daily_holdings
+    SET cumulative = cumulative + p_qty
+    WHERE account_id = p_account_id AND asset_id = p_asset_id AND date > p_date;
+
+    -- Dias sem movimento líquido não precisam de linha (o cumulative seguinte já está correto)
+    DELETE FROM t_daily_holdings
+    WHERE account_id = p_account_id AND asset_id = p_asset_id AND date = p_date AND delta = 0;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Mantém t_daily_holdings em sincronia com t_transactions (modelo V2)
+CREATE OR REPLACE FUNCTION sync_daily_holdings()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM apply_daily_holdings_delta(COALESCE(OLD.to_account_id, OLD.account_id, -1),
+                                           OLD.to_asset_id, OLD.transaction_date::date, -OLD.to_quantity);
+        PERFORM apply_daily_holdings_delta(COALESCE(OLD.from_account_id, OLD.account_id, -1),
+                                           OLD.from_asset_id, OLD.transaction_date::date, OLD.from_quantity);
+        IF OLD.fee_quantity > 0 THEN
+            PERFORM apply_daily_holdings_delta(COALESCE(OLD.from_account_id, OLD.account_id, -1),
+                                               OLD.fee_asset_id, OLD.transaction_date::date, OLD.fee_quantity);
+        END IF;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM apply_daily_holdings_delta(COALESCE(NEW.to_account_id, NEW.account_id, -1),
+                                           NEW.to_asset_id, NEW.transaction_date::date, NEW.to_quantity);
+        PERFORM apply_daily_holdings_delta(COALESCE(NEW.from_account_id, NEW.account_id, -1),
+                                           NEW.from_asset_id, NEW.transaction_date::date, -NEW.from_quantity);
+        IF NEW.fee_quantity > 0 THEN
+            PERFORM apply_daily_holdings_delta(COALESCE(NEW.from_account_id, NEW.account_id, -1),
+                                               NEW.fee_asset_id, NEW.transaction_date::date, -NEW.fee_quantity);
+        END IF;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_transactions_daily_holdings ON t_transactions;
+CREATE TRIGGER trg_transactions_daily_holdings
+    AFTER INSERT OR UPDATE OR DELETE ON t_transactions
+    FOR EACH ROW
+    EXECUTE FUNCTION sync_daily_holdings();
+
+-- Carga inicial a partir do ledger existente
+DELETE FROM t_daily_holdings;
+INSERT INTO t_daily_holdings (account_id, asset_id, date, delta, cumulative)
+SELECT account_id, asset_id, date, delta,
+       SUM(delta) OVER (PARTITION BY account_id, asset_id ORDER BY date) AS cumulative
+FROM (
+    SELECT account_id, asset_id, date, SUM(qty) AS delta
+    FROM (
+        SELECT COALESCE(t.to_account_id, t.account_id, -1) AS account_id, t.to_asset_id AS asset_id,
+               t.transaction_date::date AS date, t.to_quantity AS qty
+        FROM t_transactions t
+        WHERE t.to_asset_id IS NOT NULL AND t.to_quantity IS NOT NULL
+        UNION ALL
+        SELECT COALESCE(t.from_account_id, t.account_id, -1), t.from_asset_id,
+               t.transaction_date::date, -t.from_quantity
+        FROM t_transactions t
+        WHERE t.from_asset_id IS NOT NULL AND t.from_quantity IS NOT NULL
+        UNION ALL
+        SELECT COALESCE(t.from_account_id, t.account_id, -1), t.fee_asset_id,
+               t.transaction_date::date, -t.fee_quantity
+        FROM t_transactions t
+        WHERE t.fee_asset_id IS NOT NULL AND t.fee_quantity > 0
+    ) legs
+    GROUP BY account_id, asset_id, date
+) d
+WHERE delta <> 0;
+
+COMMENT ON TABLE t_daily_holdings IS 'Daily per-account/asset quantity deltas and running balances (V2 ledger), maintained by trigger.';
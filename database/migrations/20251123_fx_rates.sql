@@ -0,0 +1,18 @@
+-- ========================================
+-- MIGRATION: Daily FX rates (USD/EUR) for offline price conversion
+-- Date: 2025-11-23
+-- t_fx_rates(base_currency, quote_currency, rate_date, rate): 1 base = rate quote.
+-- Loaded in bulk from an ECB reference-rates file (eurofxref-hist.csv/.zip or SDMX CSV):
+--     python -m services.fx_rates eurofxref-hist.zip
+-- ========================================
+
+CREATE TABLE IF NOT EXISTS t_fx_rates (
+    base_currency CHAR(3) NOT NULL,
+    quote_currency CHAR(3) NOT NULL,
+    rate_date DATE NOT NULL,
+    rate NUMERIC(18, 10) NOT NULL CHECK (rate > 0),
+    source TEXT NOT NULL DEFAULT 'ecb',
+    CONSTRAINT pk_fx_rates PRIMARY KEY (base_currency, quote_currency, rate_date)
+);
+
+COMMENT ON TABLE t_fx_rates IS 'Taxas de câmbio diárias (1 base = rate quote); dias sem fixing usam a última taxa anterior';
@@ -0,0 +1,90 @@
+-- ========================================
+-- MIGRATION: Per-asset coverage summary for t_price_snapshots
+-- Date: 2025-11-24
+-- t_price_snapshot_coverage(asset_id, first_date, last_date, row_count, gap_days) is kept up to
+-- date by statement-level triggers on t_price_snapshots, so Settings → Snapshots reads one row
+-- per asset instead of scanning the whole snapshot table.
+-- ========================================
+
+-- Cobertura de t_price_snapshots por ativo (mantida por triggers de instrução em t_price_snapshots)
+CREATE TABLE IF NOT EXISTS t_price_snapshot_coverage (
+    asset_id INT PRIMARY KEY REFERENCES t_assets(asset_id) ON DELETE CASCADE,
+    first_date DATE NOT NULL,
+    last_date DATE NOT NULL,
+    row_count INT NOT NULL,
+    gap_days INT NOT NULL,                   -- dias sem snapshot entre first_date e last_date
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Recalcula a cobertura dos ativos indicados (uma agregação por ativo, via idx_price_snapshots_asset_date).
+-- Um advisory lock por ativo (pedido numa instrução própria, por ordem de asset_id) serializa escritores
+-- concorrentes: a agregação seguinte já vê as linhas que o anterior confirmou, sem perder atualizações.
+CREATE OR REPLACE FUNCTION refresh_price_snapshot_coverage(p_asset_ids INT[])
+RETURNS VOID AS $$
+DECLARE
+    v_asset_id INT;
+BEGIN
+    FOR v_asset_id IN SELECT DISTINCT unnest(p_asset_ids) ORDER BY 1 LOOP
+        PERFORM pg_advisory_xact_lock(7260002, v_asset_id);
+    END LOOP;
+
+    DELETE FROM t_price_snapshot_coverage c
+    WHERE c.asset_id = ANY(p_asset_ids)
+      AND NOT EXISTS (SELECT 1 FROM t_price_snapshots ps WHERE ps.asset_id = c.asset_id);
+
+    INSERT INTO t_price_snapshot_coverage (asset_id, first_date, last_date, row_count, gap_days, updated_at)
+    SELECT asset_id, MIN(snapshot_date), MAX(snapshot_date), COUNT(*),
+           (MAX(snapshot_date) - MIN(snapshot_date) + 1) - COUNT(*), CURRENT_TIMESTAMP
+    FROM t_price_snapshots
+    WHERE asset_id = ANY(p_asset_ids)
+    GROUP BY asset_id
+    ON CONFLICT (asset_id)
+    DO UPDATE SET first_date = EXCLUDED.first_date,
+                  last_date = EXCLUDED.last_date,
+                  row_count = EXCLUDED.row_count,
+                  gap_days = EXCLUDED.gap_days,
+                  updated_at = EXCLUDED.updated_at;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Trigger de instrução: um recálculo por ativo tocado, mesmo em COPY/INSERT em bulk
+CREATE OR REPLACE FUNCTION sync_price_snapshot_coverage()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM refresh_price_snapshot_coverage(ARRAY(SELECT DISTINCT asset_id FROM old_rows));
+    ELSIF TG_OP = 'UPDATE' THEN
+        PERFORM refresh_price_snapshot_coverage(ARRAY(SELECT asset_id FROM old_rows
+                                                      UNION SELECT asset_id FROM new_rows));
+    ELSE
+        PERFORM refresh_price_snapshot_coverage(ARRAY(SELECT DISTINCT asset_id FROM new_rows));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_price_snapshots_coverage_ins ON t_price_snapshots;
+CREATE TRIGGER trg_price_snapshots_coverage_ins
+    AFTER INSERT ON t_price_snapshots
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION sync_price_snapshot_coverage();
+
+DROP TRIGGER IF EXISTS trg_price_snapshots_coverage_upd ON t_price_snapshots;
+CREATE TRIGGER trg_price_snapshots_coverage_upd
+    AFTER UPDATE ON t_price_snapshots
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION sync_price_snapshot_coverage();
+
+DROP TRIGGER IF EXISTS trg_price_snapshots_coverage_del ON t_price_snapshots;
+CREATE TRIGGER trg_price_snapshots_coverage_del
+    AFTER DELETE ON t_price_snapshots
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION sync_price_snapshot_coverage();
+
+-- Carga inicial
+SELECT refresh_price_snapshot_coverage(ARRAY(SELECT DISTINCT asset_id FROM t_price_snapshots));
+
+COMMENT ON TABLE t_price_snapshot_coverage IS 'Per-asset first/last date, row count and gap days of t_price_snapshots, maintained by trigger.';
@@ -0,0 +1,75 @@
+-- ========================================
+-- MIGRATION: Daily fund NAV / NAV-per-share history
+-- Date: 2025-11-25
+-- t_fund_nav_daily(nav_date, cash_balance, crypto_value, fund_nav, total_shares, nav_per_share)
+-- is filled incrementally (only days after the last stored one) from the ledger and
+-- t_price_snapshots:
+--     python -m services.fund_nav
+-- Statement-level triggers drop the days from the earliest changed date onwards when a
+-- back-dated movement, transaction, share row or price snapshot is written.
+-- ========================================
+
+-- NAV diário do fundo (caixa + cripto a preços de t_price_snapshots), preenchido por services.fund_nav
+CREATE TABLE IF NOT EXISTS t_fund_nav_daily (
+    nav_date DATE PRIMARY KEY,
+    cash_balance NUMERIC(20, 2) NOT NULL,
+    crypto_value NUMERIC(20, 2) NOT NULL,
+    fund_nav NUMERIC(20, 2) NOT NULL,
+    total_shares NUMERIC(20, 6) NOT NULL,
+    nav_per_share NUMERIC(20, 6) NOT NULL,
+    missing_prices INT NOT NULL DEFAULT 0,   -- ativos em carteira sem preço nesse dia (valorizados a 0)
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Escritas com data D em movimentos, transações, shares ou preços tornam obsoletos os dias >= D de
+-- t_fund_nav_daily; o próximo update_fund_nav_daily() recalcula-os. TG_ARGV[0] = coluna de data.
+CREATE OR REPLACE FUNCTION trim_fund_nav_daily()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_from DATE;
+    v_old DATE;
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        EXECUTE format('SELECT MIN(%I)::date FROM new_rows', TG_ARGV[0]) INTO v_from;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        EXECUTE format('SELECT MIN(%I)::date FROM old_rows', TG_ARGV[0]) INTO v_old;
+        v_from := LEAST(v_from, v_old);
+    END IF;
+    IF v_from IS NOT NULL THEN
+        DELETE FROM t_fund_nav_daily WHERE nav_date >= v_from;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Triggers de instrução (transition tables só admitem um evento por trigger)
+DO $$
+DECLARE
+    src RECORD;
+BEGIN
+    FOR src IN
+        SELECT * FROM (VALUES
+            ('t_user_capital_movements', 'capital_movements', 'movement_date'),
+            ('t_transactions', 'transactions', 'transaction_date'),
+            ('t_user_shares', 'user_shares', 'movement_date'),
+            ('t_price_snapshots', 'price_snapshots', 'snapshot_date')
+        ) AS v(tbl, short_name, date_col)
+    LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', 'trg_' || src.short_name || '_fund_nav_ins', src.tbl);
+        EXECUTE format('CREATE TRIGGER %I AFTER INSERT ON %I REFERENCING NEW TABLE AS new_rows '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION trim_fund_nav_daily(%L)',
+                       'trg_' || src.short_name || '_fund_nav_ins', src.tbl, src.date_col);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', 'trg_' || src.short_name || '_fund_nav_upd', src.tbl);
+        EXECUTE format('CREATE TRIGGER %I AFTER UPDATE ON %I REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION trim_fund_nav_daily(%L)',
+                       'trg_' || src.short_name || '_fund_nav_upd', src.tbl, src.date_col);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', 'trg_' || src.short_name || '_fund_nav_del', src.tbl);
+        EXECUTE format('CREATE TRIGGER %I AFTER DELETE ON %I REFERENCING OLD TABLE AS old_rows '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION trim_fund_nav_daily(%L)',
+                       'trg_' || src.short_name || '_fund_nav_del', src.tbl, src.date_col);
+    END LOOP;
+END;
+$$;
+
+COMMENT ON TABLE t_fund_nav_daily IS 'Daily fund NAV and NAV per share valued with t_price_snapshots; days from a back-dated write onwards are dropped by trigger and recomputed by services.fund_nav.';
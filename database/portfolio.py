@@ -1,9 +1,13 @@
+import pandas as pd
+from psycopg2.extras import execute_values
+
 from database.connection import get_db_cursor
-from services.fees import apply_fees
+from services.fees import compute_fees, get_current_fee_settings, month_bounds, write_fees
 
 def insert_snapshot_and_fees(user_id, snapshot_date, df_assets):
     """
     Optimized version: reduces N+1 queries and uses bulk operations.
+    Fees are computed for all users at once and written in the snapshot's transaction.
     """
     with get_db_cursor() as cur:
         total_value = df_assets['valor_total'].sum()
@@ -26,34 +30,51 @@ def insert_snapshot_and_fees(user_id, snapshot_date, df_assets):
             VALUES (%s, %s, %s, %s, %s)
         """, asset_data)
 
-        # Obter todos os utilizadores (exceto admin) com seus últimos snapshots em uma única query
+        # Configuração de taxas lida uma vez, na mesma transação
+        settings = get_current_fee_settings(cur)
+
+        # Utilizadores (exceto admin) com último snapshot, HWM e manutenção do mês numa única query
+        month_start, next_month = month_bounds(snapshot_date)
         cur.execute("""
-            SELECT u.user_id, 
+            SELECT u.user_id,
                    COALESCE(
-                       (SELECT us.valor_depois 
-                        FROM t_user_snapshots us 
-                        WHERE us.user_id = u.user_id 
-                        ORDER BY us.snapshot_date DESC 
-                        LIMIT 1), 
+                       (SELECT us.valor_depois
+                        FROM t_user_snapshots us
+                        WHERE us.user_id = u.user_id
+                        ORDER BY us.snapshot_date DESC
+                        LIMIT 1),
                        0
-                   ) as valor_antes
+                   ) as valor_antes,
+                   COALESCE(hw.high_water_value, 0) as high_water,
+                   EXISTS (
+                       SELECT 1 FROM t_user_fees f
+                       WHERE f.user_id = u.user_id AND f.fee_type = 'maintenance'
+                         AND f.fee_date >= %s AND f.fee_date < %s
+                   ) as maintenance_charged
             FROM t_users u
+            LEFT JOIN t_user_high_water hw ON hw.user_id = u.user_id
             WHERE u.is_admin = FALSE
-        """)
-        user_data = cur.fetchall()
-
-        # Process fees for each user
-        for uid, valor_antes in user_data:
-            participacao = valor_antes / total_value if total_value > 0 else 0
-            valor_user = total_value * participacao
-
-            # Aplicar taxas (maintenance + performance)
-            valor_user, fee_manutencao, fee_performance = apply_fees(
-                uid, snapshot_date, total_value, valor_user
-            )
-
-            # Gravar snapshot do utilizador
-            cur.execute("""
-                INSERT INTO t_user_snapshots (user_id, snapshot_date, valor_antes, valor_depois)
-                VALUES (%s, %s, %s, %s)
-            """, (uid, snapshot_date, valor_antes, valor_user))
+        """, (month_start, next_month))
+        users = pd.DataFrame(
+            cur.fetchall(), columns=['user_id', 'valor_antes', 'high_water', 'maintenance_charged']
+        )
+        if users.empty:
+            return
+
+        # Valor de cada utilizador antes das taxas (participação × valor total)
+        valor_antes = users['valor_antes'].astype(float)
+        participacao = valor_antes / total_value if total_value > 0 else valor_antes * 0
+        users['valor_user'] = total_value * participacao
+
+        # Aplicar taxas (maintenance + performance) a todos os utilizadores de uma vez
+        fees = compute_fees(users, settings)
+        write_fees(cur, fees, snapshot_date)
+
+        # Gravar snapshots dos utilizadores
+        execute_values(cur, """
+            INSERT INTO t_user_snapshots (user_id, snapshot_date, valor_antes, valor_depois)
+            VALUES %s
+        """, [
+            (int(uid), snapshot_date, float(antes), float(depois))
+            for uid, antes, depois in zip(users['user_id'], valor_antes, fees['valor_user'])
+        ], page_size=1000)
@@ -153,6 +153,16 @@ CREATE TABLE IF NOT EXISTS t_transactions (
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Holdings diários materializados (mantidos pelo trigger trg_transactions_daily_holdings)
+CREATE TABLE IF NOT EXISTS t_daily_holdings (
+    account_id INT NOT NULL,                 -- -1 = sem conta (Banco/Tesouraria)
+    asset_id INT NOT NULL REFERENCES t_assets(asset_id),
+    date DATE NOT NULL,
+    delta NUMERIC(36,8) NOT NULL DEFAULT 0,  -- inflows - outflows - fees do dia
+    cumulative NUMERIC(36,8) NOT NULL DEFAULT 0,  -- saldo no fim do dia
+    CONSTRAINT pk_daily_holdings PRIMARY KEY (account_id, asset_id, date)
+);
+
 -- ========================================
 -- TABELAS DE SNAPSHOTS DE PREÇOS
 -- ========================================
@@ -167,6 +177,38 @@ CREATE TABLE IF NOT EXISTS t_price_snapshots (
     UNIQUE(asset_id, snapshot_date)
 );
 
+-- Cobertura de t_price_snapshots por ativo (mantida por triggers de instrução em t_price_snapshots)
+CREATE TABLE IF NOT EXISTS t_price_snapshot_coverage (
+    asset_id INT PRIMARY KEY REFERENCES t_assets(asset_id) ON DELETE CASCADE,
+    first_date DATE NOT NULL,
+    last_date DATE NOT NULL,
+    row_count INT NOT NULL,
+    gap_days INT NOT NULL,                   -- dias sem snapshot entre first_date e last_date
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- NAV diário do fundo (caixa + cripto a preços de t_price_snapshots), preenchido por services.fund_nav
+CREATE TABLE IF NOT EXISTS t_fund_nav_daily (
+    nav_date DATE PRIMARY KEY,
+    cash_balance NUMERIC(20, 2) NOT NULL,
+    crypto_value NUMERIC(20, 2) NOT NULL,
+    fund_nav NUMERIC(20, 2) NOT NULL,
+    total_shares NUMERIC(20, 6) NOT NULL,
+    nav_per_share NUMERIC(20, 6) NOT NULL,
+    missing_prices INT NOT NULL DEFAULT 0,   -- ativos em carteira sem preço nesse dia (valorizados a 0)
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Taxas de câmbio diárias (1 base = rate quote), carregadas de ficheiros do BCE (services.fx_rates)
+CREATE TABLE IF NOT EXISTS t_fx_rates (
+    base_currency CHAR(3) NOT NULL,
+    quote_currency CHAR(3) NOT NULL,
+    rate_date DATE NOT NULL,
+    rate NUMERIC(18, 10) NOT NULL CHECK (rate > 0),
+    source TEXT NOT NULL DEFAULT 'ecb',
+    CONSTRAINT pk_fx_rates PRIMARY KEY (base_currency, quote_currency, rate_date)
+);
+
 CREATE TABLE IF NOT EXISTS t_portfolio_snapshots (
     snapshot_id SERIAL PRIMARY KEY,
     snapshot_date DATE NOT NULL,
@@ -317,6 +359,7 @@ CREATE TABLE IF NOT EXISTS t_api_cardano (
     rate_limit INTEGER,
     rate_limit_per_minute INTEGER DEFAULT 60,
     timeout INTEGER,
+    sync_workers INTEGER DEFAULT 1,
     is_active BOOLEAN DEFAULT TRUE,
     notes TEXT,
     last_request_time TIMESTAMP WITH TIME ZONE,
@@ -333,6 +376,8 @@ CREATE TABLE IF NOT EXISTS t_cardano_assets (
     asset_name_hex TEXT,
     display_name TEXT,
     decimals INTEGER DEFAULT 0,
+    metadata_status TEXT,                          -- 'ok' | 'missing' (cache negativo)
+    metadata_checked_at TIMESTAMP WITH TIME ZONE,  -- última consulta ao CardanoScan
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     CONSTRAINT pk_cardano_assets PRIMARY KEY (policy_id, asset_name_hex)
 );
@@ -496,6 +541,193 @@ CREATE TRIGGER update_api_coingecko_updated_at
     FOR EACH ROW
     EXECUTE FUNCTION update_updated_at_column();
 
+-- Aplica uma variação de quantidade a t_daily_holdings (delta do dia + cumulative dos dias seguintes)
+CREATE OR REPLACE FUNCTION apply_daily_holdings_delta(p_account_id INT, p_asset_id INT, p_date DATE, p_qty NUMERIC)
+RETURNS VOID AS $$
+BEGIN
+    IF p_asset_id IS NULL OR p_qty IS NULL OR p_qty = 0 THEN
+        RETURN;
+    END IF;
+
+    INSERT INTO t_daily_holdings (account_id, asset_id, date, delta, cumulative)
+    VALUES (
+        p_account_id, p_asset_id, p_date, p_qty,
+        p_qty + COALESCE((
+            SELECT h.cumulative FROM t_daily_holdings h
+            WHERE h.account_id = p_account_id AND h.asset_id = p_asset_id AND h.date < p_date
+            ORDER BY h.date DESC
+            LIMIT 1
+        ), 0)
+    )
+    ON CONFLICT (account_id, asset_id, date)
+    DO UPDATE SET delta = t_daily_holdings.delta + EXCLUDED.delta,
+                  cumulative = t_daily_holdings.cumulative + EXCLUDED.delta;
+
+    UPDATE t_daily_holdings
+    SET cumulative = cumulative + p_qty
+    WHERE account_id = p_account_id AND asset_id = p_asset_id AND date > p_date;
+
+    -- Dias sem movimento líquido não precisam de linha (o cumulative seguinte já está correto)
+    DELETE FROM t_daily_holdings
+    WHERE account_id = p_account_id AND asset_id = p_asset_id AND date = p_date AND delta = 0;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Mantém t_daily_holdings em sincronia com t_transactions (modelo V2)
+CREATE OR REPLACE FUNCTION sync_daily_holdings()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM apply_daily_holdings_delta(COALESCE(OLD.to_account_id, OLD.account_id, -1),
+                                           OLD.to_asset_id, OLD.transaction_date::date, -OLD.to_quantity);
+        PERFORM apply_daily_holdings_delta(COALESCE(OLD.from_account_id, OLD.account_id, -1),
+                                           OLD.from_asset_id, OLD.transaction_date::date, OLD.from_quantity);
+        IF OLD.fee_quantity > 0 THEN
+            PERFORM apply_daily_holdings_delta(COALESCE(OLD.from_account_id, OLD.account_id, -1),
+                                               OLD.fee_asset_id, OLD.transaction_date::date, OLD.fee_quantity);
+        END IF;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM apply_daily_holdings_delta(COALESCE(NEW.to_account_id, NEW.account_id, -1),
+                                           NEW.to_asset_id, NEW.transaction_date::date, NEW.to_quantity);
+        PERFORM apply_daily_holdings_delta(COALESCE(NEW.from_account_id, NEW.account_id, -1),
+                                           NEW.from_asset_id, NEW.transaction_date::date, -NEW.from_quantity);
+        IF NEW.fee_quantity > 0 THEN
+            PERFORM apply_daily_holdings_delta(COALESCE(NEW.from_account_id, NEW.account_id, -1),
+                                               NEW.fee_asset_id, NEW.transaction_date::date, -NEW.fee_quantity);
+        END IF;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_transactions_daily_holdings ON t_transactions;
+CREATE TRIGGER trg_transactions_daily_holdings
+    AFTER INSERT OR UPDATE OR DELETE ON t_transactions
+    FOR EACH ROW
+    EXECUTE FUNCTION sync_daily_holdings();
+
+-- Recalcula a cobertura dos ativos indicados (uma agregação por ativo, via idx_price_snapshots_asset_date).
+-- Um advisory lock por ativo (pedido numa instrução própria, por ordem de asset_id) serializa escritores
+-- concorrentes: a agregação seguinte já vê as linhas que o anterior confirmou, sem perder atualizações.
+CREATE OR REPLACE FUNCTION refresh_price_snapshot_coverage(p_asset_ids INT[])
+RETURNS VOID AS $$
+DECLARE
+    v_asset_id INT;
+BEGIN
+    FOR v_asset_id IN SELECT DISTINCT unnest(p_asset_ids) ORDER BY 1 LOOP
+        PERFORM pg_advisory_xact_lock(7260002, v_asset_id);
+    END LOOP;
+
+    DELETE FROM t_price_snapshot_coverage c
+    WHERE c.asset_id = ANY(p_asset_ids)
+      AND NOT EXISTS (SELECT 1 FROM t_price_snapshots ps WHERE ps.asset_id = c.asset_id);
+
+    INSERT INTO t_price_snapshot_coverage (asset_id, first_date, last_date, row_count, gap_days, updated_at)
+    SELECT asset_id, MIN(snapshot_date), MAX(snapshot_date), COUNT(*),
+           (MAX(snapshot_date) - MIN(snapshot_date) + 1) - COUNT(*), CURRENT_TIMESTAMP
+    FROM t_price_snapshots
+    WHERE asset_id = ANY(p_asset_ids)
+    GROUP BY asset_id
+    ON CONFLICT (asset_id)
+    DO UPDATE SET first_date = EXCLUDED.first_date,
+                  last_date = EXCLUDED.last_date,
+                  row_count = EXCLUDED.row_count,
+                  gap_days = EXCLUDED.gap_days,
+                  updated_at = EXCLUDED.updated_at;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Trigger de instrução: um recálculo por ativo tocado, mesmo em COPY/INSERT em bulk
+CREATE OR REPLACE FUNCTION sync_price_snapshot_coverage()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM refresh_price_snapshot_coverage(ARRAY(SELECT DISTINCT asset_id FROM old_rows));
+    ELSIF TG_OP = 'UPDATE' THEN
+        PERFORM refresh_price_snapshot_coverage(ARRAY(SELECT asset_id FROM old_rows
+                                                      UNION SELECT asset_id FROM new_rows));
+    ELSE
+        PERFORM refresh_price_snapshot_coverage(ARRAY(SELECT DISTINCT asset_id FROM new_rows));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_price_snapshots_coverage_ins ON t_price_snapshots;
+CREATE TRIGGER trg_price_snapshots_coverage_ins
+    AFTER INSERT ON t_price_snapshots
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION sync_price_snapshot_coverage();
+
+DROP TRIGGER IF EXISTS trg_price_snapshots_coverage_upd ON t_price_snapshots;
+CREATE TRIGGER trg_price_snapshots_coverage_upd
+    AFTER UPDATE ON t_price_snapshots
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION sync_price_snapshot_coverage();
+
+DROP TRIGGER IF EXISTS trg_price_snapshots_coverage_del ON t_price_snapshots;
+CREATE TRIGGER trg_price_snapshots_coverage_del
+    AFTER DELETE ON t_price_snapshots
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION sync_price_snapshot_coverage();
+
+-- Escritas com data D em movimentos, transações, shares ou preços tornam obsoletos os dias >= D de
+-- t_fund_nav_daily; o próximo update_fund_nav_daily() recalcula-os. TG_ARGV[0] = coluna de data.
+CREATE OR REPLACE FUNCTION trim_fund_nav_daily()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_from DATE;
+    v_old DATE;
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        EXECUTE format('SELECT MIN(%I)::date FROM new_rows', TG_ARGV[0]) INTO v_from;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        EXECUTE format('SELECT MIN(%I)::date FROM old_rows', TG_ARGV[0]) INTO v_old;
+        v_from := LEAST(v_from, v_old);
+    END IF;
+    IF v_from IS NOT NULL THEN
+        DELETE FROM t_fund_nav_daily WHERE nav_date >= v_from;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Triggers de instrução (transition tables só admitem um evento por trigger)
+DO $$
+DECLARE
+    src RECORD;
+BEGIN
+    FOR src IN
+        SELECT * FROM (VALUES
+            ('t_user_capital_movements', 'capital_movements', 'movement_date'),
+            ('t_transactions', 'transactions', 'transaction_date'),
+            ('t_user_shares', 'user_shares', 'movement_date'),
+            ('t_price_snapshots', 'price_snapshots', 'snapshot_date')
+        ) AS v(tbl, short_name, date_col)
+    LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', 'trg_' || src.short_name || '_fund_nav_ins', src.tbl);
+        EXECUTE format('CREATE TRIGGER %I AFTER INSERT ON %I REFERENCING NEW TABLE AS new_rows '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION trim_fund_nav_daily(%L)',
+                       'trg_' || src.short_name || '_fund_nav_ins', src.tbl, src.date_col);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', 'trg_' || src.short_name || '_fund_nav_upd', src.tbl);
+        EXECUTE format('CREATE TRIGGER %I AFTER UPDATE ON %I REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION trim_fund_nav_daily(%L)',
+                       'trg_' || src.short_name || '_fund_nav_upd', src.tbl, src.date_col);
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', 'trg_' || src.short_name || '_fund_nav_del', src.tbl);
+        EXECUTE format('CREATE TRIGGER %I AFTER DELETE ON %I REFERENCING OLD TABLE AS old_rows '
+                       'FOR EACH STATEMENT EXECUTE FUNCTION trim_fund_nav_daily(%L)',
+                       'trg_' || src.short_name || '_fund_nav_del', src.tbl, src.date_col);
+    END LOOP;
+END;
+$$;
+
 -- ========================================
 -- ÍNDICES
 -- ========================================
@@ -517,6 +749,7 @@ CREATE INDEX IF NOT EXISTS idx_transactions_from_asset ON t_transactions(from_as
 CREATE INDEX IF NOT EXISTS idx_transactions_to_asset ON t_transactions(to_asset_id);
 CREATE INDEX IF NOT EXISTS idx_transactions_from_account ON t_transactions(from_account_id);
 CREATE INDEX IF NOT EXISTS idx_transactions_to_account ON t_transactions(to_account_id);
+CREATE INDEX IF NOT EXISTS idx_daily_holdings_date ON t_daily_holdings(date);
 CREATE INDEX IF NOT EXISTS idx_transactions_fee_asset ON t_transactions(fee_asset_id);
 
 -- Preços
@@ -580,6 +813,7 @@ COMMENT ON TABLE t_api_coingecko IS 'Configurações de API do CoinGecko para pr
 COMMENT ON COLUMN t_api_cardano.api_key IS 'Chave de API (sensível - deve ser encriptada)';
 COMMENT ON COLUMN t_api_cardano.default_address IS 'Endereço padrão usado nas consultas';
 COMMENT ON COLUMN t_api_cardano.rate_limit IS 'Limite de requests por minuto';
+COMMENT ON COLUMN t_api_cardano.sync_workers IS 'Número de wallets sincronizadas em paralelo (1 = sequencial)';
 
 -- Wallets e Bancos
 COMMENT ON TABLE t_wallet IS 'Gestão de wallets dos utilizadores (hot, cold, hardware)';
@@ -594,6 +828,7 @@ COMMENT ON COLUMN t_banco.account_type IS 'Tipo de conta: checking (à ordem), s
 -- Cardano
 COMMENT ON TABLE t_cardano_transactions IS 'Raw Cardano transactions per tracked wallet. Same tx_hash can appear multiple times for different wallets (e.g., inter-wallet transfers).';
 COMMENT ON TABLE t_cardano_tx_io IS 'Per-IO breakdown for tracked wallet address; ADA in lovelace, tokens by policy/asset_name.';
+COMMENT ON TABLE t_daily_holdings IS 'Daily per-account/asset quantity deltas and running balances (V2 ledger), maintained by trigger.';
 COMMENT ON TABLE t_cardano_assets IS 'Resolved metadata for Cardano native tokens (name/decimals).';
 COMMENT ON TABLE t_cardano_sync_state IS 'Incremental sync state for Cardano wallets.';
 
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark do writer de transações Cardano (t_cardano_transactions / t_cardano_tx_io).
+
+Gera transações sintéticas para uma wallet existente e mede linhas/segundo com:
+- page_size=1     → um INSERT por linha (equivalente ao caminho antigo, linha a linha)
+- page_size=1000  → execute_values em lotes (CardanoBatchWriter)
+
+Tudo corre dentro de uma transação que é revertida no fim (não deixa dados na BD).
+
+Uso:
+    python debug_scripts/benchmark_cardano_writer.py --wallet-id 1 --txs 2000 --tokens 3
+"""
+import argparse
+import os
+import sys
+import time
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from database.connection import get_connection, return_connection
+from services.cardano_sync import CardanoBatchWriter
+
+WALLET_HEX = "00deadbeef"
+
+
+class _OfflineApi:
+    """Substituto do CardanoScanAPI sem chamadas HTTP."""
+
+    def _convert_to_hex(self, address):
+        return WALLET_HEX
+
+    def get_token_name(self, token):
+        return f"TK{token.get('assetName', '')[-4:]}"
+
+    def _resolve_decimals(self, policy_id, token_name, asset_name_hex=None):
+        return 6
+
+
+def _synthetic_transactions(n_txs: int, n_tokens: int):
+    txs = []
+    for i in range(n_txs):
+        tokens = [
+            {"policyId": f"{'ab' * 28}", "assetName": f"{j:08x}", "value": str(1_000_000 + i)}
+            for j in range(n_tokens)
+        ]
+        txs.append({
+            "hash": f"bench{i:060d}",
+            "timestamp": 1_700_000_000 + i * 60,
+            "fees": 0.17,
+            "block_height": 9_000_000 + i,
+            "status": True,
+            "inputs": [{"address": WALLET_HEX, "value": "5000000", "tokens": tokens}],
+            "outputs": [{"address": WALLET_HEX, "value": "4800000", "tokens": tokens}],
+        })
+    return txs
+
+
+def _run(wallet_id: int, txs, page_size: int):
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        writer = CardanoBatchWriter(wallet_id, "addr_bench", _OfflineApi(), page_size=page_size)
+        t0 = time.perf_counter()
+        for tx in txs:
+            writer.add_transaction(tx)
+        counts = writer.flush(cur)
+        elapsed = time.perf_counter() - t0
+        rows = counts["transactions"] + counts["io_rows"] + counts["assets"]
+        return rows, elapsed
+    finally:
+        conn.rollback()
+        return_connection(conn)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do writer Cardano (linhas/s)")
+    parser.add_argument("--wallet-id", type=int, required=True, help="wallet_id existente (FK)")
+    parser.add_argument("--txs", type=int, default=2000, help="Número de transações sintéticas")
+    parser.add_argument("--tokens", type=int, default=3, help="Tokens por IO")
+    args = parser.parse_args()
+
+    txs = _synthetic_transactions(args.txs, args.tokens)
+    print(f"Transações: {len(txs)} | tokens por IO: {args.tokens}")
+    for label, page_size in (("linha a linha (page_size=1)", 1), ("execute_values (page_size=1000)", 1000)):
+        rows, elapsed = _run(args.wallet_id, txs, page_size)
+        print(f"{label:35s} {rows:8d} linhas em {elapsed:7.2f}s → {rows / elapsed:10.0f} linhas/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 ﻿import streamlit as st
 import pandas as pd
-from services.cardano_api import CardanoScanAPI
+from services.cardano_api import CardanoScanAPI, get_endpoint_latency_stats
+from services.single_flight import get_single_flight_stats
 from datetime import datetime
 from database.api_config import get_active_apis
 
@@ -395,3 +396,18 @@ def show_info_tab(address):
         
         **Status:** 🟢 Conectado
         """)
+    
+    latency = get_endpoint_latency_stats()
+    if latency:
+        with st.expander("📶 Latência por endpoint (sessão HTTP partilhada)"):
+            df_lat = pd.DataFrame.from_dict(latency, orient="index").rename_axis("Endpoint").reset_index()
+            df_lat = df_lat.rename(columns={
+                "count": "Pedidos", "errors": "Erros", "avg_ms": "Média (ms)", "max_ms": "Máx (ms)"
+            })
+            st.dataframe(df_lat, use_container_width=True, hide_index=True)
+            flight = get_single_flight_stats().get("cardanoscan")
+            if flight:
+                st.caption(
+                    f"🔗 Pedidos idênticos coalescidos: {flight['saved']} poupados "
+                    f"({flight['executed']} executados)"
+                )
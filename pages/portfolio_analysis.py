@@ -1,6 +1,7 @@
 import time
 from datetime import date
 
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
@@ -9,6 +10,8 @@ import streamlit as st
 from auth.session_manager import require_auth
 from css.charts import apply_theme
 from database.connection import get_connection, return_connection, get_engine
+from services.holdings import get_daily_deltas
+from services.price_refresher import get_latest_prices, get_latest_prices_with_age
 from utils.tags import ensure_default_tags, get_all_tags, build_tags_where_clause
 
 # Cache TTL for reference data (in seconds)
@@ -211,6 +214,9 @@ def show():
         else:
             df_mov = pd.DataFrame()  # Fallback
         
+        # Período escolhido nos filtros (None sem movimentos: histórico completo)
+        start_date = end_date = None
+        
         # Se não houver movimentos, mostrar aviso
         if df_mov.empty:
             st.info("ℹ️ Ainda não há movimentos registados.")
@@ -304,7 +310,6 @@ def show():
 
                         # Calcular Saldo Atual evolutivo usando SEMPRE preços de hoje para holdings
                         try:
-                            from services.coingecko import get_price_by_symbol
                             from datetime import date as date_cls
                             
                             # Preparar filtros globais V2
@@ -316,29 +321,33 @@ def show():
                             extra_sql = (" AND " + " AND ".join(extras)) if extras else ""
 
                             # Deltas diários por ativo (V2): inflow (to), outflow (from), fees
-                            df_deltas = pd.read_sql(
-                                f"""
-                                WITH deltas AS (
-                                    SELECT t.transaction_date::date AS date, t.to_asset_id AS asset_id, t.to_quantity AS qty
-                                    FROM t_transactions t
-                                    WHERE t.to_asset_id IS NOT NULL AND t.transaction_date::date <= %s {extra_sql}
-                                    UNION ALL
-                                    SELECT t.transaction_date::date, t.from_asset_id, -t.from_quantity
-                                    FROM t_transactions t
-                                    WHERE t.from_asset_id IS NOT NULL AND t.transaction_date::date <= %s {extra_sql}
-                                    UNION ALL
-                                    SELECT t.transaction_date::date, t.fee_asset_id, -t.fee_quantity
-                                    FROM t_transactions t
-                                    WHERE t.fee_asset_id IS NOT NULL AND t.fee_quantity > 0 AND t.transaction_date::date <= %s {extra_sql}
+                            if not extra_sql:
+                                # Sem filtros: deltas pré-agregados em t_daily_holdings
+                                df_deltas = get_daily_deltas(engine, end_date)
+                            else:
+                                df_deltas = pd.read_sql(
+                                    f"""
+                                    WITH deltas AS (
+                                        SELECT t.transaction_date::date AS date, t.to_asset_id AS asset_id, t.to_quantity AS qty
+                                        FROM t_transactions t
+                                        WHERE t.to_asset_id IS NOT NULL AND t.transaction_date::date <= %s {extra_sql}
+                                        UNION ALL
+                                        SELECT t.transaction_date::date, t.from_asset_id, -t.from_quantity
+                                        FROM t_transactions t
+                                        WHERE t.from_asset_id IS NOT NULL AND t.transaction_date::date <= %s {extra_sql}
+                                        UNION ALL
+                                        SELECT t.transaction_date::date, t.fee_asset_id, -t.fee_quantity
+                                        FROM t_transactions t
+                                        WHERE t.fee_asset_id IS NOT NULL AND t.fee_quantity > 0 AND t.transaction_date::date <= %s {extra_sql}
+                                    )
+                                    SELECT d.date, d.asset_id, SUM(d.qty) AS delta_qty
+                                    FROM deltas d
+                                    GROUP BY d.date, d.asset_id
+                                    ORDER BY d.date
+                                    """,
+                                    engine,
+                                    params=(end_date, end_date, end_date)
                                 )
-                                SELECT d.date, d.asset_id, SUM(d.qty) AS delta_qty
-                                FROM deltas d
-                                GROUP BY d.date, d.asset_id
-                                ORDER BY d.date
-                                """,
-                                engine,
-                                params=(end_date, end_date, end_date)
-                            )
 
                             # Mapear asset_id -> symbol (with caching)
                             cache_key = "assets_mapping"
@@ -416,46 +425,10 @@ def show():
                             if not all_dates:
                                 raise ValueError("Sem datas para calcular evolução")
                             
-                            # PRÉ-FETCH: Buscar TODOS os preços históricos de UMA VEZ para evitar rate limit
-                            from services.snapshots import get_historical_prices_by_symbol
-                            
-                            # Criar cache de preços: {date: {symbol: price}}
-                            prices_cache = {}
-                            if unique_symbols:
-                                # Mostrar progresso
-                                total_dates = len(all_dates)
-                                progress_text = st.empty()
-                                progress_bar = st.progress(0.0)
-                                info_text = st.empty()
-                                
-                                # Batch process dates in groups to reduce UI updates
-                                # Update UI ~20 times total for optimal responsiveness
-                                # (More frequent = slower, less frequent = feels unresponsive)
-                                batch_size = max(1, total_dates // 20)
-                                
-                                for idx, calc_date in enumerate(all_dates):
-                                    # Only update UI every batch_size iterations
-                                    if idx % batch_size == 0 or idx == total_dates - 1:
-                                        progress_text.text(f"🔄 A carregar preços históricos... {idx+1}/{total_dates} datas")
-                                        progress_bar.progress((idx + 1) / total_dates)
-                                    
-                                    prices = get_historical_prices_by_symbol(unique_symbols, calc_date)
-                                    prices_cache[calc_date] = prices
-                                    
-                                    # Informar se buscou da BD ou API (less frequent updates)
-                                    if idx % batch_size == 0 and prices:
-                                        info_text.text(f"✅ {calc_date}: {len(prices)} preços carregados (BD local + CoinGecko se necessário)")
-                                
-                                # Limpar mensagens de progresso
-                                progress_text.empty()
-                                progress_bar.empty()
-                                info_text.empty()
-                            
-                            saldo_evolution = []
-
                             # Construir matriz de deltas por símbolo e acumular ao longo do tempo
                             if not df_deltas.empty:
                                 df_deltas['date'] = pd.to_datetime(df_deltas['date'])
+                                df_deltas['delta_qty'] = df_deltas['delta_qty'].astype(float)
                                 pivot = (
                                     df_deltas.pivot_table(index='date', columns='symbol', values='delta_qty', aggfunc='sum')
                                     .fillna(0.0)
@@ -467,34 +440,40 @@ def show():
                             else:
                                 cum_holdings = pd.DataFrame(index=pd.to_datetime(all_dates))
 
-                            # Calcular saldo para cada data usando preços DESSA DATA (snapshots)
-                            for calc_date in all_dates:
-                                # Caixa (depósitos - levantamentos) até esta data
-                                cap_until = df_all_cap[df_all_cap["date"] <= calc_date]
-                                cash_from_cap = cap_until["credit"].sum() - cap_until["debit"].sum()
-
-                                # EUR em contas (das transações) até esta data
-                                eur_qty = 0.0
-                                if 'EUR' in cum_holdings.columns:
-                                    # Use asof-aligned cumulative holdings
-                                    eur_qty = float(cum_holdings.loc[pd.to_datetime(calc_date), 'EUR']) if pd.to_datetime(calc_date) in cum_holdings.index else 0.0
-
-                                # Valor de cripto (excluindo EUR) nesta data
-                                holdings_value = 0.0
-                                if not cum_holdings.empty:
-                                    historical_prices = prices_cache.get(calc_date, {})
-                                    if historical_prices:
-                                        row = cum_holdings.loc[pd.to_datetime(calc_date)] if pd.to_datetime(calc_date) in cum_holdings.index else None
-                                        if row is not None:
-                                            for sym, qty in row.items():
-                                                if sym == 'EUR':
-                                                    continue
-                                                price = historical_prices.get(sym)
-                                                if price:
-                                                    holdings_value += float(qty) * float(price)
-
-                                # Saldo = caixa de movimentos + EUR em contas + valor cripto
-                                saldo_evolution.append(cash_from_cap + eur_qty + holdings_value)
+                            # PRÉ-FETCH: matriz data × símbolo com TODOS os preços históricos numa só query
+                            # (as-of: dias sem snapshot usam o último preço dentro da janela, sem ir à API)
+                            from services.snapshots import get_historical_price_matrix
+
+                            crypto_symbols = [s for s in cum_holdings.columns if s != 'EUR']
+                            if crypto_symbols:
+                                with st.spinner(f"🔄 A carregar preços históricos ({len(all_dates)} datas × {len(crypto_symbols)} ativos)..."):
+                                    price_matrix = get_historical_price_matrix(crypto_symbols, all_dates, asof=True)
+                            else:
+                                price_matrix = pd.DataFrame(index=pd.to_datetime(all_dates))
+
+                            # Caixa (depósitos - levantamentos) acumulada até cada data
+                            if not df_all_cap.empty:
+                                cap_net = (df_all_cap["credit"].astype(float) - df_all_cap["debit"].astype(float)).groupby(pd.to_datetime(df_all_cap["date"])).sum().sort_index().cumsum()
+                                cash_from_cap = cap_net.reindex(pd.to_datetime(all_dates), method='ffill').fillna(0.0).to_numpy()
+                            else:
+                                cash_from_cap = np.zeros(len(all_dates))
+
+                            # EUR em contas (das transações) até cada data
+                            eur_qty = cum_holdings['EUR'].to_numpy(dtype=float) if 'EUR' in cum_holdings.columns else np.zeros(len(all_dates))
+
+                            # Valor de cripto (excluindo EUR) usando preços DE CADA DATA: produto vetorizado holdings × preços
+                            if crypto_symbols:
+                                holdings_value = (
+                                    (cum_holdings[crypto_symbols] * price_matrix.reindex(index=cum_holdings.index, columns=crypto_symbols))
+                                    .fillna(0.0)
+                                    .sum(axis=1)
+                                    .to_numpy()
+                                )
+                            else:
+                                holdings_value = np.zeros(len(all_dates))
+
+                            # Saldo = caixa de movimentos + EUR em contas + valor cripto
+                            saldo_evolution = (cash_from_cap + eur_qty + holdings_value).tolist()
                             
                             # Alinhar séries acumuladas (depósitos/levantamentos) às datas de eventos (forward-fill)
                             df_dates = pd.DataFrame({"date": pd.to_datetime(all_dates)})
@@ -565,13 +544,16 @@ def show():
                         st.plotly_chart(fig_portfolio, use_container_width=True)
 
                 # Calcular SALDO ATUAL com preços de HOJE (para as métricas)
+                today_price_ages = {}
                 try:
                     if 'total_credit' in locals() and 'total_debit' in locals():
                         # Buscar preços de HOJE
                         unique_symbols_today = unique_symbols if 'unique_symbols' in locals() else []
                         today_prices = {}
                         if unique_symbols_today:
-                            today_prices = get_price_by_symbol(unique_symbols_today, vs_currency='eur')
+                            prices_with_age = get_latest_prices_with_age(unique_symbols_today)
+                            today_prices = {s: p for s, (p, _) in prices_with_age.items()}
+                            today_price_ages = {s: a for s, (_, a) in prices_with_age.items() if a is not None}
 
                         # Caixa de movimentos (depósitos - levantamentos)
                         cash_from_cap = total_credit - total_debit
@@ -659,6 +641,12 @@ def show():
                                     "% do Portfólio": st.column_config.NumberColumn(format="%.2f%%")
                                 }
                             )
+                            if today_price_ages:
+                                oldest = max(today_price_ages.values())
+                                st.caption(
+                                    f"🕒 Preços de há {int(oldest // 60)} min {int(oldest % 60)} s "
+                                    "(atualizados em background)"
+                                )
                         else:
                             st.info("📭 Nenhum ativo em carteira no momento.")
                         
@@ -683,7 +671,12 @@ def show():
                     cond_prefix = " AND " if v2_where else " WHERE "
 
                     # Query de holdings por conta (V2), incluindo Banco quando não há conta (account_id = -1)
-                    df_holdings_acc = pd.read_sql(f"""
+                    # Sem filtros, o saldo por conta/ativo vem do último cumulative de t_daily_holdings
+                    agg_sql = """
+                        SELECT DISTINCT ON (account_id, asset_id) account_id, asset_id, cumulative AS qty
+                        FROM t_daily_holdings
+                        ORDER BY account_id, asset_id, date DESC
+                    """ if not v2_where else f"""
                         WITH inflows AS (
                             SELECT COALESCE(t.to_account_id, t.account_id, -1) AS account_id, t.to_asset_id AS asset_id, SUM(t.to_quantity) AS qty
                             FROM t_transactions t
@@ -708,11 +701,13 @@ def show():
                             SELECT account_id, asset_id, 0, SUM(qty), 0 FROM outflows GROUP BY 1,2
                             UNION ALL
                             SELECT account_id, asset_id, 0, 0, SUM(qty) FROM fees GROUP BY 1,2
-                        ), agg AS (
-                            SELECT account_id, asset_id, SUM(inflow) - SUM(outflow) - SUM(fee) AS qty
-                            FROM combined
-                            GROUP BY 1,2
                         )
+                        SELECT account_id, asset_id, SUM(inflow) - SUM(outflow) - SUM(fee) AS qty
+                        FROM combined
+                        GROUP BY 1,2
+                    """
+                    df_holdings_acc = pd.read_sql(f"""
+                        WITH agg AS ({agg_sql})
                         SELECT 
                             ass.symbol AS "Ativo",
                             COALESCE(ex.name, 'Banco') AS "Exchange",
@@ -817,7 +812,7 @@ def show():
                     else:
                         # Preços de hoje para valorização
                         syms = sorted(df_tag_tx['symbol'].unique().tolist())
-                        price_map = get_price_by_symbol(syms, vs_currency='eur') if syms else {}
+                        price_map = get_latest_prices(syms) if syms else {}
 
                         # Calcular por tag (cashflow)
                         rows = []
@@ -884,7 +879,8 @@ def show():
             
             if shares_table_exists:
                 # Usar sistema de shares (NAV-based ownership)
-                from services.shares import get_all_users_ownership, calculate_nav_per_share, get_total_shares_in_circulation, calculate_fund_nav
+                from services.fund_nav import update_fund_nav_daily
+                from services.shares import get_all_users_ownership, get_fund_nav_history, get_nav_snapshot
                 
                 try:
                     ownership_data = get_all_users_ownership()
@@ -907,18 +903,16 @@ def show():
                         medals = ["🥇", "🥈", "🥉"][:num_rows] + [""] * max(0, num_rows - 3)
                         df_top.insert(0, "🏅", medals)
                         
-                        # Mostra métricas do fundo
+                        # Mostra métricas do fundo (mesma avaliação de NAV usada na tabela)
+                        nav = get_nav_snapshot()
                         col1, col2, col3 = st.columns(3)
                         with col1:
-                            nav_per_share = calculate_nav_per_share()
-                            st.metric("📊 NAV por Share", f"€{nav_per_share:.4f}")
+                            st.metric("📊 NAV por Share", f"€{nav.nav_per_share:.4f}")
                         with col2:
-                            total_shares = get_total_shares_in_circulation()
-                            st.metric("🔢 Total Shares", f"{total_shares:.2f}")
+                            st.metric("🔢 Total Shares", f"{nav.total_shares:.2f}")
                         with col3:
-                            # Mostrar NAV total do fundo calculado diretamente (caixa + cripto)
-                            fund_total = calculate_fund_nav()
-                            st.metric("💰 NAV Total Fundo", f"€{fund_total:,.2f}")
+                            # NAV total do fundo (caixa + cripto)
+                            st.metric("💰 NAV Total Fundo", f"€{nav.fund_nav:,.2f}")
                         
                         # Mostra tabela
                         st.dataframe(
@@ -951,6 +945,29 @@ def show():
                             )
                             fig_pie = apply_theme(fig_pie)
                             st.plotly_chart(fig_pie, use_container_width=True)
+                        
+                        # Evolução do NAV/share (t_fund_nav_daily: só os dias novos são calculados,
+                        # no máximo uma vez por CACHE_TTL_LONG e não a cada rerun)
+                        try:
+                            refresh_time_key = "fund_nav_daily_refresh_time"
+                            if time.time() - st.session_state.get(refresh_time_key, 0) >= CACHE_TTL_LONG:
+                                update_fund_nav_daily()
+                                st.session_state[refresh_time_key] = time.time()
+                            nav_history = get_fund_nav_history(start_date, end_date)
+                            if nav_history:
+                                df_nav = pd.DataFrame(nav_history)
+                                df_nav['nav_per_share'] = df_nav['nav_per_share'].astype(float)
+                                fig_nav = px.line(
+                                    df_nav,
+                                    x='nav_date',
+                                    y='nav_per_share',
+                                    title='Evolução do NAV por Share',
+                                    labels={'nav_date': 'Data', 'nav_per_share': 'NAV/Share (€)'},
+                                )
+                                fig_nav = apply_theme(fig_nav)
+                                st.plotly_chart(fig_nav, use_container_width=True)
+                        except Exception as e:
+                            st.caption(f"ℹ️ Histórico de NAV indisponível: {e}")
                     else:
                         st.info("ℹ️ Ainda não há utilizadores com shares no fundo.")
                         
@@ -11,7 +11,7 @@ from database.connection import get_engine
 from database.wallets import get_active_wallets
 from services.cardano_sync import sync_all_cardano_wallets_for_user
 from database.api_config import get_active_apis
-from services.snapshots import get_historical_prices_by_symbol
+from services.snapshots import get_historical_prices_by_symbol, get_historical_price_matrix
 from services.cardano_api import CardanoScanAPI
 
 
@@ -99,7 +99,10 @@ def show():
         else:
             with st.spinner("A sincronizar wallets (Cardano)…"):
                 res = sync_all_cardano_wallets_for_user(user_id=user_id, max_pages=max_pages, wallet_ids=selected_wallet_ids)
-            st.success(f"Sync concluído: {res.get('synced', 0)}/{res.get('wallets', 0)} wallets, {res.get('io_rows', 0)} linhas IO no DB")
+            st.success(
+                f"Sync concluído: {res.get('synced', 0)}/{res.get('wallets', 0)} wallets, {res.get('io_rows', 0)} linhas IO no DB "
+                f"({res.get('tx_skipped', 0)} tx já existentes, {res.get('pages_skipped', 0)} páginas saltadas)"
+            )
             errs = res.get('errors') or []
             for err in errs[:5]:
                 st.warning(f"Wallet {err.get('wallet_id')} ({(err.get('address') or '')[:12]}…): {err.get('error')}")
@@ -277,9 +280,12 @@ def show():
     # Preços históricos por data/símbolo (CoinGecko snapshots)
     symbols = [c for c in (list(cum_holdings.columns) if not cum_holdings.empty else []) if c != "EUR"]
     prices_cache = {}
-    for d in all_dates:
-        # Evitar chamadas excessivas à CoinGecko: só usa snapshots já existentes em BD
-        prices_cache[d] = get_historical_prices_by_symbol(symbols, d, allow_api_fallback=False) if symbols else {}
+    if symbols:
+        # Evitar chamadas excessivas à CoinGecko: só usa snapshots já existentes em BD,
+        # numa única query e com resolução as-of para dias sem snapshot
+        price_matrix = get_historical_price_matrix(symbols, all_dates, allow_api_fallback=False, asof=True)
+        for d in all_dates:
+            prices_cache[d] = price_matrix.loc[pd.Timestamp(d)].dropna().to_dict()
 
     # Preparar forward-fill de preços históricos por símbolo para datas sem snapshot
     last_price_by_symbol = {s: None for s in symbols}
@@ -353,7 +359,7 @@ def show():
     cash_balance = total_credit - total_debit
 
     # Holdings atuais (preço de hoje) - usar snapshots da BD para evitar chamadas API
-    today_prices = get_historical_prices_by_symbol(symbols, date.today(), allow_api_fallback=False) if symbols else {}
+    today_prices = get_historical_prices_by_symbol(symbols, date.today(), allow_api_fallback=False, asof=True) if symbols else {}
     crypto_value_today = 0.0
     if not cum_holdings.empty and len(cum_holdings) > 0:
         last_row = cum_holdings.iloc[-1]
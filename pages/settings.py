@@ -339,7 +339,8 @@ def show_settings_page():
     # ========================================
     with tab8:
         from datetime import date, timedelta
-        from services.snapshots import populate_snapshots_for_period, update_latest_prices
+        from services.snapshot_backfill import plan_missing_ranges
+        from services.snapshots import get_snapshot_coverage, populate_snapshots_for_period, update_latest_prices
         
         st.subheader("📸 Gestão de Snapshots de Preços")
         
@@ -350,28 +351,34 @@ def show_settings_page():
         - Manter um histórico de preços local para análise
         """)
         
-        # Estatísticas dos snapshots
-        df_stats = pd.read_sql("""
-            SELECT 
-                COUNT(DISTINCT asset_id) as num_assets,
-                COUNT(*) as num_snapshots,
-                MIN(snapshot_date) as first_date,
-                MAX(snapshot_date) as last_date
-            FROM t_price_snapshots
-        """, engine)
+        # Estatísticas dos snapshots (t_price_snapshot_coverage: uma linha por ativo)
+        df_coverage = get_snapshot_coverage()
         
-        if not df_stats.empty and df_stats.iloc[0]['num_snapshots'] > 0:
+        if not df_coverage.empty and df_coverage['row_count'].sum() > 0:
             col1, col2, col3, col4 = st.columns(4)
             with col1:
-                st.metric("Ativos", df_stats.iloc[0]['num_assets'])
+                st.metric("Ativos", len(df_coverage))
             with col2:
-                st.metric("Total Snapshots", df_stats.iloc[0]['num_snapshots'])
+                st.metric("Total Snapshots", int(df_coverage['row_count'].sum()))
             with col3:
-                first = df_stats.iloc[0]['first_date']
+                first = df_coverage['first_date'].min()
                 st.metric("Primeira Data", first.strftime("%Y-%m-%d") if first else "—")
             with col4:
-                last = df_stats.iloc[0]['last_date']
+                last = df_coverage['last_date'].max()
                 st.metric("Última Data", last.strftime("%Y-%m-%d") if last else "—")
+            
+            with st.expander("📊 Cobertura por ativo"):
+                st.dataframe(
+                    df_coverage.rename(columns={
+                        "symbol": "Ativo",
+                        "first_date": "Primeira Data",
+                        "last_date": "Última Data",
+                        "row_count": "Snapshots",
+                        "gap_days": "Dias em falta",
+                    }).drop(columns=["asset_id"]),
+                    use_container_width=True,
+                    hide_index=True,
+                )
         else:
             st.info("📭 Ainda não há snapshots de preços guardados.")
         
@@ -417,6 +424,19 @@ def show_settings_page():
         
         days_diff = (end_date_snap - start_date_snap).days + 1
         st.caption(f"⏱️ Serão processados {days_diff} dias de dados históricos.")
+        # Calculado só a pedido (lê t_price_snapshots do período), não em cada rerun da página
+        if st.button("🔍 Ver Snapshots em Falta", use_container_width=True, key="snap_plan_gaps"):
+            try:
+                df_cg_assets = pd.read_sql("SELECT asset_id FROM t_assets WHERE coingecko_id IS NOT NULL", engine)
+                gaps = plan_missing_ranges(df_cg_assets['asset_id'].astype(int).tolist(), start_date_snap, end_date_snap)
+                if gaps:
+                    n_days = sum((end - start).days + 1 for ranges in gaps.values() for start, end in ranges)
+                    n_ranges = sum(len(ranges) for ranges in gaps.values())
+                    st.caption(f"🕳️ Em falta no período: {n_days} snapshots em {n_ranges} intervalos ({len(gaps)} ativos)")
+                else:
+                    st.caption("✅ Sem snapshots em falta no período.")
+            except Exception as e:
+                st.caption(f"ℹ️ Não foi possível calcular os snapshots em falta: {e}")
         
         if st.button("📸 Preencher Snapshots", use_container_width=True, type="secondary"):
             if days_diff > 365:
@@ -424,8 +444,12 @@ def show_settings_page():
             
             with st.spinner(f"Preenchendo snapshots de {start_date_snap} a {end_date_snap}..."):
                 try:
-                    populate_snapshots_for_period(start_date_snap, end_date_snap)
-                    st.success(f"✅ Snapshots preenchidos com sucesso para {days_diff} dias!")
+                    stats = populate_snapshots_for_period(start_date_snap, end_date_snap) or {}
+                    st.success(
+                        f"✅ Snapshots preenchidos para {days_diff} dias: "
+                        f"{stats.get('written', 0)}/{stats.get('missing', 0)} em falta gravados "
+                        f"em {stats.get('requests', 0)} chamadas à API"
+                    )
                     st.rerun()
                 except Exception as e:
                     st.error(f"❌ Erro ao preencher snapshots: {e}")
@@ -791,6 +815,7 @@ def show_api_cardano_settings():
     from database.api_config import (
         get_all_apis, create_api, update_api, delete_api, toggle_api_status
     )
+    from services.cardano_sync import MAX_SYNC_WORKERS
     
     st.subheader("🔌 Gestão de APIs Cardano")
     
@@ -801,7 +826,7 @@ def show_api_cardano_settings():
         df_apis = pd.DataFrame(apis)
         
         display_cols = ['api_id', 'api_name', 'base_url', 'is_active', 
-                       'rate_limit', 'timeout', 'default_address']
+                       'rate_limit', 'timeout', 'sync_workers', 'default_address']
         display_df = df_apis[display_cols].copy()
         display_df['is_active'] = display_df['is_active'].map({True: '✅', False: '❌'})
         display_df['default_address'] = display_df['default_address'].apply(
@@ -815,6 +840,7 @@ def show_api_cardano_settings():
             'is_active': 'Ativo',
             'rate_limit': 'Rate Limit',
             'timeout': 'Timeout',
+            'sync_workers': 'Wallets em paralelo',
             'default_address': 'Endereço Padrão'
         })
         
@@ -835,11 +861,14 @@ def show_api_cardano_settings():
             base_url = st.text_input("URL Base *", placeholder="https://api.cardanoscan.io/api/v1")
             default_address = st.text_input("Endereço Padrão", placeholder="addr1...")
             
-            col_a, col_b = st.columns(2)
+            col_a, col_b, col_c = st.columns(3)
             with col_a:
                 rate_limit = st.number_input("Rate Limit (req/min)", min_value=0, value=60)
             with col_b:
                 timeout = st.number_input("Timeout (segundos)", min_value=1, value=10)
+            with col_c:
+                sync_workers = st.number_input("Wallets em paralelo", min_value=1, max_value=MAX_SYNC_WORKERS, value=1,
+                                               help="Número de wallets sincronizadas em simultâneo")
             
             is_active = st.checkbox("API Ativa", value=True)
             notes = st.text_area("Notas", placeholder="Observações sobre a API")
@@ -858,7 +887,8 @@ def show_api_cardano_settings():
                         default_address=default_address if default_address else None,
                         rate_limit=rate_limit if rate_limit > 0 else None,
                         timeout=timeout,
-                        notes=notes if notes else None
+                        notes=notes if notes else None,
+                        sync_workers=int(sync_workers)
                     )
                     
                     if success:
@@ -923,6 +953,8 @@ def show_api_cardano_settings():
                                                       value=api_data.get('default_address') or '')
                     edit_timeout = st.number_input("Timeout", min_value=1, 
                                                    value=api_data.get('timeout', 10))
+                    edit_sync_workers = st.number_input("Wallets em paralelo", min_value=1, max_value=MAX_SYNC_WORKERS,
+                                                        value=min(int(api_data.get('sync_workers') or 1), MAX_SYNC_WORKERS))
                     
                     col_save, col_cancel = st.columns(2)
                     with col_save:
@@ -937,7 +969,8 @@ def show_api_cardano_settings():
                             api_key=edit_key,
                             base_url=edit_url,
                             default_address=edit_default_addr if edit_default_addr else None,
-                            timeout=edit_timeout
+                            timeout=edit_timeout,
+                            sync_workers=int(edit_sync_workers)
                         )
 
                         if success:
@@ -983,7 +1016,7 @@ def show_api_cardano_settings():
                             conn.execute(_sql_text("DELETE FROM t_cardano_transactions WHERE wallet_id = ANY(:w)"), {"w": selected_ids})
                             conn.execute(_sql_text("DELETE FROM t_cardano_sync_state WHERE wallet_id = ANY(:w)"), {"w": selected_ids})
                     
-                    res = sync_all_cardano_wallets_for_user(wallet_ids=selected_ids, max_pages=int(max_pages))
+                    res = sync_all_cardano_wallets_for_user(wallet_ids=selected_ids, max_pages=int(max_pages), incremental=False)
                     st.success(f"✅ Resync concluído: {res}")
 
                     if show_counts:
@@ -1227,7 +1260,14 @@ def show_api_coingecko_settings():
     st.divider()
     st.markdown("### ⏯️ Controlo de Pedidos CoinGecko")
     try:
-        from services.coingecko import pause_coingecko_requests, resume_coingecko_requests
+        from services.coingecko import (
+            get_coingecko_limiter,
+            get_price_cache_stats,
+            pause_coingecko_requests,
+            resume_coingecko_requests,
+        )
+        from services.price_refresher import get_price_refresher
+        from services.single_flight import get_single_flight_stats
         from services.snapshots import cancel_background_snapshots
         colp, colr, colc = st.columns(3)
         with colp:
@@ -1244,6 +1284,35 @@ def show_api_coingecko_settings():
                     st.info("Pedido de cancelamento enviado; tarefas em execução irão terminar o mais rápido possível.")
                 else:
                     st.warning("Não foi possível sinalizar cancelamento.")
+        cache_stats = get_price_cache_stats()
+        st.caption(
+            f"💾 Cache de preços: {cache_stats['entries']} moedas | {cache_stats['hits']} hits / "
+            f"{cache_stats['misses']} misses | {cache_stats['api_calls']} chamadas /simple/price | "
+            f"{cache_stats['stale']} preços expirados servidos após erro"
+        )
+        limiter_stats = get_coingecko_limiter().stats()
+        breaker = (
+            f"🔴 aberto ({limiter_stats['open_for_seconds']:.0f}s restantes)"
+            if limiter_stats['tripped'] else "🟢 fechado"
+        )
+        st.caption(
+            f"⏱️ Rate limit partilhado: {limiter_stats['tokens']:.2f}/{limiter_stats['capacity']:.0f} tokens "
+            f"a {limiter_stats['rate_per_minute']:.0f}/min | {limiter_stats['waiters']} pedidos em espera | "
+            f"circuit breaker {breaker} | 429 consecutivos: {limiter_stats['consecutive_429']}"
+        )
+        flight = get_single_flight_stats().get("coingecko")
+        if flight:
+            st.caption(
+                f"🔗 Pedidos idênticos coalescidos: {flight['saved']} chamadas poupadas "
+                f"({flight['executed']} executadas, {flight['in_flight']} em curso)"
+            )
+        refresher_stats = get_price_refresher().stats()
+        last_refresh = refresher_stats['last_refresh_age']
+        st.caption(
+            f"🔄 Refresher de preços: {'ativo' if refresher_stats['running'] else 'parado'} | "
+            f"{refresher_stats['tracked']} moedas | {refresher_stats['api_calls']} chamadas em lote | "
+            f"última revalidação há {f'{last_refresh:.0f}s' if last_refresh is not None else '—'}"
+        )
     except Exception:
         st.caption("ℹ️ Controles de pausa indisponíveis no momento.")
 
@@ -13,6 +13,7 @@ from sqlalchemy import text
 
 from components.transaction_form_v2 import render_transaction_form
 from database.connection import get_engine
+from services.shares import invalidate_nav_snapshot
 from utils.tags import ensure_default_tags, get_all_tags, build_tags_where_clause, set_transaction_tags
 
 # Cache TTL for reference data (in seconds)
@@ -312,6 +313,8 @@ def show():
                             
                             st.success(f"✅ Transação #{transaction_id} registada com sucesso!")
                             st.balloons()
+                        # Após o commit: o NAV em memória deixou de refletir o livro de transações
+                        invalidate_nav_snapshot()
                             
                     except Exception as e:
                         st.error(f"❌ Erro ao registar transação: {str(e)}")
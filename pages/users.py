@@ -1,3 +1,4 @@
+import hashlib
 import streamlit as st
 import pandas as pd
 from datetime import date
@@ -6,6 +7,7 @@ from database.connection import get_connection, return_connection, get_engine
 from auth.session_manager import require_auth
 from utils.security import hash_password
 from config import USERS_CACHE_DURATION, GENDER_CACHE_DURATION
+from services.shares import post_capital_movement, post_capital_movements, StalePricesError
 
 
 def _get_users_list_cached():
@@ -434,6 +436,49 @@ def _financial_data(conn, cursor):
         with col4:
             st.metric("📊 Saldo Total", f"{df_totals['balance'].iloc[0]:.2f} €")
         
+        # --- Lançamento em lote (ex.: ficheiro mensal de depósitos) ---
+        with st.expander("📥 Lançamento em Lote (CSV)"):
+            st.caption(
+                "Colunas: username, movement_type (deposit/withdrawal), amount, movement_date (AAAA-MM-DD), "
+                "description (opcional). Todo o ficheiro é registado numa única transação, pela ordem das linhas."
+            )
+            batch_file = st.file_uploader("Ficheiro CSV", type=["csv"], key="financial_batch_file")
+            # Hashes dos ficheiros já registados nesta sessão: um segundo clique não relança o lote
+            posted_batches = st.session_state.setdefault("financial_batch_posted", set())
+            batch_hash = hashlib.sha256(batch_file.getvalue()).hexdigest() if batch_file is not None else None
+            if batch_hash in posted_batches:
+                st.info("ℹ️ Este ficheiro já foi registado. Carregue um ficheiro diferente para um novo lote.")
+            elif batch_file is not None:
+                try:
+                    df_batch = pd.read_csv(batch_file)
+                    df_batch["movement_date"] = pd.to_datetime(df_batch["movement_date"]).dt.date
+                    df_users_map = pd.read_sql("SELECT user_id, username FROM t_users", get_engine())
+                    user_map = dict(zip(df_users_map["username"], df_users_map["user_id"]))
+                    unknown = sorted(set(df_batch["username"]) - set(user_map))
+                    st.dataframe(df_batch, use_container_width=True, hide_index=True)
+                    if unknown:
+                        st.error(f"❌ Utilizadores desconhecidos: {', '.join(map(str, unknown))}")
+                    elif st.button(f"Registar {len(df_batch)} movimentos", key="financial_confirm_batch"):
+                        results = post_capital_movements([
+                            {
+                                "user_id": int(user_map[row.username]),
+                                "movement_type": str(row.movement_type).strip().lower(),
+                                "amount": float(row.amount),
+                                "movement_date": row.movement_date,
+                                "description": getattr(row, "description", None) if pd.notna(getattr(row, "description", None)) else None,
+                            }
+                            for row in df_batch.itertuples(index=False)
+                        ])
+                        posted_batches.add(batch_hash)
+                        st.success(f"✅ {len(results)} movimentos registados e shares atualizadas.")
+                except StalePricesError as e:
+                    st.error(
+                        f"❌ Erro no lançamento em lote (nada foi registado): sem preço atual para {', '.join(e.symbols)}. "
+                        "Tente novamente dentro de momentos."
+                    )
+                except Exception as e:
+                    st.error(f"❌ Erro no lançamento em lote (nada foi registado): {str(e)}")
+        
         # --- Histórico de movimentos agregado ---
         st.subheader("📜 Histórico de Todos os Movimentos")
         engine = get_engine()
@@ -469,35 +514,25 @@ def _financial_data(conn, cursor):
                     if valor_dep <= 0:
                         st.warning("Informe um valor de depósito maior que zero.")
                     else:
-                        # Inserir movimento para o user
-                        cursor.execute("""
-                            INSERT INTO t_user_capital_movements (user_id, credit, description, movement_date) 
-                            VALUES (%s, %s, %s, %s)
-                        """, (user_id, valor_dep, descricao_dep, movement_date))
-
-                        conn.commit()
-
-                        # Alocar shares com base no NAV do momento (NAV/share pré-depósito)
-                        try:
-                            from services.shares import allocate_shares_on_deposit
-                            # Converter movement_date (date) para datetime (meio-dia para consistência)
-                            movement_dt = datetime.datetime.combine(movement_date, datetime.time(12, 0, 0))
-                            share_info = allocate_shares_on_deposit(
-                                user_id=user_id,
-                                deposit_amount=float(valor_dep),
-                                movement_date=movement_dt,
-                                notes=f"Depósito: {descricao_dep}"
-                            )
-                            st.success(
-                                f"✅ Depósito registado e shares atribuídas: "
-                                f"{share_info['shares_allocated']:.6f} (NAV/share: €{share_info['nav_per_share']:.4f})"
-                            )
-                        except Exception as e:
-                            st.warning(f"Depósito registado, mas falhou alocação de shares: {e}")
-
+                        # Movimento + shares (NAV/share pré-depósito) numa única transação
+                        share_info = post_capital_movement(
+                            user_id=user_id,
+                            movement_type="deposit",
+                            amount=float(valor_dep),
+                            movement_date=movement_date,
+                            description=descricao_dep
+                        )
+                        st.success(
+                            f"✅ Depósito registado e shares atribuídas: "
+                            f"{share_info['shares_amount']:.6f} (NAV/share: €{share_info['nav_per_share']:.4f})"
+                        )
                         st.rerun()
+                except StalePricesError as e:
+                    st.error(
+                        f"❌ Erro ao registar depósito: sem preço atual para {', '.join(e.symbols)}. "
+                        "Tente novamente dentro de momentos."
+                    )
                 except Exception as e:
-                    conn.rollback()
                     st.error(f"❌ Erro ao registar depósito: {str(e)}")
 
         # --- Formulário de Levantamento ---
@@ -509,34 +544,25 @@ def _financial_data(conn, cursor):
                     if valor_lev <= 0:
                         st.warning("Informe um valor de levantamento maior que zero.")
                     else:
-                        # Inserir movimento para o user
-                        cursor.execute("""
-                            INSERT INTO t_user_capital_movements (user_id, debit, description, movement_date) 
-                            VALUES (%s, %s, %s, %s)
-                        """, (user_id, valor_lev, descricao_lev, movement_date))
-
-                        conn.commit()
-
-                        # Remover (queimar) shares com base no NAV/share pré-levantamento
-                        try:
-                            from services.shares import burn_shares_on_withdrawal
-                            movement_dt = datetime.datetime.combine(movement_date, datetime.time(12, 0, 0))
-                            share_info = burn_shares_on_withdrawal(
-                                user_id=user_id,
-                                withdrawal_amount=float(valor_lev),
-                                movement_date=movement_dt,
-                                notes=f"Levantamento: {descricao_lev}"
-                            )
-                            st.success(
-                                f"✅ Levantamento registado e shares removidas: "
-                                f"{share_info['shares_burned']:.6f} (NAV/share: €{share_info['nav_per_share']:.4f})"
-                            )
-                        except Exception as e:
-                            st.warning(f"Levantamento registado, mas falhou atualização de shares: {e}")
-
+                        # Movimento + queima de shares (NAV/share pré-levantamento) numa única transação
+                        share_info = post_capital_movement(
+                            user_id=user_id,
+                            movement_type="withdrawal",
+                            amount=float(valor_lev),
+                            movement_date=movement_date,
+                            description=descricao_lev
+                        )
+                        st.success(
+                            f"✅ Levantamento registado e shares removidas: "
+                            f"{-share_info['shares_amount']:.6f} (NAV/share: €{share_info['nav_per_share']:.4f})"
+                        )
                         st.rerun()
+                except StalePricesError as e:
+                    st.error(
+                        f"❌ Erro ao registar levantamento: sem preço atual para {', '.join(e.symbols)}. "
+                        "Tente novamente dentro de momentos."
+                    )
                 except Exception as e:
-                    conn.rollback()
                     st.error(f"❌ Erro ao registar levantamento: {str(e)}")
 
         # --- Histórico de movimentos ---
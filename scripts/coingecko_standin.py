@@ -0,0 +1,396 @@
+"""Servidor local que imita a API do CoinGecko, para testes de carga e benchmarks offline.
+
+Serve os endpoints usados por services.coingecko e services.snapshots:
+- /simple/price?ids=...&vs_currencies=...
+- /coins/list
+- /coins/{id}/history?date=DD-MM-YYYY
+- /coins/{id}/market_chart?vs_currency=...&days=...
+- /coins/{id}/market_chart/range?vs_currency=...&from=...&to=...
+
+Os dados vêm de duas fontes, por esta ordem:
+1. Respostas gravadas (record/replay) em fixtures_dir, uma por pedido (JSON)
+2. Séries diárias dos CSV do CoinGecko em cardano/*-usd-max.csv (snapped_at, price, market_cap, total_volume);
+   preços em EUR = USD × eur_per_usd (taxa fixa, para resultados determinísticos)
+
+Latência (latency_ms ± jitter_ms) e respostas 429 (rate_429 = probabilidade, fail_every = cada N-ésimo pedido)
+são configuráveis; /__stats devolve os contadores por endpoint.
+
+Para apontar a app ao servidor, definir em Settings → APIs o base_url do CoinGecko (t_api_coingecko.base_url):
+
+    python scripts/coingecko_standin.py --port 8765 --latency-ms 150 --rate-429 0.05
+    # base_url = http://127.0.0.1:8765/api/v3
+
+Gravar respostas reais para replay posterior (pedidos sem fixture são enviados para upstream e guardados):
+
+    python scripts/coingecko_standin.py --record --upstream https://api.coingecko.com/api/v3
+"""
+import argparse
+import bisect
+import glob
+import hashlib
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from datetime import date, datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+import pandas as pd
+import requests
+
+# Raiz do projeto no sys.path ao correr como script (usa services.coingecko)
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(CURRENT_DIR, os.pardir))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CSV_GLOB = os.path.join("cardano", "*-usd-max.csv")
+DEFAULT_FIXTURES_DIR = os.path.join("cache", "coingecko_fixtures")
+DEFAULT_EUR_PER_USD = 0.92
+API_PREFIX = "/api/v3"
+# Parâmetros que não identificam o pedido (não entram na chave das fixtures)
+_IGNORED_PARAMS = {"x_cg_demo_api_key", "x_cg_pro_api_key"}
+
+_DAY_MS = 86_400_000
+
+
+def fixture_key(path: str, params: Dict[str, str]) -> str:
+    """Nome do ficheiro de uma resposta gravada: hash estável de caminho + parâmetros ordenados."""
+    items = sorted((k, v) for k, v in params.items() if k not in _IGNORED_PARAMS)
+    raw = json.dumps([path, items], separators=(",", ":"))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _endpoint_name(path: str) -> str:
+    """Nome do endpoint para estatísticas, sem o coin id (/coins/cardano/history → /coins/{id}/history)."""
+    parts = [p for p in path.split("/") if p]
+    if len(parts) >= 3 and parts[0] == "coins":
+        return "/coins/{id}/" + "/".join(parts[2:])
+    return "/" + "/".join(parts)
+
+
+class CsvPriceStore:
+    """Séries diárias (timestamp_ms, preço USD, market cap, volume) por coingecko_id, lidas dos CSV."""
+
+    def __init__(self, csv_glob: str = DEFAULT_CSV_GLOB, eur_per_usd: float = DEFAULT_EUR_PER_USD,
+                 shift_to_today: bool = False):
+        from services.coingecko import COMMON_SYMBOL_MAP
+
+        self.eur_per_usd = float(eur_per_usd)
+        self.coins: List[Dict[str, str]] = []
+        self._series: Dict[str, Tuple[List[int], List[Tuple[float, float, float]]]] = {}
+        for path in sorted(glob.glob(csv_glob)):
+            symbol = os.path.basename(path).split("-", 1)[0].upper()
+            coin_id = COMMON_SYMBOL_MAP.get(symbol, symbol.lower())
+            df = pd.read_csv(path).dropna(subset=["price"])
+            ts = pd.to_datetime(df["snapped_at"].str.replace(" UTC", "", regex=False), utc=True)
+            ts_ms = (ts - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(milliseconds=1)
+            if shift_to_today and len(ts_ms):
+                # Desloca a série para que o último ponto seja hoje (clientes que calculam "days" a partir de hoje)
+                today_ms = int(datetime.combine(date.today(), datetime.min.time(), tzinfo=timezone.utc).timestamp() * 1000)
+                ts_ms = ts_ms + (today_ms - int(ts_ms.iloc[-1]))
+            values = list(zip(
+                df["price"].astype(float),
+                df["market_cap"].fillna(0).astype(float),
+                df["total_volume"].fillna(0).astype(float),
+            ))
+            self._series[coin_id] = (ts_ms.tolist(), values)
+            self.coins.append({"id": coin_id, "symbol": symbol.lower(), "name": coin_id.replace("-", " ").title()})
+        logger.info(f"📂 Stand-in CoinGecko: {len(self._series)} séries carregadas de {csv_glob}")
+
+    def _rate(self, vs_currency: str) -> Optional[float]:
+        vs = (vs_currency or "usd").lower()
+        if vs == "usd":
+            return 1.0
+        if vs == "eur":
+            return self.eur_per_usd
+        return None
+
+    def has(self, coin_id: str) -> bool:
+        return coin_id in self._series
+
+    def latest(self, coin_id: str, vs_currency: str) -> Optional[float]:
+        rate = self._rate(vs_currency)
+        series = self._series.get(coin_id)
+        if rate is None or not series or not series[0]:
+            return None
+        return series[1][-1][0] * rate
+
+    def on_date(self, coin_id: str, day: date, vs_currency: str) -> Optional[Tuple[float, float, float]]:
+        """(preço, market cap, volume) do último ponto até ao fim do dia, na moeda pedida."""
+        rate = self._rate(vs_currency)
+        series = self._series.get(coin_id)
+        if rate is None or not series:
+            return None
+        end_ms = int(datetime.combine(day, datetime.min.time(), tzinfo=timezone.utc).timestamp() * 1000) + _DAY_MS
+        idx = bisect.bisect_left(series[0], end_ms) - 1
+        if idx < 0:
+            return None
+        price, mcap, vol = series[1][idx]
+        return price * rate, mcap * rate, vol * rate
+
+    def chart(self, coin_id: str, from_ms: int, to_ms: int, vs_currency: str) -> Dict[str, List]:
+        """Resposta no formato market_chart: prices, market_caps e total_volumes entre from_ms e to_ms."""
+        rate = self._rate(vs_currency)
+        series = self._series.get(coin_id)
+        out: Dict[str, List] = {"prices": [], "market_caps": [], "total_volumes": []}
+        if rate is None or not series:
+            return out
+        ts, values = series
+        lo = bisect.bisect_left(ts, from_ms)
+        hi = bisect.bisect_right(ts, to_ms)
+        for t, (price, mcap, vol) in zip(ts[lo:hi], values[lo:hi]):
+            out["prices"].append([t, price * rate])
+            out["market_caps"].append([t, mcap * rate])
+            out["total_volumes"].append([t, vol * rate])
+        return out
+
+
+class StandinConfig:
+    """Parâmetros do servidor (alteráveis em execução, ex.: para variar a taxa de 429 num benchmark)."""
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, rate_429: float = 0.0,
+                 fail_every: int = 0, seed: Optional[int] = 42, fixtures_dir: Optional[str] = DEFAULT_FIXTURES_DIR,
+                 record: bool = False, upstream: Optional[str] = None):
+        self.latency_ms = float(latency_ms)
+        self.jitter_ms = float(jitter_ms)
+        self.rate_429 = float(rate_429)
+        self.fail_every = int(fail_every)
+        self.fixtures_dir = fixtures_dir
+        self.record = bool(record)
+        self.upstream = upstream.rstrip("/") if upstream else None
+        self.random = random.Random(seed)
+
+
+class CoinGeckoStandin:
+    """Lógica de resposta do stand-in, independente do transporte HTTP (testável diretamente)."""
+
+    def __init__(self, store: CsvPriceStore, config: Optional[StandinConfig] = None):
+        self.store = store
+        self.config = config or StandinConfig()
+        self._lock = threading.Lock()
+        self._requests = 0
+        self.stats: Dict[str, int] = {"requests": 0, "429": 0, "fixtures": 0, "recorded": 0}
+
+    # ---------- Injeção de latência / 429 ----------
+    def _should_429(self) -> bool:
+        cfg = self.config
+        with self._lock:
+            self._requests += 1
+            if cfg.fail_every and self._requests % cfg.fail_every == 0:
+                return True
+            return cfg.rate_429 > 0 and cfg.random.random() < cfg.rate_429
+
+    def _sleep(self):
+        cfg = self.config
+        if cfg.latency_ms <= 0 and cfg.jitter_ms <= 0:
+            return
+        with self._lock:
+            jitter = cfg.random.uniform(-cfg.jitter_ms, cfg.jitter_ms) if cfg.jitter_ms else 0.0
+        time.sleep(max(0.0, cfg.latency_ms + jitter) / 1000.0)
+
+    def _count(self, key: str):
+        with self._lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    # ---------- Fixtures (record/replay) ----------
+    def _fixture_path(self, path: str, params: Dict[str, str]) -> Optional[str]:
+        if not self.config.fixtures_dir:
+            return None
+        return os.path.join(self.config.fixtures_dir, f"{fixture_key(path, params)}.json")
+
+    def _load_fixture(self, path: str, params: Dict[str, str]) -> Optional[Tuple[int, object]]:
+        fixture_path = self._fixture_path(path, params)
+        if not fixture_path or not os.path.exists(fixture_path):
+            return None
+        with open(fixture_path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        return int(payload.get("status", 200)), payload.get("body")
+
+    def _record(self, path: str, params: Dict[str, str]) -> Optional[Tuple[int, object]]:
+        if not (self.config.record and self.config.upstream):
+            return None
+        resp = requests.get(f"{self.config.upstream}{path}", params=params, timeout=30)
+        body = resp.json()
+        fixture_path = self._fixture_path(path, params)
+        if fixture_path and resp.status_code == 200:
+            os.makedirs(os.path.dirname(fixture_path), exist_ok=True)
+            tmp_path = f"{fixture_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                saved_params = {k: v for k, v in params.items() if k not in _IGNORED_PARAMS}
+                json.dump({"path": path, "params": saved_params, "status": resp.status_code, "body": body}, f)
+            os.replace(tmp_path, fixture_path)
+            self._count("recorded")
+        return resp.status_code, body
+
+    # ---------- Endpoints sintetizados a partir dos CSV ----------
+    def _simple_price(self, params: Dict[str, str]) -> Tuple[int, object]:
+        ids = [i for i in params.get("ids", "").split(",") if i]
+        currencies = [c for c in params.get("vs_currencies", "usd").split(",") if c]
+        body: Dict[str, Dict[str, float]] = {}
+        for coin_id in ids:
+            prices = {c: self.store.latest(coin_id, c) for c in currencies}
+            prices = {c: p for c, p in prices.items() if p is not None}
+            if prices:
+                body[coin_id] = prices
+        return 200, body
+
+    def _history(self, coin_id: str, params: Dict[str, str]) -> Tuple[int, object]:
+        try:
+            day = datetime.strptime(params.get("date", ""), "%d-%m-%Y").date()
+        except ValueError:
+            return 400, {"error": "invalid date"}
+        body: Dict[str, object] = {"id": coin_id, "symbol": coin_id, "name": coin_id}
+        usd = self.store.on_date(coin_id, day, "usd")
+        if usd is not None:
+            eur = self.store.on_date(coin_id, day, "eur")
+            body["market_data"] = {
+                "current_price": {"usd": usd[0], "eur": eur[0]},
+                "market_cap": {"usd": usd[1], "eur": eur[1]},
+                "total_volume": {"usd": usd[2], "eur": eur[2]},
+            }
+        return 200, body
+
+    def _market_chart(self, coin_id: str, params: Dict[str, str]) -> Tuple[int, object]:
+        now_ms = int(time.time() * 1000)
+        days = params.get("days", "1")
+        if days == "max":
+            from_ms = 0
+        else:
+            try:
+                from_ms = now_ms - int(float(days) * _DAY_MS)
+            except ValueError:
+                return 400, {"error": "invalid days"}
+        return 200, self.store.chart(coin_id, from_ms, now_ms, params.get("vs_currency", "usd"))
+
+    def _market_chart_range(self, coin_id: str, params: Dict[str, str]) -> Tuple[int, object]:
+        try:
+            from_ms = int(float(params["from"]) * 1000)
+            to_ms = int(float(params["to"]) * 1000)
+        except (KeyError, ValueError):
+            return 400, {"error": "from/to required"}
+        return 200, self.store.chart(coin_id, from_ms, to_ms, params.get("vs_currency", "usd"))
+
+    def _synthesize(self, path: str, params: Dict[str, str]) -> Tuple[int, object]:
+        parts = [p for p in path.split("/") if p]
+        if parts == ["simple", "price"]:
+            return self._simple_price(params)
+        if parts == ["coins", "list"]:
+            return 200, list(self.store.coins)
+        if len(parts) >= 3 and parts[0] == "coins":
+            coin_id, endpoint = parts[1], "/".join(parts[2:])
+            if not self.store.has(coin_id):
+                return 404, {"error": "coin not found"}
+            if endpoint == "history":
+                return self._history(coin_id, params)
+            if endpoint == "market_chart":
+                return self._market_chart(coin_id, params)
+            if endpoint == "market_chart/range":
+                return self._market_chart_range(coin_id, params)
+        return 404, {"error": f"unknown endpoint {path}"}
+
+    def handle(self, path: str, params: Dict[str, str]) -> Tuple[int, object]:
+        """Resposta (status, corpo JSON) para um GET, após latência e eventual 429 injetado."""
+        if path.startswith(API_PREFIX):
+            path = path[len(API_PREFIX):] or "/"
+        if path == "/__stats":
+            with self._lock:
+                return 200, dict(self.stats)
+
+        self._count("requests")
+        self._count(_endpoint_name(path))
+        self._sleep()
+        if self._should_429():
+            self._count("429")
+            return 429, {"status": {"error_code": 429, "error_message": "You've exceeded the Rate Limit (stand-in)"}}
+
+        replay = self._load_fixture(path, params)
+        if replay is not None:
+            self._count("fixtures")
+            return replay
+        recorded = self._record(path, params)
+        if recorded is not None:
+            return recorded
+        return self._synthesize(path, params)
+
+
+def _make_handler(standin: CoinGeckoStandin):
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlsplit(self.path)
+            status, body = standin.handle(url.path, dict(parse_qsl(url.query)))
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            if status == 429:
+                self.send_header("Retry-After", "60")
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, fmt, *args):
+            logger.debug("stand-in: " + fmt, *args)
+
+    return _Handler
+
+
+def start_standin_server(host: str = "127.0.0.1", port: int = 0, store: Optional[CsvPriceStore] = None,
+                         config: Optional[StandinConfig] = None) -> Tuple[ThreadingHTTPServer, str]:
+    """Arranca o stand-in numa thread daemon.
+
+    Returns:
+        (servidor, base_url) - base_url pronto para t_api_coingecko.base_url; parar com servidor.shutdown()
+    """
+    standin = CoinGeckoStandin(store or CsvPriceStore(), config)
+    server = ThreadingHTTPServer((host, port), _make_handler(standin))
+    server.daemon_threads = True
+    server.standin = standin
+    threading.Thread(target=server.serve_forever, name="coingecko-standin", daemon=True).start()
+    base_url = f"http://{host}:{server.server_address[1]}{API_PREFIX}"
+    logger.info(f"🧪 Stand-in CoinGecko em {base_url}")
+    return server, base_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-in local da API CoinGecko para benchmarks offline")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--csv-glob", default=DEFAULT_CSV_GLOB)
+    parser.add_argument("--eur-per-usd", type=float, default=DEFAULT_EUR_PER_USD)
+    parser.add_argument("--shift-to-today", action="store_true", help="Último ponto de cada CSV passa a ser hoje")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Probabilidade de responder 429 (0-1)")
+    parser.add_argument("--fail-every", type=int, default=0, help="Responder 429 a cada N-ésimo pedido")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--fixtures-dir", default=DEFAULT_FIXTURES_DIR)
+    parser.add_argument("--record", action="store_true", help="Gravar respostas de --upstream em falta")
+    parser.add_argument("--upstream", default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    store = CsvPriceStore(args.csv_glob, args.eur_per_usd, args.shift_to_today)
+    config = StandinConfig(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, rate_429=args.rate_429,
+        fail_every=args.fail_every, seed=args.seed, fixtures_dir=args.fixtures_dir,
+        record=args.record, upstream=args.upstream,
+    )
+    server, base_url = start_standin_server(args.host, args.port, store, config)
+    print(f"Stand-in CoinGecko a servir {len(store.coins)} moedas em {base_url}")
+    print(f"Definir t_api_coingecko.base_url = '{base_url}' (Settings → APIs) para usar. Ctrl+C para parar.")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,11 +2,104 @@
 Serviço para integração com a API CardanoScan.
 Fornece funcionalidades para consultar saldos, tokens e transações de endereços Cardano.
 """
+import threading
+import time
 import requests
-from typing import Dict, List, Optional, Tuple
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
 from datetime import datetime
 from pycardano import Address
 
+from services.cardano_metadata import TokenMetadataCache, asset_key, get_token_metadata_cache
+from services.rate_limit import TokenBucket
+from services.single_flight import get_single_flight
+
+# Resultado de _try_fetch/_fetch_asset_metadata quando o pedido falhou (429, 5xx, timeout):
+# distinto de None ("não encontrado"), que é o único caso guardado em cache negativo
+FETCH_FAILED = object()
+
+# ---------- Sessão HTTP partilhada (keep-alive + retry/backoff) ----------
+# Política por omissão; pode ser ajustada com configure_http_session()
+HTTP_RETRIES = 3
+HTTP_BACKOFF_FACTOR = 0.5
+HTTP_RETRY_STATUSES = (429, 500, 502, 503, 504)
+HTTP_POOL_MAXSIZE = 16
+
+_shared_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+# Latência por endpoint: {endpoint: {"count", "errors", "total_ms", "max_ms"}}
+_endpoint_stats: Dict[str, Dict[str, float]] = {}
+_stats_lock = threading.Lock()
+
+
+def _build_session(retries: int, backoff_factor: float, pool_maxsize: int) -> requests.Session:
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=HTTP_RETRY_STATUSES,
+        allowed_methods=("GET",),
+        respect_retry_after_header=True,
+        raise_on_status=False,  # devolver a última resposta; o cliente trata o status_code
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_shared_session() -> requests.Session:
+    """Sessão requests partilhada por todas as instâncias de CardanoScanAPI (pool de ligações)."""
+    global _shared_session
+    if _shared_session is None:
+        with _session_lock:
+            if _shared_session is None:
+                _shared_session = _build_session(HTTP_RETRIES, HTTP_BACKOFF_FACTOR, HTTP_POOL_MAXSIZE)
+    return _shared_session
+
+
+def configure_http_session(retries: int = HTTP_RETRIES, backoff_factor: float = HTTP_BACKOFF_FACTOR,
+                           pool_maxsize: int = HTTP_POOL_MAXSIZE) -> requests.Session:
+    """Recria a sessão partilhada com outra política de retry/backoff ou tamanho de pool."""
+    global _shared_session
+    with _session_lock:
+        old = _shared_session
+        _shared_session = _build_session(retries, backoff_factor, pool_maxsize)
+    if old is not None:
+        old.close()
+    return _shared_session
+
+
+def _record_latency(endpoint: str, elapsed_ms: float, error: bool):
+    with _stats_lock:
+        st = _endpoint_stats.setdefault(endpoint, {"count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0})
+        st["count"] += 1
+        st["errors"] += int(error)
+        st["total_ms"] += elapsed_ms
+        st["max_ms"] = max(st["max_ms"], elapsed_ms)
+
+
+def get_endpoint_latency_stats() -> Dict[str, Dict[str, float]]:
+    """Estatísticas de latência por endpoint CardanoScan (count, errors, avg_ms, max_ms)."""
+    with _stats_lock:
+        return {
+            ep: {
+                "count": int(st["count"]),
+                "errors": int(st["errors"]),
+                "avg_ms": round(st["total_ms"] / st["count"], 1) if st["count"] else 0.0,
+                "max_ms": round(st["max_ms"], 1),
+            }
+            for ep, st in _endpoint_stats.items()
+        }
+
+
+def reset_endpoint_latency_stats():
+    with _stats_lock:
+        _endpoint_stats.clear()
+
 class CardanoScanAPI:
     """Cliente para a API CardanoScan."""
     
@@ -36,39 +129,73 @@ class CardanoScanAPI:
         "6df63e2fdde8b2c3b3396265b0cc824aa4fb999396b1c154280f6b0c": 6,  # qDJED
     }
     
-    def __init__(self, api_key: str):
+    # Pedidos de metadados em paralelo ao resolver tokens desconhecidos em lote
+    METADATA_FETCH_WORKERS = 4
+
+    def __init__(self, api_key: str, rate_limiter: Optional[TokenBucket] = None, timeout: int = 10,
+                 metadata_cache: Optional[TokenMetadataCache] = None):
         """
         Inicializa o cliente da API CardanoScan.
         
         Args:
             api_key: Chave de API do CardanoScan
+            rate_limiter: TokenBucket opcional, partilhável entre clientes (ex.: sync paralelo de wallets)
+            timeout: Timeout (segundos) de cada pedido HTTP
+            metadata_cache: Cache de metadados de tokens (por omissão, o cache do processo,
+                aquecido a partir de t_cardano_assets numa única query)
         """
         self.api_key = api_key
         self.headers = {"apiKey": api_key}
-        # Cache de metadados de assets: chave "policyId.assetNameHex" -> dict
-        self._asset_meta_cache: Dict[str, Dict] = {}
+        self.rate_limiter = rate_limiter
+        self.timeout = timeout
+        # Cache de metadados de assets (memória + t_cardano_assets), partilhado entre instâncias
+        self._metadata = metadata_cache if metadata_cache is not None else get_token_metadata_cache()
+        self._metadata.warm()
+        # Estatísticas da última chamada a get_transactions (páginas pedidas/saltadas)
+        self.last_fetch_stats: Dict = {}
 
-    def _asset_cache_key(self, policy_id: Optional[str], asset_name_hex: Optional[str]) -> Optional[str]:
-        if not policy_id:
-            return None
-        return f"{policy_id}.{asset_name_hex or ''}"
+    def _throttle(self):
+        """Espera por um token do rate limiter partilhado (se configurado)."""
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+
+    def _get(self, url: str, params: Optional[Dict] = None) -> requests.Response:
+        """GET através da sessão partilhada, com rate limit e registo de latência por endpoint."""
+        self._throttle()
+        endpoint = url[len(self.BASE_URL):] if url.startswith(self.BASE_URL) else url
+        t0 = time.perf_counter()
+        error = True
+        try:
+            response = get_shared_session().get(url, headers=self.headers, params=params, timeout=self.timeout)
+            error = response.status_code >= 400
+            return response
+        finally:
+            _record_latency(endpoint, (time.perf_counter() - t0) * 1000.0, error)
 
     def _try_fetch(self, endpoint: str, params: Dict) -> Optional[Dict]:
         """
         Faz uma chamada GET simples e retorna JSON como dict se sucesso.
+        None = não encontrado (404 ou resposta vazia); FETCH_FAILED = erro (429, 5xx, timeout, ...).
+        Chamadas idênticas em curso (mesma chave de API, endpoint e params) partilham o mesmo pedido.
         """
+        key = (self.api_key, endpoint, tuple(sorted(params.items())))
+        return get_single_flight("cardanoscan").do(key, lambda: self._try_fetch_uncoalesced(endpoint, params))
+
+    def _try_fetch_uncoalesced(self, endpoint: str, params: Dict) -> Optional[Dict]:
         url = f"{self.BASE_URL}{endpoint}"
         try:
-            resp = requests.get(url, headers=self.headers, params=params, timeout=10)
-            if resp.status_code != 200:
+            resp = self._get(url, params)
+            if resp.status_code == 404:
                 return None
+            if resp.status_code != 200:
+                return FETCH_FAILED
             data = resp.json()
             # Alguns endpoints podem devolver lista
             if isinstance(data, list):
                 return data[0] if data else None
-            return data
+            return data or None
         except Exception:
-            return None
+            return FETCH_FAILED
 
     def _decode_hex_ascii(self, s: str) -> Optional[str]:
         """Decodifica string hex para ASCII, com tratamento robusto."""
@@ -138,35 +265,27 @@ class CardanoScanAPI:
                         pass
         return None
 
-    def get_asset_metadata(self, policy_id: Optional[str], asset_name_hex: Optional[str]) -> Optional[Dict]:
-        """
-        Consulta metadados do token no CardanoScan e memoriza o resultado.
-        OTIMIZAÇÃO: retorna imediatamente se já estiver em cache ou se não houver policyId.
-        """
-        # Early return: sem policy, sem metadata
-        if not policy_id:
-            return None
-            
-        cache_key = self._asset_cache_key(policy_id, asset_name_hex)
-        if cache_key and cache_key in self._asset_meta_cache:
-            return self._asset_meta_cache[cache_key]
-
-        # Cache miss negativo: se já tentámos e falhou, não tentar de novo
-        negative_key = f"_neg_{cache_key}"
-        if negative_key in self._asset_meta_cache:
-            return None
+    def _fetch_asset_metadata(self, policy_id: str, asset_name_hex: Optional[str]) -> Optional[Dict]:
+        """Consulta metadados do token no CardanoScan (sem cache).
 
+        Returns:
+            Metadados, None se o token não tem metadados, ou FETCH_FAILED se nenhum endpoint respondeu
+        """
         params = {"policyId": policy_id}
         if asset_name_hex is not None:
             params["assetName"] = asset_name_hex
 
         # Tentar alguns endpoints conhecidos do CardanoScan
-        meta = self._try_fetch("/token/info", params) or self._try_fetch("/token/metadata", params)
-        if not meta:
-            # Guardar cache negativo (não fazer mais pedidos para este token)
-            if cache_key:
-                self._asset_meta_cache[negative_key] = {}
-            return None
+        failed = False
+        for endpoint in ("/token/info", "/token/metadata"):
+            meta = self._try_fetch(endpoint, params)
+            if meta is FETCH_FAILED:
+                failed = True
+            elif meta:
+                break
+        else:
+            # "Sem metadados" só quando a API o confirmou; uma falha não entra no cache negativo
+            return FETCH_FAILED if failed else None
 
         # Enriquecer com name/decimals resolvidos
         resolved_name = self._extract_name_from_metadata(meta, asset_name_hex)
@@ -175,10 +294,66 @@ class CardanoScanAPI:
             meta["resolved_name"] = resolved_name
         if resolved_decimals is not None:
             meta["resolved_decimals"] = resolved_decimals
+        return meta
+
+    def get_asset_metadata(self, policy_id: Optional[str], asset_name_hex: Optional[str]) -> Optional[Dict]:
+        """
+        Metadados do token: cache em memória → t_cardano_assets → CardanoScan.
+        OTIMIZAÇÃO: retorna imediatamente se já estiver em cache (incluindo cache negativo)
+        ou se não houver policyId.
+        """
+        # Early return: sem policy, sem metadata
+        if not policy_id:
+            return None
 
-        if cache_key:
-            self._asset_meta_cache[cache_key] = meta
+        key = asset_key(policy_id, asset_name_hex)
+        found, meta = self._metadata.lookup(key)
+        if found:
+            return meta
+        if self._metadata.load_from_db([key]):
+            found, meta = self._metadata.lookup(key)
+            if found:
+                return meta
+
+        meta = self._fetch_asset_metadata(policy_id, asset_name_hex)
+        if meta is FETCH_FAILED:
+            return None
+        self._metadata.put(key, meta)
+        self._metadata.persist({key: meta})
         return meta
+
+    def prefetch_asset_metadata(self, tokens: Iterable[Tuple[Optional[str], Optional[str]]]) -> int:
+        """
+        Resolve em lote os metadados de vários tokens (policy_id, asset_name_hex).
+        
+        Os que não estão em memória são procurados na BD numa query; os restantes são pedidos
+        ao CardanoScan em paralelo e gravados em t_cardano_assets num único INSERT.
+        
+        Returns:
+            Número de tokens pedidos à API
+        """
+        pending: Dict[Tuple[str, str], Tuple[str, Optional[str]]] = {}
+        for policy_id, asset_name_hex in tokens:
+            key = asset_key(policy_id, asset_name_hex)
+            if key is not None and key not in pending and not self._metadata.lookup(key)[0]:
+                pending[key] = (policy_id, asset_name_hex)
+        if not pending:
+            return 0
+
+        self._metadata.load_from_db(list(pending))
+        pending = {k: v for k, v in pending.items() if not self._metadata.lookup(k)[0]}
+        if not pending:
+            return 0
+
+        workers = max(1, min(self.METADATA_FETCH_WORKERS, len(pending)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            metas = list(pool.map(lambda args: self._fetch_asset_metadata(*args), pending.values()))
+        # Pedidos falhados ficam fora dos caches (voltam a ser pedidos na próxima vez)
+        results = {key: meta for key, meta in zip(pending.keys(), metas) if meta is not FETCH_FAILED}
+        for key, meta in results.items():
+            self._metadata.put(key, meta)
+        self._metadata.persist(results)
+        return len(pending)
     
     def _convert_to_hex(self, address_bech32: str) -> str:
         """
@@ -207,7 +382,7 @@ class CardanoScanAPI:
         params = {"address": address}
         
         try:
-            response = requests.get(url, headers=self.headers, params=params, timeout=10)
+            response = self._get(url, params)
             
             if response.status_code == 404:
                 return None, "Endereço não encontrado ou ainda não possui transações on-chain"
@@ -239,18 +414,25 @@ class CardanoScanAPI:
     def get_transactions(
         self, 
         address: str, 
-        max_pages: int = 10
+        max_pages: Optional[int] = 10,
+        stop_at_block_height: Optional[int] = None
     ) -> Tuple[Optional[List[Dict]], Optional[str]]:
         """
         Obtém transações de um endereço Cardano.
         
         Args:
             address: Endereço Cardano (bech32 format)
-            max_pages: Número máximo de páginas a buscar
+            max_pages: Número máximo de páginas a buscar (None = todas)
+            stop_at_block_height: Cursor incremental. Se indicado, pára de paginar assim que
+                uma página contém transações com block_height <= cursor e descarta as
+                transações anteriores ao cursor
             
         Returns:
-            Tupla (lista de transações, mensagem_erro)
+            Tupla (lista de transações, mensagem_erro).
+            Páginas pedidas/saltadas/falhadas ficam em self.last_fetch_stats; com failed_pages não vazio
+            a lista está incompleta e o cursor incremental não deve avançar.
         """
+        self.last_fetch_stats = {}
         try:
             # Converter endereço para hex
             address_hex = self._convert_to_hex(address)
@@ -262,12 +444,7 @@ class CardanoScanAPI:
         
         try:
             # Primeira página para obter total
-            response = requests.get(
-                url, 
-                headers=self.headers, 
-                params={"address": address_hex, "pageNo": 1},
-                timeout=10
-            )
+            response = self._get(url, {"address": address_hex, "pageNo": 1})
             
             if response.status_code != 200:
                 return None, f"Erro HTTP {response.status_code}: {response.text}"
@@ -283,32 +460,56 @@ class CardanoScanAPI:
             if page_count == 0 and total_count > 0:
                 page_count = (total_count + 19) // 20  # Arredondar para cima
             
-            # Limitar ao máximo de páginas solicitado
-            total_pages = min(page_count if page_count > 0 else 1, max_pages)
-            
             # Não adicionar a primeira página ainda, vamos buscar de trás para frente
             first_page_txs = data.get("transactions", [])
             
             # Buscar páginas de trás para frente (mais recentes primeiro)
             # Se max_pages=5 e total=20, buscar páginas 20, 19, 18, 17, 16
-            start_page = max(1, page_count - max_pages + 1) if page_count > 0 else 1
+            if max_pages is None:
+                start_page = 1
+            else:
+                start_page = max(1, page_count - max_pages + 1) if page_count > 0 else 1
             
+            pages_fetched = 1
+            pages_visited = {1}  # a página 1 já foi pedida para obter o total
+            failed_pages = []
+            reached_cursor = False
             # Buscar da página mais recente até a start_page
             for page in range(page_count, start_page - 1, -1):
+                pages_visited.add(page)
                 if page == 1:
                     # Usar dados já obtidos da primeira request
-                    all_transactions.extend(first_page_txs)
+                    page_data = first_page_txs
                 else:
-                    response = requests.get(
-                        url,
-                        headers=self.headers,
-                        params={"address": address_hex, "pageNo": page},
-                        timeout=10
-                    )
-                    
+                    response = self._get(url, {"address": address_hex, "pageNo": page})
+                    pages_fetched += 1
                     if response.status_code == 200:
                         page_data = response.json().get("transactions", [])
-                        all_transactions.extend(page_data)
+                    else:
+                        failed_pages.append(page)
+                        page_data = []
+                all_transactions.extend(page_data)
+                
+                # Modo incremental: páginas mais antigas já estão na BD
+                if stop_at_block_height is not None and any(
+                    int(tx.get("blockHeight") or 0) <= stop_at_block_height for tx in page_data
+                ):
+                    reached_cursor = True
+                    break
+            
+            if stop_at_block_height is not None:
+                all_transactions = [
+                    tx for tx in all_transactions
+                    if int(tx.get("blockHeight") or 0) >= stop_at_block_height
+                ]
+            
+            self.last_fetch_stats = {
+                "pages_total": page_count,
+                "pages_fetched": pages_fetched,
+                "pages_skipped": max(page_count - len(pages_visited), 0),
+                "reached_cursor": reached_cursor,
+                "failed_pages": failed_pages,
+            }
             
             # Processar transações para formato amigável
             processed = []
@@ -355,7 +556,7 @@ class CardanoScanAPI:
         params = {"address": address}
         
         try:
-            response = requests.get(url, headers=self.headers, params=params, timeout=10)
+            response = self._get(url, params)
             
             if response.status_code == 404:
                 return None, "Conta de staking não encontrada ou não registada"
@@ -558,10 +759,8 @@ class CardanoScanAPI:
                     token_balances[key] = token_balances.get(key, 0) + token_qty
                     unique_tokens.add(key)
         
-        # OTIMIZAÇÃO: pré-carregar metadata apenas para tokens únicos (reduz chamadas API)
-        for policy_id, asset_name in unique_tokens:
-            if policy_id:  # Apenas se tiver policy
-                self.get_asset_metadata(policy_id, asset_name)
+        # OTIMIZAÇÃO: pré-carregar metadata dos tokens únicos num só lote (memória → BD → API)
+        self.prefetch_asset_metadata(unique_tokens)
         
         # Calcular diferença líquida
         net_change = total_output_user - total_input_user
@@ -0,0 +1,202 @@
+"""Cache de metadados de tokens Cardano em dois níveis.
+
+1. LRU em memória (por processo), partilhada por todas as instâncias de CardanoScanAPI
+2. t_cardano_assets na BD (metadata_status = 'ok' | 'missing', metadata_checked_at)
+
+Tokens sem metadados ficam em cache negativo: na LRU durante a vida do processo e na BD
+durante NEGATIVE_TTL_DAYS (depois disso volta-se a tentar a API).
+
+O warm-up carrega todas as entradas conhecidas numa única query, uma vez por processo
+(ou após WARM_TTL_SECONDS).
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 5000
+NEGATIVE_TTL_DAYS = 7
+WARM_TTL_SECONDS = 3600
+
+# Valor guardado na LRU para tokens sem metadados
+_NEGATIVE: Dict = {}
+
+AssetKey = Tuple[str, str]
+
+
+def asset_key(policy_id: Optional[str], asset_name_hex: Optional[str]) -> Optional[AssetKey]:
+    if not policy_id:
+        return None
+    return (policy_id, asset_name_hex or "")
+
+
+def _compact_meta(display_name: Optional[str], decimals: Optional[int]) -> Dict:
+    """Forma guardada em cache: apenas os campos resolvidos usados pelo cliente."""
+    meta: Dict = {}
+    if display_name is not None:
+        meta["resolved_name"] = display_name
+    if decimals is not None:
+        meta["resolved_decimals"] = int(decimals)
+    return meta
+
+
+class TokenMetadataCache:
+    """LRU thread-safe de metadados de tokens com persistência em t_cardano_assets."""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = int(max_entries)
+        self._entries: "OrderedDict[AssetKey, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._warmed_at: Optional[float] = None
+        self.hits = 0
+        self.misses = 0
+        self.db_hits = 0
+
+    # ---------- Nível 1: memória ----------
+    def lookup(self, key: AssetKey) -> Tuple[bool, Optional[Dict]]:
+        """Retorna (encontrado, metadados). Cache negativo devolve (True, None)."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                meta = self._entries[key]
+                return True, (meta if meta is not _NEGATIVE else None)
+            self.misses += 1
+            return False, None
+
+    def put(self, key: AssetKey, meta: Optional[Dict]):
+        with self._lock:
+            self._entries[key] = meta if meta else _NEGATIVE
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._warmed_at = None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            negatives = sum(1 for v in self._entries.values() if v is _NEGATIVE)
+            return {
+                "entries": len(self._entries),
+                "negative": negatives,
+                "hits": self.hits,
+                "misses": self.misses,
+                "db_hits": self.db_hits,
+            }
+
+    # ---------- Nível 2: BD ----------
+    def _load_rows(self, rows: Iterable[tuple]) -> int:
+        loaded = 0
+        for policy_id, asset_name_hex, display_name, decimals, status in rows:
+            key = asset_key(policy_id, asset_name_hex)
+            if key is None:
+                continue
+            self.put(key, _compact_meta(display_name, decimals) if status == "ok" else None)
+            loaded += 1
+        return loaded
+
+    def warm(self, force: bool = False) -> int:
+        """Carrega todos os metadados conhecidos de t_cardano_assets numa única query."""
+        if not force and self._warmed_at is not None and time.time() - self._warmed_at < WARM_TTL_SECONDS:
+            return 0
+        self._warmed_at = time.time()
+        try:
+            from database.connection import get_db_cursor
+            with get_db_cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT policy_id, asset_name_hex, display_name, decimals, metadata_status
+                    FROM t_cardano_assets
+                    WHERE metadata_status = 'ok'
+                       OR (metadata_status = 'missing'
+                           AND metadata_checked_at > CURRENT_TIMESTAMP - (%s * INTERVAL '1 day'))
+                    """,
+                    (NEGATIVE_TTL_DAYS,),
+                )
+                loaded = self._load_rows(cur.fetchall())
+            logger.info(f"🧠 Cache de metadados Cardano: {loaded} tokens carregados da BD")
+            return loaded
+        except Exception as e:
+            logger.debug(f"Warm-up de metadados Cardano indisponível: {e}")
+            return 0
+
+    def load_from_db(self, keys: List[AssetKey]) -> int:
+        """Procura na BD (uma query) as chaves que não estão em memória."""
+        if not keys:
+            return 0
+        try:
+            from database.connection import get_db_cursor
+            with get_db_cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT a.policy_id, a.asset_name_hex, a.display_name, a.decimals, a.metadata_status
+                    FROM t_cardano_assets a
+                    JOIN unnest(%s::text[], %s::text[]) AS k(policy_id, asset_name_hex)
+                      ON a.policy_id = k.policy_id AND a.asset_name_hex = k.asset_name_hex
+                    WHERE a.metadata_status = 'ok'
+                       OR (a.metadata_status = 'missing'
+                           AND a.metadata_checked_at > CURRENT_TIMESTAMP - (%s * INTERVAL '1 day'))
+                    """,
+                    ([k[0] for k in keys], [k[1] for k in keys], NEGATIVE_TTL_DAYS),
+                )
+                loaded = self._load_rows(cur.fetchall())
+            with self._lock:
+                self.db_hits += loaded
+            return loaded
+        except Exception as e:
+            logger.debug(f"Lookup de metadados Cardano na BD indisponível: {e}")
+            return 0
+
+    def persist(self, results: Dict[AssetKey, Optional[Dict]]):
+        """Grava resultados da API (positivos e negativos) em t_cardano_assets num único execute_values."""
+        if not results:
+            return
+        rows = []
+        for (policy_id, asset_name_hex), meta in results.items():
+            if meta:
+                rows.append((policy_id, asset_name_hex, meta.get("resolved_name"),
+                             meta.get("resolved_decimals"), "ok"))
+            else:
+                rows.append((policy_id, asset_name_hex, None, None, "missing"))
+        try:
+            from psycopg2.extras import execute_values
+            from database.connection import get_db_cursor
+            with get_db_cursor() as cur:
+                execute_values(
+                    cur,
+                    """
+                    INSERT INTO t_cardano_assets (
+                        policy_id, asset_name_hex, display_name, decimals, metadata_status, metadata_checked_at
+                    )
+                    VALUES %s
+                    ON CONFLICT (policy_id, asset_name_hex)
+                    DO UPDATE SET display_name = COALESCE(EXCLUDED.display_name, t_cardano_assets.display_name),
+                                  decimals = COALESCE(EXCLUDED.decimals, t_cardano_assets.decimals),
+                                  metadata_status = EXCLUDED.metadata_status,
+                                  metadata_checked_at = CURRENT_TIMESTAMP
+                    """,
+                    rows,
+                    template="(%s, %s, %s, %s, %s, CURRENT_TIMESTAMP)",
+                )
+        except Exception as e:
+            logger.debug(f"Não foi possível gravar metadados Cardano na BD: {e}")
+
+
+_metadata_cache: Optional[TokenMetadataCache] = None
+_metadata_cache_lock = threading.Lock()
+
+
+def get_token_metadata_cache() -> TokenMetadataCache:
+    """Instância única (por processo) do cache de metadados de tokens."""
+    global _metadata_cache
+    if _metadata_cache is None:
+        with _metadata_cache_lock:
+            if _metadata_cache is None:
+                _metadata_cache = TokenMetadataCache()
+    return _metadata_cache
@@ -19,110 +19,112 @@ Notes:
 from __future__ import annotations
 
 from typing import Optional, Dict, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 import logging
+import time
 
-from database.connection import get_connection, return_connection
+from database.connection import POOL_MAX_CONNECTIONS, get_connection, return_connection
 from database.api_config import get_active_apis
 from database.wallets import get_active_wallets
 from services.cardano_api import CardanoScanAPI
+from services.rate_limit import TokenBucket
 from services.snapshots import ensure_assets_and_snapshots, start_ensure_assets_and_snapshots_async
-from psycopg2.extras import Json
+from psycopg2.extras import Json, execute_values
 
 logger = logging.getLogger(__name__)
 
+# Cada worker segura uma ligação do pool durante a transação da wallet; as restantes ficam
+# livres para as páginas do Streamlit e o refresh de preços
+MAX_SYNC_WORKERS = POOL_MAX_CONNECTIONS - 2
 
-def _get_api_client() -> Optional[CardanoScanAPI]:
+
+def _get_api_client(rate_limiter: Optional[TokenBucket] = None) -> Optional[CardanoScanAPI]:
     apis = get_active_apis()
     if not apis:
         return None
     api_key = apis[0].get("api_key")
     if not api_key:
         return None
-    return CardanoScanAPI(api_key)
-
-
-def _upsert_cardano_asset(cur, policy_id: Optional[str], asset_name_hex: Optional[str], display_name: Optional[str], decimals: Optional[int]):
-    """Upsert asset metadata into t_cardano_assets."""
-    if not policy_id:
-        return  # ADA doesn't go here
-    # Some tokens may omit assetName; normalize to empty string to satisfy PK NOT NULL
-    asset_name_hex = asset_name_hex or ""
-    cur.execute(
-        """
-        INSERT INTO t_cardano_assets (policy_id, asset_name_hex, display_name, decimals)
-        VALUES (%s, %s, %s, %s)
-        ON CONFLICT (policy_id, asset_name_hex)
-        DO UPDATE SET display_name = COALESCE(EXCLUDED.display_name, t_cardano_assets.display_name),
-                      decimals = COALESCE(EXCLUDED.decimals, t_cardano_assets.decimals)
-        """,
-        (policy_id, asset_name_hex, display_name, decimals),
-    )
+    try:
+        timeout = int(apis[0].get("timeout") or 10)
+    except (TypeError, ValueError):
+        timeout = 10
+    return CardanoScanAPI(api_key, rate_limiter=rate_limiter, timeout=timeout)
 
 
-def _insert_transaction(cur, wallet_id: int, address: str, tx: Dict):
-    """Insert or ignore a transaction row."""
-    tx_hash = tx.get("hash")
-    ts = tx.get("timestamp")
-    # Normalize timestamp to TZ-aware
+def _get_parallel_sync_settings() -> Tuple[int, Optional[TokenBucket]]:
+    """Pool size (t_api_cardano.sync_workers) and a shared request budget (rate_limit req/min) for parallel syncs."""
+    apis = get_active_apis()
+    if not apis:
+        return 1, None
+    cfg = apis[0]
+    try:
+        workers = max(1, int(cfg.get("sync_workers") or 1))
+    except (TypeError, ValueError):
+        workers = 1
+    limiter = None
+    try:
+        rate = int(cfg.get("rate_limit") or 0)
+    except (TypeError, ValueError):
+        rate = 0
+    if rate > 0:
+        limiter = TokenBucket(rate, capacity=workers)
+    return workers, limiter
+
+
+def _parse_tx_timestamp(ts) -> Optional[datetime]:
+    """Normalize a CardanoScan timestamp (ISO string, epoch string or number) to a TZ-aware datetime."""
     if isinstance(ts, str):
         try:
             if "T" in ts:
-                tx_dt = datetime.fromisoformat(ts.replace("Z", "+00:00"))
-            else:
-                tx_dt = datetime.fromtimestamp(int(ts), tz=timezone.utc)
+                return datetime.fromisoformat(ts.replace("Z", "+00:00"))
+            return datetime.fromtimestamp(int(ts), tz=timezone.utc)
         except Exception:
-            tx_dt = None
-    elif isinstance(ts, (int, float)):
-        tx_dt = datetime.fromtimestamp(ts, tz=timezone.utc)
-    else:
-        tx_dt = None
+            return None
+    if isinstance(ts, (int, float)):
+        try:
+            return datetime.fromtimestamp(ts, tz=timezone.utc)
+        except Exception:
+            return None
+    return None
 
+
+def _transaction_row(wallet_id: int, address: str, tx: Dict) -> tuple:
+    """Build the t_cardano_transactions row for a transaction."""
     # Fees already converted to ADA in cardano_api
-    fees_ada = 0.0
-    fees_val = tx.get("fees")
     try:
-        fees_ada = float(fees_val)
+        fees_ada = float(tx.get("fees"))
     except Exception:
         fees_ada = 0.0
 
-    cur.execute(
-        """
-        INSERT INTO t_cardano_transactions (tx_hash, wallet_id, address, block_height, tx_timestamp, status, fees_ada, raw_payload)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        ON CONFLICT (tx_hash, wallet_id) DO UPDATE SET
-            block_height = EXCLUDED.block_height,
-            tx_timestamp = EXCLUDED.tx_timestamp,
-            status = EXCLUDED.status,
-            fees_ada = EXCLUDED.fees_ada
-        """,
-        (
-            tx_hash,
-            wallet_id,
-            address,
-            tx.get("block_height") or tx.get("blockHeight"),
-            tx_dt,
-            ("confirmed" if tx.get("status") else "pending") if tx.get("status") is not None else None,
-            fees_ada,
-            Json(tx),  # adapt dict -> JSON for JSONB column
-        ),
+    return (
+        tx.get("hash"),
+        wallet_id,
+        address,
+        tx.get("block_height") or tx.get("blockHeight"),
+        _parse_tx_timestamp(tx.get("timestamp")),
+        ("confirmed" if tx.get("status") else "pending") if tx.get("status") is not None else None,
+        fees_ada,
+        Json(tx),  # adapt dict -> JSON for JSONB column
     )
 
 
-def _insert_io_rows(cur, wallet_id: int, bech32_address: str, api: CardanoScanAPI, tx: Dict, symbols_accum: Optional[set] = None):
-    """Insert per-IO rows for the specific wallet address.
+def _io_rows_for_tx(
+    wallet_id: int,
+    bech32_address: str,
+    wallet_hex: str,
+    api: CardanoScanAPI,
+    tx: Dict,
+    assets_accum: Dict[Tuple[str, str], Tuple[Optional[str], Optional[int]]],
+    symbols_accum: Optional[set] = None,
+) -> List[tuple]:
+    """Build t_cardano_tx_io rows for the IOs of a transaction that match the wallet address.
 
-    Only records rows where the IO address equals the tracked wallet address.
+    Token metadata found along the way is collected in assets_accum keyed by (policy_id, asset_name_hex).
     """
     tx_hash = tx.get("hash")
-    # compare addresses in hex
-    try:
-        wallet_hex = api._convert_to_hex(bech32_address).lower()
-    except Exception:
-        wallet_hex = bech32_address.lower()
-
-    # Clean previous IO rows for idempotency
-    cur.execute("DELETE FROM t_cardano_tx_io WHERE tx_hash = %s AND wallet_id = %s", (tx_hash, wallet_id))
+    rows: List[tuple] = []
 
     def _handle_side(side_list: List[Dict], io_type: str):
         if not isinstance(side_list, list):
@@ -132,21 +134,14 @@ def _insert_io_rows(cur, wallet_id: int, bech32_address: str, api: CardanoScanAP
             if addr != wallet_hex:
                 continue
             # ADA lovelace
-            lovelace = None
             try:
                 lovelace = int(it.get("value", 0))
             except Exception:
                 lovelace = None
 
-            # Insert one row for ADA if present
+            # One row for ADA if present
             if lovelace is not None:
-                cur.execute(
-                    """
-                    INSERT INTO t_cardano_tx_io (tx_hash, wallet_id, io_type, address, lovelace)
-                    VALUES (%s, %s, %s, %s, %s)
-                    """,
-                    (tx_hash, wallet_id, io_type, bech32_address, lovelace),
-                )
+                rows.append((tx_hash, wallet_id, io_type, bech32_address, lovelace, None, None, None, None))
                 if symbols_accum is not None and lovelace != 0:
                     symbols_accum.add("ADA")
 
@@ -171,50 +166,207 @@ def _insert_io_rows(cur, wallet_id: int, bech32_address: str, api: CardanoScanAP
                     decimals = api._resolve_decimals(policy_id, display_name, asset_name_hex)
                     formatted = (raw_val_int / (10 ** decimals)) if decimals and decimals > 0 else float(raw_val_int)
 
-                    # Upsert token metadata
-                    _upsert_cardano_asset(cur, policy_id, asset_name_hex, display_name, decimals)
-
-                    # Insert IO row per token
-                    cur.execute(
-                        """
-                        INSERT INTO t_cardano_tx_io (
-                            tx_hash, wallet_id, io_type, address, policy_id, asset_name_hex, token_value_raw, token_amount
-                        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                        """,
-                        (
-                            tx_hash,
-                            wallet_id,
-                            io_type,
-                            bech32_address,
-                            policy_id,
-                            asset_name_hex,
-                            raw_val_int,
-                            formatted,
-                        ),
-                    )
+                    # Token metadata (ADA doesn't go to t_cardano_assets); keep latest non-null values
+                    if policy_id:
+                        key = (policy_id, asset_name_hex)
+                        prev_name, prev_dec = assets_accum.get(key, (None, None))
+                        assets_accum[key] = (
+                            display_name if display_name is not None else prev_name,
+                            decimals if decimals is not None else prev_dec,
+                        )
+
+                    rows.append((
+                        tx_hash, wallet_id, io_type, bech32_address, None,
+                        policy_id, asset_name_hex, raw_val_int, formatted,
+                    ))
                     if symbols_accum is not None and display_name:
                         symbols_accum.add(str(display_name).upper())
 
     _handle_side(tx.get("inputs", []), "input")
     _handle_side(tx.get("outputs", []), "output")
+    return rows
 
 
-def sync_wallet_transactions(wallet_id: int, bech32_address: str, max_pages: int = 5) -> Tuple[int, int]:
+class CardanoBatchWriter:
+    """Buffers transactions, IO rows and token metadata for one wallet and writes them in bulk.
+
+    flush() sends, inside the caller's transaction:
+    - one de-duplicated execute_values upsert into t_cardano_assets
+    - one execute_values upsert into t_cardano_transactions
+    - one DELETE of previous IO rows for the buffered tx hashes (idempotency)
+    - one execute_values INSERT into t_cardano_tx_io
+
+    page_size controls rows per statement (page_size=1 reproduces the old row-by-row round trips).
+    """
+
+    def __init__(self, wallet_id: int, bech32_address: str, api: CardanoScanAPI,
+                 symbols_accum: Optional[set] = None, page_size: int = 1000):
+        self.wallet_id = wallet_id
+        self.bech32_address = bech32_address
+        self.api = api
+        self.symbols_accum = symbols_accum
+        self.page_size = page_size
+        # compare addresses in hex
+        try:
+            self.wallet_hex = api._convert_to_hex(bech32_address).lower()
+        except Exception:
+            self.wallet_hex = bech32_address.lower()
+        self._tx_rows: Dict[str, tuple] = {}
+        self._io_rows: Dict[str, List[tuple]] = {}
+        self._assets: Dict[Tuple[str, str], Tuple[Optional[str], Optional[int]]] = {}
+
+    def prefetch_metadata(self, transactions: List[Dict]) -> int:
+        """Resolve in one batch the metadata of every token touching this wallet (cache → DB → API)."""
+        tokens = set()
+        for tx in transactions:
+            for io in (tx.get("inputs") or []) + (tx.get("outputs") or []):
+                if (io.get("address") or "").lower() != self.wallet_hex:
+                    continue
+                for tk in io.get("tokens") or []:
+                    policy_id = tk.get("policyId") or tk.get("policy")
+                    if policy_id:
+                        tokens.add((policy_id, tk.get("assetName") or tk.get("name") or ""))
+        if not tokens:
+            return 0
+        return self.api.prefetch_asset_metadata(tokens)
+
+    def add_transaction(self, tx: Dict):
+        tx_hash = tx.get("hash")
+        self._tx_rows[tx_hash] = _transaction_row(self.wallet_id, self.bech32_address, tx)
+        self._io_rows[tx_hash] = _io_rows_for_tx(
+            self.wallet_id, self.bech32_address, self.wallet_hex, self.api, tx,
+            self._assets, symbols_accum=self.symbols_accum,
+        )
+
+    def flush(self, cur) -> Dict[str, int]:
+        """Write buffered rows using the given cursor and clear the buffers. Returns row counts."""
+        counts = {"assets": len(self._assets), "transactions": len(self._tx_rows), "io_rows": 0}
+        if self._assets:
+            execute_values(
+                cur,
+                """
+                INSERT INTO t_cardano_assets (policy_id, asset_name_hex, display_name, decimals)
+                VALUES %s
+                ON CONFLICT (policy_id, asset_name_hex)
+                DO UPDATE SET display_name = COALESCE(EXCLUDED.display_name, t_cardano_assets.display_name),
+                              decimals = COALESCE(EXCLUDED.decimals, t_cardano_assets.decimals)
+                """,
+                [(pid, name, disp, dec) for (pid, name), (disp, dec) in self._assets.items()],
+                page_size=self.page_size,
+            )
+        if self._tx_rows:
+            execute_values(
+                cur,
+                """
+                INSERT INTO t_cardano_transactions (tx_hash, wallet_id, address, block_height, tx_timestamp, status, fees_ada, raw_payload)
+                VALUES %s
+                ON CONFLICT (tx_hash, wallet_id) DO UPDATE SET
+                    block_height = EXCLUDED.block_height,
+                    tx_timestamp = EXCLUDED.tx_timestamp,
+                    status = EXCLUDED.status,
+                    fees_ada = EXCLUDED.fees_ada
+                """,
+                list(self._tx_rows.values()),
+                page_size=self.page_size,
+            )
+            # Clean previous IO rows for idempotency
+            cur.execute(
+                "DELETE FROM t_cardano_tx_io WHERE wallet_id = %s AND tx_hash = ANY(%s)",
+                (self.wallet_id, list(self._tx_rows)),
+            )
+        io_rows = [row for rows in self._io_rows.values() for row in rows]
+        if io_rows:
+            execute_values(
+                cur,
+                """
+                INSERT INTO t_cardano_tx_io (
+                    tx_hash, wallet_id, io_type, address, lovelace, policy_id, asset_name_hex, token_value_raw, token_amount
+                ) VALUES %s
+                """,
+                io_rows,
+                page_size=self.page_size,
+            )
+        counts["io_rows"] = len(io_rows)
+        self._tx_rows.clear()
+        self._io_rows.clear()
+        self._assets.clear()
+        return counts
+
+
+def _get_sync_cursor(wallet_id: int) -> Optional[int]:
+    """Return last_block_height stored in t_cardano_sync_state for the wallet (None if never synced)."""
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT last_block_height FROM t_cardano_sync_state WHERE wallet_id = %s", (wallet_id,))
+        row = cur.fetchone()
+        return int(row[0]) if row and row[0] is not None else None
+    except Exception as e:
+        logger.warning(f"Não foi possível ler cursor de sync da wallet {wallet_id}: {e}")
+        conn.rollback()
+        return None
+    finally:
+        return_connection(conn)
+
+
+def sync_wallet_transactions(
+    wallet_id: int,
+    bech32_address: str,
+    max_pages: int = 5,
+    incremental: bool = True,
+    stats: Optional[Dict] = None,
+    api: Optional[CardanoScanAPI] = None,
+) -> Tuple[int, int]:
     """Sync most recent transactions for a given Cardano wallet.
 
+    In incremental mode (default) the stored cursor (t_cardano_sync_state.last_block_height)
+    bounds the paging, and transactions already stored are not rewritten (no IO DELETE/INSERT).
+    Without a cursor (first sync) it behaves like a full sync of the newest max_pages pages.
+
+    Args:
+        stats: optional dict filled with pages_fetched, pages_skipped, failed_pages, tx_new, tx_skipped,
+            io_rows_skipped
+        api: client to use (one per wallet; defaults to a new client from the active config)
+
     Returns: (num_tx_processed, num_io_rows)
     """
-    api = _get_api_client()
+    if api is None:
+        api = _get_api_client()
     if not api:
         raise RuntimeError("Nenhuma API Cardano ativa configurada.")
 
-    transactions, error = api.get_transactions(bech32_address, max_pages=max_pages)
+    cursor_height = _get_sync_cursor(wallet_id) if incremental else None
+    if cursor_height is not None:
+        # Com cursor, percorrer as páginas necessárias até o alcançar (sem limite de max_pages)
+        transactions, error = api.get_transactions(
+            bech32_address, max_pages=None, stop_at_block_height=cursor_height
+        )
+    else:
+        transactions, error = api.get_transactions(bech32_address, max_pages=max_pages)
     if error:
         raise RuntimeError(f"Erro ao buscar transações: {error}")
 
+    fetch_stats = getattr(api, "last_fetch_stats", None) or {}
+    sync_stats = {
+        "pages_fetched": int(fetch_stats.get("pages_fetched", 0)),
+        "pages_skipped": int(fetch_stats.get("pages_skipped", 0)),
+        "failed_pages": list(fetch_stats.get("failed_pages") or []),
+        "tx_new": 0,
+        "tx_skipped": 0,
+        "io_rows_skipped": 0,
+    }
+    if stats is not None:
+        stats.update(sync_stats)
+
     if not transactions:
         return (0, 0)
 
+    # Token metadata (cache → DB → API) is resolved before the wallet's transaction is opened,
+    # so API calls and their own pooled connections never run while this connection is held
+    symbols_seen: set = set()
+    writer = CardanoBatchWriter(wallet_id, bech32_address, api, symbols_accum=symbols_seen)
+    writer.prefetch_metadata(transactions)
+
     conn = get_connection()
     try:
         cur = conn.cursor()
@@ -232,72 +384,77 @@ def sync_wallet_transactions(wallet_id: int, bech32_address: str, max_pages: int
             raise RuntimeError(
                 "Esquema Cardano v3 em falta. Aplique a migration database/migrations/20251103_cardano_tx_v3.sql."
             )
+        # Incremental: transações já guardadas não são reescritas
+        existing_hashes: set = set()
+        if incremental:
+            cur.execute(
+                "SELECT tx_hash FROM t_cardano_transactions WHERE wallet_id = %s AND tx_hash = ANY(%s)",
+                (wallet_id, [tx.get("hash") for tx in transactions]),
+            )
+            existing_hashes = {r[0] for r in cur.fetchall()}
+            if existing_hashes:
+                cur.execute(
+                    "SELECT COUNT(*) FROM t_cardano_tx_io WHERE wallet_id = %s AND tx_hash = ANY(%s)",
+                    (wallet_id, list(existing_hashes)),
+                )
+                sync_stats["io_rows_skipped"] = int(cur.fetchone()[0] or 0)
+        new_transactions = [tx for tx in transactions if tx.get("hash") not in existing_hashes]
+        sync_stats["tx_new"] = len(new_transactions)
+        sync_stats["tx_skipped"] = len(transactions) - len(new_transactions)
+
         total_io = 0
-        symbols_seen: set = set()
         min_tx_date = None
         max_tx_date = None
-        for tx in transactions:
-            _insert_transaction(cur, wallet_id, bech32_address, tx)
-            _insert_io_rows(cur, wallet_id, bech32_address, api, tx, symbols_accum=symbols_seen)
+        for tx in new_transactions:
+            writer.add_transaction(tx)
             # Track tx date range
-            ts = tx.get("timestamp")
-            tx_dt = None
-            if isinstance(ts, str):
-                try:
-                    if "T" in ts:
-                        tx_dt = datetime.fromisoformat(ts.replace("Z", "+00:00"))
-                    else:
-                        tx_dt = datetime.fromtimestamp(int(ts), tz=timezone.utc)
-                except Exception:
-                    tx_dt = None
-            elif isinstance(ts, (int, float)):
-                tx_dt = datetime.fromtimestamp(ts, tz=timezone.utc)
+            tx_dt = _parse_tx_timestamp(tx.get("timestamp"))
             if tx_dt is not None:
                 d = tx_dt.date()
                 if min_tx_date is None or d < min_tx_date:
                     min_tx_date = d
                 if max_tx_date is None or d > max_tx_date:
                     max_tx_date = d
-            # count IO rows inserted for this tx (rough estimate via rowcount not reliable as multiple inserts)
-            # We'll recompute at the end.
-
-        # Update sync state
-        last_tx = transactions[0]  # transactions are sorted recent-first in our client
-        ts = last_tx.get("timestamp")
-        if isinstance(ts, str):
-            try:
-                if "T" in ts:
-                    last_dt = datetime.fromisoformat(ts.replace("Z", "+00:00"))
-                else:
-                    last_dt = datetime.fromtimestamp(int(ts), tz=timezone.utc)
-            except Exception:
-                last_dt = None
+        written = writer.flush(cur)
+        logger.debug(f"Cardano writer: {written}")
+
+        # Update sync state. With failed pages the fetched list has holes: keep the stored cursor so
+        # the next incremental sync pages back over them (already stored transactions are skipped)
+        if sync_stats["failed_pages"]:
+            logger.warning(
+                f"⚠️ Sync wallet {wallet_id}: página(s) {sync_stats['failed_pages']} falharam; cursor não avançado"
+            )
         else:
-            try:
-                last_dt = datetime.fromtimestamp(ts, tz=timezone.utc)
-            except Exception:
-                last_dt = None
-
-        cur.execute(
-            """
-            INSERT INTO t_cardano_sync_state (wallet_id, last_block_height, last_tx_timestamp, last_synced_at)
-            VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
-            ON CONFLICT (wallet_id)
-            DO UPDATE SET last_block_height = EXCLUDED.last_block_height,
-                          last_tx_timestamp = EXCLUDED.last_tx_timestamp,
-                          last_synced_at = CURRENT_TIMESTAMP
-            """,
-            (
-                wallet_id,
-                last_tx.get("block_height") or last_tx.get("blockHeight"),
-                last_dt,
-            ),
-        )
+            last_tx = transactions[0]  # transactions are sorted recent-first in our client
+            last_dt = _parse_tx_timestamp(last_tx.get("timestamp"))
+
+            cur.execute(
+                """
+                INSERT INTO t_cardano_sync_state (wallet_id, last_block_height, last_tx_timestamp, last_synced_at)
+                VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
+                ON CONFLICT (wallet_id)
+                DO UPDATE SET last_block_height = EXCLUDED.last_block_height,
+                              last_tx_timestamp = EXCLUDED.last_tx_timestamp,
+                              last_synced_at = CURRENT_TIMESTAMP
+                """,
+                (
+                    wallet_id,
+                    last_tx.get("block_height") or last_tx.get("blockHeight"),
+                    last_dt,
+                ),
+            )
 
         # Compute IO rows count
         cur.execute("SELECT COUNT(*) FROM t_cardano_tx_io WHERE wallet_id = %s", (wallet_id,))
         total_io = cur.fetchone()[0] or 0
         conn.commit()
+        if stats is not None:
+            stats.update(sync_stats)
+        logger.info(
+            f"🔁 Sync wallet {wallet_id}: {sync_stats['tx_new']} tx novas, {sync_stats['tx_skipped']} já existentes "
+            f"({sync_stats['io_rows_skipped']} linhas IO não reescritas), "
+            f"{sync_stats['pages_fetched']} página(s) pedida(s), {sync_stats['pages_skipped']} saltada(s)"
+        )
         # After commit, trigger snapshot filling in background to avoid blocking UI
         try:
             if symbols_seen and min_tx_date and max_tx_date:
@@ -317,7 +474,7 @@ def sync_wallet_transactions(wallet_id: int, bech32_address: str, max_pages: int
         except Exception as e:
             # Don't fail sync if pricing prep fails
             logger.warning(f"⚠️ Sync Cardano concluído mas preços podem estar incompletos: {e}")
-        return (len(transactions), int(total_io))
+        return (len(new_transactions), int(total_io))
     except Exception:
         conn.rollback()
         raise
@@ -325,16 +482,52 @@ def sync_wallet_transactions(wallet_id: int, bech32_address: str, max_pages: int
         return_connection(conn)
 
 
-def sync_all_cardano_wallets_for_user(user_id: Optional[int] = None, max_pages: int = 5, wallet_ids: Optional[List[int]] = None) -> Dict:
+def _sync_one_wallet(wallet: Dict, max_pages: int, incremental: bool, rate_limiter: Optional[TokenBucket]) -> Dict:
+    """Sync a single wallet and return its per-wallet result (timing, counts, error)."""
+    wid = int(wallet["wallet_id"])
+    addr = wallet.get("address")
+    result = {"wallet_id": wid, "address": addr, "tx": 0, "io_rows": 0, "seconds": 0.0, "error": None}
+    stats: Dict = {}
+    t0 = time.perf_counter()
+    try:
+        api = _get_api_client(rate_limiter=rate_limiter)
+        tx_count, io_total = sync_wallet_transactions(
+            wid, addr, max_pages=max_pages, incremental=incremental, stats=stats, api=api
+        )
+        result["tx"] = tx_count
+        result["io_rows"] = int(io_total)
+    except Exception as e:
+        result["error"] = str(e)
+    result["seconds"] = round(time.perf_counter() - t0, 3)
+    result.update({k: int(stats.get(k, 0)) for k in ("pages_fetched", "pages_skipped", "tx_skipped", "io_rows_skipped")})
+    result["pages_failed"] = len(stats.get("failed_pages") or [])
+    return result
+
+
+def sync_all_cardano_wallets_for_user(
+    user_id: Optional[int] = None,
+    max_pages: int = 5,
+    wallet_ids: Optional[List[int]] = None,
+    incremental: bool = True,
+    max_workers: Optional[int] = None,
+) -> Dict:
     """Sync active Cardano wallets.
     
+    Wallets are synced in a bounded thread pool (size from t_api_cardano.sync_workers unless
+    max_workers is given, capped at MAX_SYNC_WORKERS so the DB pool is never exhausted). HTTP calls share one request budget derived from rate_limit; DB writes
+    stay in one transaction per wallet.
+    
     Args:
         user_id: Filter by user (optional)
         max_pages: Number of recent transaction pages to fetch
         wallet_ids: Optional list of specific wallet_ids to sync. If provided, only these wallets are synced.
+        incremental: Use the stored sync cursor and skip transactions already stored
+        max_workers: Override the pool size (1 = sequential)
     
     Returns:
-        Dict with sync results: wallets count, synced count, io_rows, errors
+        Dict with sync results: wallets count, synced count, io_rows, errors,
+        pages_fetched, pages_skipped, pages_failed, tx_skipped, io_rows_skipped,
+        wallet_results (per wallet: tx, io_rows, seconds, error) and elapsed_seconds
     """
     wallets = get_active_wallets(user_id)
     wallets = [w for w in wallets if (w.get("blockchain") or "").lower() == "cardano"]
@@ -347,22 +540,38 @@ def sync_all_cardano_wallets_for_user(user_id: Optional[int] = None, max_pages:
     if not wallets:
         return {"wallets": 0, "synced": 0, "io_rows": 0}
 
-    results = {"wallets": len(wallets), "synced": 0, "io_rows": 0, "errors": []}
-    for w in wallets:
-        wid = int(w["wallet_id"]) if w.get("wallet_id") is not None else None
-        addr = w.get("address")
-        if not wid or not addr:
-            continue
-        try:
-            tx_count, io_total = sync_wallet_transactions(wid, addr, max_pages=max_pages)
-            if tx_count >= 0:
-                results["synced"] += 1
-            results["io_rows"] += io_total
-        except Exception as e:
+    results = {
+        "wallets": len(wallets), "synced": 0, "io_rows": 0, "errors": [],
+        "pages_fetched": 0, "pages_skipped": 0, "pages_failed": 0, "tx_skipped": 0, "io_rows_skipped": 0,
+        "wallet_results": [],
+    }
+    valid = [w for w in wallets if w.get("wallet_id") is not None and w.get("address")]
+    workers, limiter = _get_parallel_sync_settings()
+    if max_workers is not None:
+        workers = max(1, int(max_workers))
+    workers = min(workers, MAX_SYNC_WORKERS, max(1, len(valid)))
+
+    t0 = time.perf_counter()
+    if workers == 1:
+        wallet_results = [_sync_one_wallet(w, max_pages, incremental, limiter) for w in valid]
+    else:
+        logger.info(f"🧵 Sync paralelo: {len(valid)} wallets com {workers} workers")
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            wallet_results = list(pool.map(lambda w: _sync_one_wallet(w, max_pages, incremental, limiter), valid))
+
+    for r in wallet_results:
+        results["wallet_results"].append(r)
+        if r["error"]:
             # Collect error details but continue
             results["errors"].append({
-                "wallet_id": wid,
-                "address": addr,
-                "error": str(e),
+                "wallet_id": r["wallet_id"],
+                "address": r["address"],
+                "error": r["error"],
             })
+            continue
+        results["synced"] += 1
+        results["io_rows"] += r["io_rows"]
+        for key in ("pages_fetched", "pages_skipped", "pages_failed", "tx_skipped", "io_rows_skipped"):
+            results[key] += r[key]
+    results["elapsed_seconds"] = round(time.perf_counter() - t0, 3)
     return results
@@ -0,0 +1,175 @@
+"""Resolver símbolo → CoinGecko id com índice em memória e cópia em disco.
+
+A lista /coins/list (~15k moedas) é descarregada no máximo uma vez por COIN_LIST_MAX_AGE e guardada
+em cache/coingecko_coin_list.json, juntamente com o índice {SÍMBOLO: [ids candidatos]}.
+Um worker Streamlit acabado de arrancar lê o ficheiro e resolve símbolos sem ir à rede.
+
+Ordem de resolução de um símbolo:
+1. COMMON_SYMBOL_MAP (tokens mais comuns, sem ambiguidade)
+2. Índice (O(1)): primeiro candidato pela ordem da lista do CoinGecko
+
+Uso:
+    from services.coin_list import get_coin_list_resolver
+
+    resolver = get_coin_list_resolver()
+    resolver.resolve("ADA")                  # 'cardano'
+    resolver.resolve_many(["MIN", "SNEK"])   # {'MIN': 'minswap', 'SNEK': 'snek'}
+    resolver.candidates("MIN")               # todos os ids com esse símbolo
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+COIN_LIST_MAX_AGE = 24 * 3600  # 1 dia
+# Após uma falha de download, esperar antes de voltar a tentar (evita um pedido por símbolo)
+FAILED_FETCH_RETRY_SECONDS = 300
+DEFAULT_CACHE_PATH = os.path.join("cache", "coingecko_coin_list.json")
+
+
+def build_symbol_index(coins: Iterable[Dict]) -> Dict[str, List[str]]:
+    """Índice {SÍMBOLO: [ids]} preservando a ordem da lista original."""
+    index: Dict[str, List[str]] = {}
+    for c in coins:
+        sym = (c.get("symbol") or "").upper()
+        coin_id = c.get("id")
+        if sym and coin_id:
+            index.setdefault(sym, []).append(coin_id)
+    return index
+
+
+class CoinListResolver:
+    """Índice thread-safe de símbolos do CoinGecko, persistido em disco com verificação de idade."""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_age: float = COIN_LIST_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        self._index: Optional[Dict[str, List[str]]] = None
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+
+    # ---------- Persistência ----------
+    def _read_file(self) -> Optional[dict]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+            if isinstance(payload, dict) and isinstance(payload.get("index"), dict):
+                return payload
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ficheiro da coin list inválido ({self.path}): {e}")
+        return None
+
+    def _write_file(self, coins: List[Dict], index: Dict[str, List[str]], fetched_at: float):
+        tmp_path = None
+        try:
+            directory = os.path.dirname(self.path) or "."
+            os.makedirs(directory, exist_ok=True)
+            # Nome temporário único: escritores concorrentes não partilham o mesmo ficheiro
+            with tempfile.NamedTemporaryFile(
+                "w", encoding="utf-8", dir=directory, prefix=".coin_list.", suffix=".tmp", delete=False
+            ) as f:
+                tmp_path = f.name
+                json.dump({
+                    "fetched_at": fetched_at,
+                    "coins": [{"id": c.get("id"), "symbol": c.get("symbol"), "name": c.get("name")} for c in coins],
+                    "index": index,
+                }, f)
+            # Escrita atómica: outros processos nunca leem um ficheiro a meio
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.warning(f"Não foi possível guardar a coin list em {self.path}: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    # ---------- Carregamento ----------
+    def _is_fresh(self, fetched_at: float) -> bool:
+        return time.time() - fetched_at < self.max_age
+
+    def _ensure_index(self) -> Dict[str, List[str]]:
+        if self._index is not None and self._is_fresh(self._fetched_at):
+            return self._index
+        with self._lock:
+            if self._index is not None and self._is_fresh(self._fetched_at):
+                return self._index
+
+            payload = self._read_file()
+            if payload is not None and self._is_fresh(float(payload.get("fetched_at") or 0)):
+                self._index = payload["index"]
+                self._fetched_at = float(payload["fetched_at"])
+                logger.info(f"📂 Coin list carregada de {self.path} ({len(self._index)} símbolos)")
+                return self._index
+
+            # Ficheiro ausente ou antigo: descarregar /coins/list
+            from services.coingecko import _get_coin_list
+            coins = _get_coin_list()
+            if coins:
+                self._index = build_symbol_index(coins)
+                self._fetched_at = time.time()
+                self._write_file(coins, self._index, self._fetched_at)
+                logger.info(f"🌐 Coin list atualizada: {len(coins)} moedas, {len(self._index)} símbolos")
+            else:
+                # Sem rede: usar o ficheiro antigo (ou o índice atual) em vez de não resolver nada
+                if payload is not None:
+                    logger.warning("⚠️ Falha ao descarregar coin list - a usar cópia em disco expirada")
+                    self._index = payload["index"]
+                elif self._index is None:
+                    self._index = {}
+                self._fetched_at = time.time() - self.max_age + FAILED_FETCH_RETRY_SECONDS
+            return self._index
+
+    def refresh(self) -> int:
+        """Força novo download da coin list. Retorna o número de símbolos indexados."""
+        with self._lock:
+            self._index = None
+            self._fetched_at = 0.0
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+        return len(self._ensure_index())
+
+    # ---------- Resolução ----------
+    def candidates(self, symbol: str) -> List[str]:
+        """Todos os ids do CoinGecko com este símbolo (pela ordem da lista)."""
+        return list(self._ensure_index().get((symbol or "").upper(), []))
+
+    def resolve(self, symbol: str) -> Optional[str]:
+        return self.resolve_many([symbol]).get(symbol)
+
+    def resolve_many(self, symbols: Iterable[str]) -> Dict[str, Optional[str]]:
+        """Resolve uma lista de símbolos com um único carregamento do índice."""
+        from services.coingecko import COMMON_SYMBOL_MAP
+
+        out: Dict[str, Optional[str]] = {}
+        index: Optional[Dict[str, List[str]]] = None
+        for s in symbols:
+            sym = (s or "").upper()
+            if sym in COMMON_SYMBOL_MAP:
+                out[s] = COMMON_SYMBOL_MAP[sym]
+                continue
+            if index is None:
+                index = self._ensure_index()
+            ids = index.get(sym)
+            out[s] = ids[0] if ids else None
+        return out
+
+
+_resolver: Optional[CoinListResolver] = None
+_resolver_lock = threading.Lock()
+
+
+def get_coin_list_resolver() -> CoinListResolver:
+    """Instância única (por processo) do resolver de símbolos."""
+    global _resolver
+    if _resolver is None:
+        with _resolver_lock:
+            if _resolver is None:
+                _resolver = CoinListResolver()
+    return _resolver
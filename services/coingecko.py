@@ -6,17 +6,23 @@ Contractos principais:
 
 Implementação:
 - Tenta mapear símbolo para `id` do CoinGecko usando um mapeamento interno para os tokens mais comuns.
-- Se não encontrar, consulta `/coins/list` e faz correspondência por `symbol` (case-insensitive).
+- Se não encontrar, usa o índice símbolo → ids da `/coins/list` (services.coin_list), guardado em disco.
 - Usa `/simple/price` para obter preços em massa.
-- Tem caching in-memory com TTL para reduzir chamadas à API.
+- Tem caching in-memory com TTL por (coin_id, vs_currency): cada pedido só consulta a API
+  para as moedas que não estão em cache (get_price_cache_stats() expõe hits/misses).
 - Lê configuração (rate_limit, api_key) da tabela t_api_coingecko para ajustar comportamento.
 """
-from typing import List, Dict, Optional
-from datetime import date
+from typing import List, Dict, Optional, Tuple
+from datetime import date, datetime, timedelta, timezone
 import requests
+import threading
 import time
 import logging
 
+from services.coin_list import get_coin_list_resolver
+from services.rate_limit import SharedRateLimiter
+from services.single_flight import get_single_flight
+
 logger = logging.getLogger(__name__)
 
 # ---------- Dynamic config from DB ----------
@@ -78,14 +84,16 @@ _coin_list_cache: Optional[tuple] = None  # (timestamp, data)
 _coin_list_cache_ttl = 3600  # 1 hour
 _symbol_to_id_cache: Dict[str, str] = {k.upper(): v for k, v in COMMON_SYMBOL_MAP.items()}
 
-# Cache de preços com TTL mais longo para evitar rate limits
-_price_cache: Dict[str, tuple] = {}  # {cache_key: (timestamp, prices_dict)}
+# Cache de preços por moeda (coin_id, vs_currency) com TTL; entradas expiradas servem de
+# fallback por moeda quando a API falha (stale-if-error)
+_price_cache: Dict[Tuple[str, str], tuple] = {}  # {(coin_id, vs_currency): (timestamp, price)}
 _price_cache_ttl = 300  # 5 minutos - aumentado para reduzir chamadas API
+_price_cache_lock = threading.Lock()
+_price_cache_stats = {"hits": 0, "misses": 0, "stale": 0, "api_calls": 0}
 
-# Rate limiter global - garantir mínimo de X segundos entre QUALQUER chamada API
-# Valores base (podem ser sobrescritos pela config da DB)
-_last_api_call_time = 0
-_min_delay_between_calls = 4.0  # segundos - aumentado para evitar 429 errors
+# Rate limiter + circuit breaker partilhados por todas as threads e processos (ver get_coingecko_limiter)
+_coingecko_limiter: Optional[SharedRateLimiter] = None
+_coingecko_limiter_lock = threading.Lock()
 
 # Global pause flag to stop any external CoinGecko calls when requested
 _coingecko_paused = False
@@ -110,6 +118,30 @@ def _get_rate_limit_delay() -> float:
     return 2.0
 
 
+def _get_rate_limit_per_minute() -> float:
+    """Chamadas por minuto permitidas (t_api_coingecko.rate_limit), coerente com _get_rate_limit_delay()."""
+    return 60.0 / _get_rate_limit_delay()
+
+
+def get_coingecko_limiter() -> SharedRateLimiter:
+    """Limiter único do CoinGecko: orçamento de t_api_coingecko.rate_limit partilhado entre processos,
+    com circuit breaker (3 erros 429 consecutivos → 5 minutos sem pedidos)."""
+    global _coingecko_limiter
+    if _coingecko_limiter is None:
+        with _coingecko_limiter_lock:
+            if _coingecko_limiter is None:
+                _coingecko_limiter = SharedRateLimiter(
+                    "coingecko", _get_rate_limit_per_minute, trip_threshold=3, cooldown_seconds=300
+                )
+    return _coingecko_limiter
+
+
+def _is_429(error: Exception) -> bool:
+    if isinstance(error, requests.exceptions.HTTPError):
+        return getattr(error, 'response', None) is not None and error.response.status_code == 429
+    return "429" in str(error) or "rate limit" in str(error).lower()
+
+
 def invalidate_coingecko_config_cache():
     """Invalidate cached CoinGecko config so new DB values apply immediately."""
     global _coingecko_config_cache
@@ -229,28 +261,18 @@ def _get_coin_list() -> List[Dict]:
         if now - cache_time < _coin_list_cache_ttl:
             return cached_data
 
-    url = f"{_get_base_url()}/coins/list"
-    # Retry reduzido para 2 tentativas para evitar consumir rate limit
-    retries = 2
-    backoff = 5.0  # 5s fixo entre tentativas
-    for attempt in range(retries):
-        try:
-            resp = requests.get(url, headers=_get_headers(), timeout=10)
-            resp.raise_for_status()
-            data = resp.json()
-            _coin_list_cache = (now, data)
-            return data
-        except requests.RequestException as e:
-            logger.warning("Tentativa %d/%d: erro ao buscar coin list do CoinGecko: %s", attempt + 1, retries, e)
-            if attempt < retries - 1:
-                time.sleep(backoff)
-            else:
-                logger.error("❌ Erro ao buscar coin list do CoinGecko após %d tentativas: %s", retries, e)
-                # Return old cache if available
-                if _coin_list_cache is not None:
-                    logger.info("Usando cache expirado da coin list")
-                    return _coin_list_cache[1]
-                return []
+    # Mesmo caminho das outras chamadas: limiter partilhado, circuit breaker e single flight
+    data = _rate_limited_get(f"{_get_base_url()}/coins/list", timeout=10, retries=2)
+    if data is not None:
+        _coin_list_cache = (now, data)
+        return data
+
+    logger.error("❌ Erro ao buscar coin list do CoinGecko")
+    # Return old cache if available
+    if _coin_list_cache is not None:
+        logger.info("Usando cache expirado da coin list")
+        return _coin_list_cache[1]
+    return []
 
 
 def _symbol_to_id(symbol: str) -> Optional[str]:
@@ -259,18 +281,10 @@ def _symbol_to_id(symbol: str) -> Optional[str]:
     if sym in _symbol_to_id_cache:
         return _symbol_to_id_cache[sym]
 
-    coins = _get_coin_list()
-    if not coins:
-        return None
-
-    # Busca a primeira correspondência por symbol (case-insensitive)
-    for c in coins:
-        if c.get("symbol", "").upper() == sym:
-            coin_id = c.get("id")
-            _symbol_to_id_cache[sym] = coin_id
-            return coin_id
-
-    return None
+    coin_id = get_coin_list_resolver().resolve(sym)
+    if coin_id:
+        _symbol_to_id_cache[sym] = coin_id
+    return coin_id
 
 
 def resolve_coingecko_id_for_symbol(symbol: str) -> Optional[str]:
@@ -281,48 +295,105 @@ def resolve_coingecko_id_for_symbol(symbol: str) -> Optional[str]:
     return _symbol_to_id(symbol)
 
 
-def get_price_by_symbol(symbols: List[str], vs_currency: str = "eur") -> Dict[str, Optional[float]]:
-    """Obtém preços para uma lista de símbolos.
+def resolve_coingecko_ids_for_symbols(symbols: List[str]) -> Dict[str, Optional[str]]:
+    """Resolve vários símbolos de uma vez (um único carregamento do índice da coin list).
 
-    Retorna um dict com chave símbolo (original case) e valor float do preço ou None se não disponível.
+    Returns:
+        {símbolo original: coingecko_id ou None}
     """
-    if not symbols:
-        return {}
+    out: Dict[str, Optional[str]] = {}
+    pending = []
+    for s in symbols:
+        sym = s.upper()
+        if sym in _symbol_to_id_cache:
+            out[s] = _symbol_to_id_cache[sym]
+        else:
+            pending.append(s)
+    if pending:
+        resolved = get_coin_list_resolver().resolve_many([s.upper() for s in pending])
+        for s in pending:
+            coin_id = resolved.get(s.upper())
+            if coin_id:
+                _symbol_to_id_cache[s.upper()] = coin_id
+            out[s] = coin_id
+    return out
 
-    # If CoinGecko is disabled/paused, return None for all
-    if not _is_coingecko_enabled():
-        logger.info("CoinGecko disabled/paused - skipping get_price_by_symbol")
-        return {s: None for s in symbols}
 
-    # Criar cache key baseado nos símbolos e moeda
-    cache_key = f"{'-'.join(sorted(symbols))}_{vs_currency}"
+def get_price_cache_stats() -> Dict[str, int]:
+    """Contadores do cache de preços: hits/misses por moeda, fallbacks expirados e chamadas à API."""
+    with _price_cache_lock:
+        stats = dict(_price_cache_stats)
+        stats["entries"] = len(_price_cache)
+    return stats
+
+
+def clear_price_cache():
+    """Limpa o cache de preços por moeda (os contadores mantêm-se)."""
+    with _price_cache_lock:
+        _price_cache.clear()
+
+
+def _get_cached_prices(ids: List[str], vs_currency: str) -> Tuple[Dict[str, Optional[float]], List[str]]:
+    """Separa os ids em (preços em cache ainda válidos, ids em falta)."""
     now = time.time()
-    
-    # Verificar cache de preços
-    if cache_key in _price_cache:
-        cache_time, cached_prices = _price_cache[cache_key]
-        if now - cache_time < _price_cache_ttl:
-            logger.info(f"💾 Cache HIT para preços: {symbols[:3]}{'...' if len(symbols) > 3 else ''}")
-            return cached_prices
+    cached: Dict[str, Optional[float]] = {}
+    missing: List[str] = []
+    with _price_cache_lock:
+        for coin_id in ids:
+            entry = _price_cache.get((coin_id, vs_currency))
+            if entry is not None and now - entry[0] < _price_cache_ttl:
+                cached[coin_id] = entry[1]
+                _price_cache_stats["hits"] += 1
+            else:
+                missing.append(coin_id)
+                _price_cache_stats["misses"] += 1
+    return cached, missing
 
-    logger.info(f"🔍 Cache MISS - chamando API para {symbols[:3]}{'...' if len(symbols) > 3 else ''}")
 
-    # Mapeia símbolos para ids
-    symbol_id_map: Dict[str, str] = {}
-    ids = []
-    for s in symbols:
-        coin_id = _symbol_to_id(s)
-        if coin_id:
-            symbol_id_map[s] = coin_id
-            ids.append(coin_id)
-        else:
-            symbol_id_map[s] = None
+def _get_stale_prices(ids: List[str], vs_currency: str) -> Dict[str, Optional[float]]:
+    """Último preço conhecido (mesmo expirado) de cada id, para usar quando a API falha."""
+    stale: Dict[str, Optional[float]] = {}
+    with _price_cache_lock:
+        for coin_id in ids:
+            entry = _price_cache.get((coin_id, vs_currency))
+            if entry is not None and entry[1] is not None:
+                stale[coin_id] = entry[1]
+                _price_cache_stats["stale"] += 1
+    if stale:
+        logger.warning(f"⚠️ Usando cache EXPIRADO para {len(stale)}/{len(ids)} moedas para evitar falha total")
+    return stale
 
-    prices: Dict[str, Optional[float]] = {s: None for s in symbols}
-    if not ids:
-        return prices
 
-    # Chamada ao endpoint /simple/price
+def peek_cached_prices(ids: List[str], vs_currency: str) -> Dict[str, Tuple[Optional[float], float]]:
+    """Último preço em cache (válido ou expirado) e o timestamp em que foi obtido, por id.
+
+    Não chama a API nem altera os contadores; ids nunca pedidos não aparecem no resultado.
+    """
+    known: Dict[str, Tuple[Optional[float], float]] = {}
+    with _price_cache_lock:
+        for coin_id in ids:
+            entry = _price_cache.get((coin_id, vs_currency))
+            if entry is not None:
+                known[coin_id] = (entry[1], entry[0])
+    return known
+
+
+def _fetch_simple_prices(ids: List[str], vs_currency: str) -> Optional[Dict[str, Optional[float]]]:
+    """Uma chamada /simple/price para os ids indicados; guarda cada preço no cache.
+
+    Pedidos concorrentes para o mesmo conjunto de ids partilham a mesma chamada (single flight).
+
+    Returns:
+        {coin_id: preço ou None} ou None se a chamada falhar
+    """
+    ids = sorted(set(ids))
+    return get_single_flight("coingecko").do(
+        ("simple/price", tuple(ids), vs_currency),
+        lambda: _fetch_simple_prices_uncoalesced(ids, vs_currency),
+    )
+
+
+def _fetch_simple_prices_uncoalesced(ids: List[str], vs_currency: str) -> Optional[Dict[str, Optional[float]]]:
     params = {
         "ids": ",".join(ids),
         "vs_currencies": vs_currency,
@@ -337,69 +408,98 @@ def get_price_by_symbol(symbols: List[str], vs_currency: str = "eur") -> Dict[st
     backoff = 10.0  # Delay fixo de 10s entre tentativas
     for attempt in range(retries):
         try:
-            # Rate limiter global - garantir delay mínimo entre chamadas (dinâmico)
-            global _last_api_call_time
-            current_time = time.time()
-            time_since_last_call = current_time - _last_api_call_time
-            min_delay = _get_rate_limit_delay()
-            if time_since_last_call < min_delay:
-                wait_time = min_delay - time_since_last_call
-                logger.info(f"⏱️ Rate limiter: aguardando {wait_time:.2f}s antes da chamada API")
-                time.sleep(wait_time)
-            
             # Adicionar delay ANTES da retry (não na primeira tentativa)
             if attempt > 0:
                 logger.info(f"⏱️ Retry {attempt}/{retries-1}: aguardando {backoff:.1f}s antes de tentar novamente")
                 time.sleep(backoff)
             
-            _last_api_call_time = time.time()  # Atualizar timestamp
-            cache_timestamp = _last_api_call_time  # Capture timestamp for cache
+            # Rate limiter global (partilhado entre processos); False = circuit breaker aberto
+            if not get_coingecko_limiter().acquire():
+                logger.warning("⛔ CoinGecko circuit breaker aberto - a saltar /simple/price")
+                return None
+            cache_timestamp = time.time()  # Capture timestamp for cache
             # If paused mid-flight, abort before issuing request
             if not _is_coingecko_enabled():
                 logger.info("CoinGecko disabled/paused mid-call - aborting request")
-                return {s: None for s in symbols}
+                return None
             
             logger.info(f"🌐 Chamada /simple/price para {len(ids)} coins")
+            with _price_cache_lock:
+                _price_cache_stats["api_calls"] += 1
             resp = requests.get(url, params=params, headers=_get_headers(), timeout=15)
             resp.raise_for_status()
             data = resp.json()
+            get_coingecko_limiter().record_success()
 
-            # Preenche o resultado por símbolo original
-            for sym, coin_id in symbol_id_map.items():
-                if coin_id and coin_id in data and vs_currency in data[coin_id]:
-                    prices[sym] = float(data[coin_id][vs_currency])
+            fetched: Dict[str, Optional[float]] = {}
+            for coin_id in ids:
+                if coin_id in data and vs_currency in data[coin_id]:
+                    fetched[coin_id] = float(data[coin_id][vs_currency])
                 else:
-                    prices[sym] = None
+                    fetched[coin_id] = None
 
-            # Guardar no cache
-            _price_cache[cache_key] = (cache_timestamp, prices)
-            logger.info(f"✅ Preços obtidos da API: {symbols[:3]}{'...' if len(symbols) > 3 else ''}")
-            
-            return prices
+            # Guardar no cache (inclui None: evita voltar a pedir moedas sem preço durante o TTL)
+            with _price_cache_lock:
+                for coin_id, price in fetched.items():
+                    _price_cache[(coin_id, vs_currency)] = (cache_timestamp, price)
+            return fetched
             
         except requests.exceptions.HTTPError as e:
-            if hasattr(e, 'response') and e.response is not None and e.response.status_code == 429:
+            get_coingecko_limiter().record_failure(_is_429(e))
+            if _is_429(e):
                 logger.error(f"❌ 429 em /simple/price - desistindo SEM RETRY")
-                return {s: None for s in symbols}
+                return None
             logger.warning("Tentativa %d/%d: Erro HTTP ao obter preços do CoinGecko: %s", attempt + 1, retries, e)
             if attempt == retries - 1:
                 logger.error(f"❌ Falha após {retries} tentativas")
-                return {s: None for s in symbols}
+                return None
         except requests.RequestException as e:
             # On 429 or similar, wait and retry a few times
             logger.warning("Tentativa %d/%d: Erro ao obter preços do CoinGecko: %s", attempt + 1, retries, e)
             if attempt < retries - 1:
                 backoff *= 2.5  # Exponencial mais agressivo
                 continue
-            
-            # Última tentativa falhou - retornar cache expirado se existir
             logger.error("❌ Erro após %d tentativas: %s", retries, e)
-            if cache_key in _price_cache:
-                _, expired_prices = _price_cache[cache_key]
-                logger.warning("⚠️ Usando cache EXPIRADO para evitar falha total")
-                return expired_prices
-            
-            return {s: None for s in symbols}
+            return None
+    return None
+
+
+def get_price_by_symbol(symbols: List[str], vs_currency: str = "eur") -> Dict[str, Optional[float]]:
+    """Obtém preços para uma lista de símbolos.
+
+    Retorna um dict com chave símbolo (original case) e valor float do preço ou None se não disponível.
+    Moedas com preço em cache (por coin_id e vs_currency) não são pedidas à API; as restantes são
+    pedidas numa única chamada /simple/price. Se essa chamada falhar, usa-se o último preço conhecido
+    de cada moeda.
+    """
+    if not symbols:
+        return {}
+
+    # If CoinGecko is disabled/paused, return None for all
+    if not _is_coingecko_enabled():
+        logger.info("CoinGecko disabled/paused - skipping get_price_by_symbol")
+        return {s: None for s in symbols}
+
+    # Mapeia símbolos para ids
+    symbol_id_map: Dict[str, Optional[str]] = resolve_coingecko_ids_for_symbols(symbols)
+    ids = list(dict.fromkeys(coin_id for coin_id in symbol_id_map.values() if coin_id))
+    if not ids:
+        return {s: None for s in symbols}
+
+    id_prices, missing = _get_cached_prices(ids, vs_currency)
+    if missing:
+        logger.info(
+            f"🔍 Cache MISS para {len(missing)}/{len(ids)} moedas - chamando API para "
+            f"{missing[:3]}{'...' if len(missing) > 3 else ''}"
+        )
+        fetched = _fetch_simple_prices(missing, vs_currency)
+        if fetched is None:
+            fetched = _get_stale_prices(missing, vs_currency)
+        id_prices.update(fetched)
+    else:
+        logger.info(f"💾 Cache HIT para preços: {symbols[:3]}{'...' if len(symbols) > 3 else ''}")
+
+    return {s: (id_prices.get(coin_id) if coin_id else None) for s, coin_id in symbol_id_map.items()}
 
 
 if __name__ == "__main__":
@@ -412,14 +512,18 @@ if __name__ == "__main__":
 def _rate_limited_get(url: str, params: Optional[dict] = None, timeout: int = 15, retries: int = 2) -> Optional[dict]:
     """Internal helper to perform a GET with global rate limiting and backoff.
 
+    Concurrent identical GETs (same url and params) share one outbound call and its result.
     Returns parsed JSON dict on success, or None on failure after retries.
     REDUZIDO para 2 retries (em vez de 5) para evitar consumir muito rate limit.
     """
-    global _last_api_call_time
-    
+    key = ("GET", url, tuple(sorted((params or {}).items())))
+    return get_single_flight("coingecko").do(
+        key, lambda: _rate_limited_get_uncoalesced(url, dict(params or {}), timeout, retries)
+    )
+
+
+def _rate_limited_get_uncoalesced(url: str, params: dict, timeout: int, retries: int) -> Optional[dict]:
     # Add API key to params if using Demo API
-    if params is None:
-        params = {}
     params = _add_api_key_to_params(params)
     
     for attempt in range(retries):
@@ -427,23 +531,16 @@ def _rate_limited_get(url: str, params: Optional[dict] = None, timeout: int = 15
             if not _is_coingecko_enabled():
                 logger.info("CoinGecko disabled/paused - skipping HTTP GET")
                 return None
-            # Enforce global min delay between calls (dynamic from DB config)
-            now = time.time()
-            elapsed = now - _last_api_call_time
-            min_delay = _get_rate_limit_delay()
-            if elapsed < min_delay:
-                wait_time = min_delay - elapsed
-                if wait_time > 0.1:  # Only log if significant wait
-                    logger.debug(f"⏱️ Rate limiter: aguardando {wait_time:.2f}s")
-                time.sleep(wait_time)
-
             # Additional backoff between retries (FIXO em 10s para não consumir rate limit rapidamente)
             if attempt > 0:
                 retry_delay = 10.0  # Fixo em 10s
                 logger.info(f"⏱️ Retry {attempt}/{retries-1}: aguardando {retry_delay:.1f}s antes de tentar novamente")
                 time.sleep(retry_delay)
 
-            _last_api_call_time = time.time()
+            # Enforce global rate limit (shared across processes); False = circuit breaker open
+            if not get_coingecko_limiter().acquire():
+                logger.warning("⛔ CoinGecko circuit breaker aberto - a saltar HTTP GET")
+                return None
             # If paused mid-flight, abort before issuing request
             if not _is_coingecko_enabled():
                 logger.info("CoinGecko disabled/paused mid-call - aborting HTTP GET")
@@ -452,9 +549,11 @@ def _rate_limited_get(url: str, params: Optional[dict] = None, timeout: int = 15
             logger.info(f"🌐 Chamada CoinGecko: {url.split('/')[-2:]}")  # Log resumido da chamada
             resp = requests.get(url, params=params or {}, headers=_get_headers(), timeout=timeout)
             resp.raise_for_status()
+            get_coingecko_limiter().record_success()
             return resp.json()
         except requests.exceptions.HTTPError as e:
-            if hasattr(e, 'response') and e.response is not None and e.response.status_code == 429:
+            get_coingecko_limiter().record_failure(_is_429(e))
+            if _is_429(e):
                 logger.warning(f"⚠️ 429 Rate Limit na tentativa {attempt + 1}/{retries}")
                 # Para 429, desistir IMEDIATAMENTE sem retry para não piorar
                 logger.error(f"❌ 429 detectado - desistindo SEM RETRY para preservar rate limit")
@@ -516,14 +615,117 @@ def get_historical_price_by_id(coin_id: str, target_date: date, vs_currency: str
         return _get_price_from_market_chart_by_date(coin_id, target_date, vs_currency)
 
 
+def get_market_chart_range(coin_id: str, start_date: date, end_date: date, vs_currency: str = "eur") -> Optional[List]:
+    """Série de preços de /coins/{id}/market_chart/range entre duas datas (inclusive).
+
+    Uma única chamada HTTP, sem espera nem retry: quem chama obtém antes um token do limiter
+    (get_coingecko_limiter(), como no backfill) e reporta o resultado ao circuit breaker.
+
+    Returns:
+        Lista [[timestamp_ms, price], ...] ou None se a API estiver pausada/desativada.
+        Erros HTTP (incluindo 429) são propagados via raise_for_status().
+    """
+    if not _is_coingecko_enabled():
+        logger.info("CoinGecko disabled/paused - skipping market_chart/range")
+        return None
+
+    start_ts = int(datetime.combine(start_date, datetime.min.time()).replace(tzinfo=timezone.utc).timestamp())
+    end_ts = int(datetime.combine(end_date + timedelta(days=1), datetime.min.time()).replace(tzinfo=timezone.utc).timestamp()) - 1
+    url = f"{_get_base_url()}/coins/{coin_id}/market_chart/range"
+    params = _add_api_key_to_params({"vs_currency": vs_currency, "from": start_ts, "to": end_ts})
+
+    logger.info(f"🌐 Chamada market_chart/range: {coin_id} ({start_date} → {end_date})")
+    resp = requests.get(url, params=params, headers=_get_headers(), timeout=30)
+    resp.raise_for_status()
+    data = resp.json()
+    return data.get("prices", []) if isinstance(data, dict) else []
+
+
+def _daily_averages(prices: List) -> Dict[date, float]:
+    """Média das amostras de cada dia (UTC) de uma série [[timestamp_ms, preço], ...]."""
+    sums: Dict[date, List[float]] = {}
+    for point in prices or []:
+        try:
+            ts_ms, val = point[0], point[1]
+            if val is None:
+                continue
+            d = datetime.fromtimestamp(ts_ms / 1000.0, tz=timezone.utc).date()
+        except Exception:
+            continue
+        acc = sums.setdefault(d, [0.0, 0])
+        acc[0] += float(val)
+        acc[1] += 1
+    return {d: total / n for d, (total, n) in sums.items() if n}
+
+
+def _persist_market_chart_series(coin_id: str, daily: Dict[date, float]) -> int:
+    """Grava os dias completos de uma série market_chart em t_price_snapshots (source 'coingecko_chart').
+
+    O primeiro dia da série (janela iniciada a meio do dia) e o dia de hoje não são gravados.
+
+    Um único execute_values para todos os ativos com este coingecko_id. Snapshots existentes de outras
+    fontes (ex.: /history, 'coingecko') não são substituídos. Os pontos escritos entram também no cache
+    de séries de preços (services.price_cache).
+
+    Returns:
+        Número de linhas escritas
+    """
+    # A janela de N dias começa a meio do primeiro dia e o de hoje ainda não terminou:
+    # as médias parciais dos dois extremos não servem como snapshot diário
+    if not daily:
+        return 0
+    first_day = min(daily)
+    days = sorted((d, p) for d, p in daily.items() if first_day < d < date.today())
+    if not days:
+        return 0
+
+    from psycopg2.extras import execute_values
+    from database.connection import get_db_cursor
+    from services.price_cache import get_price_cache
+
+    with get_db_cursor() as cur:
+        cur.execute("SELECT asset_id FROM t_assets WHERE coingecko_id = %s", (coin_id,))
+        asset_ids = [int(r[0]) for r in cur.fetchall()]
+        if not asset_ids:
+            return 0
+        written = execute_values(
+            cur,
+            """
+            INSERT INTO t_price_snapshots (asset_id, snapshot_date, price_eur, source)
+            VALUES %s
+            ON CONFLICT (asset_id, snapshot_date)
+            DO UPDATE SET price_eur = EXCLUDED.price_eur
+            WHERE t_price_snapshots.source = 'coingecko_chart'
+            RETURNING asset_id, snapshot_date, price_eur
+            """,
+            [(aid, d, p) for aid in asset_ids for d, p in days],
+            template="(%s, %s, %s, 'coingecko_chart')",
+            page_size=1000,
+            fetch=True,
+        )
+
+    by_asset: Dict[int, List[tuple]] = {}
+    for aid, d, p in written:
+        by_asset.setdefault(int(aid), []).append((d, float(p)))
+    cache = get_price_cache()
+    for aid, points in by_asset.items():
+        cache.put(aid, [d for d, _ in points], [p for _, p in points])
+    logger.info(
+        f"💾 market_chart {coin_id}: {len(written)} snapshots gravados "
+        f"({days[0][0]} → {days[-1][0]}, {len(asset_ids)} ativo(s))"
+    )
+    return len(written)
+
+
 def _get_price_from_market_chart_by_date(coin_id: str, target_date: date, vs_currency: str = "eur") -> Optional[float]:
     """Fallback para obter preço do dia usando /coins/{id}/market_chart.
 
     Estratégia:
     - Calcula days = min(90, days_ago+1)
-    - Busca série prices e filtra amostras do próprio dia (UTC)
-    - Se existirem várias amostras, retorna média do dia
-    - Caso não haja amostras do dia, retorna o ponto mais próximo ao meio-dia UTC
+    - Busca série prices e calcula a média diária (UTC) de todos os dias devolvidos
+    - Em EUR, grava todos esses dias em t_price_snapshots (source 'coingecko_chart'), para que os
+      próximos dias em falta deste ativo não precisem de nova chamada
+    - Retorna a média do target_date; sem amostras nesse dia, o ponto mais próximo ao meio-dia UTC
     """
     try:
         days_ago = (date.today() - target_date).days
@@ -536,23 +738,18 @@ def _get_price_from_market_chart_by_date(coin_id: str, target_date: date, vs_cur
         if not prices:
             return None
 
-        # Normalizar timestamps (ms) -> date e filtrar pelo target_date
-        from datetime import datetime as _dt, timezone as _tz
-        day_points = []
-        target_midday = _dt.combine(target_date, _dt.min.time()).replace(tzinfo=_tz.utc).timestamp() + 12*3600
-        for ts_ms, val in prices:
+        daily = _daily_averages(prices)
+        if vs_currency == "eur":
             try:
-                d = _dt.utcfromtimestamp(ts_ms / 1000.0).date()
-                if d == target_date:
-                    day_points.append(float(val))
-            except Exception:
-                continue
+                _persist_market_chart_series(coin_id, daily)
+            except Exception as e:
+                logger.warning(f"Não foi possível gravar a série market_chart de {coin_id}: {e}")
 
-        if day_points:
-            avg = sum(day_points) / len(day_points)
-            return float(avg)
+        if target_date in daily:
+            return float(daily[target_date])
 
         # Se não há pontos no próprio dia, pegar o mais próximo do meio-dia do dia alvo
+        target_midday = datetime.combine(target_date, datetime.min.time()).replace(tzinfo=timezone.utc).timestamp() + 12*3600
         closest = None
         closest_dt_diff = None
         for ts_ms, val in prices:
@@ -643,12 +840,17 @@ class CoinGeckoService:
         backoff = 10.0  # Fixo em 10s
         for attempt in range(retries):
             try:
+                if not get_coingecko_limiter().acquire():
+                    logger.warning("⛔ CoinGecko circuit breaker aberto - a saltar market_chart")
+                    return {}
                 logger.info(f"🌐 Chamada market_chart: {coin_id} ({period})")
                 resp = requests.get(url, params=params, headers=_get_headers(), timeout=15)
                 resp.raise_for_status()
+                get_coingecko_limiter().record_success()
                 return resp.json()
             except requests.exceptions.HTTPError as e:
-                if hasattr(e, 'response') and e.response is not None and e.response.status_code == 429:
+                get_coingecko_limiter().record_failure(_is_429(e))
+                if _is_429(e):
                     logger.error(f"❌ 429 em market_chart - desistindo SEM RETRY: {e}")
                     return {}
                 logger.warning("Tentativa %d/%d: Erro ao obter market_chart: %s", attempt + 1, retries, e)
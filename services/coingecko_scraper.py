@@ -22,8 +22,9 @@ Motivo: Página é SPA (JavaScript dinâmico) + proteções Cloudflare/anti-bot.
 
 Funcionalidades:
 - ✅ Parse de CSV do CoinGecko (formato: snapped_at, price, market_cap, total_volume)
-- ✅ Conversão USD→EUR (taxa fixa 0.92 ou dinâmica via API)
-- ✅ Bulk insert em t_price_snapshots (batching 1000 registos)
+- ✅ Conversão USD→EUR (taxa fixa 0.92 ou diária via t_fx_rates, carregada de ficheiro do BCE)
+- ✅ Parsing vetorizado (pandas) e COPY para tabela temporária + um INSERT ... ON CONFLICT
+- ✅ Importação de vários CSV em paralelo (pool de processos) com linhas/s por ficheiro
 - ✅ ON CONFLICT handling (skip ou overwrite)
 - ⚠️ Web scraping (experimental, geralmente bloqueado)
 
@@ -31,6 +32,9 @@ Uso:
     # RECOMENDADO: CSV manual
     python -m services.coingecko_scraper --coin cardano --csv cardano/ada-usd-max.csv --all
     
+    # Vários CSV em paralelo (símbolo deduzido do nome: ada-usd-max.csv → ADA)
+    python -m services.coingecko_scraper --csv-glob "cardano/*-usd-max.csv" --workers 4 --all
+    
     # Experimental: tentar scraping automático (geralmente falha)
     python -m services.coingecko_scraper --coin bitcoin --days 30
     
@@ -39,20 +43,23 @@ Uso:
 """
 
 import argparse
-import csv
+import glob
 import logging
 import os
 import time
-from datetime import datetime, date
+from datetime import date
 from io import StringIO
 from typing import Optional, Dict, List, Tuple
 from urllib.parse import urljoin
 
+import numpy as np
+import pandas as pd
 import requests
 from bs4 import BeautifulSoup
 from sqlalchemy import text
 
-from database.connection import get_engine
+from database.connection import get_connection, get_engine, return_connection
+from services.fx_rates import DEFAULT_USD_EUR_RATE, usd_to_eur_rate, usd_to_eur_rates
 
 logger = logging.getLogger(__name__)
 
@@ -96,15 +103,12 @@ def get_realistic_headers() -> Dict[str, str]:
     }
 
 
-# Cache de taxas USD->EUR para evitar chamadas repetidas
-_usd_eur_cache: Dict[date, float] = {}
-
 def get_usd_to_eur_rate(target_date: date, use_fixed_rate: bool = True) -> float:
     """
     Obtém taxa de conversão USD->EUR para uma data específica.
     
-    Estratégia simplificada: usa taxa fixa 0.92 (média histórica 2017-2025)
-    para evitar rate limits e timeouts.
+    Com use_fixed_rate usa a taxa fixa 0.92 (média histórica 2017-2025); caso contrário usa a
+    série diária local t_fx_rates (services.fx_rates), sem pedidos HTTP.
     
     Args:
         target_date: Data para a qual queremos a taxa
@@ -113,32 +117,9 @@ def get_usd_to_eur_rate(target_date: date, use_fixed_rate: bool = True) -> float
     Returns:
         Taxa de conversão USD->EUR
     """
-    # Taxa fixa: simplifica e evita rate limits
     if use_fixed_rate:
-        return 0.92
-    
-    # Cache hit
-    if target_date in _usd_eur_cache:
-        return _usd_eur_cache[target_date]
-    
-    try:
-        # ECB API endpoint (apenas se use_fixed_rate=False)
-        url = f"https://api.exchangerate.host/{target_date.strftime('%Y-%m-%d')}"
-        params = {"base": "USD", "symbols": "EUR"}
-        
-        resp = requests.get(url, params=params, timeout=5)
-        if resp.status_code == 200:
-            data = resp.json()
-            rate = data.get("rates", {}).get("EUR")
-            if rate:
-                _usd_eur_cache[target_date] = float(rate)
-                return float(rate)
-    except Exception as e:
-        logger.debug(f"Erro ao obter taxa USD->EUR para {target_date}: {e}")
-    
-    # Fallback: taxa média histórica
-    _usd_eur_cache[target_date] = 0.92
-    return 0.92
+        return DEFAULT_USD_EUR_RATE
+    return usd_to_eur_rate(target_date)
 
 
 def download_coingecko_csv(coin_id: str, cache_dir: str = "cache", use_selenium: bool = False) -> Optional[str]:
@@ -361,6 +342,113 @@ def _download_with_selenium(coin_id: str, url: str, cache_dir: str) -> Optional[
         return None
 
 
+def _usd_to_eur_rates(dates: pd.Series, use_fixed_rate: bool = True) -> np.ndarray:
+    """Taxas USD->EUR alinhadas com `dates` (as-of join sobre t_fx_rates para a coluna inteira)."""
+    if use_fixed_rate:
+        return np.full(len(dates), DEFAULT_USD_EUR_RATE)
+    return usd_to_eur_rates(dates)
+
+
+def load_coingecko_csv(
+    csv_path: str,
+    limit_days: Optional[int] = None,
+    use_fixed_rate: bool = True,
+) -> pd.DataFrame:
+    """
+    Lê um CSV do CoinGecko (snapped_at, price, ...) e devolve preços diários em EUR.
+    
+    Parsing de datas e conversão USD->EUR vetorizados; linhas inválidas ou com preço <= 0
+    são descartadas e, havendo várias linhas no mesmo dia, fica a última.
+    
+    Returns:
+        DataFrame com colunas snapshot_date (date) e price_eur, ordenado por data
+    """
+    df = pd.read_csv(csv_path, usecols=["snapped_at", "price"])
+    # Formato: "2017-10-18 00:00:00 UTC"
+    snapped_at = pd.to_datetime(df["snapped_at"], format="%Y-%m-%d %H:%M:%S UTC", errors="coerce", utc=True)
+    price_usd = pd.to_numeric(df["price"], errors="coerce")
+    valid = snapped_at.notna() & (price_usd > 0)
+    invalid = int((~valid).sum())
+    if invalid:
+        logger.warning(f"⚠️ {invalid} linhas ignoradas (data inválida ou preço <= 0)")
+
+    out = pd.DataFrame({
+        "snapshot_date": snapped_at[valid].dt.date,
+        "price_usd": price_usd[valid],
+    })
+    out = out.drop_duplicates("snapshot_date", keep="last").sort_values("snapshot_date")
+    if limit_days:
+        out = out.tail(limit_days)
+    out["price_eur"] = out["price_usd"].to_numpy() * _usd_to_eur_rates(out["snapshot_date"], use_fixed_rate)
+    return out[["snapshot_date", "price_eur"]].reset_index(drop=True)
+
+
+def copy_prices_into_snapshots(
+    asset_id: int,
+    prices: pd.DataFrame,
+    skip_existing: bool = True,
+    source: str = "coingecko_csv",
+) -> int:
+    """
+    Carrega preços diários em t_price_snapshots via COPY para uma tabela temporária
+    e um único INSERT ... SELECT ... ON CONFLICT.
+    
+    Args:
+        asset_id: Ativo de destino
+        prices: DataFrame com snapshot_date e price_eur
+        skip_existing: Se True, não sobrescreve snapshots existentes
+        source: Valor da coluna source
+        
+    Returns:
+        Número de linhas inseridas/atualizadas
+    """
+    if prices.empty:
+        return 0
+
+    buf = StringIO()
+    prices[["snapshot_date", "price_eur"]].to_csv(buf, index=False, header=False)
+    buf.seek(0)
+
+    conflict_clause = (
+        "DO NOTHING" if skip_existing
+        else "DO UPDATE SET price_eur = EXCLUDED.price_eur, source = EXCLUDED.source"
+    )
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            # NUMERIC sem escala: o preço chega intacto ao INSERT e só é arredondado uma vez,
+            # pela coluna de t_price_snapshots
+            cur.execute("""
+                CREATE TEMP TABLE tmp_price_import (
+                    snapshot_date DATE NOT NULL,
+                    price_eur NUMERIC NOT NULL
+                ) ON COMMIT DROP
+            """)
+            cur.copy_expert("COPY tmp_price_import (snapshot_date, price_eur) FROM STDIN WITH (FORMAT csv)", buf)
+            cur.execute(
+                f"""
+                INSERT INTO t_price_snapshots (asset_id, snapshot_date, price_eur, source)
+                SELECT %s, snapshot_date, price_eur, %s
+                FROM tmp_price_import
+                ON CONFLICT (asset_id, snapshot_date) {conflict_clause}
+                """,
+                (int(asset_id), source),
+            )
+            written = cur.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        return_connection(conn)
+
+    if written:
+        # Invalidar o cache de preços em memória (só afeta este processo)
+        from services.price_cache import invalidate_prices
+        invalidate_prices(asset_id, prices["snapshot_date"].iloc[0], prices["snapshot_date"].iloc[-1])
+    return written
+
+
 def parse_csv_and_insert(
     csv_path: str,
     asset_symbol: str,
@@ -400,81 +488,63 @@ def parse_csv_and_insert(
     
     logger.info(f"📊 A processar CSV para {asset_symbol} (asset_id={asset_id})")
     
-    # Parse CSV
-    rows_to_insert = []
-    
-    with open(csv_path, "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        
-        for row in reader:
-            try:
-                # Parse data
-                snapped_at_str = row.get("snapped_at", "")
-                # Formato: "2017-10-18 00:00:00 UTC"
-                dt = datetime.strptime(snapped_at_str, "%Y-%m-%d %H:%M:%S %Z")
-                snapshot_date = dt.date()
-                
-                # Parse preço USD
-                price_usd = float(row.get("price", 0))
-                if price_usd <= 0:
-                    continue
-                
-                # Converter para EUR
-                usd_to_eur = get_usd_to_eur_rate(snapshot_date, use_fixed_rate=use_fixed_rate)
-                price_eur = price_usd * usd_to_eur
-                
-                rows_to_insert.append({
-                    "asset_id": asset_id,
-                    "snapshot_date": snapshot_date,
-                    "price_eur": price_eur,
-                    "source": "coingecko_csv",
-                })
-                
-            except Exception as e:
-                logger.warning(f"⚠️ Erro ao processar linha: {e}")
-                continue
-    
-    if not rows_to_insert:
+    prices = load_coingecko_csv(csv_path, limit_days=limit_days, use_fixed_rate=use_fixed_rate)
+    if prices.empty:
         logger.warning("⚠️ Nenhum dado válido encontrado no CSV")
         return 0
     
-    # Ordenar por data (mais recentes primeiro) e limitar
-    rows_to_insert.sort(key=lambda x: x["snapshot_date"], reverse=True)
-    if limit_days:
-        rows_to_insert = rows_to_insert[:limit_days]
-    
-    logger.info(f"📝 A inserir {len(rows_to_insert)} registos...")
-    
-    # Bulk insert com ON CONFLICT
-    conflict_clause = "DO NOTHING" if skip_existing else "DO UPDATE SET price_eur = EXCLUDED.price_eur, source = EXCLUDED.source"
+    logger.info(f"📝 A inserir {len(prices)} registos (COPY)...")
+    try:
+        inserted_count = copy_prices_into_snapshots(asset_id, prices, skip_existing=skip_existing)
+    except Exception as e:
+        logger.error(f"❌ Erro ao importar {csv_path}: {e}")
+        return 0
     
-    inserted_count = 0
-    batch_size = 1000
+    logger.info(f"✅ Total inserido: {inserted_count} registos")
+    return inserted_count
+
+
+def _symbol_from_csv_path(csv_path: str) -> str:
+    """Símbolo a partir do nome do ficheiro exportado pelo CoinGecko (ada-usd-max.csv → ADA)."""
+    return os.path.basename(csv_path).split("-", 1)[0].upper()
+
+
+def _import_csv_worker(job: Tuple[str, str, Optional[int], bool, bool]) -> Dict:
+    """Importa um CSV num processo do pool (função de topo para poder ser serializada)."""
+    csv_path, asset_symbol, limit_days, skip_existing, use_fixed_rate = job
+    t0 = time.time()
+    rows = parse_csv_and_insert(csv_path, asset_symbol, limit_days, skip_existing, use_fixed_rate)
+    return {"csv": csv_path, "symbol": asset_symbol, "rows": rows, "seconds": time.time() - t0}
+
+
+def import_csv_files(
+    csv_paths: List[str],
+    max_workers: int = 4,
+    limit_days: Optional[int] = None,
+    skip_existing: bool = True,
+    use_fixed_rate: bool = True,
+) -> List[Dict]:
+    """
+    Importa vários CSV (um ativo por ficheiro, símbolo deduzido do nome) em paralelo
+    num pool de processos.
     
-    with engine.begin() as conn:
-        for i in range(0, len(rows_to_insert), batch_size):
-            batch = rows_to_insert[i:i+batch_size]
-            
+    Returns:
+        Lista de {csv, symbol, rows, seconds} pela ordem de conclusão
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    jobs = [(p, _symbol_from_csv_path(p), limit_days, skip_existing, use_fixed_rate) for p in csv_paths]
+    results = []
+    with ProcessPoolExecutor(max_workers=max(1, min(int(max_workers), len(jobs) or 1))) as pool:
+        futures = {pool.submit(_import_csv_worker, job): job for job in jobs}
+        for fut in as_completed(futures):
+            csv_path, symbol = futures[fut][:2]
             try:
-                conn.execute(
-                    text(f"""
-                        INSERT INTO t_price_snapshots (asset_id, snapshot_date, price_eur, source)
-                        VALUES (:asset_id, :snapshot_date, :price_eur, :source)
-                        ON CONFLICT (asset_id, snapshot_date) {conflict_clause}
-                    """),
-                    batch
-                )
-                inserted_count += len(batch)
-                
-                if (i + batch_size) % 5000 == 0:
-                    logger.info(f"   ... {inserted_count}/{len(rows_to_insert)} inseridos")
-                    
+                results.append(fut.result())
             except Exception as e:
-                logger.error(f"❌ Erro ao inserir batch: {e}")
-                continue
-    
-    logger.info(f"✅ Total inserido: {inserted_count} registos")
-    return inserted_count
+                logger.error(f"❌ Falha ao importar {csv_path}: {e}")
+                results.append({"csv": csv_path, "symbol": symbol, "rows": 0, "seconds": 0.0})
+    return results
 
 
 def scrape_and_populate(
@@ -547,15 +617,20 @@ Exemplos:
   
   # Usar Selenium para bypass (requer: pip install selenium)
   python -m services.coingecko_scraper --coin ethereum --selenium --all
+  
+  # Vários CSV em paralelo
+  python -m services.coingecko_scraper --csv-glob "cardano/*-usd-max.csv" --workers 4 --all
         """
     )
-    parser.add_argument("--coin", required=True, help="CoinGecko coin ID (ex: cardano, bitcoin)")
+    parser.add_argument("--coin", help="CoinGecko coin ID (ex: cardano, bitcoin)")
+    parser.add_argument("--csv-glob", help="Importar vários CSV em paralelo (ex: 'cardano/*-usd-max.csv')")
+    parser.add_argument("--workers", type=int, default=4, help="Processos para --csv-glob (default: 4)")
     parser.add_argument("--symbol", help="Asset symbol na BD (auto-detect se omitido)")
     parser.add_argument("--csv", help="Path para CSV existente (skip download)")
     parser.add_argument("--days", type=int, help="Limitar aos N dias mais recentes")
     parser.add_argument("--all", action="store_true", help="Processar todos os dados históricos")
     parser.add_argument("--overwrite", action="store_true", help="Sobrescrever dados existentes")
-    parser.add_argument("--dynamic-rate", action="store_true", help="Usar taxa USD->EUR dinâmica (lento, pode ter timeouts)")
+    parser.add_argument("--dynamic-rate", action="store_true", help="Usar taxa USD->EUR diária de t_fx_rates (ver services.fx_rates)")
     parser.add_argument("--selenium", action="store_true", help="Usar Selenium WebDriver para bypass (requer selenium instalado)")
     parser.add_argument("--verbose", "-v", action="store_true", help="Logging verbose")
     
@@ -567,9 +642,33 @@ Exemplos:
         format="%(asctime)s - %(levelname)s - %(message)s"
     )
     
-    # Executar scraping
     limit_days = None if args.all else args.days
     
+    if args.csv_glob:
+        paths = sorted(glob.glob(args.csv_glob))
+        if not paths:
+            parser.error(f"Nenhum ficheiro corresponde a {args.csv_glob}")
+        t0 = time.time()
+        results = import_csv_files(
+            paths,
+            max_workers=args.workers,
+            limit_days=limit_days,
+            skip_existing=not args.overwrite,
+            use_fixed_rate=not args.dynamic_rate,
+        )
+        elapsed = time.time() - t0
+        for r in sorted(results, key=lambda r: r["csv"]):
+            rate = r["rows"] / r["seconds"] if r["seconds"] else 0.0
+            print(f"  {r['symbol']:<6} {r['rows']:>7} linhas em {r['seconds']:6.2f}s ({rate:,.0f} linhas/s)  {r['csv']}")
+        total = sum(r["rows"] for r in results)
+        print(f"\n✅ {total} registos em {elapsed:.2f}s ({total / elapsed if elapsed else 0:,.0f} linhas/s, "
+              f"{len(paths)} ficheiros, {args.workers} processos)")
+        return
+    
+    if not args.coin:
+        parser.error("--coin é obrigatório (exceto com --csv-glob)")
+    
+    # Executar scraping
     count = scrape_and_populate(
         coin_id=args.coin,
         asset_symbol=args.symbol,
@@ -1,17 +1,26 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
 from database.connection import get_db_cursor, get_connection, return_connection
 
-def get_current_fee_settings():
-    """Obtém a configuração de taxas mais recente."""
-    conn = get_connection()
-    try:
+DEFAULT_FEE_SETTINGS = {"maintenance_rate": 0.0025, "maintenance_min": 3.0, "performance_rate": 0.10}
+
+
+def get_current_fee_settings(cur=None):
+    """Obtém a configuração de taxas mais recente (no cursor dado, se houver, ou numa ligação própria)."""
+    conn = None
+    if cur is None:
+        conn = get_connection()
         cur = conn.cursor()
+    try:
         cur.execute("""
             SELECT maintenance_rate, maintenance_min, performance_rate
             FROM t_fee_settings
             ORDER BY valid_from DESC LIMIT 1
         """)
         row = cur.fetchone()
-        cur.close()
 
         if row:
             return {
@@ -19,63 +28,117 @@ def get_current_fee_settings():
                 "maintenance_min": float(row[1]),
                 "performance_rate": float(row[2]),
             }
-        return {"maintenance_rate": 0.0025, "maintenance_min": 3.0, "performance_rate": 0.10}
+        return dict(DEFAULT_FEE_SETTINGS)
     finally:
-        return_connection(conn)
+        if conn is not None:
+            cur.close()
+            return_connection(conn)
+
+
+def month_bounds(day: date):
+    """[primeiro dia do mês, primeiro dia do mês seguinte) - intervalo sargable para fee_date."""
+    start = day.replace(day=1)
+    end = start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+    return start, end
+
+
+def compute_fees(users: pd.DataFrame, settings: dict) -> pd.DataFrame:
+    """
+    Calcula as taxas de manutenção e performance de vários utilizadores de uma vez.
+
+    Args:
+        users: DataFrame com user_id, valor_user (valor antes de taxas), high_water (HWM atual, 0 se não
+            existir) e maintenance_charged (True se a manutenção do mês já foi cobrada)
+        settings: Configuração de taxas (get_current_fee_settings)
+
+    Returns:
+        DataFrame com user_id, fee_manutencao (calculada, mesmo se já cobrada), charge_maintenance,
+        fee_performance, valor_user (após taxas) e new_high_water (NaN se o HWM não muda)
+    """
+    valor = users["valor_user"].astype(float).to_numpy()
+    high_water = users["high_water"].astype(float).to_numpy()
+    charge_maintenance = ~users["maintenance_charged"].astype(bool).to_numpy()
+
+    # --- Maintenance Fee ---
+    fee_manutencao = np.maximum(np.round(valor * settings["maintenance_rate"], 2), settings["maintenance_min"])
+    valor = valor - np.where(charge_maintenance, fee_manutencao, 0.0)
+
+    # --- Performance Fee (sobre o lucro acima do high-water mark) ---
+    above_hwm = valor > high_water
+    fee_performance = np.where(above_hwm, np.round((valor - high_water) * settings["performance_rate"], 2), 0.0)
+    valor = valor - fee_performance
+
+    return pd.DataFrame({
+        "user_id": users["user_id"].to_numpy(),
+        "fee_manutencao": fee_manutencao,
+        "charge_maintenance": charge_maintenance,
+        "fee_performance": fee_performance,
+        "valor_user": valor,
+        "new_high_water": np.where(above_hwm, valor, np.nan),
+    })
+
+
+def write_fees(cur, fees: pd.DataFrame, fee_date):
+    """Grava em bulk, no cursor dado, as taxas cobradas (t_user_fees) e os novos HWMs (t_user_high_water)."""
+    from psycopg2.extras import execute_values
+
+    fee_rows = [
+        (int(r.user_id), "maintenance", float(r.fee_manutencao), fee_date)
+        for r in fees[fees["charge_maintenance"]].itertuples(index=False)
+    ] + [
+        (int(r.user_id), "performance", float(r.fee_performance), fee_date)
+        for r in fees[fees["new_high_water"].notna()].itertuples(index=False)
+    ]
+    if fee_rows:
+        execute_values(cur, """
+            INSERT INTO t_user_fees (user_id, fee_type, amount, fee_date)
+            VALUES %s
+        """, fee_rows, page_size=1000)
+
+    hwm_rows = [
+        (int(r.user_id), float(r.new_high_water))
+        for r in fees[fees["new_high_water"].notna()].itertuples(index=False)
+    ]
+    if hwm_rows:
+        execute_values(cur, """
+            INSERT INTO t_user_high_water (user_id, high_water_value)
+            VALUES %s
+            ON CONFLICT (user_id) DO UPDATE
+                SET high_water_value = EXCLUDED.high_water_value
+        """, hwm_rows, page_size=1000)
 
 
 def apply_fees(user_id, snapshot_date, total_value, valor_user):
     """
     Aplica taxas de manutenção e performance para um utilizador,
     com base na configuração ativa em t_fee_settings.
+    Para vários utilizadores, usar compute_fees + write_fees (ver database.portfolio).
     """
-    fees = get_current_fee_settings()
-    maintenance_rate = fees["maintenance_rate"]
-    maintenance_min = fees["maintenance_min"]
-    performance_rate = fees["performance_rate"]
+    month_start, next_month = month_bounds(snapshot_date)
 
     with get_db_cursor() as cur:
-        # --- Maintenance Fee ---
-        fee_manutencao = max(round(valor_user * maintenance_rate, 2), maintenance_min)
-
+        settings = get_current_fee_settings(cur)
         cur.execute("""
-            SELECT 1 FROM t_user_fees
-            WHERE user_id = %s AND fee_type = 'maintenance'
-              AND date_trunc('month', fee_date) = date_trunc('month', %s::date)
-        """, (user_id, snapshot_date))
-        manutencao_cobrada = cur.fetchone() is not None
-
-        if not manutencao_cobrada:
-            cur.execute("""
-                INSERT INTO t_user_fees (user_id, fee_type, amount, fee_date)
-                VALUES (%s, 'maintenance', %s, %s)
-            """, (user_id, fee_manutencao, snapshot_date))
-            valor_user -= fee_manutencao
-
-        # --- Performance Fee ---
-        cur.execute("SELECT high_water_value FROM t_user_high_water WHERE user_id = %s", (user_id,))
-        row = cur.fetchone()
-        hwm_anterior = row[0] if row else 0
-
-        performance_fee = 0
-        if valor_user > hwm_anterior:
-            lucro = valor_user - hwm_anterior
-            performance_fee = round(lucro * performance_rate, 2)
-
-            cur.execute("""
-                INSERT INTO t_user_fees (user_id, fee_type, amount, fee_date)
-                VALUES (%s, 'performance', %s, %s)
-            """, (user_id, performance_fee, snapshot_date)) 
-            valor_user -= performance_fee
-
-            cur.execute("""
-                    INSERT INTO t_user_high_water (user_id, high_water_value)
-                    VALUES (%s, %s)
-                    ON CONFLICT (user_id) DO UPDATE
-                        SET high_water_value = EXCLUDED.high_water_value
-            """, (user_id, valor_user))
-
-    return valor_user, fee_manutencao, performance_fee
+            SELECT
+                (SELECT high_water_value FROM t_user_high_water WHERE user_id = %s),
+                EXISTS (
+                    SELECT 1 FROM t_user_fees
+                    WHERE user_id = %s AND fee_type = 'maintenance'
+                      AND fee_date >= %s AND fee_date < %s
+                )
+        """, (user_id, user_id, month_start, next_month))
+        hwm_anterior, manutencao_cobrada = cur.fetchone()
+
+        fees = compute_fees(pd.DataFrame({
+            "user_id": [user_id],
+            "valor_user": [valor_user],
+            "high_water": [hwm_anterior or 0],
+            "maintenance_charged": [manutencao_cobrada],
+        }), settings)
+        write_fees(cur, fees, snapshot_date)
+
+    row = fees.iloc[0]
+    return float(row["valor_user"]), float(row["fee_manutencao"]), float(row["fee_performance"])
 
 
 def update_fee_settings(maintenance_rate, maintenance_min, performance_rate):
@@ -0,0 +1,203 @@
+"""Histórico diário do NAV do fundo (t_fund_nav_daily).
+
+Cada linha guarda, no fim do dia nav_date:
+- cash_balance: depósitos - levantamentos (não-admin) - compras + vendas
+- crypto_value: holdings × preço de t_price_snapshots (as-of, sem chamadas à API)
+- fund_nav, total_shares (t_user_shares) e nav_per_share
+
+As mesmas regras de services.shares.NavSnapshot, mas avaliadas para um intervalo de dias de uma vez:
+os deltas diários de caixa, quantidades e shares vêm de três queries agregadas, são acumulados com
+cumsum e valorizados contra uma matriz de preços (dias × ativos).
+
+update_fund_nav_daily() só calcula os dias depois do último guardado (até ontem). Escritas
+retroativas em movimentos, transações, shares ou preços apagam, por trigger, os dias a partir da data
+alterada, que são recalculados na execução seguinte:
+
+    python -m services.fund_nav
+"""
+import logging
+import time
+from datetime import date, timedelta
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from database.connection import get_db_cursor, get_engine
+
+logger = logging.getLogger(__name__)
+
+# Variação diária de caixa: movimentos de capital não-admin e cashflow das transações
+_CASH_DELTAS_SQL = """
+    SELECT day, SUM(amount) AS cash_delta
+    FROM (
+        SELECT uc.movement_date::date AS day, COALESCE(uc.credit, 0) - COALESCE(uc.debit, 0) AS amount
+        FROM t_user_capital_movements uc
+        JOIN t_users u ON u.user_id = uc.user_id
+        WHERE u.is_admin = FALSE AND uc.movement_date < %(until)s
+        UNION ALL
+        SELECT transaction_date::date,
+               CASE WHEN transaction_type = 'buy' THEN -(price_eur * quantity + COALESCE(fee_eur, 0))
+                    WHEN transaction_type = 'sell' THEN (price_eur * quantity) - COALESCE(fee_eur, 0)
+                    ELSE 0 END
+        FROM t_transactions
+        WHERE transaction_date < %(until)s
+    ) movements
+    GROUP BY day
+"""
+
+# Variação diária de quantidade por ativo
+_QTY_DELTAS_SQL = """
+    SELECT t.transaction_date::date AS day, a.symbol,
+           SUM(CASE WHEN t.transaction_type = 'buy' THEN t.quantity ELSE -t.quantity END) AS qty_delta
+    FROM t_transactions t
+    JOIN t_assets a ON t.asset_id = a.asset_id
+    WHERE t.transaction_date < %(until)s
+    GROUP BY 1, 2
+"""
+
+# Variação diária de shares em circulação
+_SHARES_DELTAS_SQL = """
+    SELECT movement_date::date AS day, SUM(shares_amount) AS shares_delta
+    FROM t_user_shares
+    WHERE movement_date < %(until)s
+    GROUP BY 1
+"""
+
+
+def _cumulative(deltas: pd.DataFrame, value_col: str, days: pd.DatetimeIndex, columns: Optional[str] = None):
+    """Acumula deltas diários (desde o primeiro registo) e devolve o valor no fim de cada dia em `days`."""
+    if deltas.empty:
+        if columns:
+            return pd.DataFrame(index=days, dtype=float)
+        return pd.Series(0.0, index=days)
+    deltas = deltas.assign(day=pd.to_datetime(deltas['day']), **{value_col: deltas[value_col].astype(float)})
+    first = min(deltas['day'].min(), days[0])
+    full_index = pd.date_range(first, days[-1], freq='D')
+    if columns:
+        wide = deltas.pivot_table(index='day', columns=columns, values=value_col, aggfunc='sum')
+        return wide.reindex(full_index, fill_value=0.0).fillna(0.0).cumsum().reindex(days)
+    series = deltas.groupby('day')[value_col].sum()
+    return series.reindex(full_index, fill_value=0.0).cumsum().reindex(days)
+
+
+def compute_fund_nav_series(start_date: date, end_date: date) -> pd.DataFrame:
+    """Calcula o NAV do fundo em cada dia de [start_date, end_date] (vetorizado).
+
+    Returns:
+        DataFrame com nav_date, cash_balance, crypto_value, fund_nav, total_shares,
+        nav_per_share e missing_prices (uma linha por dia)
+    """
+    from services.snapshots import get_historical_price_matrix
+
+    columns = ['nav_date', 'cash_balance', 'crypto_value', 'fund_nav', 'total_shares', 'nav_per_share', 'missing_prices']
+    if start_date > end_date:
+        return pd.DataFrame(columns=columns)
+
+    engine = get_engine()
+    params = {'until': end_date + timedelta(days=1)}
+    cash_deltas = pd.read_sql(_CASH_DELTAS_SQL, engine, params=params)
+    qty_deltas = pd.read_sql(_QTY_DELTAS_SQL, engine, params=params)
+    shares_deltas = pd.read_sql(_SHARES_DELTAS_SQL, engine, params=params)
+
+    days = pd.date_range(start_date, end_date, freq='D')
+    cash = _cumulative(cash_deltas, 'cash_delta', days)
+    total_shares = _cumulative(shares_deltas, 'shares_delta', days)
+    quantities = _cumulative(qty_deltas, 'qty_delta', days, columns='symbol')
+
+    # Só ativos com saldo positivo contam para o NAV (como no NAV atual)
+    quantities = quantities.where(quantities > 0, 0.0)
+    held = [sym for sym in quantities.columns if (quantities[sym] > 0).any()]
+    if held:
+        prices = get_historical_price_matrix(held, list(days.date), allow_api_fallback=False, asof=True)
+        prices = prices.reindex(index=days, columns=held)
+        held_qty = quantities[held]
+        crypto_value = (held_qty * prices.fillna(0.0)).sum(axis=1)
+        missing_prices = ((held_qty > 0) & prices.isna()).sum(axis=1)
+    else:
+        crypto_value = pd.Series(0.0, index=days)
+        missing_prices = pd.Series(0, index=days)
+
+    fund_nav = cash + crypto_value
+    shares = total_shares.to_numpy()
+    # Sem shares ainda: NAV/share inicial = 1.0
+    nav_per_share = np.divide(fund_nav.to_numpy(), shares, out=np.ones(len(days)), where=shares != 0)
+
+    return pd.DataFrame({
+        'nav_date': days.date,
+        'cash_balance': cash.to_numpy(),
+        'crypto_value': crypto_value.to_numpy(),
+        'fund_nav': fund_nav.to_numpy(),
+        'total_shares': shares,
+        'nav_per_share': nav_per_share,
+        'missing_prices': missing_prices.to_numpy().astype(int),
+    }, columns=columns)
+
+
+def update_fund_nav_daily(end_date: Optional[date] = None) -> Dict:
+    """Acrescenta a t_fund_nav_daily os dias ainda não calculados, até end_date (por omissão, ontem).
+
+    Returns:
+        dict com rows, start_date, end_date e elapsed_seconds
+    """
+    from psycopg2.extras import execute_values
+
+    t0 = time.time()
+    end_date = end_date or (date.today() - timedelta(days=1))
+    with get_db_cursor() as cur:
+        cur.execute("""
+            SELECT
+                (SELECT MAX(nav_date) FROM t_fund_nav_daily),
+                (SELECT MIN(movement_date)::date FROM t_user_capital_movements)
+        """)
+        last_date, first_movement = cur.fetchone()
+
+    start_date = last_date + timedelta(days=1) if last_date else first_movement
+    stats = {'rows': 0, 'start_date': start_date, 'end_date': end_date, 'elapsed_seconds': 0.0}
+    if start_date is None or start_date > end_date:
+        return stats
+
+    series = compute_fund_nav_series(start_date, end_date)
+    if series.empty:
+        return stats
+
+    with get_db_cursor() as cur:
+        execute_values(
+            cur,
+            """
+            INSERT INTO t_fund_nav_daily (
+                nav_date, cash_balance, crypto_value, fund_nav, total_shares, nav_per_share, missing_prices
+            )
+            VALUES %s
+            ON CONFLICT (nav_date)
+            DO UPDATE SET cash_balance = EXCLUDED.cash_balance,
+                          crypto_value = EXCLUDED.crypto_value,
+                          fund_nav = EXCLUDED.fund_nav,
+                          total_shares = EXCLUDED.total_shares,
+                          nav_per_share = EXCLUDED.nav_per_share,
+                          missing_prices = EXCLUDED.missing_prices,
+                          updated_at = CURRENT_TIMESTAMP
+            """,
+            [
+                (r.nav_date, float(r.cash_balance), float(r.crypto_value), float(r.fund_nav),
+                 float(r.total_shares), float(r.nav_per_share), int(r.missing_prices))
+                for r in series.itertuples(index=False)
+            ],
+            page_size=1000,
+        )
+
+    stats['rows'] = len(series)
+    stats['elapsed_seconds'] = round(time.time() - t0, 2)
+    incomplete = int((series['missing_prices'] > 0).sum())
+    logger.info(
+        f"✅ t_fund_nav_daily: {len(series)} dias calculados ({start_date} → {end_date}) "
+        f"em {stats['elapsed_seconds']}s"
+        + (f" - {incomplete} dias com ativos sem preço" if incomplete else "")
+    )
+    return stats
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    stats = update_fund_nav_daily()
+    print(f"t_fund_nav_daily: {stats['rows']} dias calculados em {stats['elapsed_seconds']}s")
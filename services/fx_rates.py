@@ -0,0 +1,206 @@
+"""Série diária de câmbio USD→EUR em t_fx_rates, sem pedidos HTTP.
+
+A série é carregada em bulk a partir de um ficheiro de taxas de referência do BCE:
+- eurofxref-hist.csv / eurofxref-hist.zip (colunas Date, USD, JPY, ...; 1 EUR = x USD)
+- CSV SDMX do ECB Data Portal (EXR.D.USD.EUR.SP00.A; colunas TIME_PERIOD, OBS_VALUE)
+
+e guardada como base USD, quote EUR (1 USD = rate EUR).
+
+As conversões são vetorizadas: usd_to_eur_rates(datas) faz um as-of join (última taxa na data
+ou antes dela, como aos fins de semana e feriados) sobre a série em memória, carregada da BD
+uma vez por processo. Datas anteriores ao início da série usam a primeira taxa conhecida;
+sem série nenhuma, usa-se DEFAULT_USD_EUR_RATE.
+
+Uso:
+    python -m services.fx_rates eurofxref-hist.zip
+
+    from services.fx_rates import convert_usd_to_eur
+    df["price_eur"] = convert_usd_to_eur(df["snapshot_date"], df["price_usd"])
+"""
+import logging
+import sys
+import threading
+from datetime import date
+from io import StringIO
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Taxa média histórica 2017-2025 (a mesma usada pelo importador de CSV com taxa fixa)
+DEFAULT_USD_EUR_RATE = 0.92
+
+
+def parse_ecb_file(path: str) -> pd.DataFrame:
+    """Lê um ficheiro do BCE e devolve a série USD→EUR.
+
+    Returns:
+        DataFrame com rate_date (date) e rate (EUR por 1 USD), ordenado e sem duplicados
+    """
+    df = pd.read_csv(path, na_values=["N/A", "", "-"], skipinitialspace=True)
+    df.columns = [str(c).strip() for c in df.columns]
+    if "Date" in df.columns and "USD" in df.columns:
+        dates, eur_usd = df["Date"], df["USD"]
+    elif "TIME_PERIOD" in df.columns and "OBS_VALUE" in df.columns:
+        if "CURRENCY" in df.columns:
+            df = df[df["CURRENCY"] == "USD"]
+        dates, eur_usd = df["TIME_PERIOD"], df["OBS_VALUE"]
+    else:
+        raise ValueError(f"Formato BCE não reconhecido em {path}: colunas {list(df.columns)[:5]}")
+
+    out = pd.DataFrame({
+        "rate_date": pd.to_datetime(dates, errors="coerce"),
+        "eur_usd": pd.to_numeric(eur_usd, errors="coerce"),
+    }).dropna()
+    out = out[out["eur_usd"] > 0]
+    out["rate_date"] = out["rate_date"].dt.date
+    out["rate"] = 1.0 / out["eur_usd"]
+    out = out.drop_duplicates("rate_date", keep="last").sort_values("rate_date")
+    return out[["rate_date", "rate"]].reset_index(drop=True)
+
+
+def load_fx_rates_file(path: str, source: str = "ecb") -> int:
+    """Carrega um ficheiro do BCE em t_fx_rates (COPY para tabela temporária + um upsert).
+
+    Returns:
+        Número de linhas inseridas/atualizadas
+    """
+    from database.connection import get_connection, return_connection
+
+    rates = parse_ecb_file(path)
+    if rates.empty:
+        logger.warning(f"⚠️ Sem taxas USD válidas em {path}")
+        return 0
+
+    buf = StringIO()
+    rates.to_csv(buf, index=False, header=False)
+    buf.seek(0)
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                CREATE TEMP TABLE tmp_fx_import (
+                    rate_date DATE NOT NULL,
+                    rate NUMERIC(18, 10) NOT NULL
+                ) ON COMMIT DROP
+            """)
+            cur.copy_expert("COPY tmp_fx_import (rate_date, rate) FROM STDIN WITH (FORMAT csv)", buf)
+            cur.execute(
+                """
+                INSERT INTO t_fx_rates (base_currency, quote_currency, rate_date, rate, source)
+                SELECT 'USD', 'EUR', rate_date, rate, %s
+                FROM tmp_fx_import
+                ON CONFLICT (base_currency, quote_currency, rate_date)
+                DO UPDATE SET rate = EXCLUDED.rate, source = EXCLUDED.source
+                """,
+                (source,),
+            )
+            written = cur.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        return_connection(conn)
+
+    get_fx_rate_store().invalidate()
+    logger.info(
+        f"✅ t_fx_rates: {written} taxas USD→EUR carregadas de {path} "
+        f"({rates['rate_date'].iloc[0]} → {rates['rate_date'].iloc[-1]})"
+    )
+    return written
+
+
+class FxRateStore:
+    """Série USD→EUR em memória (dias como datetime64[D] ordenados) com as-of lookups vetorizados."""
+
+    def __init__(self):
+        self._days: Optional[np.ndarray] = None
+        self._rates: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+
+    def set_series(self, dates: Iterable, rates: Iterable[float]):
+        days = np.asarray(pd.to_datetime(pd.Series(list(dates))).to_numpy(), dtype="datetime64[D]")
+        values = np.asarray(list(rates), dtype=np.float64)
+        order = np.argsort(days, kind="stable")
+        with self._lock:
+            self._days, self._rates = days[order], values[order]
+
+    def invalidate(self):
+        with self._lock:
+            self._days, self._rates = None, None
+
+    def _load(self) -> Tuple[np.ndarray, np.ndarray]:
+        with self._lock:
+            if self._days is not None:
+                return self._days, self._rates
+        try:
+            from database.connection import get_engine
+            df = pd.read_sql(
+                """
+                SELECT rate_date, rate
+                FROM t_fx_rates
+                WHERE base_currency = 'USD' AND quote_currency = 'EUR'
+                ORDER BY rate_date
+                """,
+                get_engine(),
+            )
+        except Exception as e:
+            # Falha de leitura não fica em cache: só esta chamada usa a taxa fixa
+            logger.warning(f"t_fx_rates indisponível ({e}) - a usar taxa fixa {DEFAULT_USD_EUR_RATE}")
+            return np.array([], dtype="datetime64[D]"), np.array([], dtype=np.float64)
+        if df.empty:
+            logger.warning(f"⚠️ t_fx_rates vazia - a usar taxa fixa {DEFAULT_USD_EUR_RATE}")
+        self.set_series(df["rate_date"], df["rate"].astype(float))
+        with self._lock:
+            return self._days, self._rates
+
+    def usd_to_eur_rates(self, dates: Iterable) -> np.ndarray:
+        """Taxa USD→EUR para cada data (as-of: última taxa na data ou antes)."""
+        days, rates = self._load()
+        targets = np.asarray(pd.to_datetime(pd.Series(list(dates))).to_numpy(), dtype="datetime64[D]")
+        if len(rates) == 0:
+            return np.full(len(targets), DEFAULT_USD_EUR_RATE)
+        idx = np.searchsorted(days, targets, side="right") - 1
+        # Antes do início da série: primeira taxa conhecida
+        return rates[np.clip(idx, 0, len(rates) - 1)]
+
+
+_store: Optional[FxRateStore] = None
+_store_lock = threading.Lock()
+
+
+def get_fx_rate_store() -> FxRateStore:
+    """Instância única (por processo) da série USD→EUR."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = FxRateStore()
+    return _store
+
+
+def usd_to_eur_rates(dates: Iterable) -> np.ndarray:
+    """Taxas USD→EUR alinhadas com `dates` (um as-of join para a coluna inteira)."""
+    return get_fx_rate_store().usd_to_eur_rates(dates)
+
+
+def usd_to_eur_rate(target_date: date) -> float:
+    """Taxa USD→EUR de um único dia."""
+    return float(usd_to_eur_rates([target_date])[0])
+
+
+def convert_usd_to_eur(dates: Iterable, usd_values: Iterable[float]) -> np.ndarray:
+    """Converte uma série de valores USD para EUR com a taxa de cada data."""
+    return np.asarray(list(usd_values), dtype=np.float64) * usd_to_eur_rates(dates)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if len(sys.argv) != 2:
+        print("Uso: python -m services.fx_rates <eurofxref-hist.csv|.zip|SDMX CSV>")
+        sys.exit(1)
+    count = load_fx_rates_file(sys.argv[1])
+    print(f"t_fx_rates: {count} taxas USD→EUR carregadas")
@@ -0,0 +1,178 @@
+"""Cache em memória (por processo) de séries de preços históricos por ativo.
+
+Substitui o antigo dicionário {(symbol, date): price} sem limite por uma
+estrutura compacta e limitada:
+- Uma série por asset_id: dias como int32 (dias desde 1970-01-01) e preços float64,
+  ordenados por dia para lookups com searchsorted
+- Eviction LRU limitada por bytes (soma dos arrays de todas as séries)
+- Invalidação por ativo e intervalo de datas, chamada por quem escreve em t_price_snapshots
+- Contadores de hits/misses/evictions para diagnóstico
+
+Uso:
+    from services.price_cache import get_price_cache
+
+    cache = get_price_cache()
+    price = cache.get(asset_id, date(2024, 1, 1))
+    cache.put(asset_id, [date(2024, 1, 1)], [0.42])
+    cache.invalidate(asset_id, date(2024, 1, 1), date(2024, 1, 31))
+"""
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+_EPOCH = date(1970, 1, 1)
+
+# Limite por omissão: ~16 MB chega para ~1.4M pontos (12 bytes/ponto)
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+
+
+def date_to_day(d) -> int:
+    """Converte date/datetime/Timestamp em número de dia (dias desde 1970-01-01)."""
+    if hasattr(d, "date") and callable(d.date):
+        d = d.date()
+    return (d - _EPOCH).days
+
+
+class PriceSeriesCache:
+    """Cache LRU thread-safe de séries de preços por asset_id, limitada em bytes."""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = int(max_bytes)
+        # asset_id -> (days int32 ordenados, prices float64)
+        self._series: "OrderedDict[int, Tuple[np.ndarray, np.ndarray]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _entry_bytes(entry: Tuple[np.ndarray, np.ndarray]) -> int:
+        return int(entry[0].nbytes + entry[1].nbytes)
+
+    def _drop(self, asset_id: int):
+        entry = self._series.pop(asset_id, None)
+        if entry is not None:
+            self._bytes -= self._entry_bytes(entry)
+
+    def _evict_if_needed(self):
+        while self._bytes > self.max_bytes and self._series:
+            asset_id, entry = self._series.popitem(last=False)
+            self._bytes -= self._entry_bytes(entry)
+            self.evictions += 1
+
+    def get(self, asset_id: int, target_date) -> Optional[float]:
+        """Preço de um ativo numa data exata, ou None se não estiver em cache."""
+        asset_id = int(asset_id)
+        day = date_to_day(target_date)
+        with self._lock:
+            entry = self._series.get(asset_id)
+            if entry is not None:
+                days, prices = entry
+                i = int(np.searchsorted(days, day))
+                if i < len(days) and days[i] == day:
+                    self._series.move_to_end(asset_id)
+                    self.hits += 1
+                    return float(prices[i])
+            self.misses += 1
+            return None
+
+    def put(self, asset_id: int, dates: Iterable, prices: Iterable[float]):
+        """Junta pontos (data, preço) à série do ativo; valores novos substituem os antigos."""
+        asset_id = int(asset_id)
+        new_days = np.fromiter((date_to_day(d) for d in dates), dtype=np.int32)
+        new_prices = np.asarray(list(prices), dtype=np.float64)
+        if len(new_days) == 0:
+            return
+        if len(new_days) != len(new_prices):
+            raise ValueError("dates e prices têm de ter o mesmo tamanho")
+
+        with self._lock:
+            old = self._series.get(asset_id)
+            if old is not None:
+                # Novos primeiro: np.unique devolve a 1ª ocorrência de cada dia
+                all_days = np.concatenate([new_days, old[0]])
+                all_prices = np.concatenate([new_prices, old[1]])
+            else:
+                all_days, all_prices = new_days, new_prices
+            days, first_idx = np.unique(all_days, return_index=True)
+            entry = (days.astype(np.int32), all_prices[first_idx].astype(np.float64))
+
+            if self._entry_bytes(entry) > self.max_bytes:
+                # Série maior que o próprio cache: não guardar
+                self._drop(asset_id)
+                return
+
+            self._drop(asset_id)
+            self._series[asset_id] = entry
+            self._bytes += self._entry_bytes(entry)
+            self._evict_if_needed()
+
+    def invalidate(self, asset_id: int, start_date=None, end_date=None):
+        """Remove pontos de um ativo no intervalo [start_date, end_date].
+
+        Sem datas, remove a série inteira do ativo.
+        """
+        asset_id = int(asset_id)
+        with self._lock:
+            entry = self._series.get(asset_id)
+            if entry is None:
+                return
+            self.invalidations += 1
+            if start_date is None and end_date is None:
+                self._drop(asset_id)
+                return
+            days, prices = entry
+            lo = date_to_day(start_date) if start_date is not None else int(days[0])
+            hi = date_to_day(end_date) if end_date is not None else int(days[-1])
+            keep = (days < lo) | (days > hi)
+            if keep.all():
+                return
+            self._drop(asset_id)
+            if keep.any():
+                new_entry = (days[keep], prices[keep])
+                self._series[asset_id] = new_entry
+                self._bytes += self._entry_bytes(new_entry)
+
+    def clear(self):
+        """Limpa todas as séries (os contadores mantêm-se)."""
+        with self._lock:
+            self._series.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores e ocupação atuais do cache."""
+        with self._lock:
+            return {
+                "assets": len(self._series),
+                "points": int(sum(len(e[0]) for e in self._series.values())),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+_price_cache: Optional[PriceSeriesCache] = None
+_price_cache_lock = threading.Lock()
+
+
+def get_price_cache() -> PriceSeriesCache:
+    """Instância única (por processo) do cache de séries de preços."""
+    global _price_cache
+    if _price_cache is None:
+        with _price_cache_lock:
+            if _price_cache is None:
+                _price_cache = PriceSeriesCache()
+    return _price_cache
+
+
+def invalidate_prices(asset_id: int, start_date=None, end_date=None):
+    """Atalho para invalidar pontos de um ativo após escrita em t_price_snapshots."""
+    get_price_cache().invalidate(int(asset_id), start_date, end_date)
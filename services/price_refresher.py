@@ -0,0 +1,240 @@
+"""Preços EUR atuais em modo stale-while-revalidate.
+
+Uma thread em background mantém fresco o cache de preços do CoinGecko (services.coingecko) para todos
+os ativos de t_assets com coingecko_id:
+- a cada REFRESH_CHECK_SECONDS verifica que moedas têm preço com mais de STALE_AFTER_SECONDS
+- pede-as em lotes de até MAX_IDS_PER_CALL ids por /simple/price (normalmente uma só chamada)
+
+As páginas leem com get_latest_prices()/get_latest_prices_with_age(): recebem de imediato o último
+preço conhecido (e a sua idade), e um preço expirado apenas acorda a thread — a leitura nunca espera
+pelo CoinGecko. A única exceção é o arranque a frio: moedas que nunca tiveram preço neste processo
+são pedidas de forma síncrona (uma chamada, partilhada por single flight).
+
+Quem não pode usar um preço antigo (o cálculo de shares num depósito/levantamento) passa max_age:
+preços mais antigos que isso são pedidos de forma síncrona antes de responder.
+
+Uso:
+    from services.price_refresher import get_latest_prices_with_age
+
+    prices = get_latest_prices_with_age(["BTC", "ADA"])   # {'BTC': (91234.5, 42.0), 'ADA': (0.61, 42.0)}
+"""
+import logging
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from services import coingecko
+
+logger = logging.getLogger(__name__)
+
+VS_CURRENCY = "eur"
+STALE_AFTER_SECONDS = 300  # igual ao TTL do cache de preços do CoinGecko
+REFRESH_CHECK_SECONDS = 60
+ASSETS_RELOAD_SECONDS = 600
+# /simple/price aceita listas longas de ids, mas o URL tem limite prático
+MAX_IDS_PER_CALL = 200
+
+PriceWithAge = Tuple[Optional[float], Optional[float]]
+
+
+class PriceRefresher:
+    """Thread daemon que revalida em lote os preços EUR expirados dos ativos conhecidos."""
+
+    def __init__(
+        self,
+        stale_after: float = STALE_AFTER_SECONDS,
+        check_interval: float = REFRESH_CHECK_SECONDS,
+        max_ids_per_call: int = MAX_IDS_PER_CALL,
+    ):
+        self.stale_after = stale_after
+        self.check_interval = check_interval
+        self.max_ids_per_call = max(1, int(max_ids_per_call))
+        self._asset_ids: Dict[str, str] = {}  # {SÍMBOLO: coingecko_id} de t_assets
+        self._assets_loaded_at = 0.0
+        self._requested: Set[str] = set()  # ids pedidos por leitores fora de t_assets
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.refreshes = 0
+        self.api_calls = 0
+        self.last_refresh_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    # ---------- Ativos ----------
+    def _load_assets(self, force: bool = False) -> Dict[str, str]:
+        if not force and self._asset_ids and time.time() - self._assets_loaded_at < ASSETS_RELOAD_SECONDS:
+            return self._asset_ids
+        try:
+            from database.connection import get_db_cursor
+            with get_db_cursor() as cur:
+                cur.execute("SELECT symbol, coingecko_id FROM t_assets WHERE coingecko_id IS NOT NULL")
+                rows = cur.fetchall()
+            with self._lock:
+                self._asset_ids = {str(sym).upper(): cg_id for sym, cg_id in rows if sym and cg_id}
+                self._assets_loaded_at = time.time()
+        except Exception as e:
+            logger.debug(f"Lista de ativos para o refresher de preços indisponível: {e}")
+            self._assets_loaded_at = time.time()
+        return self._asset_ids
+
+    def resolve_ids(self, symbols: Iterable[str]) -> Dict[str, Optional[str]]:
+        """Símbolo → coingecko_id, preferindo o mapeamento de t_assets."""
+        assets = self._load_assets()
+        out: Dict[str, Optional[str]] = {}
+        pending: List[str] = []
+        for s in symbols:
+            coin_id = assets.get(s.upper())
+            if coin_id:
+                out[s] = coin_id
+            else:
+                pending.append(s)
+        if pending:
+            out.update(coingecko.resolve_coingecko_ids_for_symbols(pending))
+        return out
+
+    # ---------- Revalidação ----------
+    def request_refresh(self, coin_ids: Iterable[str] = ()):
+        """Marca ids para revalidar e acorda a thread (não bloqueia)."""
+        with self._lock:
+            self._requested.update(c for c in coin_ids if c)
+        self.start()
+        self._wake.set()
+
+    def stale_ids(self) -> List[str]:
+        """Ids conhecidos sem preço ou com preço mais antigo que stale_after."""
+        with self._lock:
+            ids = set(self._asset_ids.values()) | self._requested
+        if not ids:
+            return []
+        now = time.time()
+        known = coingecko.peek_cached_prices(list(ids), VS_CURRENCY)
+        return sorted(c for c in ids if c not in known or now - known[c][1] >= self.stale_after)
+
+    def refresh_once(self) -> int:
+        """Revalida os preços expirados em lotes de /simple/price. Retorna o número de ids pedidos."""
+        if not coingecko._is_coingecko_enabled():
+            return 0
+        self._load_assets()
+        stale = self.stale_ids()
+        if not stale:
+            return 0
+        logger.info(f"🔄 Refresher de preços: {len(stale)} moedas expiradas")
+        for i in range(0, len(stale), self.max_ids_per_call):
+            if self._stop.is_set():
+                break
+            chunk = stale[i:i + self.max_ids_per_call]
+            self.api_calls += 1
+            if coingecko._fetch_simple_prices(chunk, VS_CURRENCY) is None:
+                self.last_error = f"/simple/price falhou para {len(chunk)} moedas"
+                logger.warning(f"⚠️ Refresher de preços: {self.last_error}")
+                break
+        else:
+            self.last_error = None
+        self.refreshes += 1
+        self.last_refresh_at = time.time()
+        return len(stale)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh_once()
+            except Exception as e:
+                self.last_error = str(e)
+                logger.warning(f"⚠️ Refresher de preços: {e}")
+            self._wake.wait(self.check_interval)
+            self._wake.clear()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="price-refresher", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wake.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            tracked = len(set(self._asset_ids.values()) | self._requested)
+            running = self._thread is not None and self._thread.is_alive()
+        return {
+            "running": running,
+            "tracked": tracked,
+            "refreshes": self.refreshes,
+            "api_calls": self.api_calls,
+            "last_refresh_age": (time.time() - self.last_refresh_at) if self.last_refresh_at else None,
+            "last_error": self.last_error,
+        }
+
+    # ---------- Leitura ----------
+    def get_prices_with_age(self, symbols: List[str], max_age: Optional[float] = None) -> Dict[str, PriceWithAge]:
+        """Último preço EUR conhecido de cada símbolo e a sua idade em segundos.
+
+        Sem max_age não espera pela API (exceto no arranque a frio); com max_age, preços mais antigos
+        são pedidos de forma síncrona (a idade devolvida mostra se o pedido falhou).
+        """
+        if not symbols:
+            return {}
+        symbol_ids = self.resolve_ids(symbols)
+        ids = list(dict.fromkeys(c for c in symbol_ids.values() if c))
+        known = coingecko.peek_cached_prices(ids, VS_CURRENCY)
+
+        # Arranque a frio (sem preço anterior) ou preço mais antigo que max_age: pedido síncrono
+        now = time.time()
+        missing = [
+            c for c in ids
+            if c not in known or (max_age is not None and now - known[c][1] > max_age)
+        ]
+        if missing and coingecko._is_coingecko_enabled():
+            coingecko._fetch_simple_prices(missing, VS_CURRENCY)
+            known.update(coingecko.peek_cached_prices(missing, VS_CURRENCY))
+
+        now = time.time()
+        stale = [c for c, (_, ts) in known.items() if now - ts >= self.stale_after]
+        with self._lock:
+            tracked = set(self._asset_ids.values()) | self._requested
+        untracked = [c for c in ids if c not in tracked]
+        if stale or untracked:
+            self.request_refresh(untracked)
+        else:
+            self.start()
+
+        out: Dict[str, PriceWithAge] = {}
+        for s, coin_id in symbol_ids.items():
+            entry = known.get(coin_id) if coin_id else None
+            out[s] = (entry[0], now - entry[1]) if entry else (None, None)
+        return out
+
+
+_refresher: Optional[PriceRefresher] = None
+_refresher_lock = threading.Lock()
+
+
+def get_price_refresher() -> PriceRefresher:
+    """Instância única (por processo) do refresher de preços."""
+    global _refresher
+    if _refresher is None:
+        with _refresher_lock:
+            if _refresher is None:
+                _refresher = PriceRefresher()
+    return _refresher
+
+
+def get_latest_prices_with_age(symbols: List[str], max_age: Optional[float] = None) -> Dict[str, PriceWithAge]:
+    """{símbolo: (preço EUR ou None, idade em segundos ou None)} a partir do último valor conhecido.
+
+    max_age: idade máxima aceite; preços mais antigos são pedidos à API antes de responder.
+    """
+    return get_price_refresher().get_prices_with_age(symbols, max_age=max_age)
+
+
+def get_latest_prices(symbols: List[str]) -> Dict[str, Optional[float]]:
+    """Como get_price_by_symbol(symbols, 'eur'), mas sem bloquear em preços expirados."""
+    return {s: price for s, (price, _) in get_latest_prices_with_age(symbols).items()}
@@ -0,0 +1,273 @@
+"""Primitivas de rate limiting partilhadas pelos clientes de APIs externas (CoinGecko, CardanoScan).
+
+- TokenBucket: limitador em memória (um processo), ex.: sync paralelo de wallets Cardano
+- SharedRateLimiter: token bucket + circuit breaker partilhados entre processos via ficheiro com flock
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: estado apenas por processo
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Token bucket thread-safe para limitar chamadas à API.
+
+    - rate_per_minute: tokens repostos por minuto
+    - capacity: máximo de tokens acumulados (rajada permitida)
+
+    acquire() bloqueia até haver um token; aceita um threading.Event para cancelar a espera.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: float = 1.0):
+        self.rate_per_sec = max(float(rate_per_minute), 0.01) / 60.0
+        self.capacity = max(float(capacity), 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_sec)
+        self._updated = now
+
+    def try_acquire(self) -> float:
+        """Tenta consumir um token. Retorna 0 se conseguiu, ou os segundos até haver um token."""
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return 0.0
+            return (1.0 - self._tokens) / self.rate_per_sec
+
+    def acquire(self, stop_event: Optional[threading.Event] = None) -> bool:
+        """Espera por um token. Retorna False se stop_event for sinalizado entretanto."""
+        while True:
+            if stop_event is not None and stop_event.is_set():
+                return False
+            wait = self.try_acquire()
+            if wait <= 0:
+                return True
+            if stop_event is not None:
+                stop_event.wait(wait)
+            else:
+                time.sleep(wait)
+
+
+class SharedRateLimiter:
+    """Token bucket + circuit breaker partilhados por threads e processos do mesmo host.
+
+    O estado (tokens, contador de 429 consecutivos, breaker, waiters por pid) vive num ficheiro JSON
+    protegido por fcntl.flock, pelo que todos os workers Streamlit consomem do mesmo orçamento
+    (t_api_coingecko.rate_limit). Sem fcntl (Windows), o estado fica apenas em memória do processo.
+
+    - acquire(): espera por um token; retorna False se o breaker estiver aberto ou stop_event for sinalizado
+    - record_success() / record_failure(is_429): alimentam o breaker (abre após trip_threshold 429 seguidos)
+    - stats(): orçamento atual, waiters em fila e estado do breaker
+    """
+
+    # Intervalo máximo entre verificações enquanto espera (para notar breaker aberto/cancelamento)
+    MAX_WAIT_SLICE = 1.0
+
+    def __init__(
+        self,
+        name: str,
+        rate_per_minute: Callable[[], float],
+        capacity: float = 1.0,
+        trip_threshold: int = 3,
+        cooldown_seconds: float = 300.0,
+        state_dir: Optional[str] = None,
+    ):
+        self.name = name
+        self._rate_fn = rate_per_minute
+        self.capacity = max(float(capacity), 1.0)
+        self.trip_threshold = int(trip_threshold)
+        self.cooldown_seconds = float(cooldown_seconds)
+        self._lock = threading.Lock()
+        self._memory_state: Dict = {}
+        self.path: Optional[str] = None
+        if fcntl is not None:
+            state_dir = state_dir or os.path.join(tempfile.gettempdir(), "cryptodashboard_rate_limits")
+            os.makedirs(state_dir, exist_ok=True)
+            self.path = os.path.join(state_dir, f"{name}.json")
+
+    # ---------- Estado partilhado ----------
+    @contextmanager
+    def _state(self):
+        """Lê o estado com lock exclusivo (thread + ficheiro) e grava-o à saída."""
+        with self._lock:
+            if self.path is None:
+                yield self._memory_state
+                return
+            with open(self.path, "a+", encoding="utf-8") as f:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    raw = f.read()
+                    try:
+                        state = json.loads(raw) if raw else {}
+                    except ValueError:
+                        state = {}
+                    yield state
+                    f.seek(0)
+                    f.truncate()
+                    f.write(json.dumps(state))
+                    f.flush()
+                finally:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _rate_per_sec(self) -> float:
+        try:
+            rate = float(self._rate_fn())
+        except Exception:
+            rate = 30.0
+        return max(rate, 0.01) / 60.0
+
+    def _refill(self, state: Dict, now: float, rate_per_sec: float):
+        tokens = state.get("tokens", self.capacity)
+        updated = state.get("updated", now)
+        state["tokens"] = min(self.capacity, tokens + max(0.0, now - updated) * rate_per_sec)
+        state["updated"] = now
+
+    def _breaker_open(self, state: Dict, now: float) -> bool:
+        open_until = state.get("open_until")
+        if not open_until:
+            return False
+        if now >= open_until:
+            logger.info(f"✅ {self.name}: circuit breaker fechado após cooldown")
+            state["open_until"] = None
+            state["consecutive_429"] = 0
+            return False
+        return True
+
+    # ---------- Tokens ----------
+    def try_acquire(self) -> Optional[float]:
+        """Tenta consumir um token. Retorna 0 se conseguiu, None se o breaker estiver aberto,
+        ou os segundos até haver um token."""
+        rate_per_sec = self._rate_per_sec()
+        with self._state() as state:
+            now = time.time()
+            if self._breaker_open(state, now):
+                return None
+            self._refill(state, now, rate_per_sec)
+            if state["tokens"] >= 1.0:
+                state["tokens"] -= 1.0
+                return 0.0
+            return (1.0 - state["tokens"]) / rate_per_sec
+
+    def _add_waiter(self, delta: int):
+        pid = str(os.getpid())
+        with self._state() as state:
+            waiters = state.setdefault("waiters", {})
+            count = waiters.get(pid, 0) + delta
+            if count > 0:
+                waiters[pid] = count
+            else:
+                waiters.pop(pid, None)
+
+    def acquire(self, stop_event: Optional[threading.Event] = None) -> bool:
+        """Espera por um token. Retorna False se o breaker abrir ou stop_event for sinalizado."""
+        waiting = False
+        try:
+            while True:
+                if stop_event is not None and stop_event.is_set():
+                    return False
+                wait = self.try_acquire()
+                if wait is None:
+                    return False
+                if wait <= 0:
+                    return True
+                if not waiting:
+                    waiting = True
+                    self._add_waiter(1)
+                    if wait > 0.1:
+                        logger.debug(f"⏱️ Rate limiter {self.name}: aguardando {wait:.2f}s")
+                wait = min(wait, self.MAX_WAIT_SLICE)
+                if stop_event is not None:
+                    stop_event.wait(wait)
+                else:
+                    time.sleep(wait)
+        finally:
+            if waiting:
+                self._add_waiter(-1)
+
+    # ---------- Circuit breaker ----------
+    def is_open(self) -> bool:
+        """True se o breaker estiver aberto (pedidos suspensos até ao fim do cooldown)."""
+        with self._state() as state:
+            return self._breaker_open(state, time.time())
+
+    def record_success(self):
+        with self._state() as state:
+            if state.get("consecutive_429"):
+                logger.info(f"✅ {self.name} respondeu com sucesso - reset contador 429")
+                state["consecutive_429"] = 0
+
+    def record_failure(self, is_429: bool):
+        """Regista um erro; trip_threshold 429 consecutivos abrem o breaker durante cooldown_seconds."""
+        with self._state() as state:
+            if not is_429:
+                state["consecutive_429"] = 0
+                return
+            count = state.get("consecutive_429", 0) + 1
+            state["consecutive_429"] = count
+            logger.warning(f"⚠️ {self.name} 429 (rate limit) #{count}/{self.trip_threshold}")
+            if count >= self.trip_threshold and not state.get("open_until"):
+                state["open_until"] = time.time() + self.cooldown_seconds
+                state["trips"] = state.get("trips", 0) + 1
+                # Esvaziar o bucket: ao reabrir, recomeçar devagar
+                state["tokens"] = 0.0
+                state["updated"] = time.time()
+                logger.error(
+                    f"❌ {self.name} desabilitada temporariamente durante {self.cooldown_seconds:.0f}s "
+                    f"devido a {count} erros 429 consecutivos"
+                )
+
+    def reset(self):
+        """Fecha o breaker e repõe o bucket (ex.: após alterar a configuração da API)."""
+        with self._state() as state:
+            state.clear()
+
+    def stats(self) -> Dict:
+        """Orçamento atual, waiters (todos os processos) e estado do breaker."""
+        rate_per_sec = self._rate_per_sec()
+        with self._state() as state:
+            now = time.time()
+            tripped = self._breaker_open(state, now)
+            self._refill(state, now, rate_per_sec)
+            waiters = state.get("waiters", {})
+            for pid in list(waiters):
+                if not _pid_alive(int(pid)):
+                    waiters.pop(pid)
+            open_until = state.get("open_until")
+            return {
+                "rate_per_minute": rate_per_sec * 60.0,
+                "tokens": round(state["tokens"], 3),
+                "capacity": self.capacity,
+                "waiters": sum(waiters.values()),
+                "tripped": tripped,
+                "consecutive_429": state.get("consecutive_429", 0),
+                "open_for_seconds": max(0.0, open_until - now) if tripped else 0.0,
+                "trips": state.get("trips", 0),
+                "shared_across_processes": self.path is not None,
+            }
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
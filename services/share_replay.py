@@ -0,0 +1,251 @@
+"""Reconstrução do livro de shares (t_user_shares) a partir do histórico.
+
+Cada linha de t_user_shares depende do NAV/share no seu instante, por isso corrigir ou antedatar um
+movimento de capital desalinha todas as seguintes. replay_user_shares() recalcula o livro inteiro:
+
+1. Carrega movimentos de capital, deltas diários de caixa/quantidades das transações e a matriz de
+   preços (t_price_snapshots, as-of) dos dias de valorização - três queries e uma leitura de preços
+2. Valoriza o fundo antes de cada movimento: ledger até ao fim do dia anterior + movimentos anteriores
+3. Resolve a sequência de shares numa passagem vetorizada: com S shares e NAV antes do movimento, um
+   movimento de valor a (negativo nos levantamentos) deixa S × (1 + a / NAV) shares, pelo que o total
+   em circulação é um produto acumulado (cumprod) dos rácios; recomeça em 1.0 €/share quando o fundo
+   fica sem shares
+4. Compara com o livro atual (dry-run) ou reescreve t_user_shares numa única transação
+
+    python -m services.share_replay            # dry-run: mostra as diferenças
+    python -m services.share_replay --apply    # reescreve t_user_shares
+"""
+import argparse
+import logging
+import time
+from datetime import timedelta
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from database.connection import get_engine
+from services.fund_nav import _QTY_DELTAS_SQL, _cumulative
+from services.shares import NAV_ADVISORY_LOCK_KEY, invalidate_nav_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Hora usada em t_user_shares para movimentos de capital (que só têm dia)
+MOVEMENT_HOUR = 12
+# Abaixo disto o fundo considera-se sem shares em circulação
+EMPTY_FUND_SHARES = 1e-9
+
+_MOVEMENTS_SQL = """
+    SELECT uc.movement_id, uc.user_id, u.is_admin, uc.movement_date,
+           COALESCE(uc.credit, 0) AS credit, COALESCE(uc.debit, 0) AS debit, uc.description
+    FROM t_user_capital_movements uc
+    JOIN t_users u ON u.user_id = uc.user_id
+    WHERE COALESCE(uc.credit, 0) <> COALESCE(uc.debit, 0)
+    ORDER BY uc.movement_date, uc.movement_id
+"""
+
+# Cashflow diário das transações (compras e vendas), sem movimentos de capital
+_TRADE_CASH_SQL = """
+    SELECT transaction_date::date AS day,
+           SUM(CASE WHEN transaction_type = 'buy' THEN -(price_eur * quantity + COALESCE(fee_eur, 0))
+                    WHEN transaction_type = 'sell' THEN (price_eur * quantity) - COALESCE(fee_eur, 0)
+                    ELSE 0 END) AS cash_delta
+    FROM t_transactions
+    WHERE transaction_date < %(until)s
+    GROUP BY 1
+"""
+
+_CURRENT_SHARES_SQL = """
+    SELECT user_id, movement_date, movement_type, amount_eur, nav_per_share, shares_amount
+    FROM t_user_shares
+    ORDER BY movement_date, share_id
+"""
+
+SHARE_COLUMNS = [
+    'user_id', 'movement_date', 'movement_type', 'amount_eur',
+    'nav_per_share', 'shares_amount', 'total_shares_after', 'fund_nav', 'notes',
+]
+
+
+def _ledger_value_before(conn, movement_days: pd.Series) -> np.ndarray:
+    """Caixa das transações + valor das holdings no fim do dia anterior a cada movimento."""
+    from services.snapshots import get_historical_price_matrix
+
+    value_days = pd.DatetimeIndex(sorted(set(pd.to_datetime(movement_days) - timedelta(days=1))))
+    params = {'until': value_days[-1] + timedelta(days=1)}
+    trade_cash = _cumulative(pd.read_sql(_TRADE_CASH_SQL, conn, params=params), 'cash_delta', value_days)
+    quantities = _cumulative(pd.read_sql(_QTY_DELTAS_SQL, conn, params=params), 'qty_delta', value_days, columns='symbol')
+
+    # Só ativos com saldo positivo contam para o NAV (como no NAV atual)
+    quantities = quantities.where(quantities > 0, 0.0)
+    held = [sym for sym in quantities.columns if (quantities[sym] > 0).any()]
+    value = trade_cash.copy()
+    if held:
+        prices = get_historical_price_matrix(held, list(value_days.date), allow_api_fallback=False, asof=True)
+        prices = prices.reindex(index=value_days, columns=held)
+        missing = int(((quantities[held] > 0) & prices.isna()).to_numpy().sum())
+        if missing:
+            logger.warning(f"⚠️ Replay de shares: {missing} pares (dia, ativo) sem preço em t_price_snapshots (valorizados a 0)")
+        value = value + (quantities[held] * prices.fillna(0.0)).sum(axis=1)
+
+    return value.reindex(pd.to_datetime(movement_days) - timedelta(days=1)).to_numpy()
+
+
+def compute_share_ledger(movements: pd.DataFrame, ledger_value: np.ndarray) -> pd.DataFrame:
+    """Resolve as shares de uma sequência ordenada de movimentos (sem ciclos por linha).
+
+    Args:
+        movements: Movimentos ordenados com user_id, is_admin, movement_date, credit, debit, description
+        ledger_value: Caixa das transações + holdings antes de cada movimento (alinhado com movements)
+
+    Returns:
+        DataFrame com as colunas de t_user_shares (SHARE_COLUMNS)
+    """
+    if movements.empty:
+        return pd.DataFrame(columns=SHARE_COLUMNS)
+
+    signed = (movements['credit'].astype(float) - movements['debit'].astype(float)).to_numpy()
+    # Movimentos de admins não entram na caixa do fundo
+    cash_delta = np.where(movements['is_admin'].astype(bool).to_numpy(), 0.0, signed)
+    nav_before = ledger_value + np.concatenate(([0.0], np.cumsum(cash_delta)[:-1]))
+
+    # Rácio de shares em circulação depois/antes de cada movimento
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = 1.0 + signed / nav_before
+    # Um movimento que deixa o fundo vazio fecha a "época"; o seguinte recomeça com NAV/share = 1.0
+    emptied = (signed < 0) & (ratio <= EMPTY_FUND_SHARES)
+    epoch = np.concatenate(([0], np.cumsum(emptied)[:-1]))
+    first = np.concatenate(([True], epoch[1:] != epoch[:-1]))
+    if (signed[first] <= 0).any():
+        bad = movements.loc[first & (signed <= 0), 'movement_id'].tolist()
+        raise ValueError(f"Levantamentos sem shares em circulação (movement_id {bad})")
+    if (~first & (nav_before <= 0)).any():
+        bad = movements.loc[~first & (nav_before <= 0), 'movement_id'].tolist()
+        raise ValueError(f"NAV do fundo não positivo antes dos movimentos {bad}; impossível calcular shares")
+
+    # Shares em circulação após cada movimento: valor inicial da época × produto dos rácios seguintes
+    growth = pd.Series(np.where(first, signed, ratio))
+    shares_after = growth.groupby(epoch).cumprod().to_numpy()
+    shares_before = np.where(first, 0.0, np.concatenate(([0.0], shares_after[:-1])))
+    nav_per_share = np.where(first, 1.0, nav_before / np.where(first, 1.0, shares_before))
+    shares_amount = signed / nav_per_share
+
+    is_deposit = signed > 0
+    movement_dt = pd.to_datetime(movements['movement_date']) + pd.Timedelta(hours=MOVEMENT_HOUR)
+    descriptions = movements['description'].fillna('').astype(str)
+    ledger = pd.DataFrame({
+        'user_id': movements['user_id'].astype(int).to_numpy(),
+        'movement_date': movement_dt.to_numpy(),
+        'movement_type': np.where(is_deposit, 'deposit', 'withdrawal'),
+        'amount_eur': np.abs(signed),
+        'nav_per_share': nav_per_share,
+        'shares_amount': shares_amount,
+        'fund_nav': nav_before + cash_delta,
+        'notes': np.where(is_deposit, 'Depósito: ', 'Levantamento: ') + descriptions.to_numpy(),
+    })
+    ledger['total_shares_after'] = ledger.groupby('user_id')['shares_amount'].cumsum()
+    # Como no lançamento: um levantamento não pode deixar o utilizador com shares negativas
+    overdrawn = (ledger['total_shares_after'] < -0.01).to_numpy()  # Margem de erro por arredondamentos
+    if overdrawn.any():
+        bad = movements.loc[overdrawn, ['movement_id', 'user_id']].to_dict('records')
+        raise ValueError(f"Utilizador não tem shares suficientes nos movimentos {bad}")
+    return ledger[SHARE_COLUMNS]
+
+
+def diff_share_ledgers(current: pd.DataFrame, replayed: pd.DataFrame) -> Dict:
+    """Compara o livro atual com o reconstruído.
+
+    Returns:
+        dict com users (shares por utilizador: atual, reconstruído, diferença) e rows (linhas
+        emparelhadas por utilizador/dia/tipo/valor, com status 'added', 'removed' ou 'changed')
+    """
+    keys = ['user_id', 'day', 'movement_type', 'amount']
+
+    def _keyed(df: pd.DataFrame) -> pd.DataFrame:
+        out = df[['user_id', 'movement_date', 'movement_type', 'amount_eur', 'nav_per_share', 'shares_amount']].copy()
+        out['day'] = pd.to_datetime(out['movement_date']).dt.date
+        out['amount'] = out['amount_eur'].astype(float).round(2)
+        out['nth'] = out.groupby(keys).cumcount()
+        return out[keys + ['nth', 'nav_per_share', 'shares_amount']].astype({'nav_per_share': float, 'shares_amount': float})
+
+    rows = _keyed(current).merge(
+        _keyed(replayed), on=keys + ['nth'], how='outer', suffixes=('_current', '_replayed'), indicator=True
+    )
+    rows['status'] = rows['_merge'].map({'left_only': 'removed', 'right_only': 'added', 'both': 'changed'}).astype(str)
+    changed = (rows['status'] != 'changed') | ~np.isclose(
+        rows['shares_amount_current'], rows['shares_amount_replayed'], rtol=0, atol=1e-6
+    )
+    rows = rows[changed].drop(columns=['_merge', 'nth']).reset_index(drop=True)
+
+    users = pd.DataFrame({
+        'current': current.groupby('user_id')['shares_amount'].sum().astype(float),
+        'replayed': replayed.groupby('user_id')['shares_amount'].sum().astype(float),
+    }).fillna(0.0)
+    users['difference'] = users['replayed'] - users['current']
+    return {'users': users.reset_index(), 'rows': rows}
+
+
+def replay_user_shares(apply: bool = False, engine=None) -> Dict:
+    """Reconstrói t_user_shares a partir dos movimentos de capital, transações e preços históricos.
+
+    Com apply=False só calcula e compara; com apply=True apaga e reescreve t_user_shares na mesma
+    transação (sob o advisory lock dos lançamentos de capital, para não concorrer com eles).
+
+    Returns:
+        dict com ledger (novo livro), users/rows (diferenças), applied e elapsed_seconds
+    """
+    engine = engine or get_engine()
+    t0 = time.time()
+    with engine.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": NAV_ADVISORY_LOCK_KEY})
+        movements = pd.read_sql(_MOVEMENTS_SQL, conn)
+        current = pd.read_sql(_CURRENT_SHARES_SQL, conn)
+        ledger_value = _ledger_value_before(conn, movements['movement_date']) if not movements.empty else np.array([])
+        ledger = compute_share_ledger(movements, ledger_value)
+        diff = diff_share_ledgers(current, ledger)
+
+        if apply:
+            conn.execute(text("DELETE FROM t_user_shares"))
+            if not ledger.empty:
+                records: List[Dict] = ledger.assign(
+                    movement_date=pd.to_datetime(ledger['movement_date']).dt.to_pydatetime()
+                ).to_dict('records')
+                conn.execute(
+                    text("""
+                        INSERT INTO t_user_shares (
+                            user_id, movement_date, movement_type, amount_eur,
+                            nav_per_share, shares_amount, total_shares_after, fund_nav, notes
+                        )
+                        VALUES (:user_id, :movement_date, :movement_type, :amount_eur,
+                                :nav_per_share, :shares_amount, :total_shares_after, :fund_nav, :notes)
+                    """),
+                    records,
+                )
+
+    if apply:
+        invalidate_nav_snapshot()
+    elapsed = round(time.time() - t0, 2)
+    logger.info(
+        f"{'✅ t_user_shares reescrita' if apply else '🔎 Replay (dry-run)'}: {len(ledger)} movimentos, "
+        f"{len(diff['rows'])} linhas diferentes em {elapsed}s"
+    )
+    return {'ledger': ledger, 'users': diff['users'], 'rows': diff['rows'], 'applied': apply, 'elapsed_seconds': elapsed}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    parser = argparse.ArgumentParser(description="Reconstrói t_user_shares a partir do histórico")
+    parser.add_argument("--apply", action="store_true", help="Reescreve t_user_shares (por omissão, só mostra as diferenças)")
+    args = parser.parse_args()
+
+    result = replay_user_shares(apply=args.apply)
+    with pd.option_context("display.max_rows", 200, "display.width", 160):
+        print(result['users'].to_string(index=False, float_format=lambda v: f"{v:.6f}"))
+        if not result['rows'].empty:
+            print()
+            print(result['rows'].to_string(index=False, float_format=lambda v: f"{v:.6f}"))
+    print(
+        f"\n{len(result['ledger'])} movimentos, {len(result['rows'])} linhas diferentes"
+        + (" - t_user_shares reescrita" if result['applied'] else " (dry-run; usar --apply para gravar)")
+    )
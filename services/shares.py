@@ -1,14 +1,36 @@
 """
 Serviço para gestão de shares (propriedade) do fundo.
 Sistema NAV-based onde cada utilizador recebe shares proporcionais ao NAV no momento do depósito.
+
+O NAV (caixa, holdings, preços, total de shares e NAV/share) é avaliado uma vez e guardado num
+NavSnapshot partilhado durante NAV_SNAPSHOT_TTL_SECONDS; todas as funções deste módulo leem desse
+snapshot. Quem escreve movimentos de capital ou transações deve chamar invalidate_nav_snapshot().
+O histórico diário (NAV e NAV/share por dia) vem de t_fund_nav_daily (services.fund_nav).
+
+Depósitos e levantamentos são registados com post_capital_movement()/post_capital_movements(): movimento
+e shares na mesma transação, sob advisory lock, com uma única avaliação do NAV por lote. Aí os preços
+não podem ter mais de NAV_PRICE_MAX_AGE_SECONDS: são pedidos à API se preciso, ou o lançamento é recusado
+(StalePricesError); ativos que a API não sabe avaliar usam o último preço de t_price_snapshots.
 """
 
 from database.connection import get_db_cursor, get_connection, return_connection
-from services.coingecko import get_price_by_symbol
+from services.price_refresher import get_latest_prices, get_latest_prices_with_age, get_price_refresher
+from services.single_flight import get_single_flight
 from typing import Optional, Dict, Tuple, List
-from datetime import datetime
+from datetime import date, datetime, time as time_of_day
+import logging
+import threading
+import time
 import streamlit as st
 
+logger = logging.getLogger(__name__)
+
+NAV_SNAPSHOT_TTL_SECONDS = 30
+# Idade máxima dos preços usados para calcular shares num depósito/levantamento
+NAV_PRICE_MAX_AGE_SECONDS = 60
+# Chave do pg_advisory_xact_lock que serializa os lançamentos de capital/shares
+NAV_ADVISORY_LOCK_KEY = 7_260_001
+
 
 def _execute_query(query: str, params: tuple = None) -> List[Dict]:
     """
@@ -47,15 +69,119 @@ def _execute_query(query: str, params: tuple = None) -> List[Dict]:
         return_connection(conn)
 
 
-def calculate_fund_nav() -> float:
+class NavSnapshot:
+    """Avaliação do fundo num instante: caixa, holdings, preços, total de shares e NAV/share."""
+
+    def __init__(
+        self,
+        cash_balance: float,
+        holdings: Dict[str, float],
+        prices: Dict[str, Optional[float]],
+        total_shares: float,
+    ):
+        self.cash_balance = cash_balance
+        self.holdings = holdings
+        self.prices = prices
+        self.total_shares = total_shares
+        self.crypto_value = sum(
+            quantity * float(prices[symbol])
+            for symbol, quantity in holdings.items()
+            if prices.get(symbol)
+        )
+        self.fund_nav = cash_balance + self.crypto_value
+        # Sem shares ainda (primeiro depósito): NAV/share inicial = 1.0
+        self.nav_per_share = self.fund_nav / total_shares if total_shares else 1.0
+        self.computed_at = time.time()
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.computed_at
+
+
+def _cursor_query(cur, query: str, params: tuple = None) -> List[Dict]:
+    """Como _execute_query, mas num cursor de uma transação em curso (sem commit)."""
+    cur.execute(query, params)
+    if cur.description is None:
+        return []
+    columns = [desc[0] for desc in cur.description]
+    return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+
+class StalePricesError(ValueError):
+    """Preços necessários ao NAV/share em falta ou mais antigos que o permitido."""
+
+    def __init__(self, symbols: List[str], max_age: float):
+        self.symbols = list(symbols)
+        super().__init__(
+            f"Preços em falta ou com mais de {max_age:.0f}s para {', '.join(self.symbols)}; "
+            "impossível calcular o NAV/share"
+        )
+
+
+def _last_snapshot_prices(query, symbols: List[str]) -> Dict[str, float]:
+    """Último preço EUR de cada símbolo em t_price_snapshots."""
+    rows = query(
+        """
+        SELECT DISTINCT ON (a.symbol) a.symbol, ps.price_eur
+        FROM t_price_snapshots ps
+        JOIN t_assets a ON a.asset_id = ps.asset_id
+        WHERE a.symbol = ANY(%s)
+        ORDER BY a.symbol, ps.snapshot_date DESC
+        """,
+        (list(symbols),),
+    )
+    return {row['symbol']: float(row['price_eur']) for row in rows if row['price_eur'] is not None}
+
+
+def _fresh_prices(query, symbols: List[str], max_age: float) -> Dict[str, Optional[float]]:
+    """Preços com no máximo max_age segundos para calcular shares.
+
+    Distingue dois casos:
+    - preço desatualizado (existe mas é antigo, ou o pedido à API falhou para um ativo com
+      coingecko_id): o lançamento é recusado com StalePricesError;
+    - ativo sem preço na API (sem coingecko_id, ou a API responde sem preço, p.ex. deslistado):
+      usa o último preço de t_price_snapshots e, sem nenhum, vale 0 como antes.
     """
-    Calcula o NAV (Net Asset Value) total do fundo.
-    NAV = Caixa (EUR) + Valor das Holdings em Cripto
+    with_age = get_latest_prices_with_age(symbols, max_age=max_age)
+    prices: Dict[str, Optional[float]] = {}
+    stale, no_answer = [], []
+    for symbol in symbols:
+        price, age = with_age.get(symbol, (None, None))
+        prices[symbol] = price
+        if price is not None:
+            if age is None or age > max_age:
+                stale.append(symbol)
+        elif age is None:
+            no_answer.append(symbol)
+
+    # Sem resposta da API: só é falha se o ativo tiver coingecko_id
+    if no_answer:
+        coin_ids = get_price_refresher().resolve_ids(no_answer)
+        stale.extend(s for s in no_answer if coin_ids.get(s))
+    if stale:
+        raise StalePricesError(stale, max_age)
+
+    unpriceable = [s for s in symbols if prices[s] is None]
+    if unpriceable:
+        prices.update(_last_snapshot_prices(query, unpriceable))
+        logger.warning(
+            "Ativos sem preço na API avaliados pelo último snapshot (ou a 0): "
+            + ", ".join(f"{s}={prices[s] or 0}" for s in unpriceable)
+        )
+    return prices
+
+
+def _evaluate_nav(query=None, price_max_age: Optional[float] = None) -> NavSnapshot:
+    """Avalia o NAV do fundo: uma query de caixa + shares, uma de holdings e uma leitura de preços.
     
-    Returns:
-        float: NAV total do fundo em EUR
+    Args:
+        query: Função (query, params) → lista de dicts; por omissão _execute_query (ligação própria)
+        price_max_age: Idade máxima (segundos) dos preços; mais antigos são pedidos à API e, se
+            continuarem desatualizados, a avaliação falha (StalePricesError). Ativos sem preço
+            na API valem o último snapshot (ver _fresh_prices)
     """
-    # 1. Calcular caixa disponível (apenas utilizadores não-admin):
+    query = query or _execute_query
+    # 1. Caixa disponível (apenas utilizadores não-admin) e total de shares em circulação:
     # caixa = depósitos - levantamentos - gasto em compras + recebido em vendas
     query_cash = """
         WITH capital AS (
@@ -73,14 +199,16 @@ def calculate_fund_nav() -> float:
             FROM t_transactions
         )
         SELECT 
-            (c.total_deposits - c.total_withdrawals - t.total_spent + t.total_received) AS cash_balance
+            (c.total_deposits - c.total_withdrawals - t.total_spent + t.total_received) AS cash_balance,
+            (SELECT COALESCE(SUM(shares_amount), 0) FROM t_user_shares) AS total_shares
         FROM capital c, trades t;
     """
     
-    result = _execute_query(query_cash)
+    result = query(query_cash)
     cash_balance = float(result[0]['cash_balance']) if result else 0.0
+    total_shares = float(result[0]['total_shares']) if result else 0.0
     
-    # 2. Calcular valor das holdings em cripto (a preços atuais)
+    # 2. Holdings em cripto
     query_holdings = """
         SELECT 
             a.symbol,
@@ -91,22 +219,67 @@ def calculate_fund_nav() -> float:
         HAVING SUM(CASE WHEN t.transaction_type = 'buy' THEN t.quantity ELSE -t.quantity END) > 0;
     """
 
-    holdings = _execute_query(query_holdings)
-    crypto_value = 0.0
+    holdings = {row['symbol']: float(row['total_quantity']) for row in query(query_holdings)}
+
+    # 3. Último preço conhecido (revalidado em background) - não bloqueia no CoinGecko,
+    # exceto quando o chamador exige preços com no máximo price_max_age segundos
+    if not holdings:
+        prices = {}
+    elif price_max_age is None:
+        prices = get_latest_prices(list(holdings)) or {}
+    else:
+        prices = _fresh_prices(query, list(holdings), price_max_age)
+
+    return NavSnapshot(cash_balance, holdings, prices, total_shares)
 
-    if holdings:
-        # Buscar preços em massa para reduzir falhas e latência
-        symbols = [row['symbol'] for row in holdings]
-        price_map = get_price_by_symbol(symbols, vs_currency='eur') or {}
-        for row in holdings:
-            symbol = row['symbol']
-            quantity = float(row['total_quantity'])
-            price = price_map.get(symbol)
-            if price:
-                crypto_value += quantity * float(price)
+
+_nav_snapshot: Optional[NavSnapshot] = None
+_nav_generation = 0
+_nav_lock = threading.Lock()
+
+
+def get_nav_snapshot(max_age: float = NAV_SNAPSHOT_TTL_SECONDS) -> NavSnapshot:
+    """
+    Snapshot do NAV partilhado pelo processo, reavaliado quando tem mais de max_age segundos
+    ou depois de invalidate_nav_snapshot(). Avaliações concorrentes partilham a mesma execução.
     
-    total_nav = cash_balance + crypto_value
-    return total_nav
+    Args:
+        max_age: Idade máxima aceite em segundos (0 força nova avaliação)
+        
+    Returns:
+        NavSnapshot
+    """
+    global _nav_snapshot
+    with _nav_lock:
+        snapshot, generation = _nav_snapshot, _nav_generation
+    if snapshot is not None and snapshot.age < max_age:
+        return snapshot
+    
+    snapshot = get_single_flight("nav").do(("nav", generation), _evaluate_nav)
+    with _nav_lock:
+        # Uma escrita durante a avaliação invalida o resultado: serve-o a quem pediu, mas não o guarda
+        if generation == _nav_generation:
+            _nav_snapshot = snapshot
+    return snapshot
+
+
+def invalidate_nav_snapshot():
+    """Descarta o NAV em memória (chamar após escrever movimentos de capital, transações ou shares)."""
+    global _nav_snapshot, _nav_generation
+    with _nav_lock:
+        _nav_snapshot = None
+        _nav_generation += 1
+
+
+def calculate_fund_nav() -> float:
+    """
+    Calcula o NAV (Net Asset Value) total do fundo.
+    NAV = Caixa (EUR) + Valor das Holdings em Cripto
+    
+    Returns:
+        float: NAV total do fundo em EUR
+    """
+    return get_nav_snapshot().fund_nav
 
 
 def get_total_shares_in_circulation() -> float:
@@ -116,13 +289,7 @@ def get_total_shares_in_circulation() -> float:
     Returns:
         float: Total de shares no fundo
     """
-    query = """
-        SELECT COALESCE(SUM(shares_amount), 0) AS total_shares
-        FROM t_user_shares;
-    """
-    
-    result = _execute_query(query)
-    return float(result[0]['total_shares']) if result else 0.0
+    return get_nav_snapshot().total_shares
 
 
 def calculate_nav_per_share() -> float:
@@ -135,16 +302,29 @@ def calculate_nav_per_share() -> float:
     Returns:
         float: NAV por share
     """
-    total_shares = get_total_shares_in_circulation()
-    
-    # Se não existem shares ainda (primeiro depósito), inicializar com NAV = 1.0
-    if total_shares == 0:
-        return 1.0
+    return get_nav_snapshot().nav_per_share
+
+
+def get_fund_nav_history(start_date: Optional[date] = None, end_date: Optional[date] = None) -> List[Dict]:
+    """
+    Histórico diário do NAV do fundo guardado em t_fund_nav_daily (uma leitura por intervalo da PK).
+    Os dias em falta são preenchidos por services.fund_nav.update_fund_nav_daily().
     
-    fund_nav = calculate_fund_nav()
-    nav_per_share = fund_nav / total_shares
+    Args:
+        start_date: Primeiro dia (por omissão, o início do histórico)
+        end_date: Último dia (por omissão, o último calculado)
+        
+    Returns:
+        list: Dias ordenados com nav_date, cash_balance, crypto_value, fund_nav, total_shares, nav_per_share
+    """
+    query = """
+        SELECT nav_date, cash_balance, crypto_value, fund_nav, total_shares, nav_per_share
+        FROM t_fund_nav_daily
+        WHERE nav_date BETWEEN %s AND %s
+        ORDER BY nav_date;
+    """
     
-    return nav_per_share
+    return _execute_query(query, (start_date or date.min, end_date or date.max))
 
 
 def get_user_total_shares(user_id: int) -> float:
@@ -167,143 +347,163 @@ def get_user_total_shares(user_id: int) -> float:
     return float(result[0]['user_shares']) if result else 0.0
 
 
-def allocate_shares_on_deposit(
-    user_id: int, 
-    deposit_amount: float, 
-    movement_date: datetime,
-    notes: Optional[str] = None
-) -> Dict:
+def post_capital_movements(movements: List[Dict]) -> List[Dict]:
     """
-    Aloca shares a um utilizador quando faz um depósito.
+    Regista depósitos/levantamentos e as respetivas shares numa única transação.
     
-    Shares atribuídas = Valor depositado / NAV por share no momento
+    Sob um advisory lock (dois admins a lançar ao mesmo tempo não leem NAVs inconsistentes), o NAV é
+    avaliado uma vez e os movimentos são aplicados em memória pela ordem dada: cada um usa o NAV/share
+    anterior a si e atualiza NAV e total de shares para o seguinte. Movimentos e linhas de
+    t_user_shares são inseridos em bulk no mesmo commit; qualquer erro anula o lote inteiro.
     
     Args:
-        user_id: ID do utilizador
-        deposit_amount: Valor depositado em EUR
-        movement_date: Data do depósito
-        notes: Notas opcionais
+        movements: Lista de dicts com user_id, movement_type ('deposit' ou 'withdrawal'),
+            amount (EUR, positivo), movement_date (date ou datetime) e, opcionalmente, description
         
     Returns:
-        dict: Informação sobre a alocação (shares_allocated, nav_per_share, total_shares_after)
+        list: Por movimento, dict com user_id, movement_type, amount, shares_amount (negativo nos
+        levantamentos), nav_per_share, total_shares_after (do utilizador) e fund_nav (após o movimento)
     """
-    # Calcular NAV por share ANTES do depósito.
-    # Nota: como normalmente chamamos esta função APÓS registar o depósito,
-    # precisamos remover o depósito do NAV atual para obter o NAV/share correto.
-    total_shares = get_total_shares_in_circulation()
-    if total_shares == 0:
-        nav_per_share = 1.0
-    else:
-        fund_nav_now = calculate_fund_nav()
-        nav_per_share = (fund_nav_now - float(deposit_amount)) / total_shares
-        # Salvaguarda para casos limite numéricos
-        if nav_per_share <= 0:
-            nav_per_share = calculate_nav_per_share()
+    from psycopg2.extras import execute_values
     
-    # Calcular shares a atribuir
-    shares_allocated = deposit_amount / nav_per_share
-    
-    # Obter shares atuais do utilizador
-    current_user_shares = get_user_total_shares(user_id)
-    total_shares_after = current_user_shares + shares_allocated
-    
-    # Calcular NAV do fundo APÓS o depósito
-    fund_nav_after = calculate_fund_nav()  # Já inclui o depósito recente
-    
-    # Inserir registo na tabela t_user_shares
-    query = """
-        INSERT INTO t_user_shares (
-            user_id, movement_date, movement_type, amount_eur, 
-            nav_per_share, shares_amount, total_shares_after, fund_nav, notes
-        )
-        VALUES (%s, %s, 'deposit', %s, %s, %s, %s, %s, %s);
-    """
+    if not movements:
+        return []
+    for m in movements:
+        if m['movement_type'] not in ('deposit', 'withdrawal'):
+            raise ValueError(f"Tipo de movimento inválido: {m['movement_type']}")
+        if float(m['amount']) <= 0:
+            raise ValueError(f"Valor do movimento tem de ser positivo: {m['amount']}")
     
-    _execute_query(
-        query, 
-        (user_id, movement_date, deposit_amount, nav_per_share, 
-         shares_allocated, total_shares_after, fund_nav_after, notes)
-    )
+    user_ids = sorted({int(m['user_id']) for m in movements})
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (NAV_ADVISORY_LOCK_KEY,))
+            nav = _evaluate_nav(lambda q, p=None: _cursor_query(cur, q, p), price_max_age=NAV_PRICE_MAX_AGE_SECONDS)
+            users = _cursor_query(
+                cur,
+                """
+                SELECT u.user_id, u.is_admin, COALESCE(SUM(s.shares_amount), 0) AS user_shares
+                FROM t_users u
+                LEFT JOIN t_user_shares s ON s.user_id = u.user_id
+                WHERE u.user_id = ANY(%s)
+                GROUP BY u.user_id, u.is_admin;
+                """,
+                (user_ids,)
+            )
+            user_shares = {row['user_id']: float(row['user_shares']) for row in users}
+            admins = {row['user_id'] for row in users if row['is_admin']}
+            unknown = set(user_ids) - set(user_shares)
+            if unknown:
+                raise ValueError(f"Utilizadores inexistentes: {sorted(unknown)}")
+            
+            fund_nav, total_shares = nav.fund_nav, nav.total_shares
+            movement_rows, share_rows, results = [], [], []
+            for m in movements:
+                user_id, amount = int(m['user_id']), float(m['amount'])
+                is_deposit = m['movement_type'] == 'deposit'
+                # Movimentos de admins não entram na caixa do fundo
+                cash_delta = 0.0 if user_id in admins else (amount if is_deposit else -amount)
+                
+                if total_shares == 0:
+                    nav_per_share = 1.0
+                else:
+                    nav_per_share = fund_nav / total_shares
+                    # Salvaguarda para casos limite numéricos: NAV/share após o movimento
+                    if nav_per_share <= 0:
+                        nav_per_share = (fund_nav + cash_delta) / total_shares
+                    if nav_per_share <= 0:
+                        raise ValueError(f"NAV do fundo não positivo (€{fund_nav:.2f}); impossível calcular shares")
+                
+                shares = amount / nav_per_share if is_deposit else -amount / nav_per_share
+                if not is_deposit and user_shares[user_id] + shares < -0.01:  # Margem de erro por arredondamentos
+                    raise ValueError(
+                        f"Utilizador {user_id} não tem shares suficientes. "
+                        f"Shares atuais: {user_shares[user_id]:.6f}, "
+                        f"Shares a remover: {-shares:.6f}"
+                    )
+                
+                user_shares[user_id] += shares
+                total_shares += shares
+                fund_nav += cash_delta
+                
+                # t_user_capital_movements guarda o dia; t_user_shares o instante (meio-dia para datas simples)
+                movement_dt = m['movement_date']
+                if not isinstance(movement_dt, datetime):
+                    movement_dt = datetime.combine(movement_dt, time_of_day(12, 0, 0))
+                description = m.get('description') or ''
+                movement_rows.append((
+                    user_id, amount if is_deposit else 0, 0 if is_deposit else amount,
+                    description, movement_dt.date()
+                ))
+                share_rows.append((
+                    user_id, movement_dt, m['movement_type'], amount, nav_per_share,
+                    shares, user_shares[user_id], fund_nav,
+                    f"{'Depósito' if is_deposit else 'Levantamento'}: {description}"
+                ))
+                results.append({
+                    'user_id': user_id,
+                    'movement_type': m['movement_type'],
+                    'amount': amount,
+                    'shares_amount': shares,
+                    'nav_per_share': nav_per_share,
+                    'total_shares_after': user_shares[user_id],
+                    'fund_nav': fund_nav,
+                })
+            
+            execute_values(
+                cur,
+                """
+                INSERT INTO t_user_capital_movements (user_id, credit, debit, description, movement_date)
+                VALUES %s
+                """,
+                movement_rows,
+                page_size=1000
+            )
+            execute_values(
+                cur,
+                """
+                INSERT INTO t_user_shares (
+                    user_id, movement_date, movement_type, amount_eur,
+                    nav_per_share, shares_amount, total_shares_after, fund_nav, notes
+                )
+                VALUES %s
+                """,
+                share_rows,
+                page_size=1000
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        return_connection(conn)
     
-    return {
-        'shares_allocated': shares_allocated,
-        'nav_per_share': nav_per_share,
-        'total_shares_after': total_shares_after,
-        'fund_nav': fund_nav_after
-    }
+    invalidate_nav_snapshot()
+    return results
 
 
-def burn_shares_on_withdrawal(
-    user_id: int, 
-    withdrawal_amount: float, 
+def post_capital_movement(
+    user_id: int,
+    movement_type: str,
+    amount: float,
     movement_date: datetime,
-    notes: Optional[str] = None
+    description: Optional[str] = None
 ) -> Dict:
     """
-    Remove (queima) shares de um utilizador quando faz um levantamento.
+    Regista um depósito ou levantamento e as respetivas shares numa única transação.
+    Ver post_capital_movements().
     
-    Shares removidas = Valor levantado / NAV por share no momento
-    
-    Args:
-        user_id: ID do utilizador
-        withdrawal_amount: Valor levantado em EUR (positivo)
-        movement_date: Data do levantamento
-        notes: Notas opcionais
-        
     Returns:
-        dict: Informação sobre a remoção (shares_burned, nav_per_share, total_shares_after)
+        dict: Resultado do movimento (shares_amount, nav_per_share, total_shares_after, fund_nav)
     """
-    # Calcular NAV por share ANTES do levantamento.
-    # Como normalmente chamamos APÓS registar o levantamento (debit), somamos o valor
-    # levantado ao NAV atual para obter o NAV/share do instante anterior ao movimento.
-    total_shares = get_total_shares_in_circulation()
-    if total_shares == 0:
-        nav_per_share = 1.0
-    else:
-        fund_nav_now = calculate_fund_nav()
-        nav_per_share = (fund_nav_now + float(withdrawal_amount)) / total_shares
-        if nav_per_share <= 0:
-            nav_per_share = calculate_nav_per_share()
-    
-    # Calcular shares a remover
-    shares_burned = withdrawal_amount / nav_per_share
-    
-    # Obter shares atuais do utilizador
-    current_user_shares = get_user_total_shares(user_id)
-    total_shares_after = current_user_shares - shares_burned
-    
-    # Validar que o utilizador tem shares suficientes
-    if total_shares_after < -0.01:  # Margem de erro por arredondamentos
-        raise ValueError(
-            f"Utilizador não tem shares suficientes. "
-            f"Shares atuais: {current_user_shares:.6f}, "
-            f"Shares a remover: {shares_burned:.6f}"
-        )
-    
-    # Calcular NAV do fundo APÓS o levantamento
-    fund_nav_after = calculate_fund_nav()  # Já reflete o levantamento
-    
-    # Inserir registo na tabela t_user_shares (com valor negativo)
-    query = """
-        INSERT INTO t_user_shares (
-            user_id, movement_date, movement_type, amount_eur, 
-            nav_per_share, shares_amount, total_shares_after, fund_nav, notes
-        )
-        VALUES (%s, %s, 'withdrawal', %s, %s, %s, %s, %s, %s);
-    """
-    
-    _execute_query(
-        query, 
-        (user_id, movement_date, withdrawal_amount, nav_per_share, 
-         -shares_burned, total_shares_after, fund_nav_after, notes)
-    )
-    
-    return {
-        'shares_burned': shares_burned,
-        'nav_per_share': nav_per_share,
-        'total_shares_after': total_shares_after,
-        'fund_nav': fund_nav_after
-    }
+    return post_capital_movements([{
+        'user_id': user_id,
+        'movement_type': movement_type,
+        'amount': amount,
+        'movement_date': movement_date,
+        'description': description,
+    }])[0]
 
 
 def get_user_ownership_percentage(user_id: int) -> float:
@@ -319,7 +519,7 @@ def get_user_ownership_percentage(user_id: int) -> float:
         float: Percentagem de propriedade (0-100)
     """
     user_shares = get_user_total_shares(user_id)
-    total_shares = get_total_shares_in_circulation()
+    total_shares = get_nav_snapshot().total_shares
     
     if total_shares == 0:
         return 0.0
@@ -348,8 +548,9 @@ def get_all_users_ownership() -> list:
     """
     
     users = _execute_query(query)
-    total_shares = get_total_shares_in_circulation()
-    nav_per_share = calculate_nav_per_share()
+    nav = get_nav_snapshot()
+    total_shares = nav.total_shares
+    nav_per_share = nav.nav_per_share
     
     result = []
     for user in users:
@@ -0,0 +1,88 @@
+"""Coalescência de pedidos idênticos em curso ("single flight").
+
+Quando várias sessões pedem o mesmo recurso ao mesmo tempo (ex.: /simple/price das mesmas moedas ao
+abrir a Análise de Portfólio), só a primeira faz a chamada; as restantes esperam e recebem o mesmo
+resultado (ou a mesma exceção). Cada grupo conta as chamadas executadas e as poupadas.
+
+Uso:
+    from services.single_flight import get_single_flight
+
+    flight = get_single_flight("coingecko")
+    data = flight.do(("GET", url, params_key), lambda: _fetch(url, params))
+"""
+import copy
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Partilha uma única execução de fn() entre chamadas concorrentes com a mesma chave."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._inflight[key] = call
+                self.executed += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            # Cópia: quem recebe o resultado partilhado pode alterá-lo sem afetar os outros
+            return copy.deepcopy(call.result)
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            call.event.set()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"executed": self.executed, "saved": self.shared, "in_flight": len(self._inflight)}
+
+
+_groups: Dict[str, SingleFlight] = {}
+_groups_lock = threading.Lock()
+
+
+def get_single_flight(name: str) -> SingleFlight:
+    """Grupo de coalescência por nome (um por API externa), único por processo."""
+    with _groups_lock:
+        group = _groups.get(name)
+        if group is None:
+            group = _groups[name] = SingleFlight(name)
+        return group
+
+
+def get_single_flight_stats() -> Dict[str, Dict[str, int]]:
+    """Contadores de todos os grupos: {nome: {executed, saved, in_flight}}."""
+    with _groups_lock:
+        groups = list(_groups.values())
+    return {g.name: g.stats() for g in groups}
@@ -0,0 +1,291 @@
+"""Backfill concorrente de t_price_snapshots a partir do CoinGecko.
+
+Em vez de uma chamada /history por (ativo, dia), o backfill:
+1. Planeia todos os pares (asset_id, data) em falta numa única query (generate_series + anti-join)
+2. Agrupa os dias em falta de cada ativo em janelas contíguas
+3. Faz uma chamada /coins/{id}/market_chart/range por janela, num thread pool,
+   limitado pelo limiter partilhado do CoinGecko (t_api_coingecko.rate_limit, comum a todos os processos)
+4. Escreve os preços diários de cada janela em bulk (um INSERT ... ON CONFLICT por janela)
+
+O cancelamento usa o mesmo threading.Event que populate_snapshots_for_period (_bg_stop_event).
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import pandas as pd
+from psycopg2.extras import execute_values
+
+from database.connection import get_db_cursor, get_engine
+from services.coingecko import get_coingecko_limiter, get_market_chart_range
+from services.price_cache import invalidate_prices
+from services.rate_limit import SharedRateLimiter, TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Tamanho máximo de cada janela /market_chart/range (acima de 90 dias a API devolve pontos diários)
+MAX_RANGE_DAYS = 365
+# Dias já existentes entre dois gaps que ainda compensa voltar a pedir para poupar uma chamada
+MERGE_GAP_DAYS = 7
+DEFAULT_MAX_WORKERS = 4
+
+
+# Pares (asset_id, dia) do período sem snapshot: generate_series × ativos, anti-join com t_price_snapshots
+_MISSING_PAIRS_SQL = """
+    SELECT a.asset_id, d::date AS snapshot_date
+    FROM unnest(%s::int[]) AS a(asset_id)
+    CROSS JOIN generate_series(%s::date, %s::date, INTERVAL '1 day') AS d
+    WHERE NOT EXISTS (
+        SELECT 1 FROM t_price_snapshots ps
+        WHERE ps.asset_id = a.asset_id AND ps.snapshot_date = d::date
+    )
+"""
+
+
+def plan_missing_snapshots(asset_ids: List[int], start_date: date, end_date: date) -> Dict[int, List[date]]:
+    """Pares (asset_id, data) sem snapshot no período, numa única query (anti-join com generate_series).
+
+    Returns:
+        {asset_id: [datas em falta, ordenadas]} (só ativos com pelo menos uma data em falta)
+    """
+    if not asset_ids or start_date > end_date:
+        return {}
+    df = pd.read_sql(
+        f"{_MISSING_PAIRS_SQL} ORDER BY a.asset_id, snapshot_date",
+        get_engine(),
+        params=([int(a) for a in asset_ids], start_date, end_date)
+    )
+    plan: Dict[int, List[date]] = {}
+    if not df.empty:
+        df['snapshot_date'] = pd.to_datetime(df['snapshot_date']).dt.date
+        for aid, grp in df.groupby('asset_id', sort=False):
+            plan[int(aid)] = grp['snapshot_date'].tolist()
+    return plan
+
+
+def plan_missing_ranges(asset_ids: List[int], start_date: date, end_date: date) -> Dict[int, List[Tuple[date, date]]]:
+    """Intervalos contíguos de dias sem snapshot, por ativo, numa única query (gaps-and-islands em SQL).
+
+    Returns:
+        {asset_id: [(início, fim), ...]} ordenados por data (só ativos com gaps)
+    """
+    if not asset_ids or start_date > end_date:
+        return {}
+    df = pd.read_sql(
+        f"""
+        SELECT asset_id, MIN(snapshot_date) AS gap_start, MAX(snapshot_date) AS gap_end
+        FROM (
+            SELECT asset_id, snapshot_date,
+                   snapshot_date - (ROW_NUMBER() OVER (PARTITION BY asset_id ORDER BY snapshot_date))::int AS grp
+            FROM ({_MISSING_PAIRS_SQL}) missing
+        ) m
+        GROUP BY asset_id, grp
+        ORDER BY asset_id, gap_start
+        """,
+        get_engine(),
+        params=([int(a) for a in asset_ids], start_date, end_date)
+    )
+    ranges: Dict[int, List[Tuple[date, date]]] = {}
+    for aid, gap_start, gap_end in df.itertuples(index=False):
+        ranges.setdefault(int(aid), []).append((pd.Timestamp(gap_start).date(), pd.Timestamp(gap_end).date()))
+    return ranges
+
+
+def collapse_to_ranges(
+    dates: List[date],
+    merge_gap_days: int = MERGE_GAP_DAYS,
+    max_range_days: int = MAX_RANGE_DAYS,
+) -> List[Tuple[date, date]]:
+    """Agrupa datas ordenadas em janelas [início, fim] para chamadas market_chart/range.
+
+    Gaps separados por até merge_gap_days dias já existentes são fundidos; nenhuma janela
+    excede max_range_days dias.
+    """
+    ranges: List[Tuple[date, date]] = []
+    for d in sorted(dates):
+        if ranges:
+            start, end = ranges[-1]
+            if (d - end).days <= merge_gap_days + 1 and (d - start).days < max_range_days:
+                ranges[-1] = (start, d)
+                continue
+        ranges.append((d, d))
+    return ranges
+
+
+def daily_prices_from_chart(prices: List, wanted: List[date]) -> Dict[date, float]:
+    """Preço diário (média das amostras do dia UTC) para as datas pedidas."""
+    wanted_set = set(wanted)
+    sums: Dict[date, List[float]] = {}
+    for ts_ms, val in prices or []:
+        if val is None:
+            continue
+        d = datetime.fromtimestamp(ts_ms / 1000.0, tz=timezone.utc).date()
+        if d in wanted_set:
+            acc = sums.setdefault(d, [0.0, 0])
+            acc[0] += float(val)
+            acc[1] += 1
+    return {d: total / n for d, (total, n) in sums.items() if n}
+
+
+def _write_prices(asset_id: int, prices: Dict[date, float]) -> int:
+    """Escreve os preços de um ativo em t_price_snapshots numa única instrução (execute_values).
+
+    Uma instrução por janela: os triggers de instrução de t_price_snapshots correm uma vez por janela.
+    """
+    if not prices:
+        return 0
+    rows = [(asset_id, d, p) for d, p in sorted(prices.items())]
+    with get_db_cursor() as cur:
+        execute_values(
+            cur,
+            """
+            INSERT INTO t_price_snapshots (asset_id, snapshot_date, price_eur, source)
+            VALUES %s
+            ON CONFLICT (asset_id, snapshot_date)
+            DO UPDATE SET price_eur = EXCLUDED.price_eur, source = EXCLUDED.source
+            """,
+            rows,
+            template="(%s, %s, %s, 'coingecko')",
+            page_size=len(rows),
+        )
+    invalidate_prices(asset_id, rows[0][1], rows[-1][1])
+    return len(rows)
+
+
+def backfill_snapshots(
+    start_date: date,
+    end_date: date,
+    asset_ids: Optional[List[int]] = None,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    stop_event: Optional[threading.Event] = None,
+    progress_callback: Optional[Callable[[int, int], None]] = None,
+    rate_limiter: Optional[Union[TokenBucket, SharedRateLimiter]] = None,
+) -> Dict:
+    """Preenche os snapshots em falta no período com chamadas market_chart/range concorrentes.
+
+    Args:
+        start_date: Data inicial
+        end_date: Data final (datas futuras são ignoradas)
+        asset_ids: Lista de asset_ids (se None, usa todos os ativos com coingecko_id)
+        max_workers: Número de threads para chamadas HTTP
+        stop_event: Event de cancelamento (ex.: _bg_stop_event)
+        progress_callback: Chamado com (janelas concluídas, total de janelas)
+        rate_limiter: Limiter a usar (por omissão, get_coingecko_limiter())
+
+    Returns:
+        Dict com missing, requests, written, failed, fallback, cancelled e elapsed_seconds
+    """
+    # Import tardio: snapshots importa este módulo em populate_snapshots_for_period
+    from services.snapshots import (
+        _handle_coingecko_error,
+        _is_coingecko_available,
+        _reset_coingecko_429_counter,
+        get_historical_price,
+    )
+
+    t0 = time.time()
+    stats = {'missing': 0, 'requests': 0, 'written': 0, 'failed': 0, 'fallback': 0, 'cancelled': False}
+    end_date = min(end_date, date.today())
+    engine = get_engine()
+
+    if asset_ids is None:
+        df_assets = pd.read_sql(
+            "SELECT asset_id, symbol, coingecko_id FROM t_assets WHERE coingecko_id IS NOT NULL",
+            engine
+        )
+    elif asset_ids:
+        placeholders = ','.join(['%s'] * len(asset_ids))
+        df_assets = pd.read_sql(
+            f"SELECT asset_id, symbol, coingecko_id FROM t_assets WHERE asset_id IN ({placeholders})",
+            engine,
+            params=tuple(asset_ids)
+        )
+    else:
+        df_assets = pd.DataFrame(columns=['asset_id', 'symbol', 'coingecko_id'])
+
+    coingecko_ids = {
+        int(r['asset_id']): r['coingecko_id']
+        for _, r in df_assets.iterrows()
+    }
+    plan = plan_missing_snapshots(list(coingecko_ids), start_date, end_date)
+    stats['missing'] = sum(len(v) for v in plan.values())
+    if not plan:
+        logger.info(f"✅ Backfill: sem snapshots em falta entre {start_date} e {end_date}")
+        stats['elapsed_seconds'] = round(time.time() - t0, 2)
+        return stats
+
+    # Ativos sem coingecko_id (ex.: EUR com preço fixo) seguem o caminho individual, sem API
+    jobs: List[Tuple[int, str, date, date, List[date]]] = []
+    for aid, missing in plan.items():
+        cg_id = coingecko_ids.get(aid)
+        if not cg_id:
+            for d in missing:
+                if stop_event is not None and stop_event.is_set():
+                    break
+                if get_historical_price(aid, d) is not None:
+                    stats['fallback'] += 1
+            continue
+        for r_start, r_end in collapse_to_ranges(missing):
+            wanted = [d for d in missing if r_start <= d <= r_end]
+            jobs.append((aid, cg_id, r_start, r_end, wanted))
+
+    total = len(jobs)
+    logger.info(
+        f"📅 Backfill: {stats['missing']} snapshots em falta → {total} chamadas market_chart/range "
+        f"({len(plan)} ativos, {max_workers} workers)"
+    )
+    limiter = rate_limiter or get_coingecko_limiter()
+
+    def _run(job):
+        aid, cg_id, r_start, r_end, wanted = job
+        if not limiter.acquire(stop_event):
+            return aid, None, 'cancelled'
+        if not _is_coingecko_available():
+            return aid, None, 'disabled'
+        try:
+            prices = get_market_chart_range(cg_id, r_start, r_end, vs_currency="eur")
+        except Exception as e:
+            _handle_coingecko_error(e)
+            logger.warning(f"  ⚠️ market_chart/range falhou para {cg_id} ({r_start} → {r_end}): {e}")
+            return aid, None, 'error'
+        if prices is None:
+            return aid, None, 'disabled'
+        _reset_coingecko_429_counter()
+        return aid, daily_prices_from_chart(prices, wanted), 'ok'
+
+    done = 0
+    with ThreadPoolExecutor(max_workers=max(1, int(max_workers))) as pool:
+        futures = [pool.submit(_run, job) for job in jobs]
+        for fut in as_completed(futures):
+            if fut.cancelled():
+                continue
+            aid, daily, status = fut.result()
+            done += 1
+            if status == 'ok':
+                stats['requests'] += 1
+                try:
+                    stats['written'] += _write_prices(aid, daily)
+                except Exception as e:
+                    stats['failed'] += 1
+                    logger.error(f"Erro ao guardar snapshots do asset_id={aid}: {e}")
+            elif status == 'cancelled':
+                stats['cancelled'] = True
+            else:
+                stats['failed'] += 1
+            if progress_callback:
+                progress_callback(done, total)
+            if stop_event is not None and stop_event.is_set() and not stats['cancelled']:
+                stats['cancelled'] = True
+                logger.warning("⏹️ Backfill cancelado pelo utilizador")
+                for f in futures:
+                    f.cancel()
+
+    stats['elapsed_seconds'] = round(time.time() - t0, 2)
+    logger.info(
+        f"✅ Backfill concluído: {stats['written']}/{stats['missing']} snapshots escritos em "
+        f"{stats['requests']} chamadas ({stats['failed']} falhadas) em {stats['elapsed_seconds']}s"
+    )
+    return stats
@@ -4,18 +4,26 @@ Este módulo permite:
 - Buscar preços históricos do CoinGecko e armazená-los localmente
 - Consultar preços históricos da base de dados
 - Preencher gaps de dados históricos
+- Consultar a cobertura por ativo (t_price_snapshot_coverage)
 - Atualizar preços diários automaticamente
 """
 import logging
 import threading
-from datetime import date, datetime, timedelta
+from datetime import date, timedelta
 from typing import List, Dict, Optional
+import numpy as np
 import pandas as pd
 from sqlalchemy import text
 from database.connection import get_engine
-from services.coingecko import CoinGeckoService, get_current_price_by_id, get_historical_price_by_id, resolve_coingecko_id_for_symbol
-import time
-import requests
+from services.price_cache import get_price_cache, invalidate_prices
+from services.coingecko import (
+    CoinGeckoService,
+    _is_429,
+    get_coingecko_limiter,
+    get_current_price_by_id,
+    get_historical_price_by_id,
+    resolve_coingecko_ids_for_symbols,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -26,65 +34,31 @@ _bg_stop_event: Optional[threading.Event] = None
 # URL base da API CoinGecko
 BASE_URL = "https://api.coingecko.com/api/v3"
 
-# Cache global para evitar chamadas repetidas durante mesma execução
-_prices_session_cache = {}  # {(symbol, date): price}
+# Mapa symbol (upper) -> asset_id para consultar o cache de preços sem ir a t_assets
+# (limitado pelo número de ativos; asset_ids não mudam)
+_asset_id_by_symbol: Dict[str, int] = {}
 
-# Proteção contra rate limit abuse
-_coingecko_429_counter = 0
-_coingecko_429_threshold = 3  # Após 3 erros 429 consecutivos, desabilitar temporariamente
-_coingecko_disabled_until = None  # Timestamp de quando reabilitar
+# Janela por omissão (em dias) para resolução "as-of": aceitar o snapshot mais recente
+# até N dias antes da data pedida antes de recorrer à API
+ASOF_MAX_STALENESS_DAYS = 3
+
+# Proteção contra rate limit abuse: o circuit breaker (3 erros 429 consecutivos → 5 minutos
+# sem pedidos) é o do limiter partilhado do CoinGecko, comum a todas as threads e processos
 
 
 def _is_coingecko_available() -> bool:
     """Verifica se a API CoinGecko está disponível (não bloqueada por 429s repetidos)."""
-    global _coingecko_disabled_until, _coingecko_429_counter
-    
-    if _coingecko_disabled_until is None:
-        return True
-    
-    # Verificar se já passou o tempo de cooldown (5 minutos)
-    if datetime.now() >= _coingecko_disabled_until:
-        logger.info("✅ CoinGecko reabilitada após cooldown")
-        _coingecko_disabled_until = None
-        _coingecko_429_counter = 0
-        return True
-    
-    return False
+    return not get_coingecko_limiter().is_open()
 
 
 def _handle_coingecko_error(error: Exception):
-    """Regista erro da CoinGecko e atualiza contador de 429s."""
-    global _coingecko_429_counter, _coingecko_disabled_until
-    
-    # Verificar se é erro 429
-    is_429 = False
-    if isinstance(error, requests.exceptions.HTTPError):
-        if hasattr(error, 'response') and error.response is not None:
-            is_429 = error.response.status_code == 429
-    elif "429" in str(error) or "rate limit" in str(error).lower():
-        is_429 = True
-    
-    if is_429:
-        _coingecko_429_counter += 1
-        logger.warning(f"⚠️ CoinGecko 429 (rate limit) #{_coingecko_429_counter}/{_coingecko_429_threshold}")
-        
-        if _coingecko_429_counter >= _coingecko_429_threshold:
-            _coingecko_disabled_until = datetime.now() + timedelta(minutes=5)
-            logger.error(
-                f"❌ CoinGecko desabilitada temporariamente até {_coingecko_disabled_until.strftime('%H:%M:%S')} "
-                f"devido a {_coingecko_429_counter} erros 429 consecutivos"
-            )
-    else:
-        # Reset contador em caso de erro diferente
-        _coingecko_429_counter = 0
+    """Regista erro da CoinGecko no circuit breaker partilhado (só 429s consecutivos o abrem)."""
+    get_coingecko_limiter().record_failure(_is_429(error))
 
 
 def _reset_coingecko_429_counter():
     """Reset contador após chamada bem-sucedida."""
-    global _coingecko_429_counter
-    if _coingecko_429_counter > 0:
-        logger.info("✅ CoinGecko respondeu com sucesso - reset contador 429")
-        _coingecko_429_counter = 0
+    get_coingecko_limiter().record_success()
 
 
 def get_historical_price(asset_id: int, target_date: date) -> Optional[float]:
@@ -99,6 +73,11 @@ def get_historical_price(asset_id: int, target_date: date) -> Optional[float]:
     Returns:
         Preço em EUR ou None se não disponível
     """
+    cache = get_price_cache()
+    cached = cache.get(asset_id, target_date)
+    if cached is not None:
+        return cached
+
     engine = get_engine()
     
     # Tentar buscar da BD
@@ -114,7 +93,9 @@ def get_historical_price(asset_id: int, target_date: date) -> Optional[float]:
     )
     
     if not df.empty:
-        return float(df.iloc[0]['price_eur'])
+        price = float(df.iloc[0]['price_eur'])
+        cache.put(asset_id, [target_date], [price])
+        return price
     
     # Buscar symbol e coingecko_id ANTES de fazer logging ou chamada API
     df_asset = pd.read_sql(
@@ -149,6 +130,7 @@ def get_historical_price(asset_id: int, target_date: date) -> Optional[float]:
                         """),
                         {"asset_id": asset_id, "date": target_date}
                     )
+                invalidate_prices(asset_id, target_date, target_date)
             except Exception as e:
                 logger.warning(f"Erro ao guardar preço fixo: {e}")
             return 1.0
@@ -205,6 +187,7 @@ def get_historical_price(asset_id: int, target_date: date) -> Optional[float]:
                             'price_eur': closest_price,
                         }
                     )
+                invalidate_prices(asset_id, target_date, target_date)
                 logger.info(f"Preço histórico guardado: asset_id={asset_id}, date={target_date}, price={closest_price}")
             except Exception as e:
                 logger.error(f"Erro ao guardar snapshot: {e}")
@@ -218,12 +201,22 @@ def get_historical_price(asset_id: int, target_date: date) -> Optional[float]:
     return None
 
 
-def get_historical_prices_bulk(asset_ids: List[int], target_date: date, allow_api_fallback: bool = True) -> Dict[int, float]:
+def get_historical_prices_bulk(
+    asset_ids: List[int],
+    target_date: date,
+    allow_api_fallback: bool = True,
+    asof: bool = False,
+    max_staleness_days: int = ASOF_MAX_STALENESS_DAYS,
+) -> Dict[int, float]:
     """Busca preços históricos para múltiplos ativos numa data.
     
     Args:
         asset_ids: Lista de IDs de ativos
         target_date: Data para a qual queremos os preços
+        allow_api_fallback: Se True, ativos sem preço na BD são buscados ao CoinGecko
+        asof: Se True, aceita o snapshot mais recente em ou antes de target_date
+            (até max_staleness_days dias antes) em vez de exigir a data exata
+        max_staleness_days: Janela máxima (dias) para a resolução as-of
         
     Returns:
         Dicionário {asset_id: price_eur}
@@ -231,25 +224,54 @@ def get_historical_prices_bulk(asset_ids: List[int], target_date: date, allow_ap
     if not asset_ids:
         return {}
     
+    # Cache em memória primeiro (um preço exato também serve para o modo as-of)
+    cache = get_price_cache()
+    result: Dict[int, float] = {}
+    for aid in asset_ids:
+        cached = cache.get(aid, target_date)
+        if cached is not None:
+            result[aid] = cached
+    to_query = [aid for aid in asset_ids if aid not in result]
+    if not to_query:
+        return result
+    
     engine = get_engine()
     
     # Buscar da BD em batch PRIMEIRO
-    placeholders = ','.join(['%s'] * len(asset_ids))
-    df = pd.read_sql(
-        f"""
-        SELECT asset_id, price_eur 
-        FROM t_price_snapshots 
-        WHERE asset_id IN ({placeholders}) AND snapshot_date = %s
-        """,
-        engine,
-        params=(*asset_ids, target_date)
-    )
+    placeholders = ','.join(['%s'] * len(to_query))
+    if asof:
+        # Último snapshot de cada ativo dentro da janela [target - N dias, target]
+        df = pd.read_sql(
+            f"""
+            SELECT DISTINCT ON (asset_id) asset_id, price_eur
+            FROM t_price_snapshots
+            WHERE asset_id IN ({placeholders})
+              AND snapshot_date <= %s AND snapshot_date >= %s
+            ORDER BY asset_id, snapshot_date DESC
+            """,
+            engine,
+            params=(*to_query, target_date, target_date - timedelta(days=max_staleness_days))
+        )
+    else:
+        df = pd.read_sql(
+            f"""
+            SELECT asset_id, price_eur 
+            FROM t_price_snapshots 
+            WHERE asset_id IN ({placeholders}) AND snapshot_date = %s
+            """,
+            engine,
+            params=(*to_query, target_date)
+        )
     
     # Convert to dictionary efficiently using pandas to_dict
-    result = dict(zip(df['asset_id'].astype(int), df['price_eur'].astype(float)))
+    from_db = dict(zip(df['asset_id'].astype(int), df['price_eur'].astype(float)))
+    if not asof:
+        for aid, price in from_db.items():
+            cache.put(aid, [target_date], [price])
+    result.update(from_db)
     
-    if result:
-        logger.info(f"✅ Encontrados {len(result)}/{len(asset_ids)} preços na BD para {target_date}")
+    if from_db:
+        logger.info(f"✅ Encontrados {len(from_db)}/{len(to_query)} preços na BD para {target_date}")
     
     # Para assets sem preço na BD, buscar do CoinGecko
     missing = [aid for aid in asset_ids if aid not in result]
@@ -265,12 +287,64 @@ def get_historical_prices_bulk(asset_ids: List[int], target_date: date, allow_ap
     return result
 
 
-def get_historical_prices_by_symbol(symbols: List[str], target_date: date, allow_api_fallback: bool = True) -> Dict[str, float]:
+def _resolve_symbol_asset_ids(symbols: List[str]) -> Dict[str, int]:
+    """Mapeia símbolos para asset_id numa única query a t_assets.
+
+    Procura por symbol OU por name (maior cobertura), preferindo o match por symbol.
+    Retorna {símbolo_original: asset_id} apenas para os símbolos encontrados.
+    """
+    if not symbols:
+        return {}
+
+    engine = get_engine()
+    wanted = {s.upper() for s in symbols}
+    placeholders = ','.join(['%s'] * len(symbols))
+    df_assets = pd.read_sql(
+        f"""
+        SELECT asset_id, symbol, name 
+        FROM t_assets 
+        WHERE UPPER(symbol) IN ({placeholders})
+           OR UPPER(name)   IN ({placeholders})
+        """,
+        engine,
+        params=tuple([s.upper() for s in symbols] + [s.upper() for s in symbols])
+    )
+
+    if df_assets.empty:
+        return {}
+
+    # Preferir mapear por symbol; se não existir, usar name match
+    by_upper: Dict[str, int] = {}
+    for r in df_assets.to_dict('records'):
+        sym = str(r['symbol']).upper() if pd.notna(r['symbol']) else None
+        nm = str(r['name']).upper() if pd.notna(r['name']) else None
+        aid = int(r['asset_id'])
+        if sym and sym in wanted:
+            by_upper[sym] = aid
+        if nm and nm in wanted and nm not in by_upper:
+            by_upper[nm] = aid
+
+    _asset_id_by_symbol.update(by_upper)
+
+    # Criar mapeamento na mesma casing dos símbolos originais
+    return {orig: by_upper[orig.upper()] for orig in symbols if orig.upper() in by_upper}
+
+
+def get_historical_prices_by_symbol(
+    symbols: List[str],
+    target_date: date,
+    allow_api_fallback: bool = True,
+    asof: bool = False,
+    max_staleness_days: int = ASOF_MAX_STALENESS_DAYS,
+) -> Dict[str, float]:
     """Busca preços históricos para múltiplos símbolos numa data.
     
     Args:
         symbols: Lista de símbolos de ativos (ex: ['BTC', 'ADA', 'ETH'])
         target_date: Data para a qual queremos os preços
+        allow_api_fallback: Se True, preços em falta na BD são buscados ao CoinGecko
+        asof: Se True, usa o snapshot mais recente até max_staleness_days antes da data
+        max_staleness_days: Janela máxima (dias) para a resolução as-of
         
     Returns:
         Dicionário {symbol: price_eur}
@@ -278,125 +352,223 @@ def get_historical_prices_by_symbol(symbols: List[str], target_date: date, allow
     if not symbols:
         return {}
     
-    # Verificar cache de sessão primeiro
+    # Verificar cache de preços primeiro (para símbolos com asset_id já conhecido)
+    cache = get_price_cache()
     result = {}
     missing_symbols = []
     
     for sym in symbols:
-        cache_key = (sym, target_date)
-        if cache_key in _prices_session_cache:
-            result[sym] = _prices_session_cache[cache_key]
+        aid = _asset_id_by_symbol.get(sym.upper())
+        price = cache.get(aid, target_date) if aid is not None else None
+        if price is not None:
+            result[sym] = price
         else:
             missing_symbols.append(sym)
     
     if not missing_symbols:
         return result  # Todos no cache
     
-    engine = get_engine()
-    
-    # Buscar asset_ids por símbolo OU por nome (maior cobertura)
-    placeholders = ','.join(['%s'] * len(missing_symbols))
-    df_assets = pd.read_sql(
-        f"""
-        SELECT asset_id, symbol, name 
-        FROM t_assets 
-        WHERE UPPER(symbol) IN ({placeholders})
-           OR UPPER(name)   IN ({placeholders})
-        """,
-        engine,
-        params=tuple([s.upper() for s in missing_symbols] + [s.upper() for s in missing_symbols])
-    )
-    
-    if df_assets.empty:
+    symbol_to_id = _resolve_symbol_asset_ids(missing_symbols)
+    if not symbol_to_id:
         return result
-    
-    # Mapear symbol -> asset_id efficiently using pandas to_dict
-    # Preferir mapear por symbol; se não existir, usar name match
-    symbol_to_id = {}
-    for _, r in df_assets.iterrows():
-        sym = str(r['symbol']).upper() if pd.notna(r['symbol']) else None
-        nm = str(r['name']).upper() if pd.notna(r['name']) else None
-        aid = int(r['asset_id'])
-        if sym and sym in [s.upper() for s in missing_symbols]:
-            symbol_to_id[sym] = aid
-        if nm and nm in [s.upper() for s in missing_symbols] and nm not in symbol_to_id:
-            symbol_to_id[nm] = aid
-
-    # Criar mapeamento na mesma casing dos missing_symbols originais
-    symbol_to_id = {orig: symbol_to_id.get(orig.upper()) for orig in missing_symbols if symbol_to_id.get(orig.upper())}
     asset_ids = list(symbol_to_id.values())
     
     # Buscar preços históricos por asset_id (com rate limiting)
-    prices_by_id = get_historical_prices_bulk(asset_ids, target_date, allow_api_fallback=allow_api_fallback)
+    prices_by_id = get_historical_prices_bulk(
+        asset_ids, target_date, allow_api_fallback=allow_api_fallback,
+        asof=asof, max_staleness_days=max_staleness_days,
+    )
     
-    # Mapear de volta para símbolos e guardar no cache
+    # Mapear de volta para símbolos (o cache é alimentado em get_historical_prices_bulk)
     for symbol, asset_id in symbol_to_id.items():
         if asset_id in prices_by_id:
-            price = prices_by_id[asset_id]
-            result[symbol] = price
-            _prices_session_cache[(symbol, target_date)] = price
+            result[symbol] = prices_by_id[asset_id]
     
     return result
 
 
-def populate_snapshots_for_period(start_date: date, end_date: date, asset_ids: Optional[List[int]] = None):
+def _to_day_numbers(values) -> np.ndarray:
+    """Converte datas (date/Timestamp/str) em números de dia (dias desde 1970-01-01)."""
+    return np.asarray(pd.to_datetime(values), dtype='datetime64[D]').astype(np.int64)
+
+
+def _asof_lookup(series_days: np.ndarray, target_days: np.ndarray, max_staleness_days: int) -> np.ndarray:
+    """Resolve, para cada dia pedido, o índice do ponto mais recente da série em ou antes desse dia.
+
+    Args:
+        series_days: Dias da série (ordenados ascendentemente)
+        target_days: Dias pedidos
+        max_staleness_days: Distância máxima aceite (0 = apenas data exata)
+
+    Returns:
+        Array de índices em series_days (-1 quando não existe ponto dentro da janela)
+    """
+    if len(series_days) == 0:
+        return np.full(len(target_days), -1, dtype=np.int64)
+    idx = np.searchsorted(series_days, target_days, side='right') - 1
+    safe_idx = np.where(idx >= 0, idx, 0)
+    ok = (idx >= 0) & ((target_days - series_days[safe_idx]) <= max_staleness_days)
+    return np.where(ok, idx, -1)
+
+
+def get_historical_price_matrix(
+    symbols: List[str],
+    dates: List[date],
+    allow_api_fallback: bool = True,
+    asof: bool = False,
+    max_staleness_days: int = ASOF_MAX_STALENESS_DAYS,
+) -> pd.DataFrame:
+    """Busca preços históricos para vários símbolos em várias datas de uma só vez.
+
+    Substitui o padrão de chamar get_historical_prices_by_symbol uma vez por data:
+    resolve os asset_ids numa query e lê todos os snapshots necessários de
+    t_price_snapshots noutra.
+
+    Em modo as-of, cada data recebe o snapshot mais recente em ou antes dela
+    (até max_staleness_days dias antes), resolvido em memória com searchsorted
+    sobre a série de cada ativo. Só os gaps maiores que a janela vão à API.
+
+    Args:
+        symbols: Lista de símbolos de ativos (ex: ['BTC', 'ADA', 'ETH'])
+        dates: Datas para as quais queremos os preços
+        allow_api_fallback: Se True, pares em falta na BD são buscados ao CoinGecko
+        asof: Se True, usa resolução as-of em vez de data exata
+        max_staleness_days: Janela máxima (dias) para a resolução as-of
+
+    Returns:
+        DataFrame indexado por data (DatetimeIndex) com uma coluna float por símbolo.
+        Pares sem preço ficam a NaN.
+    """
+    target_dates = sorted({pd.Timestamp(d).date() for d in dates})
+    index = pd.DatetimeIndex(pd.to_datetime(target_dates), name='date')
+    matrix = pd.DataFrame(np.nan, index=index, columns=list(symbols), dtype=float)
+
+    if not symbols or not target_dates:
+        return matrix
+
+    symbol_to_id = _resolve_symbol_asset_ids(symbols)
+    if not symbol_to_id:
+        return matrix
+
+    engine = get_engine()
+    asset_ids = sorted(set(symbol_to_id.values()))
+    id_placeholders = ','.join(['%s'] * len(asset_ids))
+    if asof:
+        # Série completa de cada ativo no intervalo (com margem da janela antes da 1ª data)
+        df = pd.read_sql(
+            f"""
+            SELECT asset_id, snapshot_date, price_eur
+            FROM t_price_snapshots
+            WHERE asset_id IN ({id_placeholders})
+              AND snapshot_date BETWEEN %s AND %s
+            ORDER BY asset_id, snapshot_date
+            """,
+            engine,
+            params=(*asset_ids, target_dates[0] - timedelta(days=max_staleness_days), target_dates[-1])
+        )
+    else:
+        date_placeholders = ','.join(['%s'] * len(target_dates))
+        df = pd.read_sql(
+            f"""
+            SELECT asset_id, snapshot_date, price_eur
+            FROM t_price_snapshots
+            WHERE asset_id IN ({id_placeholders}) AND snapshot_date IN ({date_placeholders})
+            ORDER BY asset_id, snapshot_date
+            """,
+            engine,
+            params=(*asset_ids, *target_dates)
+        )
+
+    target_days = _to_day_numbers(target_dates)
+    window = max_staleness_days if asof else 0
+    cache = get_price_cache()
+
+    if not df.empty:
+        df['asset_id'] = df['asset_id'].astype(int)
+        df['price_eur'] = df['price_eur'].astype(float)
+        df = df.sort_values(['asset_id', 'snapshot_date'])
+        for aid, grp in df.groupby('asset_id', sort=False):
+            series_days = _to_day_numbers(grp['snapshot_date'])
+            series_prices = grp['price_eur'].to_numpy(dtype=float)
+            idx = _asof_lookup(series_days, target_days, window)
+            found = idx >= 0
+            prices = np.where(found, series_prices[np.where(found, idx, 0)], np.nan)
+            for sym, sym_aid in symbol_to_id.items():
+                if sym_aid == aid:
+                    matrix[sym] = prices
+            # Os snapshots lidos (datas exatas) alimentam o cache de séries
+            cache.put(int(aid), grp['snapshot_date'].tolist(), series_prices)
+
+    logger.info(
+        f"✅ Matriz de preços{' (as-of)' if asof else ''}: {int(matrix.notna().sum().sum())}/{matrix.size} pares na BD "
+        f"({len(symbols)} símbolos × {len(target_dates)} datas)"
+    )
+
+    # Pares em falta (ou fora da janela as-of): buscar ao CoinGecko (guarda na BD)
+    if allow_api_fallback:
+        fetched: Dict[tuple, Optional[float]] = {}
+        for sym, aid in symbol_to_id.items():
+            for ts in matrix.index[matrix[sym].isna()]:
+                key = (aid, ts.date())
+                if key not in fetched:
+                    fetched[key] = get_historical_price(aid, ts.date())
+                if fetched[key]:
+                    matrix.at[ts, sym] = float(fetched[key])
+
+    return matrix
+
+
+def populate_snapshots_for_period(start_date: date, end_date: date, asset_ids: Optional[List[int]] = None) -> Dict:
     """Preenche snapshots de preços para um período.
     
+    Planeia todos os pares (ativo, data) em falta e preenche-os com chamadas
+    market_chart/range concorrentes (ver services.snapshot_backfill), respeitando
+    o rate limit configurado e o cancelamento via _bg_stop_event.
+    
     Args:
         start_date: Data inicial
         end_date: Data final
         asset_ids: Lista de asset_ids (se None, usa todos os ativos com coingecko_id)
+        
+    Returns:
+        Estatísticas do backfill (ver backfill_snapshots)
     """
-    engine = get_engine()
-    
-    if asset_ids is None:
-        df_assets = pd.read_sql(
-            "SELECT asset_id FROM t_assets WHERE coingecko_id IS NOT NULL",
-            engine
-        )
-        asset_ids = df_assets['asset_id'].tolist()
+    from services.snapshot_backfill import backfill_snapshots
     
-    if not asset_ids:
-        logger.warning("Nenhum ativo com coingecko_id configurado")
-        return
+    logger.info(f"📅 populate_snapshots_for_period: {start_date} até {end_date}")
     
-    logger.info(f"📅 populate_snapshots_for_period: {start_date} até {end_date} para {len(asset_ids)} ativos")
+    def _progress(done: int, total: int):
+        logger.info(f"  📦 Janela {done}/{total} processada")
     
-    # Iterar por cada dia
-    current = start_date
-    day_count = 0
-    total_days = (end_date - start_date).days + 1
-    
-    global _bg_stop_event
-    while current <= end_date:
-        if _bg_stop_event and _bg_stop_event.is_set():
-            logger.warning("⏹️ Snapshot population cancelled by user")
-            break
-        day_count += 1
-        logger.info(f"Processando {current} ({day_count}/{total_days})...")
-        
-        # Process assets in smaller batches to avoid overwhelming API
-        batch_size = 5  # Reduced from processing all at once
-        for i in range(0, len(asset_ids), batch_size):
-            batch = asset_ids[i:i+batch_size]
-            logger.info(f"  📦 Lote {i//batch_size + 1}/{(len(asset_ids) + batch_size - 1)//batch_size} ({len(batch)} ativos)")
-            
-            for asset_id in batch:
-                if _bg_stop_event and _bg_stop_event.is_set():
-                    logger.warning("⏹️ Snapshot population cancelled during batch")
-                    break
-                try:
-                    get_historical_price(asset_id, current)
-                except Exception as e:
-                    logger.warning(f"  ⚠️ Erro ao buscar preço para asset_id={asset_id}: {e}")
-            
-            # Small delay between batches to avoid rate limits
-            if i + batch_size < len(asset_ids):
-                time.sleep(0.5)  # 500ms between batches
-        
-        current += timedelta(days=1)
+    stats = backfill_snapshots(
+        start_date,
+        end_date,
+        asset_ids=asset_ids,
+        stop_event=_bg_stop_event,
+        progress_callback=_progress,
+    )
+    if stats.get('cancelled'):
+        logger.warning("⏹️ Snapshot population cancelled by user")
     
     logger.info("Preenchimento de snapshots concluído")
+    return stats
+
+
+def get_snapshot_coverage() -> pd.DataFrame:
+    """Cobertura de t_price_snapshots por ativo (t_price_snapshot_coverage, mantida por trigger).
+
+    Returns:
+        DataFrame com asset_id, symbol, first_date, last_date, row_count, gap_days (uma linha por ativo)
+    """
+    return pd.read_sql(
+        """
+        SELECT c.asset_id, a.symbol, c.first_date, c.last_date, c.row_count, c.gap_days
+        FROM t_price_snapshot_coverage c
+        JOIN t_assets a ON a.asset_id = c.asset_id
+        ORDER BY a.symbol
+        """,
+        get_engine()
+    )
 
 
 def update_latest_prices():
@@ -450,15 +622,15 @@ def ensure_assets_for_symbols(symbols: List[str], chain: str = "Cardano") -> Dic
     # Insert missing
     missing = [s for s in symbols_norm if s.upper() not in existing]
     if missing:
-        # Try resolve coingecko id for each symbol
+        # Resolve coingecko ids for all missing symbols in one batch (local coin-list index)
+        cg_ids = resolve_coingecko_ids_for_symbols(missing)
         rows = []
         for s in missing:
-            cg_id = resolve_coingecko_id_for_symbol(s)
             rows.append({
                 'symbol': s,
                 'name': s,
                 'chain': chain,
-                'coingecko_id': cg_id,
+                'coingecko_id': cg_ids.get(s),
                 'is_stablecoin': False,
             })
         # Bulk insert
@@ -1,8 +1,10 @@
 """Tests for new performance optimizations."""
+import os
 import unittest
 import pandas as pd
 import numpy as np
-from unittest.mock import Mock, patch
+from decimal import Decimal
+from unittest.mock import MagicMock, Mock, patch
 
 
 class TestVectorizedHoldings(unittest.TestCase):
@@ -203,6 +205,10 @@ class TestCachingUtilities(unittest.TestCase):
 class TestSnapshotsOptimizations(unittest.TestCase):
     """Test snapshots service optimizations."""
     
+    def setUp(self):
+        from services.price_cache import get_price_cache
+        get_price_cache().clear()
+    
     @patch('services.snapshots.get_engine')
     @patch('services.snapshots.pd.read_sql')
     def test_bulk_prices_uses_efficient_conversion(self, mock_read_sql, mock_engine):
@@ -228,6 +234,1566 @@ class TestSnapshotsOptimizations(unittest.TestCase):
         # Verify read_sql was called
         mock_read_sql.assert_called_once()
 
+    @patch('services.snapshots.get_engine')
+    @patch('services.snapshots.pd.read_sql')
+    def test_price_matrix_uses_single_price_query(self, mock_read_sql, mock_engine):
+        """Test that the date × symbol matrix is built from one snapshots query."""
+        from services.snapshots import get_historical_price_matrix
+        from datetime import date
+        
+        df_assets = pd.DataFrame({
+            'asset_id': [1, 2],
+            'symbol': ['BTC', 'ADA'],
+            'name': ['Bitcoin', 'Cardano']
+        })
+        df_prices = pd.DataFrame({
+            'asset_id': [1, 1, 2],
+            'snapshot_date': [date(2024, 1, 1), date(2024, 1, 2), date(2024, 1, 1)],
+            'price_eur': [40000.0, 41000.0, 0.5]
+        })
+        mock_read_sql.side_effect = [df_assets, df_prices]
+        mock_engine.return_value = Mock()
+        
+        matrix = get_historical_price_matrix(
+            ['BTC', 'ADA'], [date(2024, 1, 2), date(2024, 1, 1)], allow_api_fallback=False
+        )
+        
+        # One query for t_assets + one query for all (asset_id, date) pairs
+        self.assertEqual(mock_read_sql.call_count, 2)
+        self.assertEqual(list(matrix.columns), ['BTC', 'ADA'])
+        self.assertEqual(len(matrix), 2)
+        self.assertAlmostEqual(matrix.loc[pd.Timestamp('2024-01-01'), 'BTC'], 40000.0)
+        self.assertAlmostEqual(matrix.loc[pd.Timestamp('2024-01-02'), 'BTC'], 41000.0)
+        self.assertAlmostEqual(matrix.loc[pd.Timestamp('2024-01-01'), 'ADA'], 0.5)
+        self.assertTrue(np.isnan(matrix.loc[pd.Timestamp('2024-01-02'), 'ADA']))
+
+    @patch('services.snapshots.get_engine')
+    @patch('services.snapshots.pd.read_sql')
+    def test_price_matrix_asof_respects_staleness_window(self, mock_read_sql, mock_engine):
+        """Test that as-of mode reuses the last snapshot only inside the window."""
+        from services.snapshots import get_historical_price_matrix
+        from datetime import date
+        
+        df_assets = pd.DataFrame({'asset_id': [1], 'symbol': ['BTC'], 'name': ['Bitcoin']})
+        df_prices = pd.DataFrame({
+            'asset_id': [1, 1],
+            'snapshot_date': [date(2024, 1, 1), date(2024, 1, 5)],
+            'price_eur': [40000.0, 42000.0]
+        })
+        mock_read_sql.side_effect = [df_assets, df_prices]
+        mock_engine.return_value = Mock()
+        
+        matrix = get_historical_price_matrix(
+            ['BTC'],
+            [date(2024, 1, 3), date(2024, 1, 5), date(2024, 1, 12)],
+            allow_api_fallback=False,
+            asof=True,
+            max_staleness_days=3,
+        )
+        
+        # 01-03 -> snapshot de 01-01 (2 dias), 01-05 exato, 01-12 fora da janela
+        self.assertAlmostEqual(matrix.loc[pd.Timestamp('2024-01-03'), 'BTC'], 40000.0)
+        self.assertAlmostEqual(matrix.loc[pd.Timestamp('2024-01-05'), 'BTC'], 42000.0)
+        self.assertTrue(np.isnan(matrix.loc[pd.Timestamp('2024-01-12'), 'BTC']))
+
+    
+    @patch('services.snapshots.get_engine')
+    @patch('services.snapshots.pd.read_sql')
+    def test_bulk_prices_served_from_cache_on_second_call(self, mock_read_sql, mock_engine):
+        """Test that a repeated bulk lookup does not hit the database again."""
+        from services.snapshots import get_historical_prices_bulk
+        from datetime import date
+        
+        mock_read_sql.return_value = pd.DataFrame({'asset_id': [1, 2], 'price_eur': [10.0, 20.0]})
+        
+        first = get_historical_prices_bulk([1, 2], date(2024, 1, 1), allow_api_fallback=False)
+        second = get_historical_prices_bulk([1, 2], date(2024, 1, 1), allow_api_fallback=False)
+        
+        self.assertEqual(first, second)
+        self.assertEqual(mock_read_sql.call_count, 1)
+
+
+class TestPriceSeriesCache(unittest.TestCase):
+    """Test the in-memory price-series cache."""
+    
+    def test_put_get_and_overwrite(self):
+        from services.price_cache import PriceSeriesCache
+        from datetime import date
+        
+        cache = PriceSeriesCache()
+        cache.put(1, [date(2024, 1, 2), date(2024, 1, 1)], [2.0, 1.0])
+        cache.put(1, [date(2024, 1, 2)], [5.0])
+        
+        self.assertEqual(cache.get(1, date(2024, 1, 1)), 1.0)
+        self.assertEqual(cache.get(1, date(2024, 1, 2)), 5.0)
+        self.assertIsNone(cache.get(1, date(2024, 1, 3)))
+        self.assertEqual(cache.stats()['hits'], 2)
+        self.assertEqual(cache.stats()['misses'], 1)
+    
+    def test_lru_eviction_respects_byte_limit(self):
+        from services.price_cache import PriceSeriesCache
+        from datetime import date, timedelta
+        
+        days = [date(2024, 1, 1) + timedelta(days=i) for i in range(10)]
+        cache = PriceSeriesCache(max_bytes=250)  # cabe em 2 séries de 10 pontos (120 bytes)
+        cache.put(1, days, range(10))
+        cache.put(2, days, range(10))
+        cache.get(1, days[0])  # 1 passa a mais recente
+        cache.put(3, days, range(10))
+        
+        self.assertIsNone(cache.get(2, days[0]))
+        self.assertIsNotNone(cache.get(1, days[0]))
+        self.assertIsNotNone(cache.get(3, days[0]))
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertLessEqual(cache.stats()['bytes'], 250)
+    
+    def test_invalidate_date_range(self):
+        from services.price_cache import PriceSeriesCache
+        from datetime import date
+        
+        cache = PriceSeriesCache()
+        cache.put(1, [date(2024, 1, 1), date(2024, 1, 2), date(2024, 1, 3)], [1.0, 2.0, 3.0])
+        cache.invalidate(1, date(2024, 1, 2), date(2024, 1, 2))
+        
+        self.assertEqual(cache.get(1, date(2024, 1, 1)), 1.0)
+        self.assertIsNone(cache.get(1, date(2024, 1, 2)))
+        self.assertEqual(cache.get(1, date(2024, 1, 3)), 3.0)
+        
+        cache.invalidate(1)
+        self.assertEqual(cache.stats()['assets'], 0)
+
+
+
+class TestSnapshotBackfill(unittest.TestCase):
+    """Test the concurrent CoinGecko snapshot backfill."""
+    
+    def test_collapse_to_ranges_merges_small_gaps(self):
+        from services.snapshot_backfill import collapse_to_ranges
+        from datetime import date, timedelta
+        
+        d0 = date(2024, 1, 1)
+        dates = [d0 + timedelta(days=i) for i in (0, 1, 2, 5, 6, 40)]
+        
+        ranges = collapse_to_ranges(dates, merge_gap_days=3, max_range_days=365)
+        
+        self.assertEqual(ranges, [(d0, d0 + timedelta(days=6)), (d0 + timedelta(days=40), d0 + timedelta(days=40))])
+        
+        long_run = [d0 + timedelta(days=i) for i in range(400)]
+        self.assertEqual(len(collapse_to_ranges(long_run, max_range_days=365)), 2)
+    
+    def test_daily_prices_from_chart_averages_per_utc_day(self):
+        from services.snapshot_backfill import daily_prices_from_chart
+        from datetime import date, datetime, timezone
+        
+        def ms(y, m, d, h):
+            return datetime(y, m, d, h, tzinfo=timezone.utc).timestamp() * 1000
+        
+        prices = [[ms(2024, 1, 1, 0), 1.0], [ms(2024, 1, 1, 12), 3.0], [ms(2024, 1, 2, 0), 5.0]]
+        
+        daily = daily_prices_from_chart(prices, [date(2024, 1, 1)])
+        
+        self.assertEqual(daily, {date(2024, 1, 1): 2.0})
+    
+    def test_token_bucket_respects_capacity_and_cancel(self):
+        import threading
+        from services.rate_limit import TokenBucket
+        
+        bucket = TokenBucket(rate_per_minute=60, capacity=2)
+        self.assertEqual(bucket.try_acquire(), 0.0)
+        self.assertEqual(bucket.try_acquire(), 0.0)
+        self.assertGreater(bucket.try_acquire(), 0.0)
+        
+        stop = threading.Event()
+        stop.set()
+        self.assertFalse(bucket.acquire(stop))
+    
+    @patch('services.snapshot_backfill._write_prices')
+    @patch('services.snapshot_backfill.get_market_chart_range')
+    @patch('services.snapshot_backfill.get_engine')
+    @patch('services.snapshot_backfill.pd.read_sql')
+    def test_backfill_uses_one_range_call_per_window(self, mock_read_sql, mock_engine, mock_range, mock_write):
+        from services.snapshot_backfill import backfill_snapshots
+        from services.rate_limit import TokenBucket
+        from datetime import date, datetime, timezone
+        
+        mock_read_sql.side_effect = [
+            pd.DataFrame({'asset_id': [1], 'symbol': ['ADA'], 'coingecko_id': ['cardano']}),
+            pd.DataFrame({
+                'asset_id': [1, 1, 1, 1],
+                'snapshot_date': [date(2024, 1, 1), date(2024, 1, 3), date(2024, 1, 4), date(2024, 1, 5)],
+            }),
+        ]
+        mock_range.return_value = [
+            [datetime(2024, 1, d, tzinfo=timezone.utc).timestamp() * 1000, float(d)] for d in range(1, 6)
+        ]
+        mock_write.side_effect = lambda aid, prices: len(prices)
+        
+        stats = backfill_snapshots(
+            date(2024, 1, 1), date(2024, 1, 5), asset_ids=[1],
+            rate_limiter=TokenBucket(rate_per_minute=6000, capacity=10),
+        )
+        
+        mock_range.assert_called_once()
+        written = mock_write.call_args[0][1]
+        self.assertEqual(sorted(written), [date(2024, 1, 1), date(2024, 1, 3), date(2024, 1, 4), date(2024, 1, 5)])
+        self.assertEqual(stats['missing'], 4)
+        self.assertEqual(stats['written'], 4)
+        self.assertEqual(stats['requests'], 1)
+    
+    @patch('services.snapshot_backfill.invalidate_prices')
+    @patch('services.snapshot_backfill.execute_values')
+    @patch('services.snapshot_backfill.get_db_cursor')
+    def test_window_is_written_in_one_statement(self, mock_cursor, mock_values, mock_invalidate):
+        from services.snapshot_backfill import _write_prices
+        from datetime import date, timedelta
+        
+        prices = {date(2024, 1, 1) + timedelta(days=i): float(i) for i in range(365)}
+        self.assertEqual(_write_prices(7, prices), 365)
+        
+        # Uma instrução (uma página) por janela: os triggers de instrução correm uma vez
+        mock_values.assert_called_once()
+        rows = mock_values.call_args[0][2]
+        self.assertEqual(len(rows), 365)
+        self.assertGreaterEqual(mock_values.call_args[1]['page_size'], len(rows))
+        mock_invalidate.assert_called_once_with(7, date(2024, 1, 1), date(2024, 12, 30))
+
+
+
+class TestCardanoIncrementalSync(unittest.TestCase):
+    """Test cursor-driven incremental Cardano paging."""
+    
+    @patch('services.cardano_api.get_shared_session')
+    def test_get_transactions_stops_at_cursor(self, mock_session):
+        from services.cardano_api import CardanoScanAPI
+        mock_get = mock_session.return_value.get
+        
+        def page(txs, page_count=5):
+            resp = Mock()
+            resp.status_code = 200
+            resp.json.return_value = {'pageCount': page_count, 'transactions': txs}
+            return resp
+        
+        def tx(h, height):
+            return {'hash': h, 'blockHeight': height, 'timestamp': height, 'fees': 0}
+        
+        mock_get.side_effect = [
+            page([tx('old', 10)]),                                   # página 1 (mais antiga)
+            page([tx('new2', 120), tx('new1', 110), tx('cur', 100), tx('older', 90)]),  # página 5
+        ]
+        api = CardanoScanAPI('key')
+        with patch.object(api, '_convert_to_hex', return_value='abc'):
+            txs, err = api.get_transactions('addr1', max_pages=None, stop_at_block_height=100)
+        
+        self.assertIsNone(err)
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertEqual([t['hash'] for t in txs], ['new2', 'new1', 'cur'])
+        self.assertEqual(api.last_fetch_stats['pages_skipped'], 3)
+        self.assertTrue(api.last_fetch_stats['reached_cursor'])
+    
+    @patch('services.cardano_sync.start_ensure_assets_and_snapshots_async', return_value=True)
+    @patch('services.cardano_sync.CardanoBatchWriter')
+    @patch('services.cardano_sync.return_connection')
+    @patch('services.cardano_sync.get_connection')
+    @patch('services.cardano_sync._get_sync_cursor', return_value=100)
+    @patch('services.cardano_api.get_shared_session')
+    def test_failed_page_keeps_the_sync_cursor(self, mock_session, mock_cursor, mock_conn, mock_return,
+                                               mock_writer, mock_snapshots):
+        from services.cardano_api import CardanoScanAPI
+        from services.cardano_sync import sync_wallet_transactions
+        
+        def page(txs, status=200):
+            resp = Mock()
+            resp.status_code = status
+            resp.json.return_value = {'pageCount': 5, 'transactions': txs}
+            return resp
+        
+        def tx(height):
+            return {'hash': f'h{height}', 'blockHeight': height, 'timestamp': height, 'fees': 0}
+        
+        mock_session.return_value.get.side_effect = [
+            page([tx(10)]),                          # página 1
+            page([tx(130), tx(120)]),                # página 5
+            page([], status=500),                    # página 4 falha
+            page([tx(110), tx(100), tx(90)]),        # página 3 (alcança o cursor)
+        ]
+        cur = MagicMock()
+        cur.fetchone.side_effect = [(4,), (0,)]
+        cur.fetchall.return_value = []
+        mock_conn.return_value.cursor.return_value = cur
+        api = CardanoScanAPI('key')
+        stats = {}
+        
+        with patch.object(api, '_convert_to_hex', return_value='abc'):
+            sync_wallet_transactions(1, 'addr1', stats=stats, api=api)
+        
+        self.assertEqual(stats['failed_pages'], [4])
+        # Transações obtidas são gravadas, mas o cursor não avança para além da página em falta
+        self.assertFalse(any('INSERT INTO t_cardano_sync_state' in c[0][0] for c in cur.execute.call_args_list))
+        mock_conn.return_value.commit.assert_called_once()
+    
+    def test_clients_share_one_pooled_session_and_record_latency(self):
+        import services.cardano_api as cardano_api
+        from services.cardano_api import CardanoScanAPI, get_shared_session, get_endpoint_latency_stats
+        
+        session = get_shared_session()
+        self.assertIs(session, get_shared_session())
+        adapter = session.get_adapter('https://api.cardanoscan.io')
+        self.assertGreater(adapter.max_retries.total, 0)
+        
+        cardano_api.reset_endpoint_latency_stats()
+        resp = Mock(status_code=200)
+        resp.json.return_value = {'balance': '1000000'}
+        with patch.object(session, 'get', return_value=resp) as mock_get:
+            CardanoScanAPI('k1').get_balance('addr1')
+            CardanoScanAPI('k2').get_balance('addr1')
+        
+        self.assertEqual(mock_get.call_count, 2)
+        stats = get_endpoint_latency_stats()
+        self.assertEqual(stats['/address/balance']['count'], 2)
+        self.assertEqual(stats['/address/balance']['errors'], 0)
+
+    
+    @patch('services.cardano_sync.execute_values')
+    def test_batch_writer_dedupes_assets_and_batches_rows(self, mock_execute_values):
+        from services.cardano_sync import CardanoBatchWriter
+        
+        api = Mock()
+        api._convert_to_hex.return_value = 'aa'
+        api.get_token_name.return_value = 'MIN'
+        api._resolve_decimals.return_value = 6
+        token = {'policyId': 'p1', 'assetName': '4d494e', 'value': '2000000'}
+        txs = [
+            {'hash': f'h{i}', 'timestamp': 1700000000, 'fees': 0.2, 'blockHeight': i,
+             'inputs': [{'address': 'AA', 'value': '1000', 'tokens': [token]}],
+             'outputs': [{'address': 'bb', 'value': '999'}]}
+            for i in range(3)
+        ]
+        writer = CardanoBatchWriter(1, 'addr1', api)
+        for tx in txs:
+            writer.add_transaction(tx)
+        cur = Mock()
+        counts = writer.flush(cur)
+        
+        # assets, transactions, io rows: one execute_values each; one DELETE
+        self.assertEqual(mock_execute_values.call_count, 3)
+        self.assertEqual(cur.execute.call_count, 1)
+        asset_rows = mock_execute_values.call_args_list[0][0][2]
+        self.assertEqual(asset_rows, [('p1', '4d494e', 'MIN', 6)])
+        self.assertEqual(counts, {'assets': 1, 'transactions': 3, 'io_rows': 6})
+
+    
+    @patch('services.cardano_sync._get_api_client')
+    @patch('services.cardano_sync.sync_wallet_transactions')
+    @patch('services.cardano_sync._get_parallel_sync_settings')
+    @patch('services.cardano_sync.get_active_wallets')
+    def test_parallel_sync_reports_per_wallet_results(self, mock_wallets, mock_settings, mock_sync, mock_client):
+        from services.cardano_sync import sync_all_cardano_wallets_for_user
+        
+        mock_wallets.return_value = [
+            {'wallet_id': i, 'address': f'addr{i}', 'blockchain': 'Cardano'} for i in (1, 2, 3)
+        ]
+        mock_settings.return_value = (3, None)
+        
+        def fake_sync(wid, addr, **kwargs):
+            if wid == 2:
+                raise RuntimeError('HTTP 500')
+            kwargs['stats'].update({'pages_fetched': 2, 'tx_skipped': 5})
+            return 1, 10
+        mock_sync.side_effect = fake_sync
+        
+        res = sync_all_cardano_wallets_for_user()
+        
+        self.assertEqual(res['synced'], 2)
+        self.assertEqual(res['io_rows'], 20)
+        self.assertEqual(res['tx_skipped'], 10)
+        self.assertEqual([e['wallet_id'] for e in res['errors']], [2])
+        self.assertEqual([r['wallet_id'] for r in res['wallet_results']], [1, 2, 3])
+        self.assertTrue(all('seconds' in r for r in res['wallet_results']))
+
+
+class TestCardanoMetadataCache(unittest.TestCase):
+    """Test the two-level (memory + t_cardano_assets) token metadata cache."""
+    
+    def test_lru_keeps_negative_entries_and_evicts_oldest(self):
+        from services.cardano_metadata import TokenMetadataCache
+        
+        cache = TokenMetadataCache(max_entries=2)
+        cache.put(('p1', 'aa'), {'resolved_name': 'AAA'})
+        cache.put(('p2', 'bb'), None)
+        
+        self.assertEqual(cache.lookup(('p1', 'aa')), (True, {'resolved_name': 'AAA'}))
+        self.assertEqual(cache.lookup(('p2', 'bb')), (True, None))
+        cache.put(('p3', 'cc'), {'resolved_decimals': 6})
+        
+        self.assertEqual(cache.lookup(('p1', 'aa')), (False, None))
+        self.assertEqual(cache.stats()['negative'], 1)
+    
+    def test_batch_resolution_uses_db_then_api_and_persists_once(self):
+        from services.cardano_api import CardanoScanAPI
+        from services.cardano_metadata import TokenMetadataCache
+        
+        cache = TokenMetadataCache()
+        cache.put(('p1', 'aa'), {'resolved_name': 'CACHED'})
+        
+        def fake_db(keys):
+            cache.put(('p2', 'bb'), {'resolved_name': 'FROMDB'})
+            return 1
+        
+        with patch.object(cache, 'warm'), \
+             patch.object(cache, 'load_from_db', side_effect=fake_db) as mock_db, \
+             patch.object(cache, 'persist') as mock_persist:
+            api = CardanoScanAPI('key', metadata_cache=cache)
+            with patch.object(api, '_try_fetch', side_effect=lambda path, params: (
+                    {'name': 'NEW', 'decimals': 2} if params['policyId'] == 'p3' else None)) as mock_fetch:
+                fetched = api.prefetch_asset_metadata([('p1', 'aa'), ('p2', 'bb'), ('p3', 'cc'), ('p4', 'dd'), (None, 'x')])
+                # Tudo resolvido: nenhuma chamada extra à API nem à BD
+                self.assertEqual(api.get_asset_metadata('p3', 'cc')['resolved_decimals'], 2)
+                self.assertIsNone(api.get_asset_metadata('p4', 'dd'))
+        
+        self.assertEqual(fetched, 2)
+        self.assertEqual(sorted(mock_db.call_args[0][0]), [('p2', 'bb'), ('p3', 'cc'), ('p4', 'dd')])
+        # p3 via /token/info; p4 tenta /token/info e /token/metadata
+        self.assertEqual(mock_fetch.call_count, 3)
+        mock_persist.assert_called_once()
+        persisted = mock_persist.call_args[0][0]
+        self.assertEqual(set(persisted), {('p3', 'cc'), ('p4', 'dd')})
+        self.assertIsNone(persisted[('p4', 'dd')])
+    
+    def test_failed_fetch_is_not_cached_as_missing(self):
+        from services.cardano_api import CardanoScanAPI, FETCH_FAILED
+        from services.cardano_metadata import TokenMetadataCache
+        
+        cache = TokenMetadataCache()
+        api = CardanoScanAPI('key', metadata_cache=cache)
+        responses = {404: None, 429: FETCH_FAILED, 503: FETCH_FAILED}
+        for status, expected in responses.items():
+            with patch.object(api, '_get', return_value=Mock(status_code=status)):
+                self.assertIs(api._try_fetch_uncoalesced('/token/info', {'policyId': 'p'}), expected)
+        
+        with patch.object(cache, 'warm'), \
+             patch.object(cache, 'load_from_db', return_value=0), \
+             patch.object(cache, 'persist') as mock_persist, \
+             patch.object(api, '_try_fetch', return_value=FETCH_FAILED) as mock_fetch:
+            self.assertEqual(api.prefetch_asset_metadata([('p5', 'ee')]), 1)
+            self.assertIsNone(api.get_asset_metadata('p5', 'ee'))
+        
+        # Nem LRU nem t_cardano_assets: o próximo pedido volta a tentar a API
+        self.assertEqual(cache.lookup(('p5', 'ee')), (False, None))
+        self.assertEqual(mock_fetch.call_count, 4)
+        self.assertFalse(any(('p5', 'ee') in c[0][0] for c in mock_persist.call_args_list))
+
+
+class TestDailyHoldings(unittest.TestCase):
+    """Test the materialised t_daily_holdings readers and rebuild."""
+    
+    def test_account_balance_reads_latest_cumulative(self):
+        from components.transaction_form_v2 import _get_account_asset_balance
+        
+        engine = MagicMock()
+        conn = engine.connect.return_value.__enter__.return_value
+        conn.execute.return_value.first.return_value = (Decimal('12.5'),)
+        
+        self.assertEqual(_get_account_asset_balance(engine, 3, 7), 12.5)
+        sql = str(conn.execute.call_args[0][0])
+        self.assertIn('t_daily_holdings', sql)
+        self.assertNotIn('t_transactions', sql)
+        self.assertEqual(conn.execute.call_args[0][1], {'account_id': 3, 'asset_id': 7})
+        # Sem conta/ativo não há query
+        self.assertEqual(_get_account_asset_balance(engine, None, 7), 0.0)
+        self.assertEqual(conn.execute.call_count, 1)
+    
+    def test_rebuild_runs_in_one_transaction(self):
+        from services.holdings import rebuild_daily_holdings
+        
+        engine = MagicMock()
+        conn = engine.begin.return_value.__enter__.return_value
+        conn.execute.return_value.rowcount = 42
+        
+        stats = rebuild_daily_holdings(engine)
+        
+        engine.begin.assert_called_once()
+        statements = [str(c[0][0]) for c in conn.execute.call_args_list]
+        self.assertIn('LOCK TABLE t_transactions', statements[0])
+        self.assertIn('DELETE FROM t_daily_holdings', statements[1])
+        self.assertIn('SUM(delta) OVER', statements[2])
+        self.assertEqual(stats['rows'], 42)
+
+
+class TestCoinGeckoPriceCache(unittest.TestCase):
+    """Test the per-(coin_id, vs_currency) price cache in get_price_by_symbol."""
+    
+    def setUp(self):
+        import tempfile
+        import services.coingecko as cg
+        from services.rate_limit import SharedRateLimiter
+        cg.clear_price_cache()
+        state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(state_dir.cleanup)
+        limiter = SharedRateLimiter('coingecko-test', lambda: 6000, capacity=10, state_dir=state_dir.name)
+        patchers = [
+            patch('services.coingecko._is_coingecko_enabled', return_value=True),
+            patch('services.coingecko._coingecko_limiter', limiter),
+            patch('services.coingecko._get_coingecko_config', return_value=None),
+        ]
+        for p in patchers:
+            p.start()
+            self.addCleanup(p.stop)
+    
+    @staticmethod
+    def _response(data):
+        resp = MagicMock()
+        resp.json.return_value = data
+        return resp
+    
+    @patch('services.coingecko.requests.get')
+    def test_overlapping_sets_fetch_only_missing_ids(self, mock_get):
+        from services.coingecko import get_price_by_symbol, get_price_cache_stats
+        
+        mock_get.side_effect = [
+            self._response({'bitcoin': {'eur': 50000.0}, 'cardano': {'eur': 0.5}}),
+            self._response({'ethereum': {'eur': 3000.0}}),
+        ]
+        before = get_price_cache_stats()
+        
+        first = get_price_by_symbol(['BTC', 'ADA'])
+        second = get_price_by_symbol(['ADA', 'BTC', 'ETH'])
+        
+        self.assertEqual(first, {'BTC': 50000.0, 'ADA': 0.5})
+        self.assertEqual(second, {'ADA': 0.5, 'BTC': 50000.0, 'ETH': 3000.0})
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertEqual(mock_get.call_args_list[1][1]['params']['ids'], 'ethereum')
+        stats = get_price_cache_stats()
+        self.assertEqual(stats['hits'] - before['hits'], 2)
+        self.assertEqual(stats['api_calls'] - before['api_calls'], 2)
+    
+    @patch('services.coingecko.requests.get')
+    def test_stale_prices_served_per_coin_on_error(self, mock_get):
+        import requests
+        import services.coingecko as cg
+        
+        mock_get.return_value = self._response({'bitcoin': {'eur': 50000.0}})
+        cg.get_price_by_symbol(['BTC'])
+        # Expirar a entrada e fazer a API falhar
+        with cg._price_cache_lock:
+            ts, price = cg._price_cache[('bitcoin', 'eur')]
+            cg._price_cache[('bitcoin', 'eur')] = (ts - cg._price_cache_ttl - 1, price)
+        error_resp = MagicMock(status_code=429)
+        mock_get.return_value.raise_for_status.side_effect = requests.exceptions.HTTPError(response=error_resp)
+        
+        prices = cg.get_price_by_symbol(['BTC', 'ETH'])
+        
+        self.assertEqual(prices, {'BTC': 50000.0, 'ETH': None})
+
+
+class TestCoinListResolver(unittest.TestCase):
+    """Test the indexed, disk-persisted CoinGecko coin-list resolver."""
+    
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = f"{self.tmpdir.name}/coins.json"
+    
+    @patch('services.coingecko._get_coin_list')
+    def test_batch_resolve_persists_index_for_cold_workers(self, mock_list):
+        from services.coin_list import CoinListResolver
+        
+        mock_list.return_value = [
+            {'id': 'minswap', 'symbol': 'min', 'name': 'Minswap'},
+            {'id': 'min-clone', 'symbol': 'MIN', 'name': 'Clone'},
+            {'id': 'snek', 'symbol': 'snek', 'name': 'Snek'},
+        ]
+        resolver = CoinListResolver(path=self.path)
+        resolved = resolver.resolve_many(['MIN', 'snek', 'ADA', 'NOPE'])
+        
+        self.assertEqual(resolved, {'MIN': 'minswap', 'snek': 'snek', 'ADA': 'cardano', 'NOPE': None})
+        self.assertEqual(resolver.candidates('min'), ['minswap', 'min-clone'])
+        self.assertEqual(mock_list.call_count, 1)
+        # Só o ficheiro final fica no diretório (sem temporários)
+        self.assertEqual(os.listdir(self.tmpdir.name), ['coins.json'])
+        
+        # Novo processo: lê o índice do ficheiro, sem rede
+        cold = CoinListResolver(path=self.path)
+        self.assertEqual(cold.resolve('SNEK'), 'snek')
+        self.assertEqual(mock_list.call_count, 1)
+    
+    @patch('services.coingecko._get_coin_list')
+    def test_expired_file_is_refreshed_and_kept_on_failure(self, mock_list):
+        import json
+        from services.coin_list import CoinListResolver
+        
+        with open(self.path, 'w') as f:
+            json.dump({'fetched_at': 0, 'coins': [], 'index': {'SNEK': ['snek']}}, f)
+        mock_list.return_value = []  # download falha
+        
+        resolver = CoinListResolver(path=self.path)
+        self.assertEqual(resolver.resolve('SNEK'), 'snek')
+        self.assertEqual(resolver.resolve('SNEK'), 'snek')
+        # Uma única tentativa de download dentro da janela de retry
+        self.assertEqual(mock_list.call_count, 1)
+
+
+class TestSharedRateLimiter(unittest.TestCase):
+    """Test the cross-process token bucket and circuit breaker."""
+    
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+    
+    def _limiter(self, rate=60, capacity=2, **kwargs):
+        from services.rate_limit import SharedRateLimiter
+        return SharedRateLimiter('test', lambda: rate, capacity=capacity, state_dir=self.tmpdir.name, **kwargs)
+    
+    def test_budget_is_shared_between_instances(self):
+        first, second = self._limiter(), self._limiter()
+        
+        self.assertEqual(first.try_acquire(), 0.0)
+        self.assertEqual(second.try_acquire(), 0.0)
+        # Orçamento comum esgotado: ~1s até ao próximo token a 60/min
+        self.assertAlmostEqual(first.try_acquire(), 1.0, delta=0.05)
+        self.assertLess(second.stats()['tokens'], 1.0)
+    
+    def test_breaker_trips_after_consecutive_429s_and_blocks_acquire(self):
+        limiter = self._limiter(trip_threshold=2, cooldown_seconds=60)
+        other = self._limiter(trip_threshold=2, cooldown_seconds=60)
+        
+        limiter.record_failure(is_429=True)
+        limiter.record_failure(is_429=False)  # erro diferente faz reset
+        limiter.record_failure(is_429=True)
+        self.assertFalse(other.is_open())
+        limiter.record_failure(is_429=True)
+        
+        self.assertTrue(other.is_open())
+        self.assertFalse(other.acquire())
+        stats = other.stats()
+        self.assertTrue(stats['tripped'])
+        self.assertEqual(stats['trips'], 1)
+        self.assertGreater(stats['open_for_seconds'], 0)
+        
+        other.reset()
+        self.assertFalse(limiter.is_open())
+
+    @patch('services.rate_limit.time')
+    def test_breaker_closes_after_cooldown(self, mock_time):
+        mock_time.time.return_value = 1000.0
+        limiter = self._limiter(trip_threshold=1, cooldown_seconds=60)
+        limiter.record_failure(is_429=True)
+        self.assertTrue(limiter.is_open())
+
+        mock_time.time.return_value = 1061.0
+        self.assertFalse(limiter.is_open())
+
+    def test_waiters_are_counted_while_blocked(self):
+        import threading
+        limiter = self._limiter(rate=60, capacity=1)
+        limiter.try_acquire()
+        seen = []
+        stop = threading.Event()
+        t = threading.Thread(target=lambda: seen.append(limiter.acquire(stop)))
+        t.start()
+        for _ in range(50):
+            if limiter.stats()['waiters']:
+                break
+            stop.wait(0.01)
+        self.assertEqual(limiter.stats()['waiters'], 1)
+        stop.set()
+        t.join(2)
+        self.assertEqual(seen, [False])
+        self.assertEqual(limiter.stats()['waiters'], 0)
+
+    @patch('services.coingecko.requests.get')
+    @patch('services.coingecko._is_coingecko_enabled', return_value=True)
+    @patch('services.coingecko.get_coingecko_limiter')
+    def test_coin_list_download_goes_through_the_limiter(self, mock_limiter, mock_enabled, mock_get):
+        import services.coingecko as cg
+        self.addCleanup(setattr, cg, '_coin_list_cache', cg._coin_list_cache)
+        cg._coin_list_cache = None
+        
+        # Circuit breaker aberto: /coins/list não é pedido
+        mock_limiter.return_value.acquire.return_value = False
+        self.assertEqual(cg._get_coin_list(), [])
+        mock_get.assert_not_called()
+        
+        mock_limiter.return_value.acquire.return_value = True
+        mock_get.return_value.json.return_value = [{'id': 'bitcoin', 'symbol': 'btc'}]
+        self.assertEqual(cg._get_coin_list(), [{'id': 'bitcoin', 'symbol': 'btc'}])
+        mock_limiter.return_value.record_success.assert_called_once()
+
+
+class TestSingleFlight(unittest.TestCase):
+    """Test coalescing of identical in-flight calls."""
+    
+    def _run_concurrently(self, flight, fn, n=5):
+        import threading
+        results, errors = [], []
+        
+        def worker():
+            try:
+                results.append(flight.do('key', fn))
+            except Exception as e:
+                errors.append(e)
+        
+        threads = [threading.Thread(target=worker) for _ in range(n)]
+        for t in threads:
+            t.start()
+        return threads, results, errors
+    
+    def _wait_for_followers(self, flight, n):
+        import time
+        deadline = time.time() + 2
+        while flight.stats()['saved'] < n and time.time() < deadline:
+            time.sleep(0.005)
+    
+    def test_concurrent_identical_calls_share_one_execution(self):
+        import threading
+        from services.single_flight import SingleFlight
+        
+        flight = SingleFlight('test')
+        release = threading.Event()
+        calls = []
+        
+        def fetch():
+            calls.append(1)
+            release.wait(2)
+            return {'bitcoin': {'eur': 1.0}}
+        
+        threads, results, errors = self._run_concurrently(flight, fetch)
+        self._wait_for_followers(flight, 4)
+        release.set()
+        for t in threads:
+            t.join(2)
+        
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'bitcoin': {'eur': 1.0}}] * 5)
+        self.assertEqual(errors, [])
+        self.assertEqual(flight.stats(), {'executed': 1, 'saved': 4, 'in_flight': 0})
+    
+    def test_error_is_shared_with_waiting_callers(self):
+        import threading
+        from services.single_flight import SingleFlight
+        
+        flight = SingleFlight('test')
+        release = threading.Event()
+        
+        def fetch():
+            release.wait(2)
+            raise RuntimeError('HTTP 500')
+        
+        threads, results, errors = self._run_concurrently(flight, fetch, n=3)
+        self._wait_for_followers(flight, 2)
+        release.set()
+        for t in threads:
+            t.join(2)
+        
+        self.assertEqual(results, [])
+        self.assertEqual([str(e) for e in errors], ['HTTP 500'] * 3)
+        # Depois de concluída, a chave volta a executar
+        self.assertEqual(flight.do('key', lambda: 42), 42)
+        self.assertEqual(flight.stats()['executed'], 2)
+
+
+class TestPriceRefresher(unittest.TestCase):
+    """Test the stale-while-revalidate EUR price refresher."""
+    
+    def setUp(self):
+        import time
+        import services.coingecko as cg
+        from services.price_refresher import PriceRefresher
+        cg.clear_price_cache()
+        self.addCleanup(cg.clear_price_cache)
+        self.cg = cg
+        self.refresher = PriceRefresher(stale_after=300, max_ids_per_call=2)
+        self.refresher._asset_ids = {'BTC': 'bitcoin', 'ADA': 'cardano', 'ETH': 'ethereum'}
+        self.refresher._assets_loaded_at = time.time()
+        patchers = [
+            patch('services.coingecko._is_coingecko_enabled', return_value=True),
+            patch.object(self.refresher, 'start'),
+        ]
+        for p in patchers:
+            p.start()
+            self.addCleanup(p.stop)
+    
+    def _seed(self, coin_id, price, age):
+        import time
+        with self.cg._price_cache_lock:
+            self.cg._price_cache[(coin_id, 'eur')] = (time.time() - age, price)
+    
+    @patch('services.coingecko._fetch_simple_prices')
+    def test_stale_price_served_immediately_and_refresh_requested(self, mock_fetch):
+        self._seed('bitcoin', 50000.0, age=900)
+        self._seed('cardano', 0.5, age=10)
+        
+        prices = self.refresher.get_prices_with_age(['BTC', 'ADA'])
+        
+        mock_fetch.assert_not_called()
+        self.assertEqual(prices['BTC'][0], 50000.0)
+        self.assertGreaterEqual(prices['BTC'][1], 900)
+        self.assertEqual(prices['ADA'][0], 0.5)
+        self.assertTrue(self.refresher._wake.is_set())
+    
+    @patch('services.coingecko._fetch_simple_prices')
+    def test_cold_symbols_fetched_synchronously(self, mock_fetch):
+        def fetch(ids, vs):
+            for coin_id in ids:
+                self._seed(coin_id, 3000.0, age=0)
+            return {coin_id: 3000.0 for coin_id in ids}
+        mock_fetch.side_effect = fetch
+        
+        prices = self.refresher.get_prices_with_age(['ETH'])
+        
+        mock_fetch.assert_called_once_with(['ethereum'], 'eur')
+        self.assertEqual(prices['ETH'][0], 3000.0)
+        self.assertLess(prices['ETH'][1], 5)
+    
+    @patch('services.coingecko._fetch_simple_prices')
+    def test_max_age_fetches_old_prices_synchronously(self, mock_fetch):
+        def fetch(ids, vs):
+            for coin_id in ids:
+                self._seed(coin_id, 51000.0, age=0)
+            return {coin_id: 51000.0 for coin_id in ids}
+        mock_fetch.side_effect = fetch
+        self._seed('bitcoin', 50000.0, age=900)
+        self._seed('cardano', 0.5, age=10)
+        
+        prices = self.refresher.get_prices_with_age(['BTC', 'ADA'], max_age=60)
+        
+        mock_fetch.assert_called_once_with(['bitcoin'], 'eur')
+        self.assertEqual(prices['BTC'][0], 51000.0)
+        self.assertLess(prices['BTC'][1], 5)
+        self.assertEqual(prices['ADA'][0], 0.5)
+    
+    @patch('services.coingecko._fetch_simple_prices')
+    def test_refresh_batches_only_stale_ids(self, mock_fetch):
+        mock_fetch.return_value = {}
+        self.refresher._requested.add('solana')
+        self._seed('bitcoin', 50000.0, age=900)
+        self._seed('cardano', 0.5, age=10)
+        
+        refreshed = self.refresher.refresh_once()
+        
+        self.assertEqual(refreshed, 3)
+        batches = [c[0][0] for c in mock_fetch.call_args_list]
+        self.assertEqual(batches, [['bitcoin', 'ethereum'], ['solana']])
+        self.assertEqual(self.refresher.stats()['api_calls'], 2)
+
+
+class TestCoinGeckoStandin(unittest.TestCase):
+    """Test the local CoinGecko stand-in server against the real client code."""
+    
+    def setUp(self):
+        import os
+        import tempfile
+        import services.coingecko as cg
+        from scripts.coingecko_standin import CsvPriceStore
+        from services.rate_limit import SharedRateLimiter
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+        with open(os.path.join(tmp.name, 'ada-usd-max.csv'), 'w') as f:
+            f.write("snapped_at,price,market_cap,total_volume\n"
+                    "2024-01-01 00:00:00 UTC,0.50,100,10\n"
+                    "2024-01-02 00:00:00 UTC,0.60,110,11\n"
+                    "2024-01-03 00:00:00 UTC,0.70,120,12\n")
+        self.store = CsvPriceStore(os.path.join(tmp.name, '*-usd-max.csv'), eur_per_usd=0.5)
+        cg.clear_price_cache()
+        self.addCleanup(cg.clear_price_cache)
+        limiter = SharedRateLimiter('coingecko-standin-test', lambda: 6000, capacity=10, state_dir=tmp.name)
+        patchers = [
+            patch('services.coingecko._is_coingecko_enabled', return_value=True),
+            patch('services.coingecko._coingecko_limiter', limiter),
+        ]
+        for p in patchers:
+            p.start()
+            self.addCleanup(p.stop)
+    
+    def _serve(self, **config):
+        from scripts.coingecko_standin import StandinConfig, start_standin_server
+        server, base_url = start_standin_server(
+            store=self.store, config=StandinConfig(fixtures_dir=self.tmp, **config)
+        )
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        patcher = patch('services.coingecko._get_coingecko_config', return_value={'base_url': base_url})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return server
+    
+    def test_client_reads_prices_and_ranges_from_csv(self):
+        from datetime import date
+        from services.coingecko import get_historical_price_by_id, get_market_chart_range, get_price_by_symbol
+        self._serve()
+        
+        self.assertEqual(get_price_by_symbol(['ADA']), {'ADA': 0.35})
+        self.assertAlmostEqual(get_historical_price_by_id('cardano', date(2024, 1, 2)), 0.30)
+        prices = get_market_chart_range('cardano', date(2024, 1, 1), date(2024, 1, 2))
+        self.assertEqual([p for _, p in prices], [0.25, 0.30])
+    
+    def test_injected_429_reaches_circuit_breaker(self):
+        import services.coingecko as cg
+        server = self._serve(fail_every=1)
+        
+        self.assertEqual(cg.get_price_by_symbol(['ADA']), {'ADA': None})
+        self.assertEqual(server.standin.stats['429'], 1)
+        self.assertEqual(cg._coingecko_limiter.stats()['consecutive_429'], 1)
+    
+    def test_recorded_fixture_replayed_before_csv(self):
+        import json
+        import os
+        from scripts.coingecko_standin import CoinGeckoStandin, StandinConfig, fixture_key
+        params = {'ids': 'cardano', 'vs_currencies': 'eur'}
+        with open(os.path.join(self.tmp, fixture_key('/simple/price', params) + '.json'), 'w') as f:
+            json.dump({'status': 200, 'body': {'cardano': {'eur': 9.99}}}, f)
+        standin = CoinGeckoStandin(self.store, StandinConfig(fixtures_dir=self.tmp))
+        
+        status, body = standin.handle('/api/v3/simple/price', dict(params, x_cg_demo_api_key='CG-x'))
+        
+        self.assertEqual((status, body), (200, {'cardano': {'eur': 9.99}}))
+        self.assertEqual(standin.stats['fixtures'], 1)
+
+
+class TestMarketChartFallbackPersistence(unittest.TestCase):
+    """Test that the market_chart history fallback keeps the whole series."""
+    
+    @staticmethod
+    def _ms(d, hour=0):
+        from datetime import datetime, timezone
+        return int(datetime(d.year, d.month, d.day, hour, tzinfo=timezone.utc).timestamp() * 1000)
+    
+    @patch('psycopg2.extras.execute_values')
+    @patch('database.connection.get_db_cursor')
+    @patch('services.coingecko.CoinGeckoService.get_market_chart')
+    def test_all_complete_days_written_in_one_bulk_upsert(self, mock_chart, mock_cursor, mock_values):
+        from datetime import date, timedelta
+        from services.coingecko import _get_price_from_market_chart_by_date
+        from services.price_cache import PriceSeriesCache
+        
+        today = date.today()
+        d0, d1, d2 = today - timedelta(days=3), today - timedelta(days=2), today - timedelta(days=1)
+        mock_chart.return_value = {'prices': [
+            [self._ms(d0, 18), 8.0],
+            [self._ms(d1, 0), 1.0], [self._ms(d1, 12), 3.0],
+            [self._ms(d2, 0), 4.0],
+            [self._ms(today, 0), 9.0],
+        ]}
+        cur = MagicMock()
+        cur.fetchall.return_value = [(7,)]
+        mock_cursor.return_value.__enter__.return_value = cur
+        mock_values.side_effect = lambda cur, sql, rows, **kw: list(rows)
+        cache = PriceSeriesCache()
+        
+        with patch('services.price_cache.get_price_cache', return_value=cache):
+            price = _get_price_from_market_chart_by_date('cardano', d1, 'eur')
+        
+        self.assertEqual(price, 2.0)
+        mock_values.assert_called_once()
+        self.assertEqual(mock_values.call_args[0][2], [(7, d1, 2.0), (7, d2, 4.0)])
+        self.assertIn("'coingecko_chart'", mock_values.call_args[1]['template'])
+        self.assertEqual(cache.get(7, d2), 4.0)
+        self.assertIsNone(cache.get(7, today))
+    
+    @patch('psycopg2.extras.execute_values')
+    @patch('database.connection.get_db_cursor')
+    def test_partial_first_day_not_persisted(self, mock_cursor, mock_values):
+        from datetime import date, timedelta
+        from services.coingecko import _persist_market_chart_series
+        
+        today = date.today()
+        d0, d1 = today - timedelta(days=2), today - timedelta(days=1)
+        cur = MagicMock()
+        cur.fetchall.return_value = [(7,)]
+        mock_cursor.return_value.__enter__.return_value = cur
+        mock_values.side_effect = lambda cur, sql, rows, **kw: list(rows)
+        
+        with patch('services.price_cache.get_price_cache'):
+            written = _persist_market_chart_series('cardano', {d0: 8.0, d1: 4.0, today: 9.0})
+        
+        self.assertEqual(written, 1)
+        self.assertEqual(mock_values.call_args[0][2], [(7, d1, 4.0)])
+        # Só o dia parcial de arranque e o de hoje: nada a gravar
+        mock_values.reset_mock()
+        self.assertEqual(_persist_market_chart_series('cardano', {d1: 4.0, today: 9.0}), 0)
+        mock_values.assert_not_called()
+    
+    @patch('database.connection.get_db_cursor')
+    @patch('services.coingecko.CoinGeckoService.get_market_chart')
+    def test_non_eur_series_not_persisted(self, mock_chart, mock_cursor):
+        from datetime import date, timedelta
+        from services.coingecko import _get_price_from_market_chart_by_date
+        
+        d1 = date.today() - timedelta(days=1)
+        mock_chart.return_value = {'prices': [[self._ms(d1, 6), 5.0]]}
+        
+        self.assertEqual(_get_price_from_market_chart_by_date('cardano', d1, 'usd'), 5.0)
+        mock_cursor.assert_not_called()
+
+
+try:
+    import bs4  # noqa: F401  (dependência de services.coingecko_scraper)
+    HAS_BS4 = True
+except ImportError:
+    HAS_BS4 = False
+
+
+@unittest.skipUnless(HAS_BS4, "beautifulsoup4 não instalado")
+class TestCoinGeckoCsvImport(unittest.TestCase):
+    """Test the vectorised CSV parser and COPY-based loader."""
+    
+    def _csv(self, body):
+        import os
+        import tempfile
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, 'ada-usd-max.csv')
+        with open(path, 'w') as f:
+            f.write("snapped_at,price,market_cap,total_volume\n" + body)
+        return path
+    
+    def test_load_parses_dates_and_converts_vectorised(self):
+        from datetime import date
+        from services.coingecko_scraper import load_coingecko_csv
+        path = self._csv(
+            "2024-01-02 00:00:00 UTC,2.0,1,1\n"
+            "2024-01-01 00:00:00 UTC,1.0,1,1\n"
+            "garbage,1.0,1,1\n"
+            "2024-01-03 00:00:00 UTC,0,1,1\n"
+            "2024-01-02 00:00:00 UTC,4.0,1,1\n"
+        )
+        
+        df = load_coingecko_csv(path)
+        
+        self.assertEqual(df['snapshot_date'].tolist(), [date(2024, 1, 1), date(2024, 1, 2)])
+        np.testing.assert_allclose(df['price_eur'].to_numpy(), [0.92, 3.68])
+    
+    @patch('services.coingecko_scraper.usd_to_eur_rates')
+    def test_dynamic_rate_converts_whole_column_at_once(self, mock_rates):
+        from services.coingecko_scraper import load_coingecko_csv
+        mock_rates.side_effect = lambda dates: np.full(len(dates), 0.5)
+        path = self._csv("".join(f"2024-01-{d:02d} 00:00:00 UTC,2.0,1,1\n" for d in range(1, 11)))
+        
+        df = load_coingecko_csv(path, limit_days=4, use_fixed_rate=False)
+        
+        self.assertEqual(len(df), 4)
+        mock_rates.assert_called_once()
+        self.assertTrue((df['price_eur'] == 1.0).all())
+    
+    @patch('services.coingecko_scraper.return_connection')
+    @patch('services.coingecko_scraper.get_connection')
+    def test_copy_into_staging_then_single_merge(self, mock_conn, _mock_return):
+        from datetime import date
+        from services.coingecko_scraper import copy_prices_into_snapshots
+        conn = mock_conn.return_value
+        cur = conn.cursor.return_value.__enter__.return_value
+        cur.rowcount = 2
+        prices = pd.DataFrame({'snapshot_date': [date(2024, 1, 1), date(2024, 1, 2)], 'price_eur': [1.5, 2.5]})
+        
+        written = copy_prices_into_snapshots(7, prices)
+        
+        self.assertEqual(written, 2)
+        copy_sql, buf = cur.copy_expert.call_args[0]
+        self.assertIn('COPY tmp_price_import', copy_sql)
+        self.assertEqual(buf.getvalue().splitlines(), ['2024-01-01,1.5', '2024-01-02,2.5'])
+        # Staging sem escala: só t_price_snapshots arredonda o preço
+        staging_sql = cur.execute.call_args_list[0][0][0]
+        self.assertIn('CREATE TEMP TABLE tmp_price_import', staging_sql)
+        self.assertNotIn('NUMERIC(', staging_sql)
+        merges = [c for c in cur.execute.call_args_list if 'INSERT INTO t_price_snapshots' in c[0][0]]
+        self.assertEqual(len(merges), 1)
+        self.assertIn('DO NOTHING', merges[0][0][0])
+        conn.commit.assert_called_once()
+
+
+class TestFxRates(unittest.TestCase):
+    """Test ECB file parsing and vectorised as-of USD->EUR lookups."""
+    
+    def _file(self, body):
+        import os
+        import tempfile
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, 'rates.csv')
+        with open(path, 'w') as f:
+            f.write(body)
+        return path
+    
+    def test_parse_eurofxref_hist(self):
+        from datetime import date
+        from services.fx_rates import parse_ecb_file
+        path = self._file("Date,USD,JPY,\n2024-01-03,1.0919,155.0,\n2024-01-02,1.0956,N/A,\n2024-01-01,N/A,1,\n")
+        
+        df = parse_ecb_file(path)
+        
+        self.assertEqual(df['rate_date'].tolist(), [date(2024, 1, 2), date(2024, 1, 3)])
+        np.testing.assert_allclose(df['rate'].to_numpy(), [1 / 1.0956, 1 / 1.0919])
+    
+    def test_parse_sdmx_csv(self):
+        from services.fx_rates import parse_ecb_file
+        path = self._file("KEY,FREQ,CURRENCY,TIME_PERIOD,OBS_VALUE\nEXR.D.USD.EUR.SP00.A,D,USD,2024-01-02,1.25\n")
+        
+        df = parse_ecb_file(path)
+        
+        self.assertEqual(df['rate'].tolist(), [0.8])
+    
+    def test_as_of_lookup_uses_previous_fixing(self):
+        from datetime import date
+        from services.fx_rates import FxRateStore
+        store = FxRateStore()
+        store.set_series([date(2024, 1, 5), date(2024, 1, 8)], [0.9, 0.8])
+        
+        rates = store.usd_to_eur_rates([date(2024, 1, 1), date(2024, 1, 6), date(2024, 1, 7), date(2024, 1, 8)])
+        
+        np.testing.assert_allclose(rates, [0.9, 0.9, 0.9, 0.8])
+    
+    @patch('pandas.read_sql')
+    def test_empty_table_falls_back_to_fixed_rate(self, mock_read_sql):
+        from datetime import date
+        from services.fx_rates import DEFAULT_USD_EUR_RATE, FxRateStore
+        mock_read_sql.return_value = pd.DataFrame(columns=['rate_date', 'rate'])
+        store = FxRateStore()
+        
+        with patch('database.connection.get_engine'):
+            rates = store.usd_to_eur_rates([date(2024, 1, 1), date(2024, 1, 2)])
+            store.usd_to_eur_rates([date(2024, 1, 3)])
+        
+        np.testing.assert_allclose(rates, [DEFAULT_USD_EUR_RATE] * 2)
+        mock_read_sql.assert_called_once()
+    
+    @patch('pandas.read_sql')
+    def test_failed_read_is_retried_on_next_call(self, mock_read_sql):
+        from datetime import date
+        from services.fx_rates import DEFAULT_USD_EUR_RATE, FxRateStore
+        mock_read_sql.side_effect = [
+            Exception('connection refused'),
+            pd.DataFrame({'rate_date': [date(2024, 1, 1)], 'rate': [0.8]}),
+        ]
+        store = FxRateStore()
+        
+        with patch('database.connection.get_engine'):
+            first = store.usd_to_eur_rates([date(2024, 1, 2)])
+            second = store.usd_to_eur_rates([date(2024, 1, 2)])
+        
+        np.testing.assert_allclose(first, [DEFAULT_USD_EUR_RATE])
+        np.testing.assert_allclose(second, [0.8])
+        self.assertEqual(mock_read_sql.call_count, 2)
+
+
+class TestSnapshotCoverage(unittest.TestCase):
+    """Testes do planeamento de gaps em SQL e da tabela de cobertura de snapshots"""
+    
+    @patch('services.snapshot_backfill.get_engine')
+    @patch('pandas.read_sql')
+    def test_missing_snapshots_come_from_one_anti_join(self, mock_read_sql, mock_engine):
+        from datetime import date
+        from services.snapshot_backfill import plan_missing_snapshots
+        mock_read_sql.return_value = pd.DataFrame({
+            'asset_id': [1, 1, 2],
+            'snapshot_date': [date(2024, 1, 1), date(2024, 1, 3), date(2024, 1, 2)],
+        })
+        
+        plan = plan_missing_snapshots([1, 2, 3], date(2024, 1, 1), date(2024, 1, 3))
+        
+        self.assertEqual(plan, {1: [date(2024, 1, 1), date(2024, 1, 3)], 2: [date(2024, 1, 2)]})
+        mock_read_sql.assert_called_once()
+        sql = mock_read_sql.call_args[0][0]
+        self.assertIn('generate_series', sql)
+        self.assertIn('NOT EXISTS', sql)
+        self.assertEqual(mock_read_sql.call_args[1]['params'], ([1, 2, 3], date(2024, 1, 1), date(2024, 1, 3)))
+    
+    @patch('services.snapshot_backfill.get_engine')
+    @patch('pandas.read_sql')
+    def test_missing_ranges_are_grouped_in_sql(self, mock_read_sql, mock_engine):
+        from datetime import date
+        from services.snapshot_backfill import plan_missing_ranges
+        mock_read_sql.return_value = pd.DataFrame({
+            'asset_id': [1, 1],
+            'gap_start': [date(2024, 1, 1), date(2024, 1, 5)],
+            'gap_end': [date(2024, 1, 2), date(2024, 1, 5)],
+        })
+        
+        ranges = plan_missing_ranges([1], date(2024, 1, 1), date(2024, 1, 5))
+        
+        self.assertEqual(ranges, {1: [(date(2024, 1, 1), date(2024, 1, 2)), (date(2024, 1, 5), date(2024, 1, 5))]})
+        self.assertIn('ROW_NUMBER()', mock_read_sql.call_args[0][0])
+        self.assertEqual(plan_missing_ranges([], date(2024, 1, 1), date(2024, 1, 5)), {})
+        mock_read_sql.assert_called_once()
+    
+    @patch('services.snapshots.get_engine')
+    @patch('pandas.read_sql')
+    def test_coverage_reads_summary_table(self, mock_read_sql, mock_engine):
+        from services.snapshots import get_snapshot_coverage
+        mock_read_sql.return_value = pd.DataFrame(columns=['asset_id', 'symbol', 'first_date', 'last_date', 'row_count', 'gap_days'])
+        
+        get_snapshot_coverage()
+        
+        sql = mock_read_sql.call_args[0][0]
+        self.assertIn('t_price_snapshot_coverage', sql)
+        self.assertNotIn('t_price_snapshots ', sql)
+
+
+class TestNavSnapshot(unittest.TestCase):
+    """Testes do NAV memoizado em services.shares"""
+    
+    def setUp(self):
+        import sys
+        sys.modules.setdefault('streamlit', Mock())
+        from services import shares
+        shares.invalidate_nav_snapshot()
+        self.addCleanup(shares.invalidate_nav_snapshot)
+    
+    def _fake_query(self, query, params=None):
+        if 'cash_balance' in query:
+            return [{'cash_balance': Decimal('100'), 'total_shares': Decimal('50')}]
+        if 'total_quantity' in query:
+            return [{'symbol': 'BTC', 'total_quantity': Decimal('2')}]
+        if 'u.username' in query:
+            return [{'user_id': 1, 'username': 'ana', 'total_shares': Decimal('50')}]
+        return []
+    
+    @patch('services.shares.get_latest_prices', return_value={'BTC': 50.0})
+    def test_nav_is_evaluated_once_for_all_readers(self, mock_prices):
+        from services import shares
+        with patch('services.shares._execute_query', side_effect=self._fake_query) as mock_query:
+            ownership = shares.get_all_users_ownership()
+            nav_per_share = shares.calculate_nav_per_share()
+            total_shares = shares.get_total_shares_in_circulation()
+            fund_nav = shares.calculate_fund_nav()
+        
+        self.assertEqual(fund_nav, 200.0)
+        self.assertEqual(total_shares, 50.0)
+        self.assertEqual(nav_per_share, 4.0)
+        self.assertEqual(ownership[0]['value_eur'], 200.0)
+        mock_prices.assert_called_once_with(['BTC'])
+        # ownership + caixa/shares + holdings
+        self.assertEqual(mock_query.call_count, 3)
+    
+    @patch('services.shares.get_latest_prices', return_value={'BTC': 50.0})
+    def test_invalidate_forces_new_evaluation(self, mock_prices):
+        from services import shares
+        with patch('services.shares._execute_query', side_effect=self._fake_query):
+            shares.calculate_fund_nav()
+            shares.invalidate_nav_snapshot()
+            shares.calculate_fund_nav()
+        
+        self.assertEqual(mock_prices.call_count, 2)
+
+
+class TestFundNavDaily(unittest.TestCase):
+    """Testes do histórico diário de NAV (services.fund_nav)"""
+    
+    def _fake_read_sql(self, query, engine, params=None):
+        from datetime import date
+        if 'cash_delta' in query:
+            return pd.DataFrame({'day': [date(2024, 1, 1), date(2024, 1, 2)], 'cash_delta': [Decimal('100'), Decimal('-50')]})
+        if 'qty_delta' in query:
+            return pd.DataFrame({'day': [date(2024, 1, 2)], 'symbol': ['BTC'], 'qty_delta': [Decimal('1')]})
+        if 'shares_delta' in query:
+            return pd.DataFrame({'day': [date(2024, 1, 1)], 'shares_delta': [Decimal('100')]})
+        raise AssertionError(query)
+    
+    @patch('services.snapshots.get_historical_price_matrix')
+    @patch('services.fund_nav.get_engine')
+    def test_series_accumulates_deltas_and_values_with_snapshots(self, mock_engine, mock_matrix):
+        from datetime import date
+        from services.fund_nav import compute_fund_nav_series
+        days = pd.DatetimeIndex(pd.to_datetime(['2024-01-02', '2024-01-03']), name='date')
+        mock_matrix.return_value = pd.DataFrame({'BTC': [40.0, np.nan]}, index=days)
+        
+        with patch('pandas.read_sql', side_effect=self._fake_read_sql) as mock_read_sql:
+            series = compute_fund_nav_series(date(2024, 1, 2), date(2024, 1, 3))
+        
+        self.assertEqual(mock_read_sql.call_count, 3)
+        self.assertEqual(list(series['nav_date']), [date(2024, 1, 2), date(2024, 1, 3)])
+        np.testing.assert_allclose(series['cash_balance'], [50.0, 50.0])
+        np.testing.assert_allclose(series['fund_nav'], [90.0, 50.0])
+        np.testing.assert_allclose(series['nav_per_share'], [0.9, 0.5])
+        self.assertEqual(list(series['missing_prices']), [0, 1])
+        self.assertEqual(mock_matrix.call_args[1], {'allow_api_fallback': False, 'asof': True})
+    
+    @patch('services.fund_nav.compute_fund_nav_series')
+    @patch('services.fund_nav.get_db_cursor')
+    def test_update_only_computes_days_after_last_stored(self, mock_cursor, mock_compute):
+        from datetime import date
+        from services.fund_nav import update_fund_nav_daily
+        cur = MagicMock()
+        cur.fetchone.return_value = (date(2024, 1, 9), date(2023, 6, 1))
+        mock_cursor.return_value.__enter__.return_value = cur
+        mock_compute.return_value = pd.DataFrame(columns=['nav_date'])
+        
+        update_fund_nav_daily(end_date=date(2024, 1, 12))
+        
+        mock_compute.assert_called_once_with(date(2024, 1, 10), date(2024, 1, 12))
+    
+    @patch('services.fund_nav.compute_fund_nav_series')
+    @patch('services.fund_nav.get_db_cursor')
+    def test_update_is_noop_when_up_to_date(self, mock_cursor, mock_compute):
+        from datetime import date
+        from services.fund_nav import update_fund_nav_daily
+        cur = MagicMock()
+        cur.fetchone.return_value = (date(2024, 1, 12), date(2023, 6, 1))
+        mock_cursor.return_value.__enter__.return_value = cur
+        
+        stats = update_fund_nav_daily(end_date=date(2024, 1, 12))
+        
+        self.assertEqual(stats['rows'], 0)
+        mock_compute.assert_not_called()
+
+
+class TestPostCapitalMovements(unittest.TestCase):
+    """Testes do lançamento transacional de movimentos de capital e shares"""
+    
+    def setUp(self):
+        import sys
+        sys.modules.setdefault('streamlit', Mock())
+    
+    def _cursor(self, holdings=None, snapshots=()):
+        cur = MagicMock()
+        state = {}
+        
+        def execute(query, params=None):
+            state['query'] = query
+            if 'cash_balance' in query:
+                cur.description = [('cash_balance',), ('total_shares',)]
+                state['rows'] = [(Decimal('100'), Decimal('100'))]
+            elif 'total_quantity' in query:
+                cur.description = [('symbol',), ('total_quantity',)]
+                state['rows'] = holdings or [('BTC', Decimal('1'))]
+            elif 't_price_snapshots' in query:
+                cur.description = [('symbol',), ('price_eur',)]
+                state['rows'] = list(snapshots)
+            elif 'is_admin' in query:
+                cur.description = [('user_id',), ('is_admin',), ('user_shares',)]
+                state['rows'] = [(1, False, Decimal('60')), (2, False, Decimal('40'))]
+            else:
+                cur.description = None
+                state['rows'] = []
+        
+        cur.execute.side_effect = execute
+        cur.fetchall.side_effect = lambda: state['rows']
+        return cur
+    
+    def _run(self, movements, prices=None, coin_ids=None, **cursor_kwargs):
+        from services import shares
+        conn = MagicMock()
+        cur = self._cursor(**cursor_kwargs)
+        conn.cursor.return_value.__enter__.return_value = cur
+        refresher = Mock()
+        refresher.resolve_ids.side_effect = lambda symbols: {s: (coin_ids or {}).get(s) for s in symbols}
+        with patch('services.shares.get_connection', return_value=conn), \
+             patch('services.shares.return_connection'), \
+             patch('services.shares.get_latest_prices_with_age',
+                   return_value=prices or {'BTC': (100.0, 5.0)}) as mock_prices, \
+             patch('services.shares.get_price_refresher', return_value=refresher), \
+             patch('psycopg2.extras.execute_values') as mock_values:
+            results = shares.post_capital_movements(movements)
+        return results, conn, cur, mock_prices, mock_values
+    
+    def test_batch_uses_one_lock_one_nav_and_bulk_inserts(self):
+        from datetime import date
+        results, conn, cur, mock_prices, mock_values = self._run([
+            {'user_id': 1, 'movement_type': 'deposit', 'amount': 200, 'movement_date': date(2024, 1, 31)},
+            {'user_id': 2, 'movement_type': 'withdrawal', 'amount': 40, 'movement_date': date(2024, 1, 31)},
+        ])
+        
+        self.assertIn('pg_advisory_xact_lock', cur.execute.call_args_list[0][0][0])
+        mock_prices.assert_called_once_with(['BTC'], max_age=60)
+        # NAV 200 / 100 shares = 2.0; depósito de 200 → 100 shares, NAV 400 / 200 shares = 2.0
+        self.assertAlmostEqual(results[0]['nav_per_share'], 2.0)
+        self.assertAlmostEqual(results[0]['shares_amount'], 100.0)
+        self.assertAlmostEqual(results[1]['shares_amount'], -20.0)
+        self.assertAlmostEqual(results[1]['total_shares_after'], 20.0)
+        self.assertAlmostEqual(results[1]['fund_nav'], 360.0)
+        self.assertEqual(mock_values.call_count, 2)
+        self.assertEqual(len(mock_values.call_args_list[1][0][2]), 2)
+        conn.commit.assert_called_once()
+    
+    def test_insufficient_shares_rolls_back_whole_batch(self):
+        from datetime import date
+        with self.assertRaises(ValueError):
+            self._run([
+                {'user_id': 1, 'movement_type': 'deposit', 'amount': 10, 'movement_date': date(2024, 1, 31)},
+                {'user_id': 2, 'movement_type': 'withdrawal', 'amount': 500, 'movement_date': date(2024, 1, 31)},
+            ])
+    
+    def test_stale_prices_refuse_the_post(self):
+        from datetime import date
+        with self.assertRaisesRegex(ValueError, 'BTC'):
+            self._run(
+                [{'user_id': 1, 'movement_type': 'deposit', 'amount': 10, 'movement_date': date(2024, 1, 31)}],
+                prices={'BTC': (100.0, 900.0)},
+            )
+    
+    def test_unpriceable_holding_uses_last_snapshot(self):
+        from datetime import date
+        # DEAD foi deslistado: a API responde sem preço; vale o último snapshot (50)
+        results, *_ = self._run(
+            [{'user_id': 1, 'movement_type': 'deposit', 'amount': 250, 'movement_date': date(2024, 1, 31)}],
+            prices={'BTC': (100.0, 5.0), 'DEAD': (None, 5.0)},
+            holdings=[('BTC', Decimal('1')), ('DEAD', Decimal('2'))],
+            snapshots=[('DEAD', Decimal('50'))],
+        )
+        # NAV = 100 caixa + 100 BTC + 2 × 50 DEAD = 300 → 3.0 por share
+        self.assertAlmostEqual(results[0]['nav_per_share'], 3.0)
+    
+    def test_failed_fetch_for_known_asset_refuses_the_post(self):
+        from datetime import date
+        from services.shares import StalePricesError
+        with self.assertRaises(StalePricesError) as ctx:
+            self._run(
+                [{'user_id': 1, 'movement_type': 'deposit', 'amount': 10, 'movement_date': date(2024, 1, 31)}],
+                prices={'BTC': (None, None)},
+                coin_ids={'BTC': 'bitcoin'},
+            )
+        self.assertEqual(ctx.exception.symbols, ['BTC'])
+
+
+class TestShareReplay(unittest.TestCase):
+    """Testes da reconstrução vetorizada de t_user_shares"""
+    
+    def setUp(self):
+        import sys
+        sys.modules.setdefault('streamlit', Mock())
+    
+    def _movements(self):
+        from datetime import date
+        return pd.DataFrame({
+            'movement_id': [1, 2, 3, 4],
+            'user_id': [1, 2, 1, 1],
+            'is_admin': [False] * 4,
+            'movement_date': [date(2024, 1, 1), date(2024, 1, 5), date(2024, 1, 9), date(2024, 3, 1)],
+            'credit': [100, 100, 0, 50],
+            'debit': [0, 0, 50, 0],
+            'description': ['a', None, 'c', 'e'],
+        })
+    
+    def test_vectorised_ledger_matches_sequential_allocation(self):
+        from services.share_replay import compute_share_ledger
+        movements = self._movements()
+        ledger_value = np.array([0.0, 100.0, 100.0, 50.0])
+        
+        ledger = compute_share_ledger(movements, ledger_value)
+        
+        # Referência: alocação movimento a movimento
+        total_shares, moved_cash, expected = 0.0, 0.0, []
+        for i, row in movements.iterrows():
+            amount = row['credit'] - row['debit']
+            nav = ledger_value[i] + moved_cash
+            nav_per_share = 1.0 if total_shares == 0 else nav / total_shares
+            expected.append(amount / nav_per_share)
+            total_shares += expected[-1]
+            moved_cash += amount
+        np.testing.assert_allclose(ledger['shares_amount'], expected)
+        np.testing.assert_allclose(ledger['total_shares_after'], [100.0, 50.0, 75.0, 106.25])
+        self.assertEqual(list(ledger['movement_type']), ['deposit', 'deposit', 'withdrawal', 'deposit'])
+    
+    def test_fund_restarts_at_one_after_being_emptied(self):
+        from datetime import date
+        from services.share_replay import compute_share_ledger
+        movements = pd.DataFrame({
+            'movement_id': [1, 2, 3],
+            'user_id': [1, 1, 2],
+            'is_admin': [False] * 3,
+            'movement_date': [date(2024, 1, 1), date(2024, 2, 1), date(2024, 3, 1)],
+            'credit': [100, 0, 30],
+            'debit': [0, 120, 0],
+            'description': [None] * 3,
+        })
+        
+        ledger = compute_share_ledger(movements, np.array([0.0, 20.0, 0.0]))
+        
+        np.testing.assert_allclose(ledger['nav_per_share'], [1.0, 1.2, 1.0])
+        np.testing.assert_allclose(ledger['shares_amount'], [100.0, -100.0, 30.0])
+    
+    def test_withdrawal_without_shares_is_rejected(self):
+        from services.share_replay import compute_share_ledger
+        movements = self._movements().iloc[:1].assign(credit=0, debit=10)
+        with self.assertRaises(ValueError):
+            compute_share_ledger(movements, np.array([0.0]))
+    
+    def test_user_overdraft_is_rejected(self):
+        from datetime import date
+        from services.share_replay import compute_share_ledger
+        # O fundo tem shares suficientes, mas o utilizador 2 só tem 100
+        movements = pd.DataFrame({
+            'movement_id': [1, 2, 3],
+            'user_id': [1, 2, 2],
+            'is_admin': [False] * 3,
+            'movement_date': [date(2024, 1, 1), date(2024, 1, 2), date(2024, 1, 3)],
+            'credit': [100, 100, 0],
+            'debit': [0, 0, 150],
+            'description': [None] * 3,
+        })
+        with self.assertRaisesRegex(ValueError, 'shares suficientes'):
+            compute_share_ledger(movements, np.zeros(3))
+    
+    def test_diff_reports_changed_and_added_rows(self):
+        from services.share_replay import compute_share_ledger, diff_share_ledgers
+        replayed = compute_share_ledger(self._movements(), np.array([0.0, 100.0, 100.0, 50.0]))
+        current = replayed.iloc[:3].copy()
+        current.loc[1, 'shares_amount'] = 40.0
+        
+        diff = diff_share_ledgers(current, replayed)
+        
+        self.assertEqual(sorted(diff['rows']['status']), ['added', 'changed'])
+        users = diff['users'].set_index('user_id')
+        self.assertAlmostEqual(users.loc[2, 'difference'], 10.0)
+        self.assertAlmostEqual(users.loc[1, 'difference'], 31.25)
+
+
+class TestBulkFees(unittest.TestCase):
+    """Testes do cálculo de taxas em bloco (services.fees.compute_fees)"""
+    
+    SETTINGS = {"maintenance_rate": 0.0025, "maintenance_min": 3.0, "performance_rate": 0.10}
+    
+    def test_bulk_fees_match_per_user_rules(self):
+        from services.fees import compute_fees
+        users = pd.DataFrame({
+            'user_id': [1, 2, 3],
+            'valor_user': [2000.0, 1000.0, 500.0],
+            'high_water': [1000.0, 1500.0, 0.0],
+            'maintenance_charged': [False, False, True],
+        })
+        
+        fees = compute_fees(users, self.SETTINGS).set_index('user_id')
+        
+        # Utilizador 1: manutenção 5.00, performance 10% de (1995 - 1000)
+        self.assertAlmostEqual(fees.loc[1, 'fee_manutencao'], 5.0)
+        self.assertAlmostEqual(fees.loc[1, 'fee_performance'], 99.5)
+        self.assertAlmostEqual(fees.loc[1, 'valor_user'], 1895.5)
+        self.assertAlmostEqual(fees.loc[1, 'new_high_water'], 1895.5)
+        # Utilizador 2: mínimo de manutenção, abaixo do HWM
+        self.assertAlmostEqual(fees.loc[2, 'fee_manutencao'], 3.0)
+        self.assertEqual(fees.loc[2, 'fee_performance'], 0.0)
+        self.assertTrue(np.isnan(fees.loc[2, 'new_high_water']))
+        # Utilizador 3: manutenção já cobrada no mês
+        self.assertFalse(fees.loc[3, 'charge_maintenance'])
+        self.assertAlmostEqual(fees.loc[3, 'valor_user'], 450.0)
+    
+    @patch('psycopg2.extras.execute_values')
+    def test_fees_are_written_in_bulk(self, mock_values):
+        from datetime import date
+        from services.fees import compute_fees, write_fees
+        users = pd.DataFrame({
+            'user_id': [1, 2],
+            'valor_user': [2000.0, 1000.0],
+            'high_water': [1000.0, 1500.0],
+            'maintenance_charged': [False, False],
+        })
+        cur = MagicMock()
+        
+        write_fees(cur, compute_fees(users, self.SETTINGS), date(2024, 1, 31))
+        
+        self.assertEqual(mock_values.call_count, 2)
+        fee_rows = mock_values.call_args_list[0][0][2]
+        self.assertEqual([r[:2] for r in fee_rows], [(1, 'maintenance'), (2, 'maintenance'), (1, 'performance')])
+        self.assertEqual(mock_values.call_args_list[1][0][2], [(1, 1895.5)])
+        cur.execute.assert_not_called()
+    
+    def test_month_bounds_are_half_open(self):
+        from datetime import date
+        from services.fees import month_bounds
+        self.assertEqual(month_bounds(date(2024, 12, 15)), (date(2024, 12, 1), date(2025, 1, 1)))
+        self.assertEqual(month_bounds(date(2024, 2, 29)), (date(2024, 2, 1), date(2024, 3, 1)))
+
 
 if __name__ == '__main__':
     unittest.main()
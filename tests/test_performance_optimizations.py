@@ -13,7 +13,7 @@ from datetime import date
 class TestConnectionPooling(unittest.TestCase):
     """Test connection pooling functionality."""
     
-    @patch('database.connection.psycopg2.pool.SimpleConnectionPool')
+    @patch('database.connection.psycopg2.pool.ThreadedConnectionPool')
     def test_connection_pool_created_once(self, mock_pool_class):
         """Test that connection pool is created only once."""
         from database.connection import _get_pool, get_connection
@@ -33,7 +33,7 @@ class TestConnectionPooling(unittest.TestCase):
         mock_pool_class.assert_called_once()
         self.assertIs(pool1, pool2)
     
-    @patch('database.connection.psycopg2.pool.SimpleConnectionPool')
+    @patch('database.connection.psycopg2.pool.ThreadedConnectionPool')
     def test_get_connection_uses_pool(self, mock_pool_class):
         """Test that get_connection uses the pool."""
         from database.connection import get_connection
@@ -51,7 +51,7 @@ class TestConnectionPooling(unittest.TestCase):
         # Should call getconn on pool
         mock_pool.getconn.assert_called_once()
     
-    @patch('database.connection.psycopg2.pool.SimpleConnectionPool')
+    @patch('database.connection.psycopg2.pool.ThreadedConnectionPool')
     def test_context_manager_commits_on_success(self, mock_pool_class):
         """Test that context manager commits on success."""
         from database.connection import get_db_cursor
@@ -76,7 +76,7 @@ class TestConnectionPooling(unittest.TestCase):
         mock_cursor.close.assert_called_once()
         mock_pool.putconn.assert_called_once_with(mock_conn)
     
-    @patch('database.connection.psycopg2.pool.SimpleConnectionPool')
+    @patch('database.connection.psycopg2.pool.ThreadedConnectionPool')
     def test_context_manager_rollsback_on_error(self, mock_pool_class):
         """Test that context manager rolls back on error."""
         from database.connection import get_db_cursor
@@ -113,6 +113,13 @@ class TestCoinGeckoCaching(unittest.TestCase):
         import services.coingecko as cg
         cg._coin_list_cache = None
         cg._symbol_to_id_cache = {k.upper(): v for k, v in cg.COMMON_SYMBOL_MAP.items()}
+        # Calls go through the shared limiter and need an active CoinGecko config
+        for patcher in (
+            patch('services.coingecko._is_coingecko_enabled', return_value=True),
+            patch('services.coingecko.get_coingecko_limiter'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
     
     @patch('services.coingecko.requests.get')
     def test_coin_list_cache_with_ttl(self, mock_get):
@@ -235,9 +242,11 @@ class TestSnapshotServiceOptimizations(unittest.TestCase):
 class TestBulkOperations(unittest.TestCase):
     """Test bulk operation optimizations."""
     
+    @patch('psycopg2.extras.execute_values')
+    @patch('database.portfolio.execute_values')
     @patch('database.portfolio.get_db_cursor')
-    @patch('database.portfolio.apply_fees')
-    def test_bulk_insert_assets(self, mock_apply_fees, mock_cursor_context):
+    @patch('database.portfolio.get_current_fee_settings')
+    def test_bulk_insert_assets(self, mock_fee_settings, mock_cursor_context, mock_values, mock_fee_values):
         """Test that assets are inserted using executemany."""
         from database.portfolio import insert_snapshot_and_fees
         import pandas as pd
@@ -247,10 +256,10 @@ class TestBulkOperations(unittest.TestCase):
             [1],  # snapshot_id
         ]
         mock_cursor.fetchall.return_value = [
-            (2, 1000.0),  # user_id, valor_antes
+            (2, 1000.0, 0.0, False),  # user_id, valor_antes, high_water, maintenance_charged
         ]
         mock_cursor_context.return_value.__enter__.return_value = mock_cursor
-        mock_apply_fees.return_value = (950.0, 30.0, 20.0)
+        mock_fee_settings.return_value = {"maintenance_rate": 0.0025, "maintenance_min": 3.0, "performance_rate": 0.10}
         
         df_assets = pd.DataFrame({
             'asset_symbol': ['BTC', 'ETH'],
@@ -268,9 +277,11 @@ class TestBulkOperations(unittest.TestCase):
         )
         self.assertTrue(executemany_called, "executemany should be used for bulk inserts")
     
+    @patch('psycopg2.extras.execute_values')
+    @patch('database.portfolio.execute_values')
     @patch('database.portfolio.get_db_cursor')
-    @patch('database.portfolio.apply_fees')
-    def test_optimized_user_query(self, mock_apply_fees, mock_cursor_context):
+    @patch('database.portfolio.get_current_fee_settings')
+    def test_optimized_user_query(self, mock_fee_settings, mock_cursor_context, mock_values, mock_fee_values):
         """Test that users and their last snapshots are fetched in one query."""
         from database.portfolio import insert_snapshot_and_fees
         import pandas as pd
@@ -280,11 +291,11 @@ class TestBulkOperations(unittest.TestCase):
             [1],  # snapshot_id
         ]
         mock_cursor.fetchall.return_value = [
-            (2, 1000.0),  # user_id, valor_antes
-            (3, 2000.0),
+            (2, 1000.0, 0.0, False),  # user_id, valor_antes, high_water, maintenance_charged
+            (3, 2000.0, 5000.0, True),
         ]
         mock_cursor_context.return_value.__enter__.return_value = mock_cursor
-        mock_apply_fees.return_value = (950.0, 30.0, 20.0)
+        mock_fee_settings.return_value = {"maintenance_rate": 0.0025, "maintenance_min": 3.0, "performance_rate": 0.10}
         
         df_assets = pd.DataFrame({
             'asset_symbol': ['BTC'],